@@ -0,0 +1,46 @@
+"""
+バックエンドAPIのクライアント
+
+Fletの各画面とPyxelのプロセスからバックエンドを呼び出すためのライブラリです。
+以下のコンポーネントが含まれています：
+
+- ApiClient: 接続をプールして使い回す同期のクライアント
+- AsyncApiClient: asyncioから呼び出すためのクライアント
+- models: バックエンドのスキーマから生成したモデル（generate_modelsで生成）
+"""
+
+from .client import ApiClient, AsyncApiClient, ApiError, ApiConnectionError, get_client
+from .models import (
+    ChangeFeed,
+    ChatResponse,
+    ConversationList,
+    ConversationPreview,
+    Message,
+    MessagePage,
+    Object,
+    ObjectCreate,
+    ObjectListItem,
+    ObjectPage,
+    ObjectUpdate,
+    Summary,
+)
+
+__all__ = [
+    'ApiClient',
+    'AsyncApiClient',
+    'ApiError',
+    'ApiConnectionError',
+    'get_client',
+    'ChangeFeed',
+    'ChatResponse',
+    'ConversationList',
+    'ConversationPreview',
+    'Message',
+    'MessagePage',
+    'Object',
+    'ObjectCreate',
+    'ObjectListItem',
+    'ObjectPage',
+    'ObjectUpdate',
+    'Summary',
+]
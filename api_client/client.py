@@ -0,0 +1,438 @@
+import asyncio
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from .models import (
+    ChangeFeed,
+    ChatResponse,
+    ConversationList,
+    ConversationPreview,
+    MessagePage,
+    Object,
+    ObjectCreate,
+    ObjectPage,
+    ObjectUpdate,
+    Summary,
+)
+from .transport import ConnectionPool, MAX_CONNECTIONS, STALE_CONNECTION_ERRORS
+
+# バックエンドのURL
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
+# 1回の呼び出しにかける時間の上限（秒）。再試行の待ち時間も含む
+DEFAULT_TIMEOUT = float(os.getenv("API_TIMEOUT", "10"))
+# ストリーミングで次の断片を待つ時間の上限（秒）
+STREAM_TIMEOUT = float(os.getenv("API_STREAM_TIMEOUT", "60"))
+# 再試行の回数と待ち時間（指数バックオフ。実際の待ち時間は0から上限までのランダムな値）
+RETRY_ATTEMPTS = int(os.getenv("API_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = 0.1
+RETRY_MAX_DELAY = 2.0
+# オブジェクトごとの最新のサマリーの取得を1回のリクエストにまとめるために待つ時間（秒）
+BATCH_WINDOW = float(os.getenv("API_BATCH_WINDOW", "0.005"))
+# 1回のリクエストで最新のサマリーを取得するオブジェクトの最大数（バックエンドのMAX_LATEST_OBJECTSと同じ）
+MAX_LATEST_OBJECTS = 1000
+
+# 何度送っても結果が変わらないメソッド（接続エラー・ゲートウェイのエラーでも再試行する）
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+# サーバーが処理せずに断ったことを示すステータス（どのメソッドでも再試行する）
+REJECTED_STATUSES = {429, 503}
+# 処理されたか分からないステータス（冪等なメソッドのみ再試行する）
+GATEWAY_STATUSES = {502, 504}
+
+class ApiError(Exception):
+    """バックエンドがエラーを返した場合の例外（statusはHTTPのステータス、detailはエラーの内容）"""
+
+    def __init__(self, status: Optional[int], detail: str):
+        self.status = status
+        self.detail = detail
+        super().__init__(f"{status}: {detail}" if status is not None else detail)
+
+class ApiConnectionError(ApiError):
+    """バックエンドに接続できない・時間内に応答がない場合の例外"""
+
+    def __init__(self, detail: str):
+        super().__init__(None, detail)
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """attempt回目の再試行までの待ち時間。複数の画面から同時に再試行しても重ならないようランダムにずらす"""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    if retry_after is not None:
+        # サーバーが指定した時間より前には送らない
+        delay = max(delay, retry_after)
+    return delay
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _error_detail(data: bytes) -> str:
+    try:
+        detail = json.loads(data.decode("utf-8"))["detail"]
+    except (ValueError, KeyError, TypeError):
+        return data.decode("utf-8", errors="replace")
+    return detail if isinstance(detail, str) else json.dumps(detail, ensure_ascii=False)
+
+class ApiClient:
+    """
+    バックエンドのAPIのクライアント（スレッドセーフ。アプリ全体でget_clientの1つを共有する）。
+    - 接続はkeep-aliveでプールし、画面をまたいで使い回す
+    - 同じGETリクエストが同時に送られた場合は1回だけ送り、結果を共有する
+    - オブジェクトごとの最新のサマリーの取得は、同時に呼ばれたものを一括取得のAPI（/summaries/latest）の1回にまとめる
+    - 接続エラー・混雑のエラーはジッター付きの指数バックオフで再試行する（POSTは処理されていないと分かる場合のみ）
+    - timeoutは再試行も含めた呼び出し全体の時間の上限
+    """
+
+    def __init__(
+        self,
+        base_url: str = API_BASE_URL,
+        max_connections: int = MAX_CONNECTIONS,
+        timeout: float = DEFAULT_TIMEOUT,
+        retries: int = RETRY_ATTEMPTS,
+    ):
+        self.base_url = base_url
+        self.pool = ConnectionPool(base_url, max_connections)
+        self.timeout = timeout
+        self.retries = retries
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self._summary_batch: Optional[Dict[int, Future]] = None
+        self._batch_lock = threading.Lock()
+        # 統計情報
+        self.coalesced = 0
+        self.batched = 0
+        self.retried = 0
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def metrics(self) -> Dict[str, int]:
+        return {**self.pool.metrics(), "coalesced": self.coalesced, "batched": self.batched, "retried": self.retried}
+
+    def _url(self, path: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """パスにクエリを付ける（値がNoneのパラメーターは送らない。リストは同じ名前で繰り返す）"""
+        query = urllib.parse.urlencode({key: value for key, value in (params or {}).items() if value is not None}, doseq=True)
+        return self.pool.base_path + path + (f"?{query}" if query else "")
+
+    def _open(self, method: str, url: str, body: Optional[bytes], headers: Dict[str, str], timeout: float):
+        """
+        リクエストを1回送り、(接続, レスポンス) を返す（接続はレスポンスを読み終えてからプールへ返す）。
+        使い回した接続がサーバー側で閉じられていた場合は、新しい接続で1回だけ送り直す。
+        ただし送り終えた後に閉じられた場合は、サーバーが処理したか分からないため冪等なメソッドのみ送り直す。
+        """
+        connection, reused = self.pool.acquire(timeout)
+        try:
+            sent = False
+            try:
+                connection.request(method, url, body=body, headers=headers)
+                sent = True
+                return connection, connection.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                if not reused or (sent and method not in IDEMPOTENT_METHODS):
+                    raise
+                # keep-aliveの時間切れで閉じられた接続（閉じると次のリクエストで接続し直す）
+                connection.close()
+                connection.request(method, url, body=body, headers=headers)
+                return connection, connection.getresponse()
+        except BaseException:
+            self.pool.release(connection, reusable=False)
+            raise
+
+    def _request(self, method: str, url: str, body: Any = None, timeout: Optional[float] = None) -> bytes:
+        """リクエストを送り、レスポンスの本文を返す。必要に応じて再試行し、エラーの場合はApiErrorを送出する"""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Accept": "application/json"}
+        if payload is not None:
+            headers["Content-Type"] = "application/json"
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ApiConnectionError(f"{method} {url} timed out")
+            retry_after = None
+            try:
+                connection, response = self._open(method, url, payload, headers, remaining)
+                try:
+                    data = response.read()
+                except BaseException:
+                    self.pool.release(connection, reusable=False)
+                    raise
+                self.pool.release(connection, reusable=not response.will_close)
+            except (OSError, http.client.HTTPException) as exc:
+                error = ApiConnectionError(f"{method} {url} failed: {exc}")
+                retryable = method in IDEMPOTENT_METHODS
+            else:
+                if response.status < 400:
+                    return data
+                error = ApiError(response.status, _error_detail(data))
+                retry_after = _parse_retry_after(response.getheader("Retry-After"))
+                retryable = response.status in REJECTED_STATUSES or (
+                    response.status in GATEWAY_STATUSES and method in IDEMPOTENT_METHODS
+                )
+            if not retryable or attempt >= self.retries:
+                raise error
+            delay = backoff_delay(attempt, retry_after)
+            if time.monotonic() + delay >= deadline:
+                raise error
+            attempt += 1
+            self.retried += 1
+            time.sleep(delay)
+
+    # 汎用のメソッド（レスポンスのJSONを返す）
+
+    def get(self, path: str, timeout: Optional[float] = None, **params) -> Any:
+        """GETリクエストを送る。同じURLへのGETが送信中の場合はその結果を待って使う"""
+        url = self._url(path, params)
+        with self._inflight_lock:
+            future = self._inflight.get(url)
+            leader = future is None
+            if leader:
+                future = self._inflight[url] = Future()
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                future.set_result(self._request("GET", url, timeout=timeout))
+            except Exception as exc:
+                future.set_exception(exc)
+            finally:
+                with self._inflight_lock:
+                    del self._inflight[url]
+        # 呼び出し元ごとに変換し、結果の辞書を変更しても他の呼び出し元に影響しないようにする
+        return json.loads(future.result(self.timeout if timeout is None else timeout))
+
+    def post(self, path: str, body: Any = None, timeout: Optional[float] = None) -> Any:
+        return json.loads(self._request("POST", self._url(path), {} if body is None else body, timeout))
+
+    def put(self, path: str, body: Any, timeout: Optional[float] = None) -> Any:
+        return json.loads(self._request("PUT", self._url(path), body, timeout))
+
+    def delete(self, path: str, timeout: Optional[float] = None) -> Any:
+        return json.loads(self._request("DELETE", self._url(path), timeout=timeout))
+
+    def stream_events(self, path: str, body: Any, timeout: float = STREAM_TIMEOUT) -> Iterator[Tuple[str, Any]]:
+        """
+        JSONをPOSTし、Server-Sent Eventsを (イベント名, データ) として順に返すジェネレーター。
+        ストリームは再試行しない。timeoutは次のイベントを待つ時間の上限。
+        """
+        headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+        payload = json.dumps(body).encode("utf-8")
+        try:
+            connection, response = self._open("POST", self._url(path), payload, headers, timeout)
+        except (OSError, http.client.HTTPException) as exc:
+            raise ApiConnectionError(f"POST {path} failed: {exc}") from exc
+        # 最後まで読んだ場合のみ接続を使い回す（途中でやめた場合は閉じる）
+        reusable = False
+        try:
+            if response.status >= 400:
+                data = response.read()
+                reusable = not response.will_close
+                raise ApiError(response.status, _error_detail(data))
+            event = None
+            for raw_line in response:
+                line = raw_line.decode("utf-8").rstrip("\r\n")
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    yield event, json.loads(line[len("data:"):].strip())
+            reusable = not response.will_close
+        except (OSError, http.client.HTTPException) as exc:
+            raise ApiConnectionError(f"POST {path} failed: {exc}") from exc
+        finally:
+            self.pool.release(connection, reusable)
+
+    # オブジェクト
+
+    def get_object(self, object_id: int, timeout: Optional[float] = None) -> Object:
+        return self.get(f"/objects/{object_id}", timeout=timeout)
+
+    def find_objects(self, name: str, limit: Optional[int] = None, timeout: Optional[float] = None) -> List[Object]:
+        """名前（部分一致）でオブジェクトを検索する。見つからない場合は空のリスト"""
+        try:
+            return self.get("/objects/", timeout=timeout, name=name, limit=limit)
+        except ApiError as exc:
+            if exc.status == 404:
+                return []
+            raise
+
+    def get_object_page(self, after_id: Optional[int] = None, limit: Optional[int] = None, timeout: Optional[float] = None) -> ObjectPage:
+        return self.get("/objects/page", timeout=timeout, after_id=after_id, limit=limit)
+
+    def create_object(self, object_data: ObjectCreate, timeout: Optional[float] = None) -> Object:
+        return self.post("/objects/", object_data, timeout=timeout)
+
+    def update_object(self, object_id: int, object_data: ObjectUpdate, timeout: Optional[float] = None) -> Object:
+        return self.put(f"/objects/{object_id}", object_data, timeout=timeout)
+
+    def delete_object(self, object_id: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+        return self.delete(f"/objects/{object_id}", timeout=timeout)
+
+    # サマリー
+
+    def get_latest_summaries(self, object_ids: List[int], timeout: Optional[float] = None) -> List[Summary]:
+        """複数のオブジェクトの最新のサマリーを一括で取得する（サマリーがないオブジェクトは含まない）"""
+        object_ids = list(dict.fromkeys(object_ids))
+        summaries: List[Summary] = []
+        for start in range(0, len(object_ids), MAX_LATEST_OBJECTS):
+            chunk = object_ids[start:start + MAX_LATEST_OBJECTS]
+            summaries.extend(self.get("/summaries/latest", timeout=timeout, object_ids=chunk))
+        return summaries
+
+    def get_latest_summary(self, object_id: int, timeout: Optional[float] = None) -> Optional[Summary]:
+        """
+        オブジェクトの最新のサマリー（ない場合はNone）。
+        BATCH_WINDOW秒の間に他のスレッドから呼ばれたオブジェクトとまとめて、1回のリクエストで取得する。
+        """
+        with self._batch_lock:
+            batch = self._summary_batch
+            leader = batch is None
+            if leader:
+                batch = self._summary_batch = {}
+            else:
+                self.batched += 1
+            future = batch.get(object_id)
+            if future is None:
+                future = batch[object_id] = Future()
+        if leader:
+            time.sleep(BATCH_WINDOW)
+            with self._batch_lock:
+                self._summary_batch = None
+            try:
+                summaries = {summary["object_id"]: summary for summary in self.get_latest_summaries(list(batch), timeout=timeout)}
+            except Exception as exc:
+                for pending in batch.values():
+                    pending.set_exception(exc)
+            else:
+                for pending_id, pending in batch.items():
+                    pending.set_result(summaries.get(pending_id))
+        summary = future.result(self.timeout if timeout is None else timeout)
+        # 同じオブジェクトを待っていた呼び出し元どうしで辞書を共有しない
+        return dict(summary) if summary is not None else None
+
+    # 変更
+
+    def get_changes(self, since: int = 0, limit: Optional[int] = None, timeout: Optional[float] = None) -> ChangeFeed:
+        return self.get("/changes/", timeout=timeout, since=since, limit=limit)
+
+    # 会話
+
+    def get_conversations(self, cursor: Optional[str] = None, limit: Optional[int] = None, timeout: Optional[float] = None) -> ConversationList:
+        return self.get("/conversations/", timeout=timeout, cursor=cursor, limit=limit)
+
+    def get_messages(
+        self, object_id: int, before_id: Optional[int] = None, limit: Optional[int] = None, timeout: Optional[float] = None
+    ) -> MessagePage:
+        return self.get(f"/conversations/{object_id}/messages", timeout=timeout, before_id=before_id, limit=limit)
+
+    def mark_read(self, object_id: int, message_id: Optional[int] = None, timeout: Optional[float] = None) -> ConversationPreview:
+        return self.post(f"/conversations/{object_id}/read", {"message_id": message_id}, timeout=timeout)
+
+    # NPC
+
+    def chat(self, object_id: int, message: str, timeout: Optional[float] = None) -> ChatResponse:
+        return self.post(f"/npc/{object_id}/chat", {"message": message}, timeout=timeout)
+
+    def stream_chat(self, object_id: int, message: str, timeout: float = STREAM_TIMEOUT) -> Iterator[str]:
+        """NPCの返答を生成された断片ごとに返すジェネレーター。生成に失敗した場合はApiErrorを送出する"""
+        for event, data in self.stream_events(f"/npc/{object_id}/chat/stream", {"message": message}, timeout):
+            if event == "token":
+                yield data["text"]
+            elif event == "error":
+                raise ApiError(None, data["detail"])
+
+class AsyncApiClient:
+    """
+    ApiClientのasyncio版。同じ接続のプールを使い、ブロックする送受信はスレッドで行う。
+    イベントループを止めずに呼び出せるため、asyncioで動く処理から使う。
+    """
+
+    def __init__(self, client: Optional[ApiClient] = None):
+        self.client = client or get_client()
+
+    async def _run(self, method, *args, **kwargs):
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def get(self, path: str, timeout: Optional[float] = None, **params) -> Any:
+        return await self._run(self.client.get, path, timeout=timeout, **params)
+
+    async def post(self, path: str, body: Any = None, timeout: Optional[float] = None) -> Any:
+        return await self._run(self.client.post, path, body, timeout=timeout)
+
+    async def put(self, path: str, body: Any, timeout: Optional[float] = None) -> Any:
+        return await self._run(self.client.put, path, body, timeout=timeout)
+
+    async def delete(self, path: str, timeout: Optional[float] = None) -> Any:
+        return await self._run(self.client.delete, path, timeout=timeout)
+
+    async def get_object(self, object_id: int, timeout: Optional[float] = None) -> Object:
+        return await self._run(self.client.get_object, object_id, timeout=timeout)
+
+    async def find_objects(self, name: str, limit: Optional[int] = None, timeout: Optional[float] = None) -> List[Object]:
+        return await self._run(self.client.find_objects, name, limit=limit, timeout=timeout)
+
+    async def get_object_page(self, after_id: Optional[int] = None, limit: Optional[int] = None, timeout: Optional[float] = None) -> ObjectPage:
+        return await self._run(self.client.get_object_page, after_id, limit=limit, timeout=timeout)
+
+    async def create_object(self, object_data: ObjectCreate, timeout: Optional[float] = None) -> Object:
+        return await self._run(self.client.create_object, object_data, timeout=timeout)
+
+    async def update_object(self, object_id: int, object_data: ObjectUpdate, timeout: Optional[float] = None) -> Object:
+        return await self._run(self.client.update_object, object_id, object_data, timeout=timeout)
+
+    async def delete_object(self, object_id: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+        return await self._run(self.client.delete_object, object_id, timeout=timeout)
+
+    async def get_latest_summaries(self, object_ids: List[int], timeout: Optional[float] = None) -> List[Summary]:
+        return await self._run(self.client.get_latest_summaries, object_ids, timeout=timeout)
+
+    async def get_latest_summary(self, object_id: int, timeout: Optional[float] = None) -> Optional[Summary]:
+        return await self._run(self.client.get_latest_summary, object_id, timeout=timeout)
+
+    async def get_changes(self, since: int = 0, limit: Optional[int] = None, timeout: Optional[float] = None) -> ChangeFeed:
+        return await self._run(self.client.get_changes, since, limit=limit, timeout=timeout)
+
+    async def get_conversations(self, cursor: Optional[str] = None, limit: Optional[int] = None, timeout: Optional[float] = None) -> ConversationList:
+        return await self._run(self.client.get_conversations, cursor, limit=limit, timeout=timeout)
+
+    async def get_messages(
+        self, object_id: int, before_id: Optional[int] = None, limit: Optional[int] = None, timeout: Optional[float] = None
+    ) -> MessagePage:
+        return await self._run(self.client.get_messages, object_id, before_id=before_id, limit=limit, timeout=timeout)
+
+    async def mark_read(self, object_id: int, message_id: Optional[int] = None, timeout: Optional[float] = None) -> ConversationPreview:
+        return await self._run(self.client.mark_read, object_id, message_id, timeout=timeout)
+
+    async def chat(self, object_id: int, message: str, timeout: Optional[float] = None) -> ChatResponse:
+        return await self._run(self.client.chat, object_id, message, timeout=timeout)
+
+    async def stream_chat(self, object_id: int, message: str, timeout: float = STREAM_TIMEOUT) -> AsyncIterator[str]:
+        """NPCの返答を生成された断片ごとに返す非同期ジェネレーター"""
+        chunks = self.client.stream_chat(object_id, message, timeout)
+        end = object()
+        try:
+            while True:
+                chunk = await self._run(next, chunks, end)
+                if chunk is end:
+                    return
+                yield chunk
+        finally:
+            chunks.close()
+
+_client: Optional[ApiClient] = None
+_client_lock = threading.Lock()
+
+def get_client() -> ApiClient:
+    """アプリ全体（すべての画面・スレッド）で共有するクライアントを取得"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ApiClient()
+        return _client
@@ -0,0 +1,91 @@
+"""
+バックエンドのPydanticのスキーマ（OpenAPI）からapi_client/models.pyを生成するスクリプト。
+
+使い方（リポジトリのルートで実行）:
+    python -m api_client.generate_models                      # 起動中のバックエンドの/openapi.jsonから生成
+    python -m api_client.generate_models --backend backend/src  # バックエンドのアプリを読み込んで生成（起動不要）
+    python -m api_client.generate_models --input openapi.json   # 保存したスキーマから生成
+
+バックエンドのモデルを変更したら生成し直してコミットする。
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.request
+
+from .client import API_BASE_URL
+
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models.py")
+
+HEADER = '''"""
+バックエンドのAPIのモデル（api_client/generate_models.pyで生成。直接編集しない）
+
+レスポンスのJSONをそのまま扱えるようTypedDictで定義する（変換の手間がなく、既存の辞書として扱うコードもそのまま使える）。
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, NotRequired, Optional, TypedDict
+'''
+
+SCALAR_TYPES = {"integer": "int", "number": "float", "string": "str", "boolean": "bool"}
+
+def load_schema(args):
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            return json.load(f)
+    if args.backend:
+        sys.path.insert(0, os.path.abspath(args.backend))
+        from main import app
+        return app.openapi()
+    with urllib.request.urlopen(f"{args.url}/openapi.json", timeout=10) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+def type_of(schema):
+    """JSONスキーマをPythonの型の表記に変換する"""
+    if "$ref" in schema:
+        return schema["$ref"].rsplit("/", 1)[-1]
+    if "anyOf" in schema:
+        options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+        inner = type_of(options[0]) if len(options) == 1 else "Any"
+        return f"Optional[{inner}]" if len(options) < len(schema["anyOf"]) else inner
+    schema_type = schema.get("type")
+    if schema_type == "array":
+        return f"List[{type_of(schema.get('items', {}))}]"
+    if schema_type == "object":
+        return "Dict[str, Any]"
+    return SCALAR_TYPES.get(schema_type, "Any")
+
+def render_model(name, schema):
+    lines = ["", "", f"class {name}(TypedDict):"]
+    properties = schema.get("properties", {})
+    if not properties:
+        lines.append("    pass")
+    required = set(schema.get("required", []))
+    for field, field_schema in properties.items():
+        annotation = type_of(field_schema)
+        if field not in required:
+            annotation = f"NotRequired[{annotation}]"
+        description = field_schema.get("description")
+        lines.append(f"    {field}: {annotation}" + (f"  # {description}" if description else ""))
+    return lines
+
+def render(openapi):
+    lines = [HEADER.rstrip("\n")]
+    for name, schema in sorted(openapi.get("components", {}).get("schemas", {}).items()):
+        if schema.get("type") == "object":
+            lines.extend(render_model(name, schema))
+    return "\n".join(lines) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="バックエンドのOpenAPIのスキーマからapi_client/models.pyを生成する")
+    parser.add_argument("--url", default=API_BASE_URL, help="バックエンドのURL")
+    parser.add_argument("--backend", help="バックエンドのソースのディレクトリ（指定した場合はアプリを読み込んで生成）")
+    parser.add_argument("--input", help="OpenAPIのスキーマのJSONファイル")
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    args = parser.parse_args()
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(render(load_schema(args)))
+
+if __name__ == "__main__":
+    main()
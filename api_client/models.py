@@ -0,0 +1,199 @@
+"""
+バックエンドのAPIのモデル（api_client/generate_models.pyで生成。直接編集しない）
+
+レスポンスのJSONをそのまま扱えるようTypedDictで定義する（変換の手間がなく、既存の辞書として扱うコードもそのまま使える）。
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, NotRequired, Optional, TypedDict
+
+
+class Change(TypedDict):
+    seq: int
+    entity: str
+    id: int
+    object_id: NotRequired[Optional[int]]
+    op: str
+    data: NotRequired[Optional[Dict[str, Any]]]
+
+
+class ChangeFeed(TypedDict):
+    changes: List[Change]
+    next_since: int
+    has_more: bool
+    reset: NotRequired[bool]
+
+
+class ChatRequest(TypedDict):
+    message: str
+    max_tokens: NotRequired[Optional[int]]  # 生成する最大トークン数（未指定の場合はサーバーの設定値）
+
+
+class ChatResponse(TypedDict):
+    object_id: int
+    reply: str
+
+
+class ConversationList(TypedDict):
+    conversations: List[ConversationPreview]
+    next_cursor: NotRequired[Optional[str]]  # 続きを取得する場合にcursorに指定する値
+
+
+class ConversationPreview(TypedDict):
+    object_id: int
+    object_name: str
+    latest_message: Message
+    message_count: int
+    unread_count: int
+
+
+class GlobalStats(TypedDict):
+    object_count: int
+    memory_count: int
+    importance_histogram: Dict[str, Any]  # 重要度（1-9）ごとのメモリ数
+    latest_memory_at: NotRequired[Optional[str]]
+    summary_count: int
+
+
+class HTTPValidationError(TypedDict):
+    detail: NotRequired[List[ValidationError]]
+
+
+class Memory(TypedDict):
+    id: int
+    object_id: int
+    content: str
+    importance: NotRequired[int]  # 重要度（1-9の整数値）
+    timestamp: str
+    last_accessed: str
+    version: int
+
+
+class MemoryCreate(TypedDict):
+    object_id: int
+    content: str
+    importance: NotRequired[int]  # 重要度（1-9の整数値）
+
+
+class MemoryUpdate(TypedDict):
+    content: NotRequired[Optional[str]]
+    importance: NotRequired[Optional[int]]  # 重要度（1-9の整数値）
+    expected_version: NotRequired[Optional[int]]  # 更新前に期待するバージョン（一致しない場合は409）
+
+
+class Message(TypedDict):
+    id: int
+    object_id: int
+    sender: str
+    content: str
+    created_at: str
+
+
+class MessageCreate(TypedDict):
+    sender: NotRequired[str]  # 送信者（player / npc）
+    content: str
+
+
+class MessagePage(TypedDict):
+    object_id: int
+    messages: List[Message]
+    next_before_id: NotRequired[Optional[int]]  # さらに古いメッセージを取得する場合にbefore_idに指定する値
+    has_more: bool
+
+
+class Object(TypedDict):
+    id: int
+    name: str
+    summary: str
+    description: str
+    photos: NotRequired[Optional[str]]
+    version: int
+
+
+class ObjectCreate(TypedDict):
+    name: str
+    summary: str
+    description: str
+    photos: NotRequired[Optional[str]]
+
+
+class ObjectListItem(TypedDict):
+    id: int
+    name: str
+    summary: str
+    version: int
+
+
+class ObjectPage(TypedDict):
+    objects: List[ObjectListItem]
+    next_after_id: NotRequired[Optional[int]]  # 続きを取得する場合にafter_idに指定する値
+    has_more: bool
+    total: int
+    change_seq: int
+
+
+class ObjectStats(TypedDict):
+    object_id: int
+    memory_count: int
+    importance_histogram: Dict[str, Any]  # 重要度（1-9）ごとのメモリ数
+    latest_memory_at: NotRequired[Optional[str]]
+    summary_count: int
+
+
+class ObjectUpdate(TypedDict):
+    name: NotRequired[Optional[str]]
+    summary: NotRequired[Optional[str]]
+    description: NotRequired[Optional[str]]
+    photos: NotRequired[Optional[str]]
+    expected_version: NotRequired[Optional[int]]  # 更新前に期待するバージョン（一致しない場合は409）
+
+
+class PromptContext(TypedDict):
+    object_id: int
+    budget: int
+    used_tokens: int
+    text: str
+    summary_id: NotRequired[Optional[int]]
+    memory_ids: NotRequired[List[int]]  # 含めたメモリのID（スコアの高い順）
+    omitted_memories: NotRequired[int]  # 上限に収まらず含めなかったメモリの件数
+
+
+class ReadRequest(TypedDict):
+    message_id: NotRequired[Optional[int]]  # このメッセージまでを既読にする（未指定の場合はすべて）
+
+
+class StatsRebuildResult(TypedDict):
+    objects: int
+    corrected: int
+
+
+class Summary(TypedDict):
+    id: int
+    object_id: int
+    key_features: str
+    current_daily_tasks: str
+    recent_progress_feelings: str
+    created_at: str
+    version: int
+
+
+class SummaryCreate(TypedDict):
+    object_id: int
+    key_features: str
+    current_daily_tasks: str
+    recent_progress_feelings: str
+
+
+class SummaryUpdate(TypedDict):
+    key_features: NotRequired[Optional[str]]
+    current_daily_tasks: NotRequired[Optional[str]]
+    recent_progress_feelings: NotRequired[Optional[str]]
+    expected_version: NotRequired[Optional[int]]  # 更新前に期待するバージョン（一致しない場合は409）
+
+
+class ValidationError(TypedDict):
+    loc: List[Any]
+    msg: str
+    type: str
+    input: NotRequired[Any]
+    ctx: NotRequired[Dict[str, Any]]
@@ -0,0 +1,90 @@
+import http.client
+import select
+import threading
+import urllib.parse
+
+# ホストごとに同時に使う接続の最大数（超えた分は空くまで待つ）
+MAX_CONNECTIONS = 8
+
+# keep-aliveの接続がサーバー側で閉じられていた場合に送出される例外
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+def _is_closed(connection):
+    """空いている接続がサーバー側で閉じられているか（応答を待っていない接続が読み込み可能ならEOFが届いている）"""
+    if connection.sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([connection.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+class ConnectionPool:
+    """
+    バックエンドへのkeep-aliveの接続を使い回すプール（スレッドセーフ）。
+    リクエストのたびにTCPの接続を張り直さないため、画面の操作ごとの往復時間が短くなる。
+    空いている接続は最後に使ったものから渡す（サーバーのkeep-aliveの時間切れで閉じられている可能性が低いため）。
+    """
+
+    def __init__(self, base_url, max_connections=MAX_CONNECTIONS):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.scheme = parsed.scheme or "http"
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port
+        self.base_path = parsed.path.rstrip("/")
+        self.max_connections = max_connections
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        # 統計情報
+        self.created = 0
+        self.reused = 0
+
+    def _connect(self, timeout):
+        connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        connection = connection_class(self.host, self.port, timeout=timeout)
+        self.created += 1
+        return connection
+
+    def acquire(self, timeout):
+        """
+        接続を1つ借りる。(接続, 使い回した接続か) を返す。
+        すべての接続が使用中の場合はtimeout秒まで待ち、空かなければTimeoutErrorを送出する。
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("connection pool exhausted")
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None or not _is_closed(connection):
+                break
+            # サーバー側で閉じられた接続は送る前に捨てる（POSTを送った後に閉じられたと分かっても送り直せないため）
+            connection.close()
+        if connection is None:
+            return self._connect(timeout), False
+        self.reused += 1
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection, True
+
+    def release(self, connection, reusable=True):
+        """借りた接続を返す。続けて使えない接続（エラー・Connection: close）は閉じる"""
+        if reusable:
+            with self._lock:
+                self._idle.append(connection)
+        else:
+            connection.close()
+        self._slots.release()
+
+    def close(self):
+        """空いている接続をすべて閉じる（使用中の接続は返されたときにプールへ戻る）"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def metrics(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {"created": self.created, "reused": self.reused, "idle": idle}
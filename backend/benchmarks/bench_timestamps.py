@@ -0,0 +1,82 @@
+"""
+日時の保存形式（文字列 / エポックミリ秒）によるインデックスサイズと範囲検索の速度を比較する。
+
+    python benchmarks/bench_timestamps.py [行数]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+OBJECTS = 100
+QUERIES = 2_000
+START = datetime(2025, 1, 1)
+SPAN_MS = 365 * 24 * 3600 * 1000
+
+def build(path: str, as_text: bool):
+    connection = sqlite3.connect(path)
+    column_type = "DATETIME" if as_text else "INTEGER"
+    connection.execute(f"CREATE TABLE memories (id INTEGER PRIMARY KEY, object_id INTEGER NOT NULL, timestamp {column_type})")
+    rng = random.Random(0)
+    rows = []
+    for i in range(ROWS):
+        offset_ms = rng.randrange(SPAN_MS)
+        if as_text:
+            # SQLAlchemyのDateTimeと同じ形式の文字列
+            value = (START + timedelta(milliseconds=offset_ms)).strftime("%Y-%m-%d %H:%M:%S.%f")
+        else:
+            value = offset_ms
+        rows.append((i + 1, rng.randrange(OBJECTS), value))
+    connection.executemany("INSERT INTO memories VALUES (?, ?, ?)", rows)
+    connection.commit()
+
+    pages_before = connection.execute("PRAGMA page_count").fetchone()[0]
+    connection.execute("CREATE INDEX ix_memories_object_timestamp ON memories (object_id, timestamp)")
+    connection.commit()
+    page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+    index_bytes = (connection.execute("PRAGMA page_count").fetchone()[0] - pages_before) * page_size
+    return connection, index_bytes
+
+def range_queries(as_text: bool):
+    rng = random.Random(1)
+    queries = []
+    for _ in range(QUERIES):
+        begin = rng.randrange(SPAN_MS - 7 * 24 * 3600 * 1000)
+        end = begin + 7 * 24 * 3600 * 1000
+        if as_text:
+            begin = (START + timedelta(milliseconds=begin)).strftime("%Y-%m-%d %H:%M:%S.%f")
+            end = (START + timedelta(milliseconds=end)).strftime("%Y-%m-%d %H:%M:%S.%f")
+        queries.append((rng.randrange(OBJECTS), begin, end))
+    return queries
+
+def measure(connection: sqlite3.Connection, queries) -> float:
+    sql = "SELECT id, timestamp FROM memories WHERE object_id = ? AND timestamp BETWEEN ? AND ? ORDER BY timestamp"
+    started = time.perf_counter()
+    for params in queries:
+        connection.execute(sql, params).fetchall()
+    return time.perf_counter() - started
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        results = {}
+        for label, as_text in (("text", True), ("epoch_ms", False)):
+            connection, index_bytes = build(os.path.join(directory, f"{label}.db"), as_text)
+            queries = range_queries(as_text)
+            measure(connection, queries)  # ウォームアップ
+            elapsed = min(measure(connection, queries) for _ in range(3))
+            connection.close()
+            results[label] = (index_bytes, elapsed)
+
+    print(f"rows={ROWS} objects={OBJECTS} range_queries={QUERIES}")
+    for label, (index_bytes, elapsed) in results.items():
+        print(f"{label:>9}: index {index_bytes / 1024:8.0f} KiB  range scan {elapsed * 1000:8.1f} ms")
+    text_index, text_elapsed = results["text"]
+    epoch_index, epoch_elapsed = results["epoch_ms"]
+    print(f"index size: {epoch_index / text_index:.2f}x  range scan: {text_elapsed / epoch_elapsed:.2f}x faster")
+
+if __name__ == "__main__":
+    main()
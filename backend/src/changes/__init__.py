@@ -0,0 +1,14 @@
+from .models import Change, ChangeFeed, ChangeQuery
+from .service import ChangeService, get_change_service, record_change, compact_changes
+from .router import router
+
+__all__ = [
+    "Change",
+    "ChangeFeed",
+    "ChangeQuery",
+    "ChangeService",
+    "get_change_service",
+    "record_change",
+    "compact_changes",
+    "router"
+]
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from typing import Optional, List, Dict, Any
+
+# 変更ログの1件
+class Change(BaseModel):
+    seq: int
+    entity: str  # "object" / "memory" / "summary"
+    id: int
+    object_id: Optional[int] = None
+    op: str  # "upsert" / "delete"
+    data: Optional[Dict[str, Any]] = None  # upsert時の最新の行（deleteの場合はNone）
+
+# 差分取得のレスポンス
+class ChangeFeed(BaseModel):
+    changes: List[Change]
+    next_since: int  # 次回のsinceに指定する値
+    has_more: bool  # limitを超える変更が残っているか
+    reset: bool = False  # Trueの場合は差分同期できないため全件を再取得する
+
+# 取得のリクエストパラメーター
+class ChangeQuery(BaseModel):
+    since: int = 0
+    limit: Optional[int] = 100
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Query, Depends
+from typing import Optional
+from sqlalchemy.orm import Session
+from .models import ChangeFeed, ChangeQuery
+from .service import get_change_service
+from utils.database import get_db
+
+router = APIRouter(prefix="/changes", tags=["changes"])
+
+# 差分の取得
+@router.get("/", response_model=ChangeFeed)
+def get_changes(
+    since: int = Query(0, description="このシーケンス番号より後の変更を取得"),
+    limit: Optional[int] = Query(100, description="取得件数制限"),
+    db: Session = Depends(get_db)
+):
+    change_service = get_change_service(db)
+    query = ChangeQuery(
+        since=since,
+        limit=limit
+    )
+    return change_service.get_changes(query)
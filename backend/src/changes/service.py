@@ -0,0 +1,122 @@
+from typing import List, Optional, Dict, Any
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from .models import Change, ChangeFeed, ChangeQuery
+from utils.db_models import ChangeLogDB, ChangeLogStateDB, ObjectDB
+import json
+import os
+
+# 差分取得で一度に返す最大件数
+MAX_CHANGES_LIMIT = 1000
+# 圧縮時に残す直近の変更数（これより古い重複エントリを圧縮する）
+CHANGE_LOG_RETENTION = int(os.getenv("CHANGE_LOG_RETENTION", "10000"))
+# 削除記録（tombstone）を残す直近の変更数
+TOMBSTONE_RETENTION = int(os.getenv("TOMBSTONE_RETENTION", "100000"))
+
+def record_change(session: Session, entity: str, entity_id: int, object_id: Optional[int], op: str, data: Any = None) -> None:
+    """書き込みと同じトランザクション内で変更ログを追記する"""
+    session.add(ChangeLogDB(
+        entity=entity,
+        entity_id=entity_id,
+        object_id=object_id,
+        op=op,
+        data=json.dumps(jsonable_encoder(data), ensure_ascii=False) if data is not None else None
+    ))
+
+def compact_changes(session: Session, retention: int = CHANGE_LOG_RETENTION, tombstone_retention: int = TOMBSTONE_RETENTION) -> int:
+    """
+    古い変更ログを圧縮する。
+    直近retention件より古いエントリは、同じ行に対する最新のエントリだけを残す。
+    直近tombstone_retention件より古い削除記録は破棄し、その位置をtruncated_seqとして記録する。
+    削除済みのオブジェクトの子（メモリ・サマリー）のエントリはオブジェクトの削除記録で代表されるため破棄する。
+    """
+    latest_seq = session.query(func.max(ChangeLogDB.seq)).scalar() or 0
+    removed = 0
+
+    orphaned = ~select(ObjectDB.id).where(ObjectDB.id == ChangeLogDB.object_id).exists()
+    removed += session.query(ChangeLogDB).filter(
+        ChangeLogDB.entity != "object",
+        ChangeLogDB.object_id.isnot(None),
+        orphaned
+    ).delete(synchronize_session=False)
+
+    horizon = latest_seq - retention
+    if horizon > 0:
+        latest_per_row = session.query(func.max(ChangeLogDB.seq)).group_by(ChangeLogDB.entity, ChangeLogDB.entity_id)
+        removed += session.query(ChangeLogDB).filter(
+            ChangeLogDB.seq <= horizon,
+            ChangeLogDB.seq.not_in(latest_per_row)
+        ).delete(synchronize_session=False)
+
+    tombstone_horizon = latest_seq - tombstone_retention
+    if tombstone_horizon > 0:
+        pruned = session.query(ChangeLogDB).filter(
+            ChangeLogDB.seq <= tombstone_horizon,
+            ChangeLogDB.op == "delete"
+        ).delete(synchronize_session=False)
+        if pruned:
+            removed += pruned
+            state = session.get(ChangeLogStateDB, 1)
+            if state is None:
+                session.add(ChangeLogStateDB(id=1, truncated_seq=tombstone_horizon))
+            else:
+                state.truncated_seq = max(state.truncated_seq, tombstone_horizon)
+
+    return removed
+
+class ChangeService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    # 指定したシーケンス番号より後の変更を取得
+    def get_changes(self, query: ChangeQuery) -> ChangeFeed:
+        if query.since < 0:
+            raise HTTPException(
+                status_code=400,
+                detail="Since must be 0 or greater"
+            )
+        limit = query.limit if query.limit is not None else 100
+        if limit < 1 or limit > MAX_CHANGES_LIMIT:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Limit must be between 1 and {MAX_CHANGES_LIMIT}"
+            )
+
+        # 破棄済みの削除記録より前からは差分同期できない
+        state = self.db.get(ChangeLogStateDB, 1)
+        if state is not None and 0 < query.since < state.truncated_seq:
+            latest_seq = self.db.query(func.max(ChangeLogDB.seq)).scalar() or 0
+            return ChangeFeed(changes=[], next_since=latest_seq, has_more=False, reset=True)
+
+        # limit+1件取得して続きがあるか判定する
+        db_changes = (
+            self.db.query(ChangeLogDB)
+            .filter(ChangeLogDB.seq > query.since)
+            .order_by(ChangeLogDB.seq)
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(db_changes) > limit
+        db_changes = db_changes[:limit]
+
+        return ChangeFeed(
+            changes=[
+                Change(
+                    seq=db_change.seq,
+                    entity=db_change.entity,
+                    id=db_change.entity_id,
+                    object_id=db_change.object_id,
+                    op=db_change.op,
+                    data=json.loads(db_change.data) if db_change.data is not None else None
+                )
+                for db_change in db_changes
+            ],
+            next_since=db_changes[-1].seq if db_changes else query.since,
+            has_more=has_more
+        )
+
+# サービスのファクトリー関数
+def get_change_service(db: Session) -> ChangeService:
+    return ChangeService(db)
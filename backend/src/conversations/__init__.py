@@ -0,0 +1,18 @@
+from .models import Message, MessageCreate, MessagePage, ConversationPreview, ConversationList, ReadRequest, ConversationWindow
+from .service import ConversationService, get_conversation_service
+from .memory import ConversationMemory
+from .router import router
+
+__all__ = [
+    "Message",
+    "MessageCreate",
+    "MessagePage",
+    "ConversationPreview",
+    "ConversationList",
+    "ReadRequest",
+    "ConversationWindow",
+    "ConversationService",
+    "get_conversation_service",
+    "ConversationMemory",
+    "router"
+]
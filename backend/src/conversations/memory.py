@@ -0,0 +1,126 @@
+import os
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .models import Message, ConversationWindow
+from .service import _to_message
+from utils.db_models import ChatMessageDB, ConversationDB
+from utils.writer import SessionWriter
+from utils.tokens import estimate_tokens
+
+# 会話の履歴の設定（環境変数で変更可能）
+CHAT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "8"))  # 要約せずにそのまま残す直近の発言数
+CHAT_HISTORY_BUDGET = int(os.getenv("CHAT_HISTORY_BUDGET", "384"))  # 要約と直近の発言に使うトークン数
+# 直近の発言より古い発言がこの数たまったら要約に畳み込む
+CHAT_FOLD_BATCH = int(os.getenv("CHAT_FOLD_BATCH", "8"))
+# 1回の要約で畳み込む発言の最大数（要約が遅れてたまった場合は複数回に分ける）
+CHAT_FOLD_MAX_MESSAGES = int(os.getenv("CHAT_FOLD_MAX_MESSAGES", "40"))
+
+def format_line(speaker: str, content: str) -> str:
+    return f"{speaker}：{content}\n"
+
+class ConversationMemory:
+    """
+    会話の履歴をプロンプトに収めるための管理。
+    直近のCHAT_HISTORY_TURNS件の発言はそのまま残し、それより古い発言は要約に畳み込む。
+    トークン数はメッセージ・会話の行に保存された値を使うため、会話が長くなってもプロンプトの組み立てにかかる時間は変わらない。
+    """
+
+    def __init__(self, db: Session, writer=None):
+        self.db = db
+        # 書き込みはライター経由で行う（未指定の場合はこのセッションで直接コミット）
+        self.writer = writer or SessionWriter(db)
+
+    def _conversation(self, object_id: int) -> Optional[ConversationDB]:
+        return self.db.query(ConversationDB).filter(ConversationDB.object_id == object_id).first()
+
+    def window(self, object_id: int, speakers: Dict[str, str], budget: int = CHAT_HISTORY_BUDGET) -> ConversationWindow:
+        """
+        要約と、予算に収まる直近の発言（最大CHAT_HISTORY_TURNS件）を取得する。
+        speakersは送信者（player / npc）ごとの表示名。
+        """
+        conversation = self._conversation(object_id)
+        if conversation is None:
+            return ConversationWindow(object_id=object_id, budget=budget, used_tokens=0, text="", message_ids=[])
+
+        used = 0
+        summary = None
+        if conversation.summary and conversation.summary_tokens <= budget:
+            summary = conversation.summary
+            used = conversation.summary_tokens
+
+        # 行ごとに加わる「名前：」と改行のトークン数は送信者ごとに1回だけ数える
+        overhead = {sender: estimate_tokens(format_line(name, "")) for sender, name in speakers.items()}
+        db_messages = (
+            self.db.query(ChatMessageDB)
+            .filter(ChatMessageDB.object_id == object_id, ChatMessageDB.id > (conversation.summarized_through_id or 0))
+            .order_by(ChatMessageDB.id.desc())
+            .limit(CHAT_HISTORY_TURNS)
+            .all()
+        )
+        # 新しい発言から予算に収まる分だけ残す（途中の発言を飛ばすと会話がつながらないため、収まらなくなった時点で止める）
+        kept: List[ChatMessageDB] = []
+        for db_message in db_messages:
+            cost = db_message.tokens + overhead[db_message.sender]
+            if used + cost > budget:
+                break
+            kept.append(db_message)
+            used += cost
+        kept.reverse()
+
+        return ConversationWindow(
+            object_id=object_id,
+            budget=budget,
+            used_tokens=used,
+            summary=summary,
+            text="".join(format_line(speakers[m.sender], m.content) for m in kept),
+            message_ids=[m.id for m in kept]
+        )
+
+    def needs_fold(self, object_id: int) -> bool:
+        """直近の発言より古い未要約の発言がCHAT_FOLD_BATCH件以上あるか（会話の行の件数だけで判定する）"""
+        conversation = self._conversation(object_id)
+        return conversation is not None and conversation.pending_count - CHAT_HISTORY_TURNS >= CHAT_FOLD_BATCH
+
+    def fold_candidates(self, object_id: int) -> Tuple[Optional[str], List[Message]]:
+        """現在の要約と、要約に畳み込む発言（直近のCHAT_HISTORY_TURNS件を除いた未要約の発言の古い方から）を取得"""
+        conversation = self._conversation(object_id)
+        if conversation is None:
+            return None, []
+        count = min(conversation.pending_count - CHAT_HISTORY_TURNS, CHAT_FOLD_MAX_MESSAGES)
+        if count <= 0:
+            return conversation.summary, []
+        db_messages = (
+            self.db.query(ChatMessageDB)
+            .filter(ChatMessageDB.object_id == object_id, ChatMessageDB.id > (conversation.summarized_through_id or 0))
+            .order_by(ChatMessageDB.id)
+            .limit(count)
+            .all()
+        )
+        return conversation.summary, [_to_message(db_message) for db_message in db_messages]
+
+    def apply_summary(self, object_id: int, through_id: int, summary: str) -> bool:
+        """
+        through_idまでの発言を畳み込んだ要約を保存し、未要約の件数・トークン数を減らす。
+        要約の作成中に別の要約が保存されていた場合は保存せずFalseを返す。
+        """
+        def _apply(session: Session) -> bool:
+            conversation = session.query(ConversationDB).filter(ConversationDB.object_id == object_id).first()
+            if conversation is None:
+                return False
+            previous = conversation.summarized_through_id or 0
+            if through_id <= previous:
+                return False
+            count, tokens = session.query(func.count(ChatMessageDB.id), func.coalesce(func.sum(ChatMessageDB.tokens), 0)).filter(
+                ChatMessageDB.object_id == object_id,
+                ChatMessageDB.id > previous,
+                ChatMessageDB.id <= through_id
+            ).one()
+            conversation.summary = summary
+            conversation.summary_tokens = estimate_tokens(summary)
+            conversation.summarized_through_id = through_id
+            conversation.pending_count = max(conversation.pending_count - count, 0)
+            conversation.pending_tokens = max(conversation.pending_tokens - tokens, 0)
+            return True
+
+        return self.writer.run(_apply)
@@ -0,0 +1,49 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
+
+# チャットのメッセージ
+class Message(BaseModel):
+    id: int
+    object_id: int
+    sender: str  # "player" / "npc"
+    content: str
+    created_at: datetime
+
+# 追加のリクエストパラメーター
+class MessageCreate(BaseModel):
+    sender: str = Field(default="player", description="送信者（player / npc）")
+    content: str
+
+# 履歴の1ページ（古い順）
+class MessagePage(BaseModel):
+    object_id: int
+    messages: List[Message]
+    next_before_id: Optional[int] = Field(default=None, description="さらに古いメッセージを取得する場合にbefore_idに指定する値")
+    has_more: bool
+
+# 会話の一覧の1件
+class ConversationPreview(BaseModel):
+    object_id: int
+    object_name: str
+    latest_message: Message
+    message_count: int
+    unread_count: int
+
+# 会話の一覧（新しい順）
+class ConversationList(BaseModel):
+    conversations: List[ConversationPreview]
+    next_cursor: Optional[str] = Field(default=None, description="続きを取得する場合にcursorに指定する値")
+
+# 既読のリクエストパラメーター
+class ReadRequest(BaseModel):
+    message_id: Optional[int] = Field(default=None, description="このメッセージまでを既読にする（未指定の場合はすべて）")
+
+# プロンプトに含める会話の履歴（要約と直近の発言）
+class ConversationWindow(BaseModel):
+    object_id: int
+    budget: int
+    used_tokens: int
+    summary: Optional[str] = None  # 直近の発言より古い発言の要約（予算に収まらない場合はNone）
+    text: str  # 直近の発言（古い順に1行ずつ）
+    message_ids: List[int]
@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Query, Depends
+from typing import Optional
+from sqlalchemy.orm import Session
+from .models import Message, MessageCreate, MessagePage, ConversationPreview, ConversationList, ReadRequest
+from .service import get_conversation_service
+from utils.database import get_db
+
+router = APIRouter(prefix="/conversations", tags=["conversations"])
+
+# 会話の一覧を取得（最新のメッセージ・未読数を含む）
+@router.get("/", response_model=ConversationList)
+def get_conversations(
+    cursor: Optional[str] = Query(None, description="前回のレスポンスのnext_cursor"),
+    limit: int = Query(50, description="取得件数制限"),
+    db: Session = Depends(get_db)
+):
+    conversation_service = get_conversation_service(db)
+    return conversation_service.get_conversations(cursor, limit)
+
+# 単一の会話を取得
+@router.get("/{object_id}", response_model=ConversationPreview)
+def get_conversation(object_id: int, db: Session = Depends(get_db)):
+    conversation_service = get_conversation_service(db)
+    return conversation_service.get_conversation(object_id)
+
+# 会話の履歴を取得（新しい方から1ページずつ）
+@router.get("/{object_id}/messages", response_model=MessagePage)
+def get_messages(
+    object_id: int,
+    before_id: Optional[int] = Query(None, description="このIDより古いメッセージを取得（前回のレスポンスのnext_before_id）"),
+    limit: int = Query(50, description="取得件数制限"),
+    db: Session = Depends(get_db)
+):
+    conversation_service = get_conversation_service(db)
+    return conversation_service.get_messages(object_id, before_id, limit)
+
+# メッセージの追加
+@router.post("/{object_id}/messages", response_model=Message)
+def append_message(object_id: int, message_data: MessageCreate, db: Session = Depends(get_db)):
+    conversation_service = get_conversation_service(db)
+    return conversation_service.append_message(object_id, message_data)
+
+# 既読にする
+@router.post("/{object_id}/read", response_model=ConversationPreview)
+def mark_read(object_id: int, read_request: ReadRequest, db: Session = Depends(get_db)):
+    conversation_service = get_conversation_service(db)
+    return conversation_service.mark_read(object_id, read_request.message_id)
@@ -0,0 +1,233 @@
+from typing import Optional, Tuple
+from sqlalchemy import func, tuple_, type_coerce, Integer
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from .models import Message, MessageCreate, MessagePage, ConversationPreview, ConversationList
+from utils.db_models import ObjectDB, ChatMessageDB, ConversationDB
+from utils.writer import SessionWriter, get_writer
+from utils.events import publish
+from utils.timestamps import now_ms
+from utils.tokens import estimate_tokens
+
+SENDERS = ("player", "npc")
+# 1回に取得できるメッセージ・会話の件数の上限
+MAX_PAGE_SIZE = 200
+# カーソルには保存値のエポックミリ秒をそのまま使う（日時に変換して戻すと夏時間の切り替わりで値がずれるため）
+_LATEST_AT_MS = type_coerce(ConversationDB.latest_at, Integer).label("latest_at_ms")
+
+def _to_message(db_message: ChatMessageDB) -> Message:
+    return Message(
+        id=db_message.id,
+        object_id=db_message.object_id,
+        sender=db_message.sender,
+        content=db_message.content,
+        created_at=db_message.created_at
+    )
+
+def _format_cursor(latest_at_ms: int, object_id: int) -> str:
+    return f"{latest_at_ms}:{object_id}"
+
+def _parse_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        latest_at_ms, object_id = cursor.split(":")
+        return int(latest_at_ms), int(object_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="Cursor must be in the form '<latest_at_ms>:<object_id>'"
+        )
+
+class ConversationService:
+    def __init__(self, db: Session, writer=None):
+        self.db = db
+        # 書き込みはライター経由で行う（未指定の場合はこのセッションで直接コミット）
+        self.writer = writer or SessionWriter(db)
+
+    def _validate_limit(self, limit: int) -> None:
+        """limitが1からMAX_PAGE_SIZEの範囲内であることを確認"""
+        if limit < 1 or limit > MAX_PAGE_SIZE:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Limit must be between 1 and {MAX_PAGE_SIZE}"
+            )
+
+    def _validate_message(self, message_data: MessageCreate) -> None:
+        if message_data.sender not in SENDERS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Sender must be one of {', '.join(SENDERS)}"
+            )
+        if not message_data.content or len(message_data.content.strip()) == 0:
+            raise HTTPException(
+                status_code=400,
+                detail="Content must be at least 1 character long"
+            )
+
+    def _ensure_object(self, session: Session, object_id: int) -> None:
+        if session.query(ObjectDB.id).filter(ObjectDB.id == object_id).first() is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Object with id {object_id} not found"
+            )
+
+    # メッセージの追加
+    def append_message(self, object_id: int, message_data: MessageCreate) -> Message:
+        self._validate_message(message_data)
+
+        def _append(session: Session) -> Message:
+            self._ensure_object(session, object_id)
+
+            created_at = now_ms()
+            # トークン数は書き込み時に1回だけ数え、プロンプトを組み立てる際は数え直さない
+            tokens = estimate_tokens(message_data.content)
+            db_message = ChatMessageDB(
+                object_id=object_id,
+                sender=message_data.sender,
+                content=message_data.content,
+                tokens=tokens,
+                created_at=created_at
+            )
+            session.add(db_message)
+            session.flush()
+            session.refresh(db_message)
+
+            # 会話の最新メッセージ・件数・未要約のトークン数を同じトランザクションで更新する
+            # NPCのメッセージは未読に数え、プレイヤーが送信した時点で会話は既読とする
+            from_npc = message_data.sender == "npc"
+            session.execute(
+                insert(ConversationDB)
+                .values(
+                    object_id=object_id,
+                    latest_message_id=db_message.id,
+                    latest_at=created_at,
+                    message_count=1,
+                    unread_count=1 if from_npc else 0,
+                    last_read_message_id=None if from_npc else db_message.id,
+                    pending_count=1,
+                    pending_tokens=tokens
+                )
+                .on_conflict_do_update(
+                    index_elements=[ConversationDB.object_id],
+                    set_={
+                        "latest_message_id": db_message.id,
+                        "latest_at": created_at,
+                        "message_count": ConversationDB.message_count + 1,
+                        "unread_count": ConversationDB.unread_count + 1 if from_npc else 0,
+                        "last_read_message_id": ConversationDB.last_read_message_id if from_npc else db_message.id,
+                        "pending_count": ConversationDB.pending_count + 1,
+                        "pending_tokens": ConversationDB.pending_tokens + tokens,
+                    }
+                )
+            )
+            return _to_message(db_message)
+
+        message = self.writer.run(_append)
+        # コミット後に変更を通知
+        publish("message.created", object_id, message)
+        return message
+
+    # 会話の履歴を新しい方から1ページ取得（ページ内は古い順）
+    def get_messages(self, object_id: int, before_id: Optional[int] = None, limit: int = 50) -> MessagePage:
+        self._validate_limit(limit)
+
+        # limit+1件取得して続きがあるか判定する
+        db_query = self.db.query(ChatMessageDB).filter(ChatMessageDB.object_id == object_id)
+        if before_id is not None:
+            db_query = db_query.filter(ChatMessageDB.id < before_id)
+        db_messages = db_query.order_by(ChatMessageDB.id.desc()).limit(limit + 1).all()
+
+        if not db_messages and before_id is None:
+            self._ensure_object(self.db, object_id)
+
+        has_more = len(db_messages) > limit
+        db_messages = db_messages[:limit]
+        db_messages.reverse()
+        return MessagePage(
+            object_id=object_id,
+            messages=[_to_message(db_message) for db_message in db_messages],
+            next_before_id=db_messages[0].id if has_more else None,
+            has_more=has_more
+        )
+
+    def _preview_query(self):
+        # 会話・最新のメッセージ・オブジェクト名を1回のクエリで取得する
+        return (
+            self.db.query(ConversationDB, ChatMessageDB, ObjectDB.name)
+            .join(ChatMessageDB, ChatMessageDB.id == ConversationDB.latest_message_id)
+            .join(ObjectDB, ObjectDB.id == ConversationDB.object_id)
+        )
+
+    def _to_preview(self, row) -> ConversationPreview:
+        conversation, latest_message, object_name = row
+        return ConversationPreview(
+            object_id=conversation.object_id,
+            object_name=object_name,
+            latest_message=_to_message(latest_message),
+            message_count=conversation.message_count,
+            unread_count=conversation.unread_count
+        )
+
+    # 会話の一覧を新しい順に取得
+    def get_conversations(self, cursor: Optional[str] = None, limit: int = 50) -> ConversationList:
+        self._validate_limit(limit)
+
+        db_query = self._preview_query().add_columns(_LATEST_AT_MS)
+        if cursor is not None:
+            latest_at_ms, object_id = _parse_cursor(cursor)
+            db_query = db_query.filter(tuple_(_LATEST_AT_MS, ConversationDB.object_id) < (latest_at_ms, object_id))
+        rows = (
+            db_query
+            .order_by(ConversationDB.latest_at.desc(), ConversationDB.object_id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = _format_cursor(last.latest_at_ms, last[0].object_id)
+        return ConversationList(
+            conversations=[self._to_preview(row[:3]) for row in rows],
+            next_cursor=next_cursor
+        )
+
+    # 単一の会話の取得
+    def get_conversation(self, object_id: int) -> ConversationPreview:
+        row = self._preview_query().filter(ConversationDB.object_id == object_id).first()
+        if row is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Conversation with object id {object_id} not found"
+            )
+        return self._to_preview(row)
+
+    # 既読にする
+    def mark_read(self, object_id: int, message_id: Optional[int] = None) -> ConversationPreview:
+        def _mark_read(session: Session) -> None:
+            conversation = session.query(ConversationDB).filter(ConversationDB.object_id == object_id).first()
+            if conversation is None:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Conversation with object id {object_id} not found"
+                )
+            if message_id is None or message_id >= conversation.latest_message_id:
+                conversation.unread_count = 0
+                conversation.last_read_message_id = conversation.latest_message_id
+                return
+            # 指定したメッセージより後のNPCのメッセージを未読として数え直す
+            conversation.unread_count = session.query(func.count(ChatMessageDB.id)).filter(
+                ChatMessageDB.object_id == object_id,
+                ChatMessageDB.id > message_id,
+                ChatMessageDB.sender == "npc"
+            ).scalar()
+            conversation.last_read_message_id = max(message_id, conversation.last_read_message_id or 0)
+
+        self.writer.run(_mark_read)
+        return self.get_conversation(object_id)
+
+# サービスのファクトリー関数
+def get_conversation_service(db: Session) -> ConversationService:
+    return ConversationService(db, writer=get_writer())
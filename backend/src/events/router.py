@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from utils.events import get_event_bus
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+# 接続維持のためのコメントを送る間隔（秒）
+HEARTBEAT_INTERVAL = 15.0
+
+# 変更通知の購読（Server-Sent Events）
+@router.get("/stream")
+async def stream_events(
+    object_id: Optional[List[int]] = Query(None, description="通知を受け取るオブジェクトID（複数指定可、省略時はすべて）")
+):
+    """memories・summaries・objectsの作成・更新・削除をServer-Sent Eventsで配信"""
+    subscription = get_event_bus().subscribe(set(object_id) if object_id else None)
+
+    async def event_stream():
+        try:
+            # 接続直後に購読開始を通知する
+            yield ": subscribed\n\n"
+            # クライアントが切断するとStreamingResponseによってこのジェネレーターは中断される
+            while True:
+                events = await subscription.next_batch(HEARTBEAT_INTERVAL)
+                if not events:
+                    yield ": keep-alive\n\n"
+                    continue
+                dropped = subscription.take_dropped()
+                if dropped:
+                    # バッファからあふれた場合はクライアントに再取得を促す
+                    yield f"event: overflow\ndata: {{\"dropped\":{dropped}}}\n\n"
+                for event in events:
+                    yield f"id: {event.seq}\nevent: {event.type}\ndata: {event.payload}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -8,15 +8,30 @@ import uvicorn
 
 # データベース関連のインポート
 from utils.database import create_tables
+from utils.writer import get_writer, stop_writer
+from utils.admission import AdmissionMiddleware, get_admission_controller
+from utils.scheduler import PeriodicTask
 # すべてのデータベースモデルをインポート（テーブル作成のため）
-from utils.db_models import ObjectDB, MemoryDB, SummaryDB
+from utils.db_models import ObjectDB, MemoryDB, SummaryDB, ChangeLogDB, ChangeLogStateDB, ObjectStatsDB, GlobalStatsDB, ChatMessageDB, ConversationDB
 
 # memoriesモジュールをインポート
 from memories import router as memories_router
 # objectsモジュールをインポート
-from objects import router as objects_router
+from objects import router as objects_router, sweep_orphans
 # summariesモジュールをインポート
 from summaries import router as summaries_router
+# metricsモジュールをインポート
+from metrics import router as metrics_router
+# eventsモジュールをインポート
+from events import router as events_router
+# changesモジュールをインポート
+from changes import router as changes_router, compact_changes
+# statsモジュールをインポート
+from stats import router as stats_router
+# conversationsモジュールをインポート
+from conversations import router as conversations_router
+# npcモジュールをインポート
+from npc import router as npc_router, get_inference_engine, get_inference_scheduler, stop_inference_scheduler, get_conversation_summarizer, stop_conversation_summarizer
 
 # FastAPIアプリケーションのインスタンスを作成
 app = FastAPI(
@@ -25,6 +40,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# 流量制御ミドルウェアを追加（ルートごとの同時実行数を制限し、処理しきれない場合は503を返す）
+app.add_middleware(AdmissionMiddleware, controller=get_admission_controller())
+
 # CORSミドルウェアを追加（フロントエンドとの通信を許可）
 app.add_middleware(
     CORSMiddleware,
@@ -34,11 +52,47 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 定期的に実行するバックグラウンド処理
+background_tasks = [
+    # 変更ログの圧縮
+    PeriodicTask(
+        "change-log-compaction",
+        float(os.getenv("CHANGE_LOG_COMPACTION_INTERVAL", "300")),
+        lambda: get_writer().run(compact_changes)
+    ),
+    # 削除されたオブジェクトに残ったメモリ・サマリーの掃除
+    PeriodicTask(
+        "orphan-sweeper",
+        float(os.getenv("ORPHAN_SWEEP_INTERVAL", "600")),
+        lambda: get_writer().run(sweep_orphans)
+    ),
+]
+
 # アプリケーション起動時にデータベースを初期化
 @app.on_event("startup")
 async def startup_event():
     # データベーステーブルを作成
     create_tables()
+    # 書き込みキューを起動
+    get_writer().start()
+    # LLMの読み込みを開始（完了を待たずに起動する）
+    get_inference_engine().start()
+    # 推論の待ち行列を処理するスレッドを開始
+    get_inference_scheduler().start()
+    # 会話の要約を行うスレッドを開始
+    get_conversation_summarizer().start()
+    # バックグラウンド処理を開始
+    for task in background_tasks:
+        task.start()
+
+# アプリケーション終了時にバックグラウンド処理・会話の要約・推論の待ち行列・書き込みキューを停止
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in background_tasks:
+        task.stop()
+    stop_conversation_summarizer()
+    stop_inference_scheduler()
+    stop_writer()
 
 # memoriesルーターを追加
 app.include_router(memories_router)
@@ -46,6 +100,18 @@ app.include_router(memories_router)
 app.include_router(objects_router)
 # summariesルーターを追加
 app.include_router(summaries_router)
+# metricsルーターを追加
+app.include_router(metrics_router)
+# eventsルーターを追加
+app.include_router(events_router)
+# changesルーターを追加
+app.include_router(changes_router)
+# statsルーターを追加
+app.include_router(stats_router)
+# conversationsルーターを追加
+app.include_router(conversations_router)
+# npcルーターを追加
+app.include_router(npc_router)
 
 # サーバー起動用のメイン関数
 if __name__ == "__main__":
@@ -10,6 +10,7 @@ class Memory(BaseModel):
     importance: int = Field(default=5, description="重要度（1-9の整数値）")
     timestamp: datetime  # 作成時に必ず設定される
     last_accessed: datetime  # 作成・取得時に必ず設定される
+    version: int  # 更新のたびに1ずつ増える
 
 # 作成のリクエストパラメーター
 class MemoryCreate(BaseModel):
@@ -21,6 +22,7 @@ class MemoryCreate(BaseModel):
 class MemoryUpdate(BaseModel):
     content: Optional[str] = None
     importance: Optional[int] = Field(default=None, description="重要度（1-9の整数値）")
+    expected_version: Optional[int] = Field(default=None, description="更新前に期待するバージョン（一致しない場合は409）")
 
 # 取得のリクエストパラメーター
 class MemoryQuery(BaseModel):
@@ -1,27 +1,31 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Header, Response
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from .models import Memory, MemoryCreate, MemoryUpdate, MemoryQuery
 from .service import get_memory_service
 from utils.database import get_db
+from utils.etag import format_etag, parse_if_match
 
 router = APIRouter(prefix="/memories", tags=["memories"])
 
 # レコードの作成
 @router.post("/", response_model=Memory)
-async def create_memory(memory_data: MemoryCreate, db: Session = Depends(get_db)):
+def create_memory(memory_data: MemoryCreate, db: Session = Depends(get_db)):
     memory_service = get_memory_service(db)
     return memory_service.create_memory(memory_data)
 
 # 単一レコードの取得
 @router.get("/{memory_id}", response_model=Memory)
-async def get_memory(memory_id: int, db: Session = Depends(get_db)):
+def get_memory(memory_id: int, response: Response, db: Session = Depends(get_db)):
     memory_service = get_memory_service(db)
-    return memory_service.get_memory(memory_id)
+    result = memory_service.get_memory(memory_id)
+    # 更新時にIf-Matchで指定できるようバージョンをETagで返す
+    response.headers["ETag"] = format_etag(result.version)
+    return result
 
 # レコードの取得（複数）
 @router.get("/", response_model=List[Memory])
-async def get_memories(
+def get_memories(
     object_id: int = Query(..., description="オブジェクトID"),
     limit: Optional[int] = Query(10, description="取得件数制限"),
     db: Session = Depends(get_db)
@@ -35,13 +39,21 @@ async def get_memories(
 
 # レコードの更新
 @router.put("/{memory_id}", response_model=Memory)
-async def update_memory(memory_id: int, update_data: MemoryUpdate, db: Session = Depends(get_db)):
+def update_memory(
+    memory_id: int,
+    update_data: MemoryUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="更新前に期待するバージョン（一致しない場合は409）"),
+    db: Session = Depends(get_db)
+):
     memory_service = get_memory_service(db)
-    return memory_service.update_memory(memory_id, update_data)
+    result = memory_service.update_memory(memory_id, update_data, expected_version=parse_if_match(if_match))
+    response.headers["ETag"] = format_etag(result.version)
+    return result
 
 # レコードの削除
 @router.delete("/{memory_id}")
-async def delete_memory(memory_id: int, db: Session = Depends(get_db)):
+def delete_memory(memory_id: int, db: Session = Depends(get_db)):
     memory_service = get_memory_service(db)
     memory_service.delete_memory(memory_id)
     return {"message": f"Memory {memory_id} deleted successfully"}
\ No newline at end of file
@@ -1,15 +1,21 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 from .models import Memory, MemoryCreate, MemoryUpdate, MemoryQuery
 from utils.db_models import MemoryDB, ObjectDB
 from utils.database import get_db
-import pytz
+from utils.writer import SessionWriter, get_writer
+from utils.events import publish
+from utils.timestamps import now_ms, from_epoch_ms
+from changes.service import record_change
 
 class MemoryService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, writer=None):
         self.db = db
+        # 書き込みはライター経由で行う（未指定の場合はこのセッションで直接コミット）
+        self.writer = writer or SessionWriter(db)
 
     def _validate_importance(self, importance: int) -> None:
         """importanceの値が1から9の範囲内であることを確認"""
@@ -27,6 +33,19 @@ class MemoryService:
                 detail="Content must be at least 1 character long"
             )
 
+    def _touch(self, memory_ids: List[int]) -> datetime:
+        """指定したmemoryのlast_accessedを現在時刻に更新し、保存された値を返す"""
+        current_time = now_ms()
+        
+        def _update_last_accessed(session: Session) -> None:
+            session.query(MemoryDB).filter(MemoryDB.id.in_(memory_ids)).update(
+                {MemoryDB.last_accessed: current_time}, synchronize_session=False
+            )
+        
+        self.writer.run(_update_last_accessed)
+        # 保存したエポックミリ秒を表示用の日時に変換して返す
+        return from_epoch_ms(current_time)
+
     # レコードの作成
     def create_memory(self, memory_data: MemoryCreate) -> Memory:
         # contentのバリデーション
@@ -35,34 +54,44 @@ class MemoryService:
         # importanceのバリデーション
         self._validate_importance(memory_data.importance)
         
-        # 外部キー（object_id）の存在確認
-        existing_object = self.db.query(ObjectDB).filter(ObjectDB.id == memory_data.object_id).first()
-        if not existing_object:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Object with id {memory_data.object_id} not found"
+        def _create(session: Session) -> Memory:
+            # 外部キー（object_id）の存在確認
+            existing_object = session.query(ObjectDB).filter(ObjectDB.id == memory_data.object_id).first()
+            if not existing_object:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Object with id {memory_data.object_id} not found"
+                )
+            
+            db_memory = MemoryDB(
+                object_id=memory_data.object_id,
+                content=memory_data.content,
+                importance=memory_data.importance,
+                timestamp=now_ms(),
+                last_accessed=now_ms()
             )
-        
-        db_memory = MemoryDB(
-            object_id=memory_data.object_id,
-            content=memory_data.content,
-            importance=memory_data.importance,
-            timestamp=datetime.now(pytz.timezone('Asia/Tokyo')),
-            last_accessed=datetime.now(pytz.timezone('Asia/Tokyo'))
-        )
-        
-        self.db.add(db_memory)
-        self.db.commit()
-        self.db.refresh(db_memory)
-        
-        return Memory(
-            id=db_memory.id,
-            object_id=db_memory.object_id,
-            content=db_memory.content,
-            importance=db_memory.importance,
-            timestamp=db_memory.timestamp,
-            last_accessed=db_memory.last_accessed
-        )
+            
+            session.add(db_memory)
+            session.flush()
+            session.refresh(db_memory)
+            
+            memory = Memory(
+                id=db_memory.id,
+                object_id=db_memory.object_id,
+                content=db_memory.content,
+                importance=db_memory.importance,
+                timestamp=db_memory.timestamp,
+                last_accessed=db_memory.last_accessed,
+                version=db_memory.version
+            )
+            # 同じトランザクション内で変更ログを記録
+            record_change(session, "memory", memory.id, memory.object_id, "upsert", memory)
+            return memory
+        
+        memory = self.writer.run(_create)
+        # コミット後に変更を通知
+        publish("memory.created", memory.object_id, memory)
+        return memory
 
     # 単一レコードの取得
     def get_memory(self, memory_id: int) -> Memory:
@@ -75,8 +104,7 @@ class MemoryService:
             )
         
         # last_accessedを更新
-        db_memory.last_accessed = datetime.now(pytz.timezone('Asia/Tokyo'))
-        self.db.commit()
+        current_time = self._touch([memory_id])
         
         return Memory(
             id=db_memory.id,
@@ -84,7 +112,8 @@ class MemoryService:
             content=db_memory.content,
             importance=db_memory.importance,
             timestamp=db_memory.timestamp,
-            last_accessed=db_memory.last_accessed
+            last_accessed=current_time,
+            version=db_memory.version
         )
 
     # レコードの取得（複数）
@@ -107,11 +136,7 @@ class MemoryService:
             )
         
         # 取得したすべてのmemoryのlast_accessedを更新
-        current_time = datetime.now(pytz.timezone('Asia/Tokyo'))
-        for db_memory in db_memories:
-            db_memory.last_accessed = current_time
-        
-        self.db.commit()
+        current_time = self._touch([db_memory.id for db_memory in db_memories])
         
         return [
             Memory(
@@ -120,72 +145,111 @@ class MemoryService:
                 content=db_memory.content,
                 importance=db_memory.importance,
                 timestamp=db_memory.timestamp,
-                last_accessed=db_memory.last_accessed
+                last_accessed=current_time,
+                version=db_memory.version
             )
             for db_memory in db_memories
         ]
 
     # レコードの更新
-    def update_memory(self, memory_id: int, update_data: MemoryUpdate) -> Memory:
-        db_memory = self.db.query(MemoryDB).filter(MemoryDB.id == memory_id).first()
-        
-        if not db_memory:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Memory with id {memory_id} not found"
+    def update_memory(self, memory_id: int, update_data: MemoryUpdate, expected_version: Optional[int] = None) -> Memory:
+        try:
+            update_dict = update_data.model_dump(exclude_unset=True)
+        
+            # 空文字列やNoneのフィールドを除外
+            valid_update_dict = {}
+            for key, value in update_dict.items():
+                if key == 'content':
+                    # contentの場合は空文字列や空白のみの場合は除外
+                    if value is not None and len(str(value).strip()) > 0:
+                        self._validate_content(value)
+                        valid_update_dict[key] = value
+                elif key == 'importance':
+                    # importanceの場合はNoneでなければバリデーション
+                    if value is not None:
+                        self._validate_importance(value)
+                        valid_update_dict[key] = value
+        
+            # 更新するフィールドがない場合は400エラー
+            if not valid_update_dict:
+                raise HTTPException(
+                    status_code=400,
+                    detail="No valid fields to update. All provided fields are empty or invalid."
+                )
+        except HTTPException as exc:
+            # 入力が不正な場合だけ存在を確認し、存在しなければ404を優先する（更新が成功する場合は事前のSELECTを行わない）
+            if exc.status_code == 400 and not self.db.query(MemoryDB.id).filter(MemoryDB.id == memory_id).first():
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Memory with id {memory_id} not found"
+                )
+            raise
+        
+        # 期待するバージョンの指定がなければリクエストボディの値を使う
+        if expected_version is None:
+            expected_version = update_data.expected_version
+        
+        valid_update_dict["last_accessed"] = now_ms()
+        valid_update_dict["version"] = MemoryDB.version + 1
+        
+        def _update(session: Session) -> Memory:
+            # 事前のSELECTを行わず、1回のUPDATE ... RETURNINGで更新と結果の取得を行う
+            stmt = update(MemoryDB).where(MemoryDB.id == memory_id)
+            if expected_version is not None:
+                stmt = stmt.where(MemoryDB.version == expected_version)
+            stmt = stmt.values(valid_update_dict).returning(
+                MemoryDB.id,
+                MemoryDB.object_id,
+                MemoryDB.content,
+                MemoryDB.importance,
+                MemoryDB.timestamp,
+                MemoryDB.last_accessed,
+                MemoryDB.version
             )
-        
-        update_dict = update_data.model_dump(exclude_unset=True)
-        
-        # 空文字列やNoneのフィールドを除外
-        valid_update_dict = {}
-        for key, value in update_dict.items():
-            if key == 'content':
-                # contentの場合は空文字列や空白のみの場合は除外
-                if value is not None and len(str(value).strip()) > 0:
-                    self._validate_content(value)
-                    valid_update_dict[key] = value
-            elif key == 'importance':
-                # importanceの場合はNoneでなければバリデーション
-                if value is not None:
-                    self._validate_importance(value)
-                    valid_update_dict[key] = value
-        
-        # 更新するフィールドがない場合は400エラー
-        if not valid_update_dict:
-            raise HTTPException(
-                status_code=400,
-                detail="No valid fields to update. All provided fields are empty or invalid."
-            )
-        
-        for key, value in valid_update_dict.items():
-            setattr(db_memory, key, value)
-        
-        db_memory.last_accessed = datetime.now(pytz.timezone('Asia/Tokyo'))
-        self.db.commit()
-        
-        return Memory(
-            id=db_memory.id,
-            object_id=db_memory.object_id,
-            content=db_memory.content,
-            importance=db_memory.importance,
-            timestamp=db_memory.timestamp,
-            last_accessed=db_memory.last_accessed
-        )
+            row = session.execute(stmt, execution_options={"synchronize_session": False}).first()
+            
+            if row is None:
+                # 更新できなかった場合のみ、存在しないのかバージョンが一致しないのかを確認する
+                if not session.query(MemoryDB.id).filter(MemoryDB.id == memory_id).first():
+                    raise HTTPException(
+                        status_code=404,
+                        detail=f"Memory with id {memory_id} not found"
+                    )
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Memory with id {memory_id} has been modified (expected version {expected_version})"
+                )
+            
+            memory = Memory(**row._mapping)
+            # 同じトランザクション内で変更ログを記録
+            record_change(session, "memory", memory.id, memory.object_id, "upsert", memory)
+            return memory
+        
+        memory = self.writer.run(_update)
+        # コミット後に変更を通知
+        publish("memory.updated", memory.object_id, memory)
+        return memory
 
     # レコードの削除
     def delete_memory(self, memory_id: int) -> None:
-        db_memory = self.db.query(MemoryDB).filter(MemoryDB.id == memory_id).first()
-        
-        if not db_memory:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Memory with id {memory_id} not found"
-            )
-        
-        self.db.delete(db_memory)
-        self.db.commit()
+        def _delete(session: Session) -> int:
+            db_memory = session.query(MemoryDB).filter(MemoryDB.id == memory_id).first()
+            
+            if not db_memory:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Memory with id {memory_id} not found"
+                )
+            
+            object_id = db_memory.object_id
+            session.delete(db_memory)
+            record_change(session, "memory", memory_id, object_id, "delete")
+            return object_id
+        
+        object_id = self.writer.run(_delete)
+        # コミット後に変更を通知
+        publish("memory.deleted", object_id, {"id": memory_id})
 
 # サービスのファクトリー関数
 def get_memory_service(db: Session) -> MemoryService:
-    return MemoryService(db) 
\ No newline at end of file
+    return MemoryService(db, writer=get_writer()) 
\ No newline at end of file
@@ -0,0 +1,45 @@
+from fastapi import APIRouter
+from utils.admission import get_admission_controller
+from utils.singleflight import get_read_coalescer
+from utils.events import get_event_bus
+from npc.inference import get_inference_engine
+from npc.scheduler import get_inference_scheduler
+from npc.summarizer import get_conversation_summarizer
+from npc.context import get_context_cache
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+# 流量制御の待ち行列の状況を取得
+@router.get("/admission")
+def get_admission_metrics():
+    """ルートグループごとの実行数・待ち行列の長さ・拒否数を取得"""
+    return get_admission_controller().metrics()
+
+# 読み込みの集約状況を取得
+@router.get("/singleflight")
+def get_singleflight_metrics():
+    """実際に実行した読み込み数と、実行中の結果を共有した数を取得"""
+    return get_read_coalescer().metrics()
+
+# 変更通知の配信状況を取得
+@router.get("/events")
+def get_event_metrics():
+    """発行したイベント数・購読者数・未送信のイベント数を取得"""
+    return get_event_bus().metrics()
+
+
+# LLMの状態を取得
+@router.get("/llm")
+def get_llm_metrics():
+    """モデルの読み込み状況・読み込み時間・推論数と、待ち行列の待ち時間・生成速度・会話の要約の状況を取得"""
+    return {
+        **get_inference_engine().metrics(),
+        "scheduler": get_inference_scheduler().metrics(),
+        "summarizer": get_conversation_summarizer().metrics(),
+    }
+
+# プロンプトの文脈のキャッシュの状況を取得
+@router.get("/context")
+def get_context_metrics():
+    """組み立てた文脈・メモリごとのトークン数のキャッシュのヒット数と、新たに数えたトークン数を取得"""
+    return get_context_cache().metrics()
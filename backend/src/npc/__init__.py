@@ -0,0 +1,35 @@
+from .models import ChatRequest, ChatResponse, PromptContext
+from .context import ContextBuilder, ContextCache, get_context_builder, get_context_cache
+from .inference import InferenceBackend, LlamaCppBackend, FakeBackend, InferenceEngine, get_inference_engine, set_inference_engine
+from .scheduler import InferenceScheduler, InferenceJob, JobCancelled, SchedulerFull, get_inference_scheduler, stop_inference_scheduler
+from .summarizer import ConversationSummarizer, get_conversation_summarizer, stop_conversation_summarizer
+from .service import NPCService, get_npc_service
+from .router import router
+
+__all__ = [
+    "ChatRequest",
+    "ChatResponse",
+    "PromptContext",
+    "ContextBuilder",
+    "ContextCache",
+    "get_context_builder",
+    "get_context_cache",
+    "InferenceBackend",
+    "LlamaCppBackend",
+    "FakeBackend",
+    "InferenceEngine",
+    "get_inference_engine",
+    "set_inference_engine",
+    "InferenceScheduler",
+    "InferenceJob",
+    "JobCancelled",
+    "SchedulerFull",
+    "get_inference_scheduler",
+    "stop_inference_scheduler",
+    "ConversationSummarizer",
+    "get_conversation_summarizer",
+    "stop_conversation_summarizer",
+    "NPCService",
+    "get_npc_service",
+    "router"
+]
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import diskcache
+except ImportError:  # diskcacheがない環境ではプロセス内のLRUで代用する
+    diskcache = None
+
+# キャッシュの設定（環境変数で変更可能）
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", "./data/llm_cache")
+LLM_RESPONSE_CACHE = os.getenv("LLM_RESPONSE_CACHE", "true").lower() in ("1", "true", "yes")
+LLM_RESPONSE_CACHE_SIZE_MB = int(os.getenv("LLM_RESPONSE_CACHE_SIZE_MB", "256"))
+LLM_PREFIX_CACHE_SIZE_MB = int(os.getenv("LLM_PREFIX_CACHE_SIZE_MB", "1024"))
+# diskcacheがない場合にメモリ上に保持する件数
+MEMORY_CACHE_ENTRIES = int(os.getenv("LLM_MEMORY_CACHE_ENTRIES", "256"))
+
+_WHITESPACE = re.compile(r"[ \t　]+")
+
+def normalize_prompt(prompt: str) -> str:
+    """空白の違いだけのプロンプトが同じキーになるよう正規化する"""
+    lines = [_WHITESPACE.sub(" ", line).strip() for line in prompt.strip().splitlines()]
+    return "\n".join(line for line in lines if line)
+
+def make_key(namespace: str, prompt: str, normalize: bool = True, **params: Any) -> str:
+    """（正規化した）プロンプトとパラメーターのハッシュをキーにする"""
+    payload = json.dumps({"prompt": normalize_prompt(prompt) if normalize else prompt, **params}, ensure_ascii=False, sort_keys=True)
+    return f"{namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+class MemoryStore:
+    """diskcacheの代わりに使う件数上限付きのLRU"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def close(self) -> None:
+        pass
+
+class CacheStore:
+    """
+    サイズ上限付きの永続キャッシュ。diskcacheが使える場合はディスクに保存し、LRUで古いものから削除する。
+    ヒット数・ミス数を記録する。
+    """
+
+    def __init__(self, name: str, size_limit_mb: int, directory: Optional[str] = LLM_CACHE_DIR):
+        self.name = name
+        if diskcache is not None and directory:
+            self.backend = "diskcache"
+            self._store = diskcache.Cache(
+                os.path.join(directory, name),
+                size_limit=size_limit_mb * 1024 * 1024,
+                eviction_policy="least-recently-used"
+            )
+        else:
+            self.backend = "memory"
+            self._store = MemoryStore(MEMORY_CACHE_ENTRIES)
+        # 統計情報
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        value = self._store.get(key, None)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._store.set(key, value)
+
+    def close(self) -> None:
+        self._store.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": len(self._store),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+        }
+
+class ResponseCache:
+    """完了した応答をプロンプトと生成パラメーターごとに保存するキャッシュ"""
+
+    def __init__(self, store: CacheStore):
+        self.store = store
+
+    def key(self, model: str, prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]]) -> str:
+        return make_key("response", prompt, model=model, max_tokens=max_tokens, temperature=temperature, stop=stop or [])
+
+    def get(self, key: str) -> Optional[str]:
+        return self.store.get(key)
+
+    def set(self, key: str, text: str) -> None:
+        self.store.set(key, text)
+
+class PrefixStateCache:
+    """
+    NPCごとの共通部分（人物・サマリー・メモリ）を評価した後のモデルの状態を保存するキャッシュ。
+    同じ共通部分から始まる会話では、保存した状態を読み込んで共通部分の再評価を省く。
+    """
+
+    def __init__(self, store: CacheStore):
+        self.store = store
+
+    def load_or_create(self, model: str, prefix: str, load: Callable[[Any], None], create: Callable[[], Any]) -> bool:
+        """保存済みの状態があればloadに渡して読み込み、なければcreateで作成して保存する。読み込めた場合はTrue"""
+        # トークン列が一致する必要があるため正規化しない
+        key = make_key("prefix", prefix, normalize=False, model=model)
+        state = self.store.get(key)
+        if state is not None:
+            load(state)
+            return True
+        self.store.set(key, create())
+        return False
@@ -0,0 +1,206 @@
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import func, type_coerce, Integer
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from .cache import MemoryStore
+from .models import PromptContext
+from utils.db_models import ObjectDB, MemoryDB, SummaryDB, ChangeLogDB
+from utils.tokens import estimate_tokens
+
+# プロンプトの文脈の設定（環境変数で変更可能）
+NPC_CONTEXT_BUDGET = int(os.getenv("NPC_CONTEXT_BUDGET", "1024"))  # 会話のプロンプトに使うトークン数
+CONTEXT_MAX_BUDGET = int(os.getenv("CONTEXT_MAX_BUDGET", "8192"))
+# メモリのスコアで新しさの重みが半分になる時間
+MEMORY_RECENCY_HALF_LIFE_HOURS = float(os.getenv("MEMORY_RECENCY_HALF_LIFE_HOURS", "72"))
+# メモリごとのトークン数・組み立てた文脈を保持する件数
+CONTEXT_FRAGMENT_CACHE_ENTRIES = int(os.getenv("CONTEXT_FRAGMENT_CACHE_ENTRIES", "100000"))
+CONTEXT_CACHE_ENTRIES = int(os.getenv("CONTEXT_CACHE_ENTRIES", "1024"))
+
+PLAYER_NAME = "プレイヤー"
+
+# 本文を取得する際に1回のクエリで指定するIDの数
+_FETCH_CHUNK = 500
+_TIMESTAMP_MS = type_coerce(MemoryDB.timestamp, Integer).label("timestamp")
+
+def memory_score(importance: int, timestamp: Optional[int], newest: Optional[int]) -> float:
+    """
+    重要度（0〜1）と、オブジェクトの最新のメモリを基準にした新しさ（0〜1）の和。
+    last_accessedは参照のたびに変わるため使わず、同じデータからは常に同じ順位になるようにする。
+    """
+    age_hours = max(newest - timestamp, 0) / 3_600_000 if timestamp is not None and newest is not None else 0
+    return importance / 9 + 0.5 ** (age_hours / MEMORY_RECENCY_HALF_LIFE_HOURS)
+
+class ContextCache:
+    """
+    プロセス全体で共有する文脈のキャッシュ。
+    メモリごとの断片とトークン数はバージョンが変わるまで再利用し、組み立てた文脈はオブジェクトの変更番号が変わるまで再利用する。
+    """
+
+    def __init__(self, fragment_entries: int = CONTEXT_FRAGMENT_CACHE_ENTRIES, context_entries: int = CONTEXT_CACHE_ENTRIES):
+        self.fragments = MemoryStore(fragment_entries)
+        self.contexts = MemoryStore(context_entries)
+        # 統計情報
+        self.context_hits = 0
+        self.context_misses = 0
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+        self.tokens_counted = 0
+
+    def clear(self) -> None:
+        self.fragments = MemoryStore(self.fragments.max_entries)
+        self.contexts = MemoryStore(self.contexts.max_entries)
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "contexts": len(self.contexts),
+            "context_hits": self.context_hits,
+            "context_misses": self.context_misses,
+            "fragments": len(self.fragments),
+            "fragment_hits": self.fragment_hits,
+            "fragment_misses": self.fragment_misses,
+            "tokens_counted": self.tokens_counted,
+        }
+
+_context_cache = ContextCache()
+
+def get_context_cache() -> ContextCache:
+    return _context_cache
+
+class ContextBuilder:
+    """オブジェクトの説明・最新のサマリー・スコアの高いメモリをトークン数の上限に収めて組み立てる"""
+
+    def __init__(self, db: Session, cache: Optional[ContextCache] = None, count_tokens: Callable[[str], int] = estimate_tokens):
+        self.db = db
+        # 未指定の場合はこのビルダーだけのキャッシュ（共有する場合はget_context_cacheを渡す）
+        self.cache = cache or ContextCache()
+        self.count_tokens = count_tokens
+
+    def _validate_budget(self, budget: int) -> None:
+        """budgetが1からCONTEXT_MAX_BUDGETの範囲内であることを確認"""
+        if budget < 1 or budget > CONTEXT_MAX_BUDGET:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Budget must be between 1 and {CONTEXT_MAX_BUDGET}"
+            )
+
+    def _fingerprint(self, object_id: int) -> Optional[int]:
+        """オブジェクト・メモリ・サマリーの最新の変更番号（どれかが変更されると変わる）"""
+        return self.db.query(func.max(ChangeLogDB.seq)).filter(ChangeLogDB.object_id == object_id).scalar()
+
+    def build(self, object_id: int, budget: int) -> PromptContext:
+        self._validate_budget(budget)
+
+        fingerprint = self._fingerprint(object_id)
+        cached = self.cache.contexts.get((object_id, budget))
+        if cached is not None and cached[0] == fingerprint:
+            self.cache.context_hits += 1
+            return cached[1]
+        self.cache.context_misses += 1
+
+        db_object = self.db.query(ObjectDB).filter(ObjectDB.id == object_id).first()
+        if not db_object:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Object with id {object_id} not found"
+            )
+
+        context = self._assemble(db_object, budget)
+        # 変更履歴のない行（サービスを通さずに書き込まれた行）は変更を検知できないためキャッシュしない
+        if fingerprint is not None:
+            self.cache.contexts.set((object_id, budget), (fingerprint, context))
+        return context
+
+    def _assemble(self, db_object: ObjectDB, budget: int) -> PromptContext:
+        # 説明は必ず含める
+        parts = [
+            f"以下は{db_object.name}と{PLAYER_NAME}の会話です。{db_object.name}として自然に1文で返答してください。\n"
+            f"# 人物\n{db_object.description}\n"
+        ]
+        used = self.count_tokens(parts[0])
+        if used > budget:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Budget is too small for the object description ({used} tokens required)"
+            )
+
+        summary_id = None
+        summary = self.db.get(SummaryDB, db_object.latest_summary_id) if db_object.latest_summary_id else None
+        if summary is not None:
+            block = (
+                "# 現在の様子\n"
+                f"特徴: {summary.key_features}\n"
+                f"日課: {summary.current_daily_tasks}\n"
+                f"最近の様子: {summary.recent_progress_feelings}\n"
+            )
+            tokens = self.count_tokens(block)
+            if used + tokens <= budget:
+                parts.append(block)
+                used += tokens
+                summary_id = summary.id
+
+        # スコアの計算に必要な列だけを（日時に変換せずエポックミリ秒のまま）読み込み、スコアの高い順に収まるものを詰める
+        rows = (
+            self.db.query(MemoryDB.id, MemoryDB.version, MemoryDB.importance, _TIMESTAMP_MS)
+            .filter(MemoryDB.object_id == db_object.id)
+            .all()
+        )
+        memory_ids: List[int] = []
+        if rows:
+            newest = max((row.timestamp for row in rows if row.timestamp is not None), default=None)
+            rows.sort(key=lambda row: (-memory_score(row.importance, row.timestamp, newest), -row.id))
+            fragments = self._memory_fragments(rows)
+            heading = "# 覚えていること\n"
+            heading_tokens = self.count_tokens(heading)
+            for row in rows:
+                if row.id not in fragments:
+                    # 読み込みの間に削除されたメモリ
+                    continue
+                fragment, tokens = fragments[row.id]
+                cost = tokens + (heading_tokens if not memory_ids else 0)
+                if used + cost > budget:
+                    continue
+                if not memory_ids:
+                    parts.append(heading)
+                parts.append(fragment)
+                used += cost
+                memory_ids.append(row.id)
+
+        return PromptContext(
+            object_id=db_object.id,
+            budget=budget,
+            used_tokens=used,
+            text="".join(parts),
+            summary_id=summary_id,
+            memory_ids=memory_ids,
+            omitted_memories=len(rows) - len(memory_ids)
+        )
+
+    def _memory_fragments(self, rows) -> Dict[int, Tuple[str, int]]:
+        """メモリごとの断片とトークン数。キャッシュにない（またはバージョンが古い）メモリだけ本文を読み込んで数える"""
+        fragments: Dict[int, Tuple[str, int]] = {}
+        missing = []
+        for row in rows:
+            # IDは削除後に再利用されることがあるため、バージョンと記録時刻が一致する場合だけ再利用する
+            cached = self.cache.fragments.get(row.id)
+            if cached is not None and cached[0] == (row.version, row.timestamp):
+                fragments[row.id] = cached[1:]
+            else:
+                missing.append(row.id)
+        self.cache.fragment_hits += len(fragments)
+        self.cache.fragment_misses += len(missing)
+
+        for start in range(0, len(missing), _FETCH_CHUNK):
+            chunk = missing[start:start + _FETCH_CHUNK]
+            for memory_id, version, timestamp, content in (
+                self.db.query(MemoryDB.id, MemoryDB.version, _TIMESTAMP_MS, MemoryDB.content).filter(MemoryDB.id.in_(chunk))
+            ):
+                fragment = f"- {content}\n"
+                tokens = self.count_tokens(fragment)
+                self.cache.tokens_counted += tokens
+                self.cache.fragments.set(memory_id, ((version, timestamp), fragment, tokens))
+                fragments[memory_id] = (fragment, tokens)
+        return fragments
+
+def get_context_builder(db: Session) -> ContextBuilder:
+    return ContextBuilder(db, cache=get_context_cache())
@@ -0,0 +1,271 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Iterator, List, Optional
+from utils.tokens import estimate_tokens
+from .cache import CacheStore, ResponseCache, PrefixStateCache, LLM_RESPONSE_CACHE, LLM_RESPONSE_CACHE_SIZE_MB, LLM_PREFIX_CACHE_SIZE_MB
+
+logger = logging.getLogger(__name__)
+
+# 推論の設定（環境変数で変更可能）
+LLM_BACKEND = os.getenv("LLM_BACKEND", "llama_cpp")  # "llama_cpp" / "fake"
+LLM_MODEL_PATH = os.getenv("LLM_MODEL_PATH", "./data/models/model.gguf")
+LLM_THREADS = int(os.getenv("LLM_THREADS", str(os.cpu_count() or 4)))
+LLM_CONTEXT_SIZE = int(os.getenv("LLM_CONTEXT_SIZE", "2048"))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "128"))
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+
+# モデルの状態
+STATUS_STOPPED = "stopped"
+STATUS_LOADING = "loading"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+
+class InferenceBackend:
+    """テキスト生成のバックエンド。load()はバックグラウンドスレッドから1回だけ呼ばれる"""
+
+    name = "base"
+
+    def load(self) -> None:
+        pass
+
+    def warm_up(self) -> None:
+        pass
+
+    def stream(self, prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]] = None, prefix: Optional[str] = None) -> Iterator[str]:
+        """
+        生成したテキストを断片ごとに返す。
+        prefixはpromptの先頭の共通部分で、対応するバックエンドはその評価結果を再利用する。
+        """
+        raise NotImplementedError
+
+    def generate(self, prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]] = None, prefix: Optional[str] = None) -> str:
+        return "".join(self.stream(prompt, max_tokens, temperature, stop, prefix))
+
+    def count_tokens(self, text: str) -> int:
+        """テキストのトークン数（max_tokensと同じ単位）。トークナイザーがない場合は概算"""
+        return estimate_tokens(text)
+
+    def metrics(self) -> dict:
+        return {}
+
+class LlamaCppBackend(InferenceBackend):
+    """llama_cppでGGUFモデルをCPU上で実行するバックエンド"""
+
+    name = "llama_cpp"
+
+    def __init__(self, model_path: str = LLM_MODEL_PATH, n_threads: int = LLM_THREADS, n_ctx: int = LLM_CONTEXT_SIZE, prefix_cache: Optional[PrefixStateCache] = None):
+        self.model_path = model_path
+        self.n_threads = n_threads
+        self.n_ctx = n_ctx
+        self.prefix_cache = prefix_cache
+        self.llm = None
+
+    def load(self) -> None:
+        # llama_cppは読み込みに時間がかかるため、実際に使う時点でインポートする
+        from llama_cpp import Llama
+        self.llm = Llama(
+            model_path=self.model_path,
+            n_threads=self.n_threads,
+            n_ctx=self.n_ctx,
+            n_gpu_layers=0,
+            verbose=False
+        )
+
+    def warm_up(self) -> None:
+        # 最初の推論で発生する初期化をここで済ませておく
+        self.llm("こんにちは", max_tokens=1)
+
+    def _eval_prefix(self, prefix: str):
+        """共通部分だけを評価した状態を作成"""
+        self.llm.reset()
+        self.llm.eval(self.llm.tokenize(prefix.encode("utf-8")))
+        return self.llm.save_state()
+
+    def stream(self, prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]] = None, prefix: Optional[str] = None) -> Iterator[str]:
+        if prefix and self.prefix_cache is not None and prompt.startswith(prefix):
+            # 共通部分の状態を読み込んでおくと、llama_cppは一致するトークンの評価を省いて続きから生成する
+            self.prefix_cache.load_or_create(
+                self.model_path,
+                prefix,
+                load=self.llm.load_state,
+                create=lambda: self._eval_prefix(prefix)
+            )
+        for chunk in self.llm(prompt, max_tokens=max_tokens, temperature=temperature, stop=stop or [], stream=True):
+            text = chunk["choices"][0]["text"]
+            if text:
+                yield text
+
+    def count_tokens(self, text: str) -> int:
+        if self.llm is None:
+            return estimate_tokens(text)
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def metrics(self) -> dict:
+        if self.prefix_cache is None:
+            return {}
+        return {"prefix_cache": self.prefix_cache.store.metrics()}
+
+class FakeBackend(InferenceBackend):
+    """テスト・開発用の決定的なバックエンド。同じプロンプトには常に同じ応答を返す"""
+
+    name = "fake"
+
+    def __init__(self, load_delay: float = 0.0, fail: bool = False, token_delay: float = 0.0):
+        self.load_delay = load_delay
+        self.fail = fail
+        # 1断片あたりの生成時間（秒）。推論が遅い場合の動作確認用
+        self.token_delay = token_delay
+
+    def load(self) -> None:
+        if self.load_delay:
+            time.sleep(self.load_delay)
+        if self.fail:
+            raise RuntimeError("fake backend failed to load")
+
+    def stream(self, prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]] = None, prefix: Optional[str] = None) -> Iterator[str]:
+        # プロンプトの最後の発言を含む応答を組み立て、max_tokens個の断片（1文字ずつ）に制限する
+        # 最終行の「：」以降は生成済みの部分とみなし、途中から再開した場合は続きだけを返す
+        generated = prompt.rsplit("\n", 1)[-1].partition("：")[2]
+        base = prompt[:len(prompt) - len(generated)]
+        lines = [line for line in base.splitlines() if line.strip()]
+        last_line = lines[-2] if len(lines) >= 2 else (lines[-1] if lines else "")
+        digest = hashlib.sha1(base.encode("utf-8")).hexdigest()[:6]
+        reply = f"「{last_line.split('：', 1)[-1].strip()}」ですね。({digest})"
+        if not reply.startswith(generated):
+            reply = generated
+        for char in reply[len(generated):][:max_tokens]:
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield char
+
+    def count_tokens(self, text: str) -> int:
+        # 1文字を1トークンとして生成する
+        return len(text)
+
+def create_backend(kind: str = LLM_BACKEND) -> InferenceBackend:
+    if kind == "fake":
+        return FakeBackend()
+    if kind == "llama_cpp":
+        return LlamaCppBackend(prefix_cache=PrefixStateCache(CacheStore("prefix", LLM_PREFIX_CACHE_SIZE_MB)))
+    raise ValueError(f"Unknown LLM backend: {kind}")
+
+class InferenceEngine:
+    """
+    ワーカープロセスごとに1つのモデルを保持する推論エンジン。
+    モデルの読み込みとウォームアップはバックグラウンドスレッドで行い、APIの起動を待たせない。
+    """
+
+    def __init__(self, backend: InferenceBackend, response_cache: Optional[ResponseCache] = None, model_name: Optional[str] = None):
+        self.backend = backend
+        self.response_cache = response_cache
+        # キャッシュのキーに含めるモデルの識別子（モデルを入れ替えた場合に古い応答を使わない）
+        self.model_name = model_name or getattr(backend, "model_path", backend.name)
+        self.status = STATUS_STOPPED
+        self.error: Optional[str] = None
+        self._ready = threading.Event()
+        self._state_lock = threading.Lock()
+        # llama_cppのモデルはスレッドセーフではないため推論は1件ずつ行う
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # 統計情報
+        self.load_seconds: Optional[float] = None
+        self.requests = 0
+        # 最初の断片が返るまでの時間（秒）の指数移動平均と直近の値
+        self.ttft_avg: Optional[float] = None
+        self.ttft_last: Optional[float] = None
+
+    def start(self) -> None:
+        """モデルの読み込みを開始する（完了は待たない）"""
+        with self._state_lock:
+            if self.status in (STATUS_LOADING, STATUS_READY):
+                return
+            self.status = STATUS_LOADING
+            self.error = None
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._load, name="llm-loader", daemon=True)
+            self._thread.start()
+
+    def _load(self) -> None:
+        started = time.monotonic()
+        try:
+            self.backend.load()
+            self.backend.warm_up()
+        except Exception as exc:
+            logger.exception("Failed to load LLM backend %s", self.backend.name)
+            self.error = str(exc)
+            self.status = STATUS_FAILED
+        else:
+            self.load_seconds = time.monotonic() - started
+            self.status = STATUS_READY
+        finally:
+            # 失敗した場合も待っている呼び出し元を起こす
+            self._ready.set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        self._ready.wait(timeout)
+        return self.status == STATUS_READY
+
+    def _record_ttft(self, started: float) -> None:
+        elapsed = time.monotonic() - started
+        self.ttft_last = elapsed
+        self.ttft_avg = elapsed if self.ttft_avg is None else self.ttft_avg * 0.9 + elapsed * 0.1
+
+    def stream(self, prompt: str, max_tokens: int = LLM_MAX_TOKENS, temperature: float = LLM_TEMPERATURE, stop: Optional[List[str]] = None, prefix: Optional[str] = None) -> Iterator[str]:
+        started = time.monotonic()
+        self.requests += 1
+        key = None
+        if self.response_cache is not None:
+            key = self.response_cache.key(self.model_name, prompt, max_tokens, temperature, stop)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                self._record_ttft(started)
+                yield cached
+                return
+
+        chunks = []
+        with self._lock:
+            for chunk in self.backend.stream(prompt, max_tokens, temperature, stop, prefix):
+                if not chunks:
+                    self._record_ttft(started)
+                chunks.append(chunk)
+                yield chunk
+        # 最後まで生成できた応答だけを保存する（途中で中断された場合はここに到達しない）
+        if key is not None:
+            self.response_cache.set(key, "".join(chunks))
+
+    def generate(self, prompt: str, max_tokens: int = LLM_MAX_TOKENS, temperature: float = LLM_TEMPERATURE, stop: Optional[List[str]] = None, prefix: Optional[str] = None) -> str:
+        return "".join(self.stream(prompt, max_tokens, temperature, stop, prefix))
+
+    def count_tokens(self, text: str) -> int:
+        return self.backend.count_tokens(text)
+
+    def metrics(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "status": self.status,
+            "error": self.error,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "requests": self.requests,
+            "ttft_ms_avg": round(self.ttft_avg * 1000, 3) if self.ttft_avg is not None else None,
+            "ttft_ms_last": round(self.ttft_last * 1000, 3) if self.ttft_last is not None else None,
+            "response_cache": self.response_cache.store.metrics() if self.response_cache is not None else None,
+            **self.backend.metrics(),
+        }
+
+_engine: Optional[InferenceEngine] = None
+
+def get_inference_engine() -> InferenceEngine:
+    """ワーカープロセス全体で共有する推論エンジンを取得"""
+    global _engine
+    if _engine is None:
+        response_cache = ResponseCache(CacheStore("responses", LLM_RESPONSE_CACHE_SIZE_MB)) if LLM_RESPONSE_CACHE else None
+        _engine = InferenceEngine(create_backend(), response_cache=response_cache)
+    return _engine
+
+def set_inference_engine(engine: Optional[InferenceEngine]) -> None:
+    """推論エンジンを差し替える（テストでFakeBackendを使う場合など）"""
+    global _engine
+    _engine = engine
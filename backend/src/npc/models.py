@@ -0,0 +1,22 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+# チャットのリクエストパラメーター
+class ChatRequest(BaseModel):
+    message: str
+    max_tokens: Optional[int] = Field(default=None, description="生成する最大トークン数（未指定の場合はサーバーの設定値）")
+
+# チャットの応答
+class ChatResponse(BaseModel):
+    object_id: int
+    reply: str
+
+# トークン数の上限に収めたプロンプトの文脈
+class PromptContext(BaseModel):
+    object_id: int
+    budget: int
+    used_tokens: int
+    text: str
+    summary_id: Optional[int] = None
+    memory_ids: List[int] = Field(default_factory=list, description="含めたメモリのID（スコアの高い順）")
+    omitted_memories: int = Field(default=0, description="上限に収まらず含めなかったメモリの件数")
@@ -0,0 +1,62 @@
+import json
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from .models import ChatRequest, ChatResponse
+from .scheduler import JobCancelled
+from .service import get_npc_service, LLM_REQUEST_TIMEOUT
+from utils.database import get_db
+
+router = APIRouter(prefix="/npc", tags=["npc"])
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+# NPCとの会話
+@router.post("/{object_id}/chat", response_model=ChatResponse)
+def chat(object_id: int, chat_request: ChatRequest, db: Session = Depends(get_db)):
+    npc_service = get_npc_service(db)
+    return npc_service.chat(object_id, chat_request)
+
+# NPCとの会話（生成された断片をServer-Sent Eventsで順に返す）
+@router.post("/{object_id}/chat/stream")
+def chat_stream(object_id: int, chat_request: ChatRequest, db: Session = Depends(get_db)):
+    """返答をtokenイベントで断片ごとに送り、最後にdoneイベントで返答全体を送る"""
+    npc_service = get_npc_service(db)
+    # 入力エラー・混雑はストリームを開始する前に通常のエラーとして返す
+    job = npc_service.chat_stream(object_id, chat_request)
+
+    async def reply_stream():
+        chunks = job.iter_chunks(timeout=LLM_REQUEST_TIMEOUT)
+        reply = ""
+        try:
+            while True:
+                chunk = await run_in_threadpool(next, chunks, None)
+                if chunk is None:
+                    break
+                # 返答の先頭の空白は送らない（chatと同じ返答にする）
+                if not reply:
+                    chunk = chunk.lstrip()
+                    if not chunk:
+                        continue
+                reply += chunk
+                yield _sse("token", {"text": chunk})
+            # 返答を会話の履歴に保存してから完了を通知する
+            await run_in_threadpool(npc_service.record_reply, object_id, reply)
+            yield _sse("done", {"object_id": object_id, "reply": reply.strip()})
+        except TimeoutError:
+            yield _sse("error", {"detail": "Reply generation timed out"})
+        except JobCancelled:
+            yield _sse("error", {"detail": "Reply generation was cancelled"})
+        except Exception as exc:
+            yield _sse("error", {"detail": f"Reply generation failed: {exc}"})
+        finally:
+            # クライアントが切断した場合も推論を取り消し、モデルを次の推論に使えるようにする
+            job.cancel()
+
+    return StreamingResponse(
+        reply_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,388 @@
+import heapq
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+from utils.admission import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, PRIORITY_NAMES
+from .inference import InferenceEngine, get_inference_engine, LLM_MAX_TOKENS, LLM_TEMPERATURE
+
+logger = logging.getLogger(__name__)
+
+# 推論の待ち行列の設定（環境変数で変更可能）。上限は優先度ごとに数え、バックグラウンドの推論が対話の推論の枠を使わないようにする
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "64"))
+LLM_MAX_PENDING_PER_NPC = int(os.getenv("LLM_MAX_PENDING_PER_NPC", "4"))
+# 共通部分が同じバックグラウンドの推論をまとめて実行する最大件数
+LLM_BACKGROUND_BATCH_SIZE = int(os.getenv("LLM_BACKGROUND_BATCH_SIZE", "8"))
+
+class JobCancelled(Exception):
+    pass
+
+class SchedulerFull(Exception):
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+
+class InferenceJob:
+    """
+    待ち行列に投入された1件の推論。生成された断片は順に取り出せる。
+    バックグラウンドの推論は対話の推論に割り込まれると、生成済みの部分を残して待ち行列に戻り、続きから再開する。
+    """
+
+    _END = object()
+
+    def __init__(self, prompt: str, max_tokens: int, temperature: float, stop: Optional[List[str]], prefix: Optional[str], priority: int, npc_id: Optional[int]):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.stop = stop
+        self.prefix = prefix
+        self.priority = priority
+        self.npc_id = npc_id
+        # 待ち行列での順序（優先度, NPCごとの巡回順, 投入順）
+        self.sort_key: Tuple[int, int, int] = (priority, 0, 0)
+        self.generated: List[str] = []
+        # 生成したトークン数（推論エンジンのトークナイザーで数える）
+        self.tokens = 0
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self.preemptions = 0
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self._chunks: "queue.Queue" = queue.Queue()
+        self._done = threading.Event()
+        # 投入先のスケジューラー（取り消したときに上限の枠をすぐに空ける）
+        self._scheduler: Optional["InferenceScheduler"] = None
+        self._released = False
+
+    def __lt__(self, other: "InferenceJob") -> bool:
+        return self.sort_key < other.sort_key
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def remaining_tokens(self) -> int:
+        return max(0, self.max_tokens - self.tokens)
+
+    def cancel(self) -> None:
+        """推論を取り消す（待ち行列にある場合は実行されず、実行中の場合は次の断片で止まる）"""
+        if not self.done:
+            self.cancelled = True
+            if self._scheduler is not None:
+                self._scheduler._release_slot(self)
+
+    def _emit(self, chunk: str) -> None:
+        self.generated.append(chunk)
+        self._chunks.put(chunk)
+
+    def _finish(self, error: Optional[BaseException] = None) -> None:
+        self.error = error
+        self._done.set()
+        self._chunks.put(self._END)
+
+    def _raise_if_failed(self) -> None:
+        if self.error is not None:
+            raise self.error
+        if self.cancelled:
+            raise JobCancelled()
+
+    def iter_chunks(self, timeout: Optional[float] = None) -> Iterator[str]:
+        """生成された断片を順に返す。timeout秒以内に次の断片が届かない場合は取り消してTimeoutErrorを送出"""
+        while True:
+            try:
+                chunk = self._chunks.get(timeout=timeout)
+            except queue.Empty:
+                self.cancel()
+                raise TimeoutError("Inference job timed out")
+            if chunk is self._END:
+                self._raise_if_failed()
+                return
+            yield chunk
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        """推論の完了を待って生成したテキストを返す。timeout秒以内に完了しない場合は取り消してTimeoutErrorを送出"""
+        if not self._done.wait(timeout):
+            self.cancel()
+            raise TimeoutError("Inference job timed out")
+        self._raise_if_failed()
+        return "".join(self.generated)
+
+class InferenceScheduler:
+    """
+    モデルを使う推論を1つのスレッドで優先度順に実行するスケジューラー。
+    - 対話の推論はバックグラウンドの推論より先に実行し、実行中のバックグラウンドの推論にも断片の区切りで割り込む
+    - 同じ優先度の中ではNPCごとに順番に実行し、1つのNPCの推論が待ち行列を占有しないようにする
+    - 共通部分が同じバックグラウンドの推論はまとめて続けて実行し、共通部分の状態を再利用する
+    """
+
+    def __init__(self, engine: InferenceEngine, max_queue: int = LLM_QUEUE_SIZE, max_pending_per_npc: int = LLM_MAX_PENDING_PER_NPC, batch_size: int = LLM_BACKGROUND_BATCH_SIZE):
+        self.engine = engine
+        self.max_queue = max_queue
+        self.max_pending_per_npc = max_pending_per_npc
+        self.batch_size = batch_size
+        self._heap: List[InferenceJob] = []
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        # NPCごとの次の巡回順と、優先度ごとに直近に実行した巡回順
+        self._next_round: Dict[Tuple[int, int], int] = {}
+        self._current_round: Dict[int, int] = defaultdict(int)
+        # 優先度・NPCごとの未完了の推論の件数
+        self._pending_per_npc: Dict[Tuple[int, int], int] = defaultdict(int)
+        self._thread: Optional[threading.Thread] = None
+        self._current: Optional[InferenceJob] = None
+        self._stopping = False
+        # 統計情報
+        self.completed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.preemptions = 0
+        self.batches = 0
+        self.batched_jobs = 0
+        # 生成したトークン数と断片の数（キャッシュした応答は複数のトークンが1つの断片で返る）
+        self.tokens = 0
+        self.chunks = 0
+        self.generation_seconds = 0.0
+        self.tokens_per_second: Optional[float] = None
+        self.queue_wait: Dict[int, Optional[float]] = {PRIORITY_INTERACTIVE: None, PRIORITY_BACKGROUND: None}
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._loop, name="llm-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            thread = self._thread
+            self._thread = None
+            self._stopping = True
+            # 待っている推論は取り消す（実行中の推論は次の断片で止まる）
+            for job in self._heap + ([self._current] if self._current is not None else []):
+                job.cancel()
+            self._cond.notify_all()
+        if thread is not None and thread.is_alive():
+            thread.join()
+
+    def submit(
+        self,
+        prompt: str,
+        max_tokens: int = LLM_MAX_TOKENS,
+        temperature: float = LLM_TEMPERATURE,
+        stop: Optional[List[str]] = None,
+        prefix: Optional[str] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        npc_id: Optional[int] = None
+    ) -> InferenceJob:
+        """
+        推論を待ち行列に投入する。同じ優先度の待ち行列・NPCごとの上限を超える場合はSchedulerFullを送出。
+        上限は優先度ごとに数えるため、バックグラウンドの推論がたまっていても対話の推論は投入できる。
+        """
+        job = InferenceJob(prompt, max_tokens, temperature, stop, prefix, priority, npc_id)
+        with self._cond:
+            # 取り消された推論は先頭に来るまで待ち行列に残るが、件数には含めない
+            queued = sum(1 for queued_job in self._heap if queued_job.priority == priority and not queued_job.cancelled)
+            if queued >= self.max_queue or (npc_id is not None and self._pending_per_npc[(priority, npc_id)] >= self.max_pending_per_npc):
+                self.rejected += 1
+                raise SchedulerFull(self._estimate_wait())
+            if npc_id is not None:
+                key = (priority, npc_id)
+                round_ = max(self._current_round[priority], self._next_round.get(key, 0))
+                self._next_round[key] = round_ + 1
+                self._pending_per_npc[key] += 1
+                job._scheduler = self
+            else:
+                round_ = self._current_round[priority]
+            job.sort_key = (priority, round_, next(self._seq))
+            heapq.heappush(self._heap, job)
+            self._cond.notify()
+        self.start()
+        return job
+
+    def _estimate_wait(self) -> float:
+        """待ち行列がはけるまでの目安（秒）"""
+        if not self.tokens_per_second:
+            return 5.0
+        queued_tokens = sum(job.remaining_tokens for job in self._heap if not job.cancelled)
+        return queued_tokens / self.tokens_per_second
+
+    def _interactive_waiting(self) -> bool:
+        # 対話の推論は常に待ち行列の先頭に来る
+        with self._cond:
+            return bool(self._heap) and self._heap[0].priority == PRIORITY_INTERACTIVE
+
+    def _next_batch(self) -> List[InferenceJob]:
+        """次に実行する推論（バックグラウンドの場合は共通部分が同じものをまとめる）を取り出す。停止時は空"""
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0].cancelled:
+                    self._release(heapq.heappop(self._heap))
+                if self._heap:
+                    break
+                if self._stopping:
+                    return []
+                self._cond.wait()
+
+            head = heapq.heappop(self._heap)
+            self._current_round[head.priority] = max(self._current_round[head.priority], head.sort_key[1])
+            batch = [head]
+            if head.priority != PRIORITY_INTERACTIVE and head.prefix is not None:
+                same_prefix = sorted(job for job in self._heap if job.priority == head.priority and job.prefix == head.prefix and not job.cancelled)
+                batch += same_prefix[:self.batch_size - 1]
+                if len(batch) > 1:
+                    taken = set(map(id, batch))
+                    self._heap = [job for job in self._heap if id(job) not in taken]
+                    heapq.heapify(self._heap)
+            return batch
+
+    def _release_slot(self, job: InferenceJob) -> None:
+        """推論をNPCごとの件数から除く（実行を終えたとき・取り消したときの最初の1回だけ）"""
+        with self._cond:
+            if job._released or job.npc_id is None:
+                return
+            job._released = True
+            key = (job.priority, job.npc_id)
+            self._pending_per_npc[key] -= 1
+            if self._pending_per_npc[key] <= 0:
+                del self._pending_per_npc[key]
+
+    def _release(self, job: InferenceJob) -> None:
+        """実行を終えた（または取り消された）推論をNPCごとの件数から除く"""
+        self._release_slot(job)
+        if job.cancelled:
+            self.cancelled += 1
+            job._finish()
+
+    def _requeue(self, jobs: List[InferenceJob]) -> None:
+        with self._cond:
+            for job in jobs:
+                heapq.heappush(self._heap, job)
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            if len(batch) > 1:
+                self.batches += 1
+                self.batched_jobs += len(batch)
+            for index, job in enumerate(batch):
+                # 対話の推論が届いた場合は、まとめた残りを待ち行列に戻して先に実行させる
+                if index > 0 and self._interactive_waiting():
+                    self._requeue(batch[index:])
+                    break
+                self._current = job
+                try:
+                    self._run(job)
+                finally:
+                    self._current = None
+
+    def _record_wait(self, job: InferenceJob) -> None:
+        wait = job.started_at - job.enqueued_at
+        previous = self.queue_wait.get(job.priority)
+        self.queue_wait[job.priority] = wait if previous is None else previous * 0.9 + wait * 0.1
+
+    def _run(self, job: InferenceJob) -> None:
+        if job.cancelled:
+            with self._cond:
+                self._release(job)
+            return
+        if job.started_at is None:
+            job.started_at = time.monotonic()
+            self._record_wait(job)
+
+        preempted = False
+        error: Optional[BaseException] = None
+        started = time.monotonic()
+        produced = 0
+        tokens = 0
+        # 割り込まれた推論は生成済みの部分をプロンプトに続けて再開する
+        chunks = self.engine.stream(
+            job.prompt + "".join(job.generated),
+            max_tokens=job.remaining_tokens,
+            temperature=job.temperature,
+            stop=job.stop,
+            prefix=job.prefix
+        )
+        try:
+            for chunk in chunks:
+                job._emit(chunk)
+                chunk_tokens = self.engine.count_tokens(chunk)
+                job.tokens += chunk_tokens
+                tokens += chunk_tokens
+                produced += 1
+                if job.cancelled:
+                    break
+                if job.priority != PRIORITY_INTERACTIVE and job.remaining_tokens > 0 and self._interactive_waiting():
+                    preempted = True
+                    break
+        except Exception as exc:
+            logger.exception("Inference job failed")
+            error = exc
+        finally:
+            chunks.close()
+
+        elapsed = time.monotonic() - started
+        self.tokens += tokens
+        self.chunks += produced
+        self.generation_seconds += elapsed
+        if tokens and elapsed > 0:
+            rate = tokens / elapsed
+            self.tokens_per_second = rate if self.tokens_per_second is None else self.tokens_per_second * 0.9 + rate * 0.1
+
+        if preempted and not job.cancelled:
+            job.preemptions += 1
+            self.preemptions += 1
+            self._requeue([job])
+            return
+        with self._cond:
+            self._release(job)
+        if not job.cancelled:
+            self.completed += 1
+            job._finish(error)
+
+    def metrics(self) -> dict:
+        with self._cond:
+            queued = defaultdict(int)
+            for job in self._heap:
+                queued[PRIORITY_NAMES.get(job.priority, str(job.priority))] += 1
+        return {
+            "queued": dict(queued),
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "preemptions": self.preemptions,
+            "batches": self.batches,
+            "batched_jobs": self.batched_jobs,
+            "queue_wait_ms": {
+                PRIORITY_NAMES[priority]: round(wait * 1000, 3) if wait is not None else None
+                for priority, wait in self.queue_wait.items()
+            },
+            "tokens": self.tokens,
+            "chunks": self.chunks,
+            "tokens_per_second": round(self.tokens_per_second, 3) if self.tokens_per_second is not None else None,
+            "tokens_per_second_total": round(self.tokens / self.generation_seconds, 3) if self.generation_seconds else None,
+        }
+
+_scheduler: Optional[InferenceScheduler] = None
+
+def get_inference_scheduler() -> InferenceScheduler:
+    """ワーカープロセス全体で共有する推論のスケジューラーを取得"""
+    global _scheduler
+    engine = get_inference_engine()
+    # 推論エンジンが差し替えられた場合は作り直す
+    if _scheduler is None or _scheduler.engine is not engine:
+        if _scheduler is not None:
+            _scheduler.stop()
+        _scheduler = InferenceScheduler(engine)
+    return _scheduler
+
+def stop_inference_scheduler() -> None:
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
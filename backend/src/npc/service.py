@@ -0,0 +1,159 @@
+from typing import Optional
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from .models import ChatRequest, ChatResponse
+from .context import ContextBuilder, ContextCache, NPC_CONTEXT_BUDGET, PLAYER_NAME, get_context_cache
+from .inference import LLM_MAX_TOKENS, STATUS_FAILED
+from .scheduler import InferenceScheduler, InferenceJob, SchedulerFull, get_inference_scheduler
+from .summarizer import ConversationSummarizer, get_conversation_summarizer
+from utils.admission import PRIORITY_INTERACTIVE
+from conversations.memory import ConversationMemory
+from conversations.models import MessageCreate
+from conversations.service import ConversationService, get_conversation_service
+from utils.db_models import ObjectDB
+import math
+import os
+
+# モデルの読み込み完了を待つ最大時間（秒）
+LLM_READY_TIMEOUT = float(os.getenv("LLM_READY_TIMEOUT", "0"))
+# 生成トークン数の上限
+MAX_CHAT_TOKENS = 1024
+# 返答の生成を待つ最大時間（秒）。超えた場合は推論を取り消す
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+
+class NPCService:
+    def __init__(self, db: Session, scheduler: InferenceScheduler, conversations: Optional[ConversationService] = None, summarizer: Optional[ConversationSummarizer] = None, context_cache: Optional[ContextCache] = None):
+        self.db = db
+        self.scheduler = scheduler
+        self.engine = scheduler.engine
+        # プロンプトの文脈のキャッシュ（未指定の場合はこのサービスだけのキャッシュ）
+        self.context_builder = ContextBuilder(db, cache=context_cache)
+        self.memory = ConversationMemory(db)
+        # 会話の履歴の保存先（未指定の場合は保存しない）
+        self.conversations = conversations
+        # 古い発言の要約（未指定の場合は要約せず、直近の発言だけをプロンプトに含める）
+        self.summarizer = summarizer
+
+    def _validate_message(self, message: str) -> None:
+        """messageが1文字以上であることを確認"""
+        if not message or len(message.strip()) == 0:
+            raise HTTPException(
+                status_code=400,
+                detail="Message must be at least 1 character long"
+            )
+
+    def _ensure_ready(self) -> None:
+        """モデルが使用可能でなければ503エラー"""
+        if self.engine.wait_ready(LLM_READY_TIMEOUT):
+            return
+        if self.engine.status == STATUS_FAILED:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Model failed to load: {self.engine.error}"
+            )
+        raise HTTPException(
+            status_code=503,
+            detail="Model is loading. Please retry later.",
+            headers={"Retry-After": "5"}
+        )
+
+    def build_prompt(self, db_object: ObjectDB, message: str) -> str:
+        """オブジェクトの説明・最新のサマリー・重要なメモリから会話のプロンプトを組み立てる"""
+        prefix, conversation = self.build_prompt_parts(db_object, message)
+        return prefix + conversation
+
+    def build_prompt_parts(self, db_object: ObjectDB, message: str):
+        """
+        プロンプトを、NPCごとに共通の部分（トークン数の上限に収めた文脈と会話の要約）と会話の部分に分けて組み立てる。
+        会話の部分には直近の発言だけを含めるため、会話が長くなってもプロンプトの長さは一定に保たれる。
+        """
+        context = self.context_builder.build(db_object.id, NPC_CONTEXT_BUDGET)
+        history = self.memory.window(db_object.id, {"player": PLAYER_NAME, "npc": db_object.name})
+        # 要約は畳み込むまで変わらないため共通部分に含め、共通部分の状態を再利用できるようにする
+        prefix = context.text
+        if history.summary:
+            prefix += f"# これまでの会話\n{history.summary}\n"
+        # 共通部分は改行で終え、会話部分のトークンと境界が揃うようにする
+        prefix += "# 会話\n"
+        conversation = history.text + f"{PLAYER_NAME}：{message.strip()}\n{db_object.name}："
+        return prefix, conversation
+
+    def _prepare(self, object_id: int, chat_request: ChatRequest):
+        self._validate_message(chat_request.message)
+        
+        max_tokens = chat_request.max_tokens if chat_request.max_tokens is not None else LLM_MAX_TOKENS
+        if max_tokens < 1 or max_tokens > MAX_CHAT_TOKENS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Max tokens must be between 1 and {MAX_CHAT_TOKENS}"
+            )
+        
+        db_object = self.db.query(ObjectDB).filter(ObjectDB.id == object_id).first()
+        if not db_object:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Object with id {object_id} not found"
+            )
+        
+        self._ensure_ready()
+        prefix, conversation = self.build_prompt_parts(db_object, chat_request.message)
+        return prefix + conversation, prefix, max_tokens
+
+    def _submit(self, object_id: int, prompt: str, prefix: str, max_tokens: int) -> InferenceJob:
+        """返答の生成を対話の優先度で待ち行列に投入する。NPCごとの上限を超える場合は429エラー"""
+        try:
+            # 1行の返答で止める
+            return self.scheduler.submit(
+                prompt,
+                max_tokens=max_tokens,
+                stop=["\n"],
+                prefix=prefix,
+                priority=PRIORITY_INTERACTIVE,
+                npc_id=object_id
+            )
+        except SchedulerFull as exc:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many pending requests. Please retry later.",
+                headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+            )
+
+    def _record(self, object_id: int, sender: str, content: str) -> None:
+        """会話の履歴にメッセージを追加（空の返答は保存しない）"""
+        if self.conversations is not None and content.strip():
+            self.conversations.append_message(object_id, MessageCreate(sender=sender, content=content.strip()))
+
+    def record_reply(self, object_id: int, reply: str) -> None:
+        """生成し終えたNPCの返答を会話の履歴に追加し、古い発言の要約を（リクエストとは別のスレッドで）確認する"""
+        self._record(object_id, "npc", reply)
+        if self.summarizer is not None:
+            self.summarizer.schedule(object_id)
+
+    # NPCとの会話
+    def chat(self, object_id: int, chat_request: ChatRequest) -> ChatResponse:
+        prompt, prefix, max_tokens = self._prepare(object_id, chat_request)
+        job = self._submit(object_id, prompt, prefix, max_tokens)
+        # 待ち行列に入った時点でプレイヤーの発言を保存する（推論と並行して書き込む）
+        self._record(object_id, "player", chat_request.message)
+        try:
+            reply = job.result(LLM_REQUEST_TIMEOUT)
+        except TimeoutError:
+            raise HTTPException(
+                status_code=504,
+                detail="Reply generation timed out"
+            )
+        reply = reply.strip()
+        self.record_reply(object_id, reply)
+        return ChatResponse(object_id=object_id, reply=reply)
+
+    # NPCとの会話（生成された断片を順に返す推論を開始する）
+    # 返答は生成し終えた時点で呼び出し元がrecord_replyで保存する
+    def chat_stream(self, object_id: int, chat_request: ChatRequest) -> InferenceJob:
+        prompt, prefix, max_tokens = self._prepare(object_id, chat_request)
+        job = self._submit(object_id, prompt, prefix, max_tokens)
+        self._record(object_id, "player", chat_request.message)
+        return job
+
+# サービスのファクトリー関数
+def get_npc_service(db: Session) -> NPCService:
+    return NPCService(db, get_inference_scheduler(), conversations=get_conversation_service(db), summarizer=get_conversation_summarizer(), context_cache=get_context_cache())
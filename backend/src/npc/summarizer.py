@@ -0,0 +1,168 @@
+import logging
+import os
+import queue
+import threading
+from typing import Callable, List, Optional
+from sqlalchemy.orm import Session
+from conversations.memory import ConversationMemory, format_line
+from conversations.models import Message
+from .context import PLAYER_NAME
+from .scheduler import InferenceScheduler, InferenceJob, SchedulerFull, JobCancelled, get_inference_scheduler
+from utils.admission import PRIORITY_BACKGROUND
+from utils.database import SessionLocal
+from utils.db_models import ObjectDB
+from utils.writer import get_writer
+
+logger = logging.getLogger(__name__)
+
+# 要約の設定（環境変数で変更可能）
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "160"))
+# 要約の生成を待つ最大時間（秒）。バックグラウンドの推論は対話の推論に割り込まれるため長めにする
+CHAT_SUMMARY_TIMEOUT = float(os.getenv("CHAT_SUMMARY_TIMEOUT", "300"))
+
+def build_summary_prompt(npc_name: str, summary: Optional[str], messages: List[Message]) -> str:
+    """これまでの要約と畳み込む発言から、新しい要約を生成するプロンプトを組み立てる"""
+    speakers = {"player": PLAYER_NAME, "npc": npc_name}
+    lines = "".join(format_line(speakers[message.sender], message.content) for message in messages)
+    return (
+        f"以下は{npc_name}と{PLAYER_NAME}の会話のこれまでの要約と、その続きです。"
+        "続きの内容を加えた新しい要約を、重要な出来事・約束・相手について分かったことを残して1行で書いてください。\n"
+        f"# これまでの要約\n{summary or 'なし'}\n"
+        f"# 続きの会話\n{lines}"
+        "# 新しい要約\n"
+    )
+
+class ConversationSummarizer:
+    """
+    直近の発言より古い発言を要約に畳み込む処理を、会話のリクエストとは別のスレッドで行う。
+    要約の生成はバックグラウンドの優先度で推論のスケジューラーに投入するため、対話の推論を遅らせない。
+    同じ会話の要約は同時に1つだけ行う。
+    """
+
+    def __init__(self, scheduler: InferenceScheduler, session_factory: Callable[[], Session] = SessionLocal, writer=None):
+        self.scheduler = scheduler
+        self.session_factory = session_factory
+        self.writer = writer
+        self._queue: "queue.Queue[Optional[int]]" = queue.Queue()
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._current: Optional[InferenceJob] = None
+        # 統計情報
+        self.folds = 0
+        self.folded_messages = 0
+        self.skipped = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="chat-summarizer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+            # 予定されている要約は行わず、生成中の要約は取り消す（次の会話の後に改めて確認される）
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._scheduled.clear()
+            current = self._current
+        if current is not None:
+            current.cancel()
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+
+    def schedule(self, object_id: int) -> None:
+        """会話の要約が必要か確認する（すでに予定されている場合は何もしない）"""
+        with self._lock:
+            if object_id in self._scheduled:
+                return
+            self._scheduled.add(object_id)
+        self._queue.put(object_id)
+        self.start()
+
+    def _loop(self) -> None:
+        while True:
+            object_id = self._queue.get()
+            if object_id is None:
+                return
+            with self._lock:
+                self._scheduled.discard(object_id)
+            db = self.session_factory()
+            try:
+                # 要約が遅れて発言がたまっていた場合は続けて畳み込む
+                if self.fold(object_id, db):
+                    self.schedule(object_id)
+            except Exception:
+                self.failures += 1
+                logger.exception("Failed to summarize conversation %s", object_id)
+            finally:
+                db.close()
+
+    def fold(self, object_id: int, db: Session) -> bool:
+        """要約が必要であれば古い発言を要約に畳み込む。要約を保存した場合はTrue"""
+        memory = ConversationMemory(db, writer=self.writer or get_writer())
+        if not memory.needs_fold(object_id):
+            return False
+        summary, messages = memory.fold_candidates(object_id)
+        npc_name = db.query(ObjectDB.name).filter(ObjectDB.id == object_id).scalar()
+        if not messages or npc_name is None:
+            return False
+
+        try:
+            job = self.scheduler.submit(
+                build_summary_prompt(npc_name, summary, messages),
+                max_tokens=CHAT_SUMMARY_MAX_TOKENS,
+                stop=["\n"],
+                priority=PRIORITY_BACKGROUND,
+                npc_id=object_id
+            )
+            self._current = job
+            new_summary = job.result(CHAT_SUMMARY_TIMEOUT).strip()
+        except (SchedulerFull, JobCancelled, TimeoutError):
+            # 混雑している場合は次の会話の後に再試行する（それまでは直近の発言だけでプロンプトを組み立てる）
+            self.skipped += 1
+            return False
+        finally:
+            self._current = None
+        if not new_summary:
+            self.skipped += 1
+            return False
+
+        if not memory.apply_summary(object_id, messages[-1].id, new_summary):
+            self.skipped += 1
+            return False
+        self.folds += 1
+        self.folded_messages += len(messages)
+        return True
+
+    def metrics(self) -> dict:
+        return {
+            "scheduled": self._queue.qsize(),
+            "folds": self.folds,
+            "folded_messages": self.folded_messages,
+            "skipped": self.skipped,
+            "failures": self.failures,
+        }
+
+_summarizer: Optional[ConversationSummarizer] = None
+
+def get_conversation_summarizer() -> ConversationSummarizer:
+    """ワーカープロセス全体で共有する会話の要約処理を取得"""
+    global _summarizer
+    scheduler = get_inference_scheduler()
+    # スケジューラーが作り直された場合は作り直す
+    if _summarizer is None or _summarizer.scheduler is not scheduler:
+        if _summarizer is not None:
+            _summarizer.stop()
+        _summarizer = ConversationSummarizer(scheduler)
+    return _summarizer
+
+def stop_conversation_summarizer() -> None:
+    global _summarizer
+    if _summarizer is not None:
+        _summarizer.stop()
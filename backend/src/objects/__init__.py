@@ -1,5 +1,5 @@
-from .models import Object, ObjectCreate, ObjectUpdate, ObjectQuery
-from .service import ObjectService, get_object_service
+from .models import Object, ObjectCreate, ObjectUpdate, ObjectQuery, ObjectListItem, ObjectPage
+from .service import ObjectService, get_object_service, delete_object_children, sweep_orphans
 from .router import router
 
 __all__ = [
@@ -7,7 +7,11 @@ __all__ = [
     "ObjectCreate", 
     "ObjectUpdate",
     "ObjectQuery",
+    "ObjectListItem",
+    "ObjectPage",
     "ObjectService",
     "get_object_service",
+    "delete_object_children",
+    "sweep_orphans",
     "router"
 ] 
\ No newline at end of file
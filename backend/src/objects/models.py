@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
@@ -9,6 +9,7 @@ class Object(BaseModel):
     summary: str
     description: str
     photos: Optional[str] = "[]"  # JSON文字列として多次元配列を保存
+    version: int  # 更新のたびに1ずつ増える
 
 # 作成のリクエストパラメーター
 class ObjectCreate(BaseModel):
@@ -23,8 +24,24 @@ class ObjectUpdate(BaseModel):
     summary: Optional[str] = None
     description: Optional[str] = None
     photos: Optional[str] = None  # JSON文字列として多次元配列を保存
+    expected_version: Optional[int] = Field(default=None, description="更新前に期待するバージョン（一致しない場合は409）")
 
 # 取得のリクエストパラメーター
 class ObjectQuery(BaseModel):
     name: Optional[str] = None
-    limit: Optional[int] = 10 
\ No newline at end of file
+    limit: Optional[int] = 10
+
+# 一覧表示用の1件（説明・写真は含めない）
+class ObjectListItem(BaseModel):
+    id: int
+    name: str
+    summary: str
+    version: int
+
+# 一覧の1ページ（IDの昇順）
+class ObjectPage(BaseModel):
+    objects: List[ObjectListItem]
+    next_after_id: Optional[int] = Field(default=None, description="続きを取得する場合にafter_idに指定する値")
+    has_more: bool
+    total: int  # オブジェクトの総数
+    change_seq: int  # 取得時点の最新の変更番号（/changes/のsinceに指定すると以降の変更を取得できる）
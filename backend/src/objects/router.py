@@ -1,27 +1,47 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Header, Response
 from typing import List, Optional
+from datetime import datetime
 from sqlalchemy.orm import Session
-from .models import Object, ObjectCreate, ObjectUpdate, ObjectQuery
+from .models import Object, ObjectCreate, ObjectUpdate, ObjectQuery, ObjectPage
 from .service import get_object_service
+from summaries.models import Summary
+from summaries.service import get_summary_service
+from npc.models import PromptContext
+from npc.context import get_context_builder, NPC_CONTEXT_BUDGET
 from utils.database import get_db
+from utils.etag import format_etag, parse_if_match
+from utils.singleflight import coalesced_json
 
 router = APIRouter(prefix="/objects", tags=["objects"])
 
 # レコードの作成
 @router.post("/", response_model=Object)
-async def create_object(object_data: ObjectCreate, db: Session = Depends(get_db)):
+def create_object(object_data: ObjectCreate, db: Session = Depends(get_db)):
     object_service = get_object_service(db)
     return object_service.create_object(object_data)
 
+# 一覧の1ページを取得（/{object_id}より先に定義する）
+@router.get("/page", response_model=ObjectPage)
+def get_object_page(
+    after_id: Optional[int] = Query(None, description="このIDより後から取得（前回のレスポンスのnext_after_id）"),
+    limit: int = Query(100, description="取得件数制限"),
+    db: Session = Depends(get_db)
+):
+    object_service = get_object_service(db)
+    return object_service.get_object_page(after_id, limit)
+
 # 単一レコードの取得
 @router.get("/{object_id}", response_model=Object)
-async def get_object(object_id: int, db: Session = Depends(get_db)):
+def get_object(object_id: int, response: Response, db: Session = Depends(get_db)):
     object_service = get_object_service(db)
-    return object_service.get_object(object_id)
+    result = object_service.get_object(object_id)
+    # 更新時にIf-Matchで指定できるようバージョンをETagで返す
+    response.headers["ETag"] = format_etag(result.version)
+    return result
 
 # レコードの取得（複数）
 @router.get("/", response_model=List[Object])
-async def get_objects(
+def get_objects(
     name: Optional[str] = Query(None, description="オブジェクト名（部分一致）"),
     limit: Optional[int] = Query(10, description="取得件数制限"),
     db: Session = Depends(get_db)
@@ -35,20 +55,28 @@ async def get_objects(
 
 # レコードの更新
 @router.put("/{object_id}", response_model=Object)
-async def update_object(object_id: int, update_data: ObjectUpdate, db: Session = Depends(get_db)):
+def update_object(
+    object_id: int,
+    update_data: ObjectUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="更新前に期待するバージョン（一致しない場合は409）"),
+    db: Session = Depends(get_db)
+):
     object_service = get_object_service(db)
-    return object_service.update_object(object_id, update_data)
+    result = object_service.update_object(object_id, update_data, expected_version=parse_if_match(if_match))
+    response.headers["ETag"] = format_etag(result.version)
+    return result
 
 # レコードの削除
 @router.delete("/{object_id}")
-async def delete_object(object_id: int, db: Session = Depends(get_db)):
+def delete_object(object_id: int, db: Session = Depends(get_db)):
     object_service = get_object_service(db)
     object_service.delete_object(object_id)
     return {"message": f"Object {object_id} deleted successfully"}
 
 # オブジェクトに関連するメモリを取得
 @router.get("/{object_id}/memories")
-async def get_object_memories(
+def get_object_memories(
     object_id: int,
     limit: Optional[int] = Query(10, description="取得件数制限"),
     db: Session = Depends(get_db)
@@ -68,27 +96,61 @@ async def get_object_memories(
 
 # オブジェクトに関連するサマリーを取得
 @router.get("/{object_id}/summaries")
-async def get_object_summaries(
+def get_object_summaries(
     object_id: int,
     limit: Optional[int] = Query(10, description="取得件数制限"),
     db: Session = Depends(get_db)
 ):
     """オブジェクトに関連するサマリーを取得"""
     object_service = get_object_service(db)
-    # オブジェクトの存在確認
-    obj = object_service.get_object(object_id)
     
-    summaries = object_service.get_object_summaries(object_id, limit)
-    return {
-        "object_id": object_id,
-        "object_name": obj.name,
-        "summaries": summaries,
-        "count": len(summaries)
-    }
+    def _load():
+        # オブジェクトの存在確認
+        obj = object_service.get_object(object_id)
+        
+        summaries = object_service.get_object_summaries(object_id, limit)
+        return {
+            "object_id": object_id,
+            "object_name": obj.name,
+            "summaries": summaries,
+            "count": len(summaries)
+        }
+    
+    # 同時に届いた同一リクエストは1回の実行にまとめる
+    return coalesced_json("objects.summaries", _load, object_id=object_id, limit=limit)
+
+# 指定時刻のオブジェクトのサマリーを取得（履歴から復元）
+@router.get("/{object_id}/summary", response_model=Summary)
+def get_summary_at(
+    object_id: int,
+    at: Optional[datetime] = Query(None, description="取得する時刻（未指定の場合は最新）"),
+    db: Session = Depends(get_db)
+):
+    """指定時刻のオブジェクトのサマリーを取得"""
+    summary_service = get_summary_service(db)
+    return summary_service.get_summary_at(object_id, at)
+
+# オブジェクトの最新のサマリーを取得
+@router.get("/{object_id}/summary/latest", response_model=Summary)
+def get_latest_summary(object_id: int, db: Session = Depends(get_db)):
+    """オブジェクトの最新のサマリーを取得"""
+    summary_service = get_summary_service(db)
+    return summary_service.get_latest_summary(object_id)
+
+# トークン数の上限に収めたプロンプトの文脈を取得
+@router.get("/{object_id}/context", response_model=PromptContext)
+def get_prompt_context(
+    object_id: int,
+    budget: int = Query(NPC_CONTEXT_BUDGET, description="文脈に使う最大トークン数"),
+    db: Session = Depends(get_db)
+):
+    """オブジェクトの説明・最新のサマリー・スコアの高いメモリをトークン数の上限に収めて取得"""
+    context_builder = get_context_builder(db)
+    return context_builder.build(object_id, budget)
 
 # オブジェクトの詳細情報を取得（メモリとサマリーを含む）
 @router.get("/{object_id}/details")
-async def get_object_details(
+def get_object_details(
     object_id: int,
     memory_limit: Optional[int] = Query(10, description="メモリ取得件数制限"),
     summary_limit: Optional[int] = Query(10, description="サマリー取得件数制限"),
@@ -96,4 +158,11 @@ async def get_object_details(
 ):
     """オブジェクトの詳細情報を取得（メモリとサマリーを含む）"""
     object_service = get_object_service(db)
-    return object_service.get_object_details(object_id, memory_limit, summary_limit) 
\ No newline at end of file
+    # 同時に届いた同一リクエストは1回の実行にまとめる
+    return coalesced_json(
+        "objects.details",
+        lambda: object_service.get_object_details(object_id, memory_limit, summary_limit),
+        object_id=object_id,
+        memory_limit=memory_limit,
+        summary_limit=summary_limit
+    ) 
\ No newline at end of file
@@ -1,15 +1,62 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+from sqlalchemy import delete, func, select, update
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
-from .models import Object, ObjectCreate, ObjectUpdate, ObjectQuery
-from utils.db_models import ObjectDB, MemoryDB, SummaryDB
+from .models import Object, ObjectCreate, ObjectUpdate, ObjectQuery, ObjectListItem, ObjectPage
+from utils.db_models import ObjectDB, MemoryDB, SummaryDB, SummaryHistoryDB, ChatMessageDB, ConversationDB, ChangeLogDB, GlobalStatsDB
+from utils.writer import SessionWriter, get_writer
+from utils.events import publish
+from utils.timestamps import now_ms, from_epoch_ms
+from changes.service import record_change
 import json
-import pytz
+import os
+
+# オブジェクト削除時に1回の書き込みで削除する子の行数の上限
+CASCADE_DELETE_BATCH_SIZE = int(os.getenv("CASCADE_DELETE_BATCH_SIZE", "5000"))
+# 一覧の1ページで取得できる件数の上限
+MAX_PAGE_SIZE = 500
+
+def _delete_rows_batch(session: Session, model, condition, batch_size: int) -> int:
+    """条件に一致する行をbatch_size件まで、行を読み込まずにDELETE文で削除する"""
+    # DELETE文に対して自動で相関させず、独立したサブクエリとして対象のIDを選ぶ
+    target_ids = select(model.id).where(condition).limit(batch_size).correlate(None)
+    result = session.execute(
+        delete(model).where(model.id.in_(target_ids)),
+        execution_options={"synchronize_session": False}
+    )
+    return result.rowcount
+
+# オブジェクトに従属する行のモデル（削除する順）
+CHILD_MODELS = (MemoryDB, SummaryDB, SummaryHistoryDB, ConversationDB, ChatMessageDB)
+
+def delete_object_children(session: Session, object_id: int, batch_size: int = CASCADE_DELETE_BATCH_SIZE) -> int:
+    """オブジェクトのメモリ・サマリー・サマリーの履歴・会話をbatch_size件ずつ削除し、削除した件数を返す"""
+    deleted = 0
+    for model in CHILD_MODELS:
+        if deleted >= batch_size:
+            break
+        deleted += _delete_rows_batch(session, model, model.object_id == object_id, batch_size - deleted)
+    return deleted
+
+def sweep_orphans(session: Session, batch_size: int = CASCADE_DELETE_BATCH_SIZE) -> int:
+    """
+    存在しないオブジェクトを参照しているメモリ・サマリー・サマリーの履歴・会話をbatch_size件まで削除する。
+    過去の削除で残った行や、削除処理が途中で中断された場合の後始末に使う。
+    """
+    deleted = 0
+    for model in CHILD_MODELS:
+        if deleted >= batch_size:
+            break
+        orphaned = ~select(ObjectDB.id).where(ObjectDB.id == model.object_id).exists()
+        deleted += _delete_rows_batch(session, model, orphaned, batch_size - deleted)
+    return deleted
 
 class ObjectService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, writer=None):
         self.db = db
+        # 書き込みはライター経由で行う（未指定の場合はこのセッションで直接コミット）
+        self.writer = writer or SessionWriter(db)
 
     def _validate_string_field(self, field_name: str, value: str) -> None:
         """文字列フィールドが1文字以上であることを確認"""
@@ -41,24 +88,33 @@ class ObjectService:
         if object_data.photos is not None and object_data.photos.strip():
             self._validate_photos_field(object_data.photos)
         
-        db_object = ObjectDB(
-            name=object_data.name,
-            summary=object_data.summary,
-            description=object_data.description,
-            photos=object_data.photos
-        )
-        
-        self.db.add(db_object)
-        self.db.commit()
-        self.db.refresh(db_object)
-        
-        return Object(
-            id=db_object.id,
-            name=db_object.name,
-            summary=db_object.summary,
-            description=db_object.description,
-            photos=db_object.photos
-        )
+        def _create(session: Session) -> Object:
+            db_object = ObjectDB(
+                name=object_data.name,
+                summary=object_data.summary,
+                description=object_data.description,
+                photos=object_data.photos
+            )
+            
+            session.add(db_object)
+            session.flush()
+            
+            obj = Object(
+                id=db_object.id,
+                name=db_object.name,
+                summary=db_object.summary,
+                description=db_object.description,
+                photos=db_object.photos,
+                version=db_object.version
+            )
+            # 同じトランザクション内で変更ログを記録
+            record_change(session, "object", obj.id, obj.id, "upsert", obj)
+            return obj
+        
+        obj = self.writer.run(_create)
+        # コミット後に変更を通知
+        publish("object.created", obj.id, obj)
+        return obj
 
     # 単一レコードの取得
     def get_object(self, object_id: int) -> Object:
@@ -75,7 +131,8 @@ class ObjectService:
             name=db_object.name,
             summary=db_object.summary,
             description=db_object.description,
-            photos=db_object.photos
+            photos=db_object.photos,
+            version=db_object.version
         )
 
     # レコードの取得（複数）
@@ -112,70 +169,152 @@ class ObjectService:
                 name=db_object.name,
                 summary=db_object.summary,
                 description=db_object.description,
-                photos=db_object.photos
+                photos=db_object.photos,
+                version=db_object.version
             )
             for db_object in db_objects
         ]
 
-    # レコードの更新
-    def update_object(self, object_id: int, update_data: ObjectUpdate) -> Object:
-        db_object = self.db.query(ObjectDB).filter(ObjectDB.id == object_id).first()
-        
-        if not db_object:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Object with id {object_id} not found"
-            )
-        
-        update_dict = update_data.model_dump(exclude_unset=True)
-        
-        # 空文字列やNoneのフィールドを除外
-        valid_update_dict = {}
-        for key, value in update_dict.items():
-            if key in ['name', 'summary', 'description']:
-                # 文字列フィールドの場合は空文字列や空白のみの場合は除外
-                if value is not None and len(str(value).strip()) > 0:
-                    self._validate_string_field(key.capitalize(), value)
-                    valid_update_dict[key] = value
-            elif key == 'photos':
-                # photosフィールドの場合（空文字列も許可）
-                if value is not None:
-                    if value.strip():  # 空文字列でない場合のみJSON形式チェック
-                        self._validate_photos_field(value)
-                    valid_update_dict[key] = value
-        
-        # 更新するフィールドがない場合は400エラー
-        if not valid_update_dict:
+    # 一覧の1ページを取得（IDの昇順、after_idより後）
+    def get_object_page(self, after_id: Optional[int] = None, limit: int = 100) -> ObjectPage:
+        if limit < 1 or limit > MAX_PAGE_SIZE:
             raise HTTPException(
                 status_code=400,
-                detail="No valid fields to update. All provided fields are empty or invalid."
+                detail=f"Limit must be between 1 and {MAX_PAGE_SIZE}"
             )
-        
-        for key, value in valid_update_dict.items():
-            setattr(db_object, key, value)
-        
-        self.db.commit()
-        
-        return Object(
-            id=db_object.id,
-            name=db_object.name,
-            summary=db_object.summary,
-            description=db_object.description,
-            photos=db_object.photos
+
+        # 変更番号は一覧より先に取得し、取得中の変更を差分同期で取りこぼさないようにする
+        change_seq = self.db.query(func.max(ChangeLogDB.seq)).scalar() or 0
+        # 一覧に必要な列だけを読み込み、limit+1件取得して続きがあるか判定する
+        db_query = self.db.query(ObjectDB.id, ObjectDB.name, ObjectDB.summary, ObjectDB.version)
+        if after_id is not None:
+            db_query = db_query.filter(ObjectDB.id > after_id)
+        rows = db_query.order_by(ObjectDB.id).limit(limit + 1).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        # 総数はトリガーで更新される統計から取得する（COUNT(*)で全件を数えない）
+        total = self.db.query(GlobalStatsDB.object_count).filter(GlobalStatsDB.id == 1).scalar()
+        if total is None:
+            total = self.db.query(func.count(ObjectDB.id)).scalar()
+        return ObjectPage(
+            objects=[ObjectListItem(**row._mapping) for row in rows],
+            next_after_id=rows[-1].id if has_more else None,
+            has_more=has_more,
+            total=total,
+            change_seq=change_seq
         )
 
+    # レコードの更新
+    def update_object(self, object_id: int, update_data: ObjectUpdate, expected_version: Optional[int] = None) -> Object:
+        try:
+            update_dict = update_data.model_dump(exclude_unset=True)
+        
+            # 空文字列やNoneのフィールドを除外
+            valid_update_dict = {}
+            for key, value in update_dict.items():
+                if key in ['name', 'summary', 'description']:
+                    # 文字列フィールドの場合は空文字列や空白のみの場合は除外
+                    if value is not None and len(str(value).strip()) > 0:
+                        self._validate_string_field(key.capitalize(), value)
+                        valid_update_dict[key] = value
+                elif key == 'photos':
+                    # photosフィールドの場合（空文字列も許可）
+                    if value is not None:
+                        if value.strip():  # 空文字列でない場合のみJSON形式チェック
+                            self._validate_photos_field(value)
+                        valid_update_dict[key] = value
+        
+            # 更新するフィールドがない場合は400エラー
+            if not valid_update_dict:
+                raise HTTPException(
+                    status_code=400,
+                    detail="No valid fields to update. All provided fields are empty or invalid."
+                )
+        except HTTPException as exc:
+            # 入力が不正な場合だけ存在を確認し、存在しなければ404を優先する（更新が成功する場合は事前のSELECTを行わない）
+            if exc.status_code == 400 and not self.db.query(ObjectDB.id).filter(ObjectDB.id == object_id).first():
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Object with id {object_id} not found"
+                )
+            raise
+        
+        # 期待するバージョンの指定がなければリクエストボディの値を使う
+        if expected_version is None:
+            expected_version = update_data.expected_version
+        
+        valid_update_dict["version"] = ObjectDB.version + 1
+        
+        def _update(session: Session) -> Object:
+            # 事前のSELECTを行わず、1回のUPDATE ... RETURNINGで更新と結果の取得を行う
+            stmt = update(ObjectDB).where(ObjectDB.id == object_id)
+            if expected_version is not None:
+                stmt = stmt.where(ObjectDB.version == expected_version)
+            stmt = stmt.values(valid_update_dict).returning(
+                ObjectDB.id,
+                ObjectDB.name,
+                ObjectDB.summary,
+                ObjectDB.description,
+                ObjectDB.photos,
+                ObjectDB.version
+            )
+            row = session.execute(stmt, execution_options={"synchronize_session": False}).first()
+            
+            if row is None:
+                # 更新できなかった場合のみ、存在しないのかバージョンが一致しないのかを確認する
+                if not session.query(ObjectDB.id).filter(ObjectDB.id == object_id).first():
+                    raise HTTPException(
+                        status_code=404,
+                        detail=f"Object with id {object_id} not found"
+                    )
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Object with id {object_id} has been modified (expected version {expected_version})"
+                )
+            
+            obj = Object(**row._mapping)
+            # 同じトランザクション内で変更ログを記録
+            record_change(session, "object", obj.id, obj.id, "upsert", obj)
+            return obj
+        
+        obj = self.writer.run(_update)
+        # コミット後に変更を通知
+        publish("object.updated", obj.id, obj)
+        return obj
+
     # レコードの削除
-    def delete_object(self, object_id: int) -> None:
-        db_object = self.db.query(ObjectDB).filter(ObjectDB.id == object_id).first()
-        
-        if not db_object:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Object with id {object_id} not found"
+    def delete_object(self, object_id: int, batch_size: int = CASCADE_DELETE_BATCH_SIZE) -> None:
+        def _delete(session: Session) -> int:
+            # 子の行を読み込まないよう、存在確認もDELETE文の結果で行う
+            # （セッションに読み込み済みのオブジェクトは削除済みとして扱う）
+            deleted = session.execute(
+                delete(ObjectDB).where(ObjectDB.id == object_id),
+                execution_options={"synchronize_session": "evaluate"}
+            ).rowcount
+            
+            if not deleted:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Object with id {object_id} not found"
+                )
+            
+            # 子の削除記録はオブジェクトの削除記録で代表する（子ごとには記録しない）
+            # 子の変更ログは消しておき、削除記録が破棄された後の最初からの取得で子が復活しないようにする
+            session.execute(
+                delete(ChangeLogDB).where(ChangeLogDB.object_id == object_id, ChangeLogDB.entity != "object"),
+                execution_options={"synchronize_session": False}
             )
-        
-        self.db.delete(db_object)
-        self.db.commit()
+            record_change(session, "object", object_id, object_id, "delete")
+            return delete_object_children(session, object_id, batch_size)
+        
+        deleted = self.writer.run(_delete)
+        # 残りの子は件数を制限した書き込みに分けて削除し、書き込みを長時間占有しない
+        # （途中で中断された場合も孤立した行として定期的な掃除で削除される）
+        while deleted >= batch_size:
+            deleted = self.writer.run(lambda session: delete_object_children(session, object_id, batch_size))
+        # コミット後に変更を通知
+        publish("object.deleted", object_id, {"id": object_id})
 
     # オブジェクトに関連するメモリを取得
     def get_object_memories(self, object_id: int, limit: Optional[int] = 10) -> List[Dict[str, Any]]:
@@ -191,11 +330,17 @@ class ObjectService:
         
         # メモリにアクセスしたのでlast_accessedを更新
         if memories:
-            jst = pytz.timezone('Asia/Tokyo')
-            current_time = datetime.now(jst)
-            for memory in memories:
-                memory.last_accessed = current_time
-            self.db.commit()
+            current_time = now_ms()
+            memory_ids = [memory.id for memory in memories]
+            
+            def _update_last_accessed(session: Session) -> None:
+                session.query(MemoryDB).filter(MemoryDB.id.in_(memory_ids)).update(
+                    {MemoryDB.last_accessed: current_time}, synchronize_session=False
+                )
+            
+            self.writer.run(_update_last_accessed)
+            # 保存したエポックミリ秒を表示用の日時に変換して返す
+            current_time = from_epoch_ms(current_time)
         
         return [
             {
@@ -204,7 +349,8 @@ class ObjectService:
                 "content": memory.content,
                 "importance": memory.importance,
                 "timestamp": memory.timestamp,
-                "last_accessed": memory.last_accessed
+                "last_accessed": current_time,
+                "version": memory.version
             }
             for memory in memories
         ]
@@ -227,7 +373,8 @@ class ObjectService:
                 "key_features": summary.key_features,
                 "current_daily_tasks": summary.current_daily_tasks,
                 "recent_progress_feelings": summary.recent_progress_feelings,
-                "created_at": summary.created_at
+                "created_at": summary.created_at,
+                "version": summary.version
             }
             for summary in summaries
         ]
@@ -245,4 +392,4 @@ class ObjectService:
 
 # サービスのファクトリー関数
 def get_object_service(db: Session) -> ObjectService:
-    return ObjectService(db) 
\ No newline at end of file
+    return ObjectService(db, writer=get_writer()) 
\ No newline at end of file
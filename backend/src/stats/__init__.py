@@ -0,0 +1,13 @@
+from .models import ObjectStats, GlobalStats, StatsRebuildResult
+from .service import StatsService, get_stats_service, rebuild_stats
+from .router import router
+
+__all__ = [
+    "ObjectStats",
+    "GlobalStats",
+    "StatsRebuildResult",
+    "StatsService",
+    "get_stats_service",
+    "rebuild_stats",
+    "router"
+]
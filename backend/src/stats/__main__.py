@@ -0,0 +1,13 @@
+"""
+統計の再構築コマンド
+
+    cd backend/src && python -m stats
+"""
+from utils.database import SessionLocal, create_tables
+from .service import StatsService
+
+if __name__ == "__main__":
+    create_tables()
+    with SessionLocal() as db:
+        result = StatsService(db).rebuild()
+    print(f"統計を再構築しました: objects={result.objects} corrected={result.corrected}")
@@ -0,0 +1,24 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Dict
+from datetime import datetime
+
+# オブジェクトごとの統計
+class ObjectStats(BaseModel):
+    object_id: int
+    memory_count: int
+    importance_histogram: Dict[int, int] = Field(description="重要度（1-9）ごとのメモリ数")
+    latest_memory_at: Optional[datetime] = None  # メモリがない場合はNone
+    summary_count: int
+
+# 全体の統計
+class GlobalStats(BaseModel):
+    object_count: int
+    memory_count: int
+    importance_histogram: Dict[int, int] = Field(description="重要度（1-9）ごとのメモリ数")
+    latest_memory_at: Optional[datetime] = None
+    summary_count: int
+
+# 統計の再構築結果
+class StatsRebuildResult(BaseModel):
+    objects: int  # 統計を再構築したオブジェクト数
+    corrected: int  # 実データとずれていたオブジェクト数（全体の統計を含む）
@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from .models import ObjectStats, GlobalStats, StatsRebuildResult
+from .service import get_stats_service
+from utils.database import get_db
+
+router = APIRouter(tags=["stats"])
+
+# オブジェクトごとの統計の取得
+@router.get("/objects/{object_id}/stats", response_model=ObjectStats)
+def get_object_stats(object_id: int, db: Session = Depends(get_db)):
+    stats_service = get_stats_service(db)
+    return stats_service.get_object_stats(object_id)
+
+# 全体の統計の取得
+@router.get("/stats/", response_model=GlobalStats)
+def get_global_stats(db: Session = Depends(get_db)):
+    stats_service = get_stats_service(db)
+    return stats_service.get_global_stats()
+
+# 統計の再構築（実データとのずれを補正）
+@router.post("/stats/rebuild", response_model=StatsRebuildResult)
+def rebuild_stats(db: Session = Depends(get_db)):
+    stats_service = get_stats_service(db)
+    return stats_service.rebuild()
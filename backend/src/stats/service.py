@@ -0,0 +1,97 @@
+from typing import Dict, Tuple
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from .models import ObjectStats, GlobalStats, StatsRebuildResult
+from utils.db_models import ObjectDB, ObjectStatsDB, GlobalStatsDB
+from utils.triggers import IMPORTANCE_LEVELS, IMPORTANCE_COLUMNS, rebuild_stats_tables
+from utils.writer import SessionWriter, get_writer
+
+def _histogram(db_stats) -> Dict[int, int]:
+    return {level: getattr(db_stats, column) for level, column in zip(IMPORTANCE_LEVELS, IMPORTANCE_COLUMNS)}
+
+def _snapshot(session: Session) -> Dict[Tuple[str, int], tuple]:
+    """比較用に統計テーブルの内容を取得"""
+    columns = ["memory_count", *IMPORTANCE_COLUMNS, "latest_memory_at", "summary_count"]
+    snapshot = {}
+    for db_stats in session.query(ObjectStatsDB).all():
+        snapshot[("object", db_stats.object_id)] = tuple(getattr(db_stats, column) for column in columns)
+    db_global = session.get(GlobalStatsDB, 1)
+    if db_global is not None:
+        snapshot[("global", 1)] = (db_global.object_count, *(getattr(db_global, column) for column in columns))
+    return snapshot
+
+def rebuild_stats(session: Session) -> StatsRebuildResult:
+    """統計を実データから作り直し、ずれていた件数を返す"""
+    before = _snapshot(session)
+    rebuild_stats_tables(session)
+    # 一括で書き換えたため読み込み済みの統計は破棄して読み直す
+    session.expire_all()
+    after = _snapshot(session)
+    corrected = sum(1 for key, values in after.items() if before.get(key) != values)
+    corrected += sum(1 for key in before if key not in after)
+    return StatsRebuildResult(
+        objects=sum(1 for entity, _ in after if entity == "object"),
+        corrected=corrected
+    )
+
+class StatsService:
+    def __init__(self, db: Session, writer=None):
+        self.db = db
+        # 書き込みはライター経由で行う（未指定の場合はこのセッションで直接コミット）
+        self.writer = writer or SessionWriter(db)
+
+    # オブジェクトごとの統計を取得
+    def get_object_stats(self, object_id: int) -> ObjectStats:
+        db_stats = self.db.get(ObjectStatsDB, object_id)
+        
+        if not db_stats:
+            # 統計行がなくてもオブジェクトが存在する場合は空の統計を返す（再構築で補正される）
+            if not self.db.query(ObjectDB.id).filter(ObjectDB.id == object_id).first():
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Object with id {object_id} not found"
+                )
+            return ObjectStats(
+                object_id=object_id,
+                memory_count=0,
+                importance_histogram={level: 0 for level in IMPORTANCE_LEVELS},
+                latest_memory_at=None,
+                summary_count=0
+            )
+        
+        return ObjectStats(
+            object_id=db_stats.object_id,
+            memory_count=db_stats.memory_count,
+            importance_histogram=_histogram(db_stats),
+            latest_memory_at=db_stats.latest_memory_at,
+            summary_count=db_stats.summary_count
+        )
+
+    # 全体の統計を取得
+    def get_global_stats(self) -> GlobalStats:
+        db_stats = self.db.get(GlobalStatsDB, 1)
+        
+        if not db_stats:
+            return GlobalStats(
+                object_count=0,
+                memory_count=0,
+                importance_histogram={level: 0 for level in IMPORTANCE_LEVELS},
+                latest_memory_at=None,
+                summary_count=0
+            )
+        
+        return GlobalStats(
+            object_count=db_stats.object_count,
+            memory_count=db_stats.memory_count,
+            importance_histogram=_histogram(db_stats),
+            latest_memory_at=db_stats.latest_memory_at,
+            summary_count=db_stats.summary_count
+        )
+
+    # 統計の再構築
+    def rebuild(self) -> StatsRebuildResult:
+        return self.writer.run(rebuild_stats)
+
+# サービスのファクトリー関数
+def get_stats_service(db: Session) -> StatsService:
+    return StatsService(db, writer=get_writer())
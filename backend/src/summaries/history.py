@@ -0,0 +1,126 @@
+from typing import Dict, Optional, Any
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session, aliased
+from utils.db_models import SummaryHistoryDB
+from utils.deltas import encode_keyframe, encode_delta, decode_keyframe, apply_delta
+import os
+
+# 全体を保存する間隔（バージョン数）。過去の状態の復元は1つの全体と最大でこの数-1個の差分で行える
+SUMMARY_KEYFRAME_INTERVAL = int(os.getenv("SUMMARY_KEYFRAME_INTERVAL", "8"))
+
+# 履歴として保存するフィールド
+HISTORY_FIELDS = ("key_features", "current_daily_tasks", "recent_progress_feelings")
+
+FULL_KINDS = ("create", "keyframe")
+
+def summary_fields(source) -> Dict[str, str]:
+    """サマリー（モデル・DB行・Row）から履歴として保存するフィールドを取り出す"""
+    return {field: getattr(source, field) for field in HISTORY_FIELDS}
+
+def record_summary_created(session: Session, summary_id: int, object_id: int, version: int, fields: Dict[str, str], recorded_at=None) -> None:
+    """作成時の状態を全体として記録する"""
+    session.add(SummaryHistoryDB(
+        summary_id=summary_id,
+        object_id=object_id,
+        version=version,
+        recorded_at=recorded_at,
+        kind="create",
+        data=encode_keyframe(fields)
+    ))
+
+def record_summary_updated(session: Session, summary_id: int, object_id: int, version: int, old_fields: Dict[str, str], new_fields: Dict[str, str]) -> None:
+    """更新後の状態を、直前のバージョンからの差分（一定間隔で全体）として記録する"""
+    last_version, last_keyframe = session.query(
+        func.max(SummaryHistoryDB.version),
+        func.max(case((SummaryHistoryDB.kind.in_(FULL_KINDS), SummaryHistoryDB.version)))
+    ).filter(
+        SummaryHistoryDB.summary_id == summary_id,
+        SummaryHistoryDB.kind != "delete"
+    ).one()
+
+    # 履歴が途切れている場合（履歴導入前の行など）は差分の基準がないため全体を保存する
+    keyframe = (
+        last_keyframe is None
+        or last_version != version - 1
+        or version - last_keyframe >= SUMMARY_KEYFRAME_INTERVAL
+    )
+    session.add(SummaryHistoryDB(
+        summary_id=summary_id,
+        object_id=object_id,
+        version=version,
+        kind="keyframe" if keyframe else "delta",
+        data=encode_keyframe(new_fields) if keyframe else encode_delta(old_fields, new_fields)
+    ))
+
+def record_summary_deleted(session: Session, summary_id: int, object_id: int, version: int) -> None:
+    session.add(SummaryHistoryDB(
+        summary_id=summary_id,
+        object_id=object_id,
+        version=version,
+        kind="delete",
+        data=None
+    ))
+
+def load_summary_at(session: Session, object_id: int, at_ms: int) -> Optional[Dict[str, Any]]:
+    """指定時刻にオブジェクトの最新だったサマリーの状態を復元する（存在しない場合はNone）"""
+    # 指定時刻までに作成され、削除されていない最も新しいサマリー
+    deleted = aliased(SummaryHistoryDB)
+    created = (
+        session.query(SummaryHistoryDB.summary_id, SummaryHistoryDB.recorded_at)
+        .filter(
+            SummaryHistoryDB.object_id == object_id,
+            SummaryHistoryDB.kind == "create",
+            SummaryHistoryDB.recorded_at <= at_ms,
+            ~session.query(deleted.id).filter(
+                deleted.summary_id == SummaryHistoryDB.summary_id,
+                deleted.kind == "delete",
+                deleted.recorded_at <= at_ms
+            ).exists()
+        )
+        .order_by(SummaryHistoryDB.recorded_at.desc(), SummaryHistoryDB.summary_id.desc())
+        .first()
+    )
+    if created is None:
+        return None
+    summary_id, created_at = created
+
+    # 指定時刻の時点のバージョン
+    target_version = session.query(func.max(SummaryHistoryDB.version)).filter(
+        SummaryHistoryDB.summary_id == summary_id,
+        SummaryHistoryDB.kind != "delete",
+        SummaryHistoryDB.recorded_at <= at_ms
+    ).scalar()
+
+    # 直前の全体を1つ読み込み、その後の差分を順に適用する
+    keyframe = (
+        session.query(SummaryHistoryDB.version, SummaryHistoryDB.data)
+        .filter(
+            SummaryHistoryDB.summary_id == summary_id,
+            SummaryHistoryDB.kind.in_(FULL_KINDS),
+            SummaryHistoryDB.version <= target_version
+        )
+        .order_by(SummaryHistoryDB.version.desc())
+        .first()
+    )
+    fields = decode_keyframe(keyframe.data)
+    deltas = (
+        session.query(SummaryHistoryDB.data)
+        .filter(
+            SummaryHistoryDB.summary_id == summary_id,
+            SummaryHistoryDB.kind == "delta",
+            SummaryHistoryDB.version > keyframe.version,
+            SummaryHistoryDB.version <= target_version
+        )
+        .order_by(SummaryHistoryDB.version)
+        .all()
+    )
+    for delta in deltas:
+        fields = apply_delta(fields, delta.data)
+
+    return {
+        "id": summary_id,
+        "object_id": object_id,
+        **fields,
+        "created_at": created_at,
+        "version": target_version
+    }
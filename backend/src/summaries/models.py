@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
@@ -10,6 +10,7 @@ class Summary(BaseModel):
     current_daily_tasks: str
     recent_progress_feelings: str
     created_at: datetime  # 作成時に必ず設定される
+    version: int  # 更新のたびに1ずつ増える
 
 # 作成のリクエストパラメーター
 class SummaryCreate(BaseModel):
@@ -23,6 +24,7 @@ class SummaryUpdate(BaseModel):
     key_features: Optional[str] = None
     current_daily_tasks: Optional[str] = None
     recent_progress_feelings: Optional[str] = None
+    expected_version: Optional[int] = Field(default=None, description="更新前に期待するバージョン（一致しない場合は409）")
 
 # 取得のリクエストパラメーター
 class SummaryQuery(BaseModel):
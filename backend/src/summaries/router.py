@@ -1,27 +1,41 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Header, Response
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from .models import Summary, SummaryCreate, SummaryUpdate, SummaryQuery
 from .service import get_summary_service
 from utils.database import get_db
+from utils.etag import format_etag, parse_if_match
+from utils.singleflight import coalesced_json
 
 router = APIRouter(prefix="/summaries", tags=["summaries"])
 
 # レコードの作成
 @router.post("/", response_model=Summary)
-async def create_summary(summary_data: SummaryCreate, db: Session = Depends(get_db)):
+def create_summary(summary_data: SummaryCreate, db: Session = Depends(get_db)):
     summary_service = get_summary_service(db)
     return summary_service.create_summary(summary_data)
 
+# 複数オブジェクトの最新のサマリーを取得（/{summary_id}より先に定義する）
+@router.get("/latest", response_model=List[Summary])
+def get_latest_summaries(
+    object_ids: List[int] = Query(..., description="オブジェクトID（複数指定可）"),
+    db: Session = Depends(get_db)
+):
+    summary_service = get_summary_service(db)
+    return summary_service.get_latest_summaries(object_ids)
+
 # 単一レコードの取得
 @router.get("/{summary_id}", response_model=Summary)
-async def get_summary(summary_id: int, db: Session = Depends(get_db)):
+def get_summary(summary_id: int, response: Response, db: Session = Depends(get_db)):
     summary_service = get_summary_service(db)
-    return summary_service.get_summary(summary_id)
+    result = summary_service.get_summary(summary_id)
+    # 更新時にIf-Matchで指定できるようバージョンをETagで返す
+    response.headers["ETag"] = format_etag(result.version)
+    return result
 
 # レコードの取得（複数）
 @router.get("/", response_model=List[Summary])
-async def get_summaries(
+def get_summaries(
     object_id: int = Query(..., description="オブジェクトID"),
     limit: Optional[int] = Query(10, description="取得件数制限"),
     db: Session = Depends(get_db)
@@ -31,17 +45,26 @@ async def get_summaries(
         object_id=object_id,
         limit=limit
     )
-    return summary_service.get_summaries(query)
+    # 同時に届いた同一リクエストは1回の実行にまとめる
+    return coalesced_json("summaries.list", lambda: summary_service.get_summaries(query), object_id=object_id, limit=limit)
 
 # レコードの更新
 @router.put("/{summary_id}", response_model=Summary)
-async def update_summary(summary_id: int, update_data: SummaryUpdate, db: Session = Depends(get_db)):
+def update_summary(
+    summary_id: int,
+    update_data: SummaryUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None, description="更新前に期待するバージョン（一致しない場合は409）"),
+    db: Session = Depends(get_db)
+):
     summary_service = get_summary_service(db)
-    return summary_service.update_summary(summary_id, update_data)
+    result = summary_service.update_summary(summary_id, update_data, expected_version=parse_if_match(if_match))
+    response.headers["ETag"] = format_etag(result.version)
+    return result
 
 # レコードの削除
 @router.delete("/{summary_id}")
-async def delete_summary(summary_id: int, db: Session = Depends(get_db)):
+def delete_summary(summary_id: int, db: Session = Depends(get_db)):
     summary_service = get_summary_service(db)
     summary_service.delete_summary(summary_id)
     return {"message": f"Summary {summary_id} deleted successfully"} 
\ No newline at end of file
@@ -1,14 +1,34 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
 from .models import Summary, SummaryCreate, SummaryUpdate, SummaryQuery
 from utils.db_models import SummaryDB, ObjectDB
-import pytz
+from utils.writer import SessionWriter, get_writer
+from utils.events import publish
+from utils.timestamps import now_ms, to_epoch_ms
+from changes.service import record_change
+from .history import summary_fields, record_summary_created, record_summary_updated, record_summary_deleted, load_summary_at
+
+# 最新のサマリーを一括取得する際のオブジェクト数の上限
+MAX_LATEST_OBJECTS = 1000
+
+def _latest_summary_id(object_id: int):
+    """オブジェクトの最新のサマリーのIDを求めるサブクエリ"""
+    return (
+        select(SummaryDB.id)
+        .where(SummaryDB.object_id == object_id)
+        .order_by(SummaryDB.created_at.desc(), SummaryDB.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
 
 class SummaryService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, writer=None):
         self.db = db
+        # 書き込みはライター経由で行う（未指定の場合はこのセッションで直接コミット）
+        self.writer = writer or SessionWriter(db)
 
     def _validate_string_field(self, field_name: str, value: str) -> None:
         """文字列フィールドが1文字以上であることを確認"""
@@ -18,6 +38,17 @@ class SummaryService:
                 detail=f"{field_name} must be at least 1 character long"
             )
 
+    def _to_model(self, db_summary: SummaryDB) -> Summary:
+        return Summary(
+            id=db_summary.id,
+            object_id=db_summary.object_id,
+            key_features=db_summary.key_features,
+            current_daily_tasks=db_summary.current_daily_tasks,
+            recent_progress_feelings=db_summary.recent_progress_feelings,
+            created_at=db_summary.created_at,
+            version=db_summary.version
+        )
+
     # レコードの作成
     def create_summary(self, summary_data: SummaryCreate) -> Summary:
         # 文字列フィールドのバリデーション
@@ -25,34 +56,51 @@ class SummaryService:
         self._validate_string_field("Current daily tasks", summary_data.current_daily_tasks)
         self._validate_string_field("Recent progress feelings", summary_data.recent_progress_feelings)
         
-        # 外部キー（object_id）の存在確認
-        existing_object = self.db.query(ObjectDB).filter(ObjectDB.id == summary_data.object_id).first()
-        if not existing_object:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Object with id {summary_data.object_id} not found"
+        def _create(session: Session) -> Summary:
+            # 外部キー（object_id）の存在確認
+            existing_object = session.query(ObjectDB).filter(ObjectDB.id == summary_data.object_id).first()
+            if not existing_object:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Object with id {summary_data.object_id} not found"
+                )
+            
+            db_summary = SummaryDB(
+                object_id=summary_data.object_id,
+                key_features=summary_data.key_features,
+                current_daily_tasks=summary_data.current_daily_tasks,
+                recent_progress_feelings=summary_data.recent_progress_feelings,
+                created_at=now_ms()
             )
+            
+            session.add(db_summary)
+            session.flush()
+            session.refresh(db_summary)
+            
+            # 作成したサマリーが最新になる
+            session.execute(
+                update(ObjectDB).where(ObjectDB.id == summary_data.object_id).values(latest_summary_id=db_summary.id),
+                execution_options={"synchronize_session": False}
+            )
+            
+            summary = Summary(
+                id=db_summary.id,
+                object_id=db_summary.object_id,
+                key_features=db_summary.key_features,
+                current_daily_tasks=db_summary.current_daily_tasks,
+                recent_progress_feelings=db_summary.recent_progress_feelings,
+                created_at=db_summary.created_at,
+                version=db_summary.version
+            )
+            # 同じトランザクション内で履歴と変更ログを記録
+            record_summary_created(session, summary.id, summary.object_id, summary.version, summary_fields(summary), db_summary.created_at)
+            record_change(session, "summary", summary.id, summary.object_id, "upsert", summary)
+            return summary
         
-        db_summary = SummaryDB(
-            object_id=summary_data.object_id,
-            key_features=summary_data.key_features,
-            current_daily_tasks=summary_data.current_daily_tasks,
-            recent_progress_feelings=summary_data.recent_progress_feelings,
-            created_at=datetime.now(pytz.timezone('Asia/Tokyo'))
-        )
-        
-        self.db.add(db_summary)
-        self.db.commit()
-        self.db.refresh(db_summary)
-        
-        return Summary(
-            id=db_summary.id,
-            object_id=db_summary.object_id,
-            key_features=db_summary.key_features,
-            current_daily_tasks=db_summary.current_daily_tasks,
-            recent_progress_feelings=db_summary.recent_progress_feelings,
-            created_at=db_summary.created_at
-        )
+        summary = self.writer.run(_create)
+        # コミット後に変更を通知
+        publish("summary.created", summary.object_id, summary)
+        return summary
 
     # 単一レコードの取得
     def get_summary(self, summary_id: int) -> Summary:
@@ -70,7 +118,8 @@ class SummaryService:
             key_features=db_summary.key_features,
             current_daily_tasks=db_summary.current_daily_tasks,
             recent_progress_feelings=db_summary.recent_progress_feelings,
-            created_at=db_summary.created_at
+            created_at=db_summary.created_at,
+            version=db_summary.version
         )
 
     # レコードの取得（複数）
@@ -99,71 +148,197 @@ class SummaryService:
                 key_features=db_summary.key_features,
                 current_daily_tasks=db_summary.current_daily_tasks,
                 recent_progress_feelings=db_summary.recent_progress_feelings,
-                created_at=db_summary.created_at
+                created_at=db_summary.created_at,
+                version=db_summary.version
             )
             for db_summary in db_summaries
         ]
 
     # レコードの更新
-    def update_summary(self, summary_id: int, update_data: SummaryUpdate) -> Summary:
-        db_summary = self.db.query(SummaryDB).filter(SummaryDB.id == summary_id).first()
+    def update_summary(self, summary_id: int, update_data: SummaryUpdate, expected_version: Optional[int] = None) -> Summary:
+        try:
+            update_dict = update_data.model_dump(exclude_unset=True)
         
-        if not db_summary:
+            # 空文字列やNoneのフィールドを除外
+            valid_update_dict = {}
+            for key, value in update_dict.items():
+                if key in ['key_features', 'current_daily_tasks', 'recent_progress_feelings']:
+                    # 文字列フィールドの場合は空文字列や空白のみの場合は除外
+                    if value is not None and len(str(value).strip()) > 0:
+                        field_name_map = {
+                            'key_features': 'Key features',
+                            'current_daily_tasks': 'Current daily tasks',
+                            'recent_progress_feelings': 'Recent progress feelings'
+                        }
+                        self._validate_string_field(field_name_map[key], value)
+                        valid_update_dict[key] = value
+        
+            # 更新するフィールドがない場合は400エラー
+            if not valid_update_dict:
+                raise HTTPException(
+                    status_code=400,
+                    detail="No valid fields to update. All provided fields are empty or invalid."
+                )
+        except HTTPException as exc:
+            # 入力が不正な場合だけ存在を確認し、存在しなければ404を優先する（更新が成功する場合は事前のSELECTを行わない）
+            if exc.status_code == 400 and not self.db.query(SummaryDB.id).filter(SummaryDB.id == summary_id).first():
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Summary with id {summary_id} not found"
+                )
+            raise
+        
+        # 期待するバージョンの指定がなければリクエストボディの値を使う
+        if expected_version is None:
+            expected_version = update_data.expected_version
+        
+        valid_update_dict["version"] = SummaryDB.version + 1
+        
+        def _update(session: Session) -> Summary:
+            # 履歴の差分を作るため更新前の値を取得する（存在確認を兼ねる）
+            # SQLiteのRETURNINGは更新後の値しか返せないため、サマリーだけは更新前に1回読み込む
+            before = session.query(
+                SummaryDB.key_features,
+                SummaryDB.current_daily_tasks,
+                SummaryDB.recent_progress_feelings
+            ).filter(SummaryDB.id == summary_id).first()
+            
+            if before is None:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Summary with id {summary_id} not found"
+                )
+            
+            # バージョンの確認と更新は1回のUPDATE ... RETURNINGで行う
+            stmt = update(SummaryDB).where(SummaryDB.id == summary_id)
+            if expected_version is not None:
+                stmt = stmt.where(SummaryDB.version == expected_version)
+            stmt = stmt.values(valid_update_dict).returning(
+                SummaryDB.id,
+                SummaryDB.object_id,
+                SummaryDB.key_features,
+                SummaryDB.current_daily_tasks,
+                SummaryDB.recent_progress_feelings,
+                SummaryDB.created_at,
+                SummaryDB.version
+            )
+            row = session.execute(stmt, execution_options={"synchronize_session": False}).first()
+            
+            if row is None:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Summary with id {summary_id} has been modified (expected version {expected_version})"
+                )
+            
+            summary = Summary(**row._mapping)
+            # 同じトランザクション内で履歴と変更ログを記録
+            record_summary_updated(session, summary.id, summary.object_id, summary.version, summary_fields(before), summary_fields(summary))
+            record_change(session, "summary", summary.id, summary.object_id, "upsert", summary)
+            return summary
+        
+        summary = self.writer.run(_update)
+        # コミット後に変更を通知
+        publish("summary.updated", summary.object_id, summary)
+        return summary
+
+    # レコードの削除
+    def delete_summary(self, summary_id: int) -> None:
+        def _delete(session: Session) -> int:
+            db_summary = session.query(SummaryDB).filter(SummaryDB.id == summary_id).first()
+            
+            if not db_summary:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"Summary with id {summary_id} not found"
+                )
+            
+            object_id = db_summary.object_id
+            record_summary_deleted(session, summary_id, object_id, db_summary.version)
+            session.delete(db_summary)
+            session.flush()
+            
+            # 最新のサマリーを削除した場合のみ、次に新しいサマリーを指すよう更新する
+            session.execute(
+                update(ObjectDB)
+                .where(ObjectDB.id == object_id, ObjectDB.latest_summary_id == summary_id)
+                .values(latest_summary_id=_latest_summary_id(object_id)),
+                execution_options={"synchronize_session": False}
+            )
+            record_change(session, "summary", summary_id, object_id, "delete")
+            return object_id
+        
+        object_id = self.writer.run(_delete)
+        # コミット後に変更を通知
+        publish("summary.deleted", object_id, {"id": summary_id})
+
+    # オブジェクトの最新のサマリーを取得
+    def get_latest_summary(self, object_id: int) -> Summary:
+        row = (
+            self.db.query(ObjectDB.id, SummaryDB)
+            .outerjoin(SummaryDB, SummaryDB.id == ObjectDB.latest_summary_id)
+            .filter(ObjectDB.id == object_id)
+            .first()
+        )
+        
+        if row is None:
             raise HTTPException(
                 status_code=404,
-                detail=f"Summary with id {summary_id} not found"
+                detail=f"Object with id {object_id} not found"
             )
         
-        update_dict = update_data.model_dump(exclude_unset=True)
-        
-        # 空文字列やNoneのフィールドを除外
-        valid_update_dict = {}
-        for key, value in update_dict.items():
-            if key in ['key_features', 'current_daily_tasks', 'recent_progress_feelings']:
-                # 文字列フィールドの場合は空文字列や空白のみの場合は除外
-                if value is not None and len(str(value).strip()) > 0:
-                    field_name_map = {
-                        'key_features': 'Key features',
-                        'current_daily_tasks': 'Current daily tasks',
-                        'recent_progress_feelings': 'Recent progress feelings'
-                    }
-                    self._validate_string_field(field_name_map[key], value)
-                    valid_update_dict[key] = value
-        
-        # 更新するフィールドがない場合は400エラー
-        if not valid_update_dict:
+        db_summary = row[1]
+        if db_summary is None:
             raise HTTPException(
-                status_code=400,
-                detail="No valid fields to update. All provided fields are empty or invalid."
+                status_code=404,
+                detail=f"No summaries found for object_id {object_id}"
             )
         
-        for key, value in valid_update_dict.items():
-            setattr(db_summary, key, value)
-        
-        self.db.commit()
+        return self._to_model(db_summary)
+
+    # 複数オブジェクトの最新のサマリーを取得（サマリーがないオブジェクトは含まない）
+    def get_latest_summaries(self, object_ids: List[int]) -> List[Summary]:
+        if not object_ids:
+            raise HTTPException(
+                status_code=400,
+                detail="At least one object_id is required"
+            )
+        if len(object_ids) > MAX_LATEST_OBJECTS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Up to {MAX_LATEST_OBJECTS} object_ids can be requested at once"
+            )
         
-        return Summary(
-            id=db_summary.id,
-            object_id=db_summary.object_id,
-            key_features=db_summary.key_features,
-            current_daily_tasks=db_summary.current_daily_tasks,
-            recent_progress_feelings=db_summary.recent_progress_feelings,
-            created_at=db_summary.created_at
+        # ポインターを使った1回の結合で取得する
+        db_summaries = (
+            self.db.query(SummaryDB)
+            .join(ObjectDB, ObjectDB.latest_summary_id == SummaryDB.id)
+            .filter(ObjectDB.id.in_(set(object_ids)))
+            .order_by(SummaryDB.object_id)
+            .all()
         )
+        
+        return [self._to_model(db_summary) for db_summary in db_summaries]
 
-    # レコードの削除
-    def delete_summary(self, summary_id: int) -> None:
-        db_summary = self.db.query(SummaryDB).filter(SummaryDB.id == summary_id).first()
+    # 指定時刻のオブジェクトのサマリーを履歴から復元して取得（未指定の場合は最新）
+    def get_summary_at(self, object_id: int, at: Optional[datetime] = None) -> Summary:
+        if at is None:
+            return self.get_latest_summary(object_id)
         
-        if not db_summary:
+        if not self.db.query(ObjectDB.id).filter(ObjectDB.id == object_id).first():
             raise HTTPException(
                 status_code=404,
-                detail=f"Summary with id {summary_id} not found"
+                detail=f"Object with id {object_id} not found"
+            )
+        
+        state = load_summary_at(self.db, object_id, to_epoch_ms(at))
+        if state is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No summary found for object_id {object_id} at {at.isoformat()}"
             )
         
-        self.db.delete(db_summary)
-        self.db.commit()
+        return Summary(**state)
 
 # サービスのファクトリー関数
 def get_summary_service(db: Session) -> SummaryService:
-    return SummaryService(db) 
\ No newline at end of file
+    return SummaryService(db, writer=get_writer()) 
\ No newline at end of file
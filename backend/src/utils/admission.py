@@ -0,0 +1,305 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 優先度（値が小さいほど優先される）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# リクエストの優先度・待ち時間上限を指定するヘッダー
+PRIORITY_HEADER = b"x-request-priority"
+DEADLINE_HEADER = b"x-request-deadline-ms"
+
+# 優先度ごとのデフォルトの待ち時間上限（ミリ秒）
+DEFAULT_DEADLINE_MS = {
+    PRIORITY_INTERACTIVE: float(os.getenv("ADMISSION_DEADLINE_MS_INTERACTIVE", "2000")),
+    PRIORITY_BACKGROUND: float(os.getenv("ADMISSION_DEADLINE_MS_BACKGROUND", "10000")),
+}
+
+# ルートグループごとの同時実行数と待ち行列の上限
+DEFAULT_LIMITS = {
+    "chat": 4,
+    "details": 16,
+    "reads": 32,
+    "writes": 16,
+}
+DEFAULT_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+
+# 流量制御の対象外とするパス（長時間接続するイベント配信を含む）
+BYPASS_PATHS = ("/docs", "/redoc", "/openapi.json", "/metrics", "/events")
+
+class RouteRule:
+    """
+    パスとメソッドからルートグループと優先度を決めるルール。
+    streaming=Trueのルートはレスポンスを開始した時点で実行枠を解放する（ストリームの間は枠を使い続けない）。
+    """
+
+    def __init__(
+        self, pattern: str, pool: str, priority: int = PRIORITY_INTERACTIVE,
+        methods: Optional[Tuple[str, ...]] = None, streaming: bool = False,
+    ):
+        self.pattern = re.compile(pattern)
+        self.pool = pool
+        self.priority = priority
+        self.methods = methods
+        self.streaming = streaming
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        return self.pattern.search(path) is not None
+
+DEFAULT_RULES = [
+    # 返答のストリームは開始までを制限する（生成中の推論の数はnpc/scheduler.pyが制限する）
+    RouteRule(r"^/npc/[^/]+/chat/stream$", "chat", streaming=True),
+    RouteRule(r"^/npc/[^/]+/chat", "chat"),
+    RouteRule(r"^/objects/[^/]+/details$", "details", methods=("GET",)),
+    # 差分同期・統計の再集計・サマリーの書き込み（会話の要約）はバックグラウンドの処理
+    RouteRule(r"^/changes/?$", "reads", PRIORITY_BACKGROUND, methods=("GET", "HEAD")),
+    RouteRule(r"^/stats/rebuild$", "writes", PRIORITY_BACKGROUND),
+    RouteRule(r"^/summaries/", "writes", PRIORITY_BACKGROUND, methods=("POST", "PUT", "DELETE")),
+    RouteRule(r"", "reads", methods=("GET", "HEAD")),
+    RouteRule(r"", "writes"),
+]
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+
+class _Waiter:
+    def __init__(self, priority: int, future: "asyncio.Future"):
+        self.priority = priority
+        self.future = future
+        self.cancelled = False
+
+class AdmissionPool:
+    """同時実行数を制限し、あふれたリクエストを優先度付きの待ち行列で待たせるプール"""
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._heap: List[Tuple[int, int, _Waiter]] = []
+        self._counter = itertools.count()
+        self._queued = {PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+        # 処理時間の指数移動平均（秒）。待ち時間の見積もりに使う
+        self.avg_service_time = 0.05
+        # 統計情報
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    def estimate_wait(self, ahead: int) -> float:
+        """待ち行列で前にいるリクエスト数から待ち時間を見積もる"""
+        return (ahead + 1) * self.avg_service_time / self.limit
+
+    def _ahead_of(self, priority: int) -> int:
+        return sum(count for p, count in self._queued.items() if p <= priority)
+
+    def _shed_lowest(self, priority: int) -> bool:
+        """自分より優先度の低い待ちリクエストを1件追い出して空きを作る"""
+        candidates = [entry for entry in self._heap if not entry[2].cancelled and entry[0] > priority]
+        if not candidates:
+            return False
+        victim = max(candidates)[2]
+        self._remove(victim)
+        self.shed += 1
+        if not victim.future.done():
+            victim.future.set_exception(AdmissionRejected(self.estimate_wait(self.queued)))
+        return True
+
+    def _remove(self, waiter: _Waiter) -> None:
+        waiter.cancelled = True
+        self._queued[waiter.priority] -= 1
+
+    async def acquire(self, priority: int, deadline: float) -> None:
+        """実行枠を確保する。期限内に確保できない場合はAdmissionRejectedを送出"""
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        timeout = deadline - time.monotonic()
+        estimated = self.estimate_wait(self._ahead_of(priority))
+        # 待ち行列が満杯か、期限内に順番が来る見込みがなければ即座に拒否する
+        if self.queued >= self.max_queue and not self._shed_lowest(priority):
+            self.rejected += 1
+            raise AdmissionRejected(estimated)
+        if estimated > timeout:
+            self.rejected += 1
+            raise AdmissionRejected(estimated)
+
+        waiter = _Waiter(priority, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._heap, (priority, next(self._counter), waiter))
+        self._queued[priority] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if waiter.future.done() and not waiter.future.exception():
+                # 期限直前に枠が割り当てられた場合はそのまま実行する
+                self.admitted += 1
+                return
+            self._remove(waiter)
+            self.rejected += 1
+            raise AdmissionRejected(self.estimate_wait(self.queued))
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.exception():
+                self.release(0.0)
+            elif not waiter.cancelled:
+                self._remove(waiter)
+            raise
+        except AdmissionRejected:
+            # 優先度の高いリクエストに追い出された（shedとして計上済み）
+            raise
+        self.admitted += 1
+
+    def release(self, elapsed: float) -> None:
+        """実行枠を解放し、待ち行列の先頭に引き渡す"""
+        if elapsed > 0:
+            self.avg_service_time = self.avg_service_time * 0.9 + elapsed * 0.1
+        while self._heap:
+            _, _, waiter = heapq.heappop(self._heap)
+            if waiter.cancelled:
+                continue
+            self._queued[waiter.priority] -= 1
+            if waiter.future.done():
+                continue
+            # 枠をそのまま次のリクエストに引き渡す
+            waiter.future.set_result(True)
+            return
+        self.active -= 1
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "limit": self.limit,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "queued_by_priority": {PRIORITY_NAMES[p]: count for p, count in self._queued.items()},
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "avg_service_ms": round(self.avg_service_time * 1000, 3),
+        }
+
+class AdmissionController:
+    """ルートグループごとのプールを管理する"""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, queue_size: int = DEFAULT_QUEUE_SIZE, rules: Optional[List[RouteRule]] = None):
+        limits = limits or {
+            name: int(os.getenv(f"ADMISSION_LIMIT_{name.upper()}", str(limit)))
+            for name, limit in DEFAULT_LIMITS.items()
+        }
+        self.pools = {name: AdmissionPool(name, limit, queue_size) for name, limit in limits.items()}
+        self.rules = rules or DEFAULT_RULES
+
+    def classify(self, method: str, path: str) -> Optional[Tuple[AdmissionPool, int, bool]]:
+        """(プール, 優先度, ストリーミングか) を返す。流量制御の対象外の場合はNone"""
+        if path.startswith(BYPASS_PATHS):
+            return None
+        for rule in self.rules:
+            if rule.matches(method, path) and rule.pool in self.pools:
+                return self.pools[rule.pool], rule.priority, rule.streaming
+        return None
+
+    def metrics(self) -> Dict[str, Dict[str, object]]:
+        return {name: pool.metrics() for name, pool in self.pools.items()}
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+class AdmissionMiddleware:
+    """同時実行数の上限を超えたリクエストを待たせ、期限内に処理できない場合は503を返すASGIミドルウェア"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        classified = self.controller.classify(scope["method"], scope["path"])
+        if classified is None:
+            await self.app(scope, receive, send)
+            return
+        pool, priority, streaming = classified
+
+        # ヘッダーでバックグラウンド処理として明示された場合は優先度を下げる
+        if (_header(scope, PRIORITY_HEADER) or "").lower() == "background":
+            priority = PRIORITY_BACKGROUND
+        deadline_ms = DEFAULT_DEADLINE_MS[priority]
+        requested = _header(scope, DEADLINE_HEADER)
+        if requested:
+            try:
+                deadline_ms = min(deadline_ms, float(requested))
+            except ValueError:
+                pass
+
+        try:
+            await pool.acquire(priority, time.monotonic() + deadline_ms / 1000.0)
+        except AdmissionRejected as exc:
+            await self._reject(send, exc.retry_after)
+            return
+
+        started = time.monotonic()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                pool.release(time.monotonic() - started)
+
+        async def send_streaming(message):
+            # ストリームを開始したら実行枠を次のリクエストに引き渡す
+            if message["type"] == "http.response.start":
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_streaming if streaming else send)
+        finally:
+            release()
+
+    async def _reject(self, send, retry_after: float) -> None:
+        body = json.dumps({"detail": "Server is busy. Please retry later."}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+_controller: Optional[AdmissionController] = None
+
+def get_admission_controller() -> AdmissionController:
+    """アプリケーション全体で共有する流量制御を取得"""
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController()
+    return _controller
@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.pool import StaticPool
 import os
+from .migrations import is_fresh_database, run_migrations
 
 # データベースファイルのパス
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/aimonitoringgame.db")
@@ -17,6 +18,46 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def _is_file_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and ":memory:" not in url
+
+def enable_write_transactions(target_engine) -> None:
+    """
+    書き込み専用エンジン向けの設定。
+    pysqliteの暗黙トランザクションを無効にしてBEGIN IMMEDIATEを自前で発行し、
+    SAVEPOINTが正しく動作するようにする。
+    """
+    @event.listens_for(target_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        dbapi_connection.execute("PRAGMA busy_timeout=5000")
+
+    @event.listens_for(target_engine, "begin")
+    def _on_begin(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+if _is_file_sqlite(DATABASE_URL):
+    # WALモードにして読み込みが書き込みを待たないようにする
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+    # 書き込みキュー専用のコネクション
+    writer_engine = create_engine(
+        DATABASE_URL,
+        poolclass=StaticPool,
+        connect_args={"check_same_thread": False}
+    )
+    enable_write_transactions(writer_engine)
+else:
+    # インメモリDBなど別コネクションを張れない場合は共有する
+    writer_engine = engine
+
+WriterSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=writer_engine)
+
 # データベースセッションの依存関係
 def get_db():
     db = SessionLocal()
@@ -27,4 +68,7 @@ def get_db():
 
 # テーブル作成
 def create_tables():
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    fresh = is_fresh_database(engine)
+    Base.metadata.create_all(bind=engine)
+    # 既存のデータベースには未適用のスキーマ変更を適用する
+    run_migrations(engine, fresh)
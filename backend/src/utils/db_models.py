@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, Index, LargeBinary, event
 from sqlalchemy.orm import relationship
 from .database import Base
-from datetime import datetime
-import pytz
+from .timestamps import EpochMillis, now_ms
+from .triggers import create_triggers
 
 class ObjectDB(Base):
     __tablename__ = "objects"
@@ -12,33 +12,178 @@ class ObjectDB(Base):
     summary = Column(String, nullable=False)
     description = Column(String, nullable=False)
     photos = Column(Text, default="[]")  # JSON文字列として多次元配列を保存
+    version = Column(Integer, nullable=False, default=1)  # 楽観的排他制御用のバージョン
+    # 最新のサマリーのID（SummaryServiceの書き込みで更新。サマリーがない場合はNone）
+    latest_summary_id = Column(Integer, nullable=True)
     
     # リレーションシップ
-    memories = relationship("MemoryDB", back_populates="object")
-    summaries = relationship("SummaryDB", back_populates="object")
+    # 子の行は削除時に読み込まず、サービス側でまとめて削除する
+    memories = relationship("MemoryDB", back_populates="object", passive_deletes=True)
+    summaries = relationship("SummaryDB", back_populates="object", passive_deletes=True)
 
 class MemoryDB(Base):
     __tablename__ = "memories"
     
     id = Column(Integer, primary_key=True, index=True)
-    object_id = Column(Integer, ForeignKey("objects.id"), nullable=False)
+    object_id = Column(Integer, ForeignKey("objects.id"), nullable=False, index=True)
     content = Column(String, nullable=False)
     importance = Column(Integer, default=5)
-    timestamp = Column(DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Tokyo')))
-    last_accessed = Column(DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Tokyo')))
+    timestamp = Column(EpochMillis, default=now_ms)  # エポックミリ秒で保存
+    last_accessed = Column(EpochMillis, default=now_ms)
+    version = Column(Integer, nullable=False, default=1)  # 楽観的排他制御用のバージョン
     
     # リレーションシップ
     object = relationship("ObjectDB", back_populates="memories")
+    
+    __table_args__ = (
+        # オブジェクトごとの一覧（重要度・最終アクセス順）用
+        Index("ix_memories_object_importance_accessed", "object_id", "importance", "last_accessed"),
+        # オブジェクトごとの最新のメモリ時刻用
+        Index("ix_memories_object_timestamp", "object_id", "timestamp"),
+    )
 
 class SummaryDB(Base):
     __tablename__ = "summaries"
     
     id = Column(Integer, primary_key=True, index=True)
-    object_id = Column(Integer, ForeignKey("objects.id"), nullable=False)
+    object_id = Column(Integer, ForeignKey("objects.id"), nullable=False, index=True)
     key_features = Column(String, nullable=False)
     current_daily_tasks = Column(String, nullable=False)
     recent_progress_feelings = Column(String, nullable=False)
-    created_at = Column(DateTime, default=lambda: datetime.now(pytz.timezone('Asia/Tokyo')))
+    created_at = Column(EpochMillis, default=now_ms)  # エポックミリ秒で保存
+    version = Column(Integer, nullable=False, default=1)  # 楽観的排他制御用のバージョン
     
     # リレーションシップ
-    object = relationship("ObjectDB", back_populates="summaries") 
\ No newline at end of file
+    object = relationship("ObjectDB", back_populates="summaries")
+    
+    __table_args__ = (
+        # オブジェクトごとの一覧（新しい順）用
+        Index("ix_summaries_object_created", "object_id", "created_at"),
+    )
+
+class SummaryHistoryDB(Base):
+    __tablename__ = "summary_history"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    summary_id = Column(Integer, nullable=False)
+    object_id = Column(Integer, nullable=False, index=True)
+    version = Column(Integer, nullable=False)  # この時点のサマリーのバージョン
+    recorded_at = Column(EpochMillis, nullable=False, default=now_ms)
+    # "create"（作成時の全体） / "keyframe"（全体） / "delta"（前のバージョンからの差分） / "delete"（削除）
+    kind = Column(String, nullable=False)
+    data = Column(LargeBinary, nullable=True)  # zlibで圧縮したJSON（deleteの場合はNone）
+    
+    __table_args__ = (
+        Index("ix_summary_history_summary_version", "summary_id", "version"),
+        # 指定時刻に最新だったサマリーの検索用
+        Index("ix_summary_history_object_kind_recorded", "object_id", "kind", "recorded_at"),
+    )
+
+class ChatMessageDB(Base):
+    __tablename__ = "chat_messages"
+    
+    # 追記のみ（削除はオブジェクトの削除時のみ）。IDは再利用せず、ページングのキーに使う
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    object_id = Column(Integer, ForeignKey("objects.id"), nullable=False)
+    sender = Column(String, nullable=False)  # "player" / "npc"
+    content = Column(Text, nullable=False)
+    tokens = Column(Integer, nullable=False, default=0)  # 本文のトークン数（書き込み時に数えて保存）
+    created_at = Column(EpochMillis, nullable=False, default=now_ms)  # エポックミリ秒で保存
+    
+    __table_args__ = (
+        # 会話ごとの履歴（IDの降順でのページング）用
+        Index("ix_chat_messages_object_id", "object_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+class ConversationDB(Base):
+    __tablename__ = "conversations"
+    
+    # NPC（オブジェクト）ごとの会話の最新メッセージと未読数（メッセージの書き込みで更新）
+    id = Column(Integer, primary_key=True)
+    object_id = Column(Integer, ForeignKey("objects.id"), nullable=False, unique=True)
+    latest_message_id = Column(Integer, nullable=False)
+    latest_at = Column(EpochMillis, nullable=False)
+    message_count = Column(Integer, nullable=False, default=0)
+    unread_count = Column(Integer, nullable=False, default=0)
+    last_read_message_id = Column(Integer, nullable=True)
+    # 古い発言を畳み込んだ要約と、要約に含めた最後のメッセージのID
+    summary = Column(Text, nullable=True)
+    summary_tokens = Column(Integer, nullable=False, default=0)
+    summarized_through_id = Column(Integer, nullable=True)
+    # まだ要約に含めていないメッセージの件数とトークン数の合計
+    pending_count = Column(Integer, nullable=False, default=0)
+    pending_tokens = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # 会話の一覧（新しい順）用
+        Index("ix_conversations_latest", "latest_at", "object_id"),
+    )
+
+class ChangeLogDB(Base):
+    __tablename__ = "change_log"
+    
+    # 単調増加のシーケンス番号（削除後も再利用しない）
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String, nullable=False)  # "object" / "memory" / "summary"
+    entity_id = Column(Integer, nullable=False)
+    object_id = Column(Integer, nullable=True)
+    op = Column(String, nullable=False)  # "upsert" / "delete"
+    data = Column(Text, nullable=True)  # upsert時の行のJSON（deleteの場合はNone）
+    
+    __table_args__ = (
+        Index("ix_change_log_entity", "entity", "entity_id"),
+        # オブジェクトごとの最新の変更番号（プロンプトのキャッシュの無効化に使う）
+        Index("ix_change_log_object_seq", "object_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+class ChangeLogStateDB(Base):
+    __tablename__ = "change_log_state"
+    
+    id = Column(Integer, primary_key=True)
+    # この番号以前の削除記録は破棄済み（これより古いsinceからは差分同期できない）
+    truncated_seq = Column(Integer, nullable=False, default=0)
+
+class ObjectStatsDB(Base):
+    __tablename__ = "object_stats"
+    
+    # 値はトリガー（utils/triggers.py）で書き込みのたびに更新される
+    object_id = Column(Integer, primary_key=True)
+    memory_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # 重要度ごとのメモリ数
+    importance_1 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_2 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_3 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_4 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_5 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_6 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_7 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_8 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_9 = Column(Integer, nullable=False, default=0, server_default="0")
+    latest_memory_at = Column(EpochMillis, nullable=True)
+    summary_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+class GlobalStatsDB(Base):
+    __tablename__ = "global_stats"
+    
+    # 全体の統計（id=1の1行のみ）
+    id = Column(Integer, primary_key=True)
+    object_count = Column(Integer, nullable=False, default=0, server_default="0")
+    memory_count = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_1 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_2 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_3 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_4 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_5 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_6 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_7 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_8 = Column(Integer, nullable=False, default=0, server_default="0")
+    importance_9 = Column(Integer, nullable=False, default=0, server_default="0")
+    latest_memory_at = Column(EpochMillis, nullable=True)
+    summary_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+# テーブル作成後に統計用のトリガーを作成する
+@event.listens_for(Base.metadata, "after_create")
+def _create_stats_triggers(target, connection, **kw):
+    create_triggers(connection)
@@ -0,0 +1,63 @@
+import difflib
+import json
+import zlib
+from typing import Dict, List, Optional, Union
+
+# 文字列フィールドの差分を圧縮して保存するための変換
+# 差分は「n文字そのまま（正の整数）」「n文字削除（負の整数）」「挿入する文字列」の並びで表す
+
+DeltaOps = List[Union[int, str]]
+
+def _pack(payload) -> bytes:
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+def _unpack(data: bytes):
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+def diff_text(old: str, new: str) -> DeltaOps:
+    """oldをnewに変換する差分を作成"""
+    ops: DeltaOps = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(-(i2 - i1))
+        if j2 > j1:
+            ops.append(new[j1:j2])
+    return ops
+
+def apply_text(old: str, ops: DeltaOps) -> str:
+    """差分をoldに適用する"""
+    parts = []
+    position = 0
+    for op in ops:
+        if isinstance(op, str):
+            parts.append(op)
+        elif op > 0:
+            parts.append(old[position:position + op])
+            position += op
+        else:
+            position -= op
+    return "".join(parts)
+
+def encode_keyframe(fields: Dict[str, str]) -> bytes:
+    """全フィールドの値を圧縮"""
+    return _pack(fields)
+
+def encode_delta(old: Dict[str, str], new: Dict[str, str]) -> bytes:
+    """変更されたフィールドの差分だけを圧縮"""
+    return _pack({key: diff_text(old[key], value) for key, value in new.items() if old.get(key) != value})
+
+def decode_keyframe(data: bytes) -> Dict[str, str]:
+    return _unpack(data)
+
+def apply_delta(fields: Dict[str, str], data: Optional[bytes]) -> Dict[str, str]:
+    """圧縮された差分を適用した新しい値を返す"""
+    result = dict(fields)
+    if data is None:
+        return result
+    for key, ops in _unpack(data).items():
+        result[key] = apply_text(result.get(key, ""), ops)
+    return result
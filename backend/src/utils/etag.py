@@ -0,0 +1,22 @@
+from typing import Optional
+from fastapi import HTTPException
+
+def format_etag(version: int) -> str:
+    """バージョンをETagヘッダーの値に変換"""
+    return f'"{version}"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """If-Matchヘッダーから期待するバージョンを取り出す（未指定または*の場合はNone）"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="If-Match must be a version number"
+        )
@@ -0,0 +1,129 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, List, Optional, Set
+from fastapi.encoders import jsonable_encoder
+
+# 購読者ごとのバッファに保持するイベントの上限
+EVENT_BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "256"))
+
+class ChangeEvent:
+    """作成・更新・削除の通知。ペイロードは発行時に一度だけシリアライズする"""
+
+    def __init__(self, seq: int, event_type: str, object_id: Optional[int], data: Any):
+        self.seq = seq
+        self.type = event_type
+        self.object_id = object_id
+        self.payload = json.dumps(
+            {"seq": seq, "type": event_type, "object_id": object_id, "data": jsonable_encoder(data)},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+
+class Subscription:
+    """
+    1つのクライアントの購読。イベントループ上で消費される。
+    バッファが上限に達した場合は古いイベントから捨て、捨てた件数をクライアントに伝える。
+    """
+
+    def __init__(self, bus: "EventBus", loop: asyncio.AbstractEventLoop, object_ids: Optional[Set[int]], max_buffer: int):
+        self.bus = bus
+        self.loop = loop
+        self.object_ids = object_ids
+        self.max_buffer = max_buffer
+        self.buffer: Deque[ChangeEvent] = deque()
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def matches(self, event: ChangeEvent) -> bool:
+        return self.object_ids is None or event.object_id in self.object_ids
+
+    def _push(self, event: ChangeEvent) -> None:
+        if len(self.buffer) >= self.max_buffer:
+            self.buffer.popleft()
+            self.dropped += 1
+        self.buffer.append(event)
+        self._ready.set()
+
+    async def next_batch(self, timeout: float) -> List[ChangeEvent]:
+        """バッファに溜まったイベントを取り出す。タイムアウトした場合は空のリストを返す"""
+        if not self.buffer:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        events = list(self.buffer)
+        self.buffer.clear()
+        return events
+
+    def take_dropped(self) -> int:
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+class EventBus:
+    """サービスの書き込みを購読者に配信する。発行はどのスレッドからでも行える"""
+
+    def __init__(self, max_buffer: int = EVENT_BUFFER_SIZE):
+        self.max_buffer = max_buffer
+        self._lock = threading.Lock()
+        self._subscriptions: List[Subscription] = []
+        self._seq = itertools.count(1)
+        # 統計情報
+        self.published = 0
+
+    def subscribe(self, object_ids: Optional[Set[int]] = None, max_buffer: Optional[int] = None) -> Subscription:
+        """購読を開始する（イベントループ上で呼び出す）"""
+        subscription = Subscription(self, asyncio.get_running_loop(), object_ids or None, max_buffer or self.max_buffer)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, event_type: str, object_id: Optional[int], data: Any = None) -> None:
+        closed = []
+        with self._lock:
+            self.published += 1
+            if not self._subscriptions:
+                return
+            event = ChangeEvent(next(self._seq), event_type, object_id, data)
+            # 発行順に配信されるようロックを保持したまま各イベントループに渡す
+            for subscription in self._subscriptions:
+                if not subscription.matches(event):
+                    continue
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription._push, event)
+                except RuntimeError:
+                    # イベントループが終了している購読は破棄する
+                    closed.append(subscription)
+        for subscription in closed:
+            self.unsubscribe(subscription)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        return {
+            "published": self.published,
+            "subscribers": len(subscriptions),
+            "buffered": sum(len(subscription.buffer) for subscription in subscriptions),
+        }
+
+_bus = EventBus()
+
+def get_event_bus() -> EventBus:
+    """アプリケーション全体で共有するイベントバスを取得"""
+    return _bus
+
+def publish(event_type: str, object_id: Optional[int], data: Any = None) -> None:
+    """共有イベントバスにイベントを発行"""
+    _bus.publish(event_type, object_id, data)
@@ -0,0 +1,144 @@
+from datetime import datetime
+from typing import Callable, List
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from .timestamps import LEGACY_TIMEZONE
+from .triggers import create_triggers, rebuild_stats_tables
+from .deltas import encode_keyframe
+
+# 既存のデータベースに適用するスキーマ変更（PRAGMA user_versionで適用済みの位置を管理）
+# 新しいテーブルはcreate_allで作成されるため、既存テーブルへの変更だけをここに追加する
+
+def _column_names(connection: Connection, table: str) -> List[str]:
+    return [column["name"] for column in inspect(connection).get_columns(table)]
+
+def _add_column(connection: Connection, table: str, column: str, definition: str) -> None:
+    if column not in _column_names(connection, table):
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+# 1: 楽観的排他制御のためのversion列を追加
+def _add_version_columns(connection: Connection) -> None:
+    for table in ("objects", "memories", "summaries"):
+        _add_column(connection, table, "version", "INTEGER NOT NULL DEFAULT 1")
+
+# 2: オブジェクト単位の削除・検索のためのobject_idのインデックスを追加
+def _add_object_id_indexes(connection: Connection) -> None:
+    for table in ("memories", "summaries"):
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_object_id ON {table} (object_id)"))
+
+# 3: 文字列で保存していた日時をエポックミリ秒（整数）に変換し、日時を含む複合インデックスを追加
+def _convert_timestamps_to_epoch_ms(connection: Connection) -> None:
+    # 従来の値はタイムゾーンなしの日本時間（夏時間がないため固定のオフセットで変換できる）
+    offset_ms = int(LEGACY_TIMEZONE.localize(datetime(2000, 1, 1)).utcoffset().total_seconds() * 1000)
+    for table, columns in (("memories", ("timestamp", "last_accessed")), ("summaries", ("created_at",))):
+        for column in columns:
+            connection.execute(text(
+                f"UPDATE {table} SET {column} = "
+                f"CAST(ROUND((julianday({column}) - 2440587.5) * 86400000) AS INTEGER) - {offset_ms} "
+                f"WHERE typeof({column}) = 'text'"
+            ))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_memories_object_importance_accessed ON memories (object_id, importance, last_accessed)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_summaries_object_created ON summaries (object_id, created_at)"))
+
+# 4: オブジェクトごとの統計を既存のデータから作成（テーブルとトリガーはcreate_allで作成済み）
+def _build_object_stats(connection: Connection) -> None:
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_memories_object_timestamp ON memories (object_id, timestamp)"))
+    create_triggers(connection)
+    rebuild_stats_tables(connection)
+
+# 5: 最新のサマリーへのポインターを追加し、既存のサマリーから設定
+def _add_latest_summary_pointer(connection: Connection) -> None:
+    _add_column(connection, "objects", "latest_summary_id", "INTEGER")
+    connection.execute(text(
+        "UPDATE objects SET latest_summary_id = ("
+        "SELECT id FROM summaries WHERE summaries.object_id = objects.id "
+        "ORDER BY created_at DESC, id DESC LIMIT 1)"
+    ))
+
+# 6: 既存のサマリーの現在の状態を履歴の起点として記録（それより前の状態は残っていない）
+def _backfill_summary_history(connection: Connection) -> None:
+    rows = connection.execute(text(
+        "SELECT id, object_id, version, created_at, key_features, current_daily_tasks, recent_progress_feelings "
+        "FROM summaries WHERE id NOT IN (SELECT summary_id FROM summary_history)"
+    )).fetchall()
+    if not rows:
+        return
+    connection.execute(
+        text(
+            "INSERT INTO summary_history (summary_id, object_id, version, recorded_at, kind, data) "
+            "VALUES (:summary_id, :object_id, :version, :recorded_at, 'create', :data)"
+        ),
+        [
+            {
+                "summary_id": row.id,
+                "object_id": row.object_id,
+                "version": row.version,
+                "recorded_at": row.created_at,
+                "data": encode_keyframe({
+                    "key_features": row.key_features,
+                    "current_daily_tasks": row.current_daily_tasks,
+                    "recent_progress_feelings": row.recent_progress_feelings
+                })
+            }
+            for row in rows
+        ]
+    )
+
+# 7: オブジェクトごとの最新の変更番号を取得するための変更ログの(object_id, seq)のインデックスを追加
+def _add_change_log_object_index(connection: Connection) -> None:
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_change_log_object_seq ON change_log (object_id, seq)"))
+
+# 8: 会話の要約と、メッセージごとのトークン数の列を追加
+def _add_conversation_summary_columns(connection: Connection) -> None:
+    _add_column(connection, "chat_messages", "tokens", "INTEGER NOT NULL DEFAULT 0")
+    for column, definition in (
+        ("summary", "TEXT"),
+        ("summary_tokens", "INTEGER NOT NULL DEFAULT 0"),
+        ("summarized_through_id", "INTEGER"),
+        ("pending_count", "INTEGER NOT NULL DEFAULT 0"),
+        ("pending_tokens", "INTEGER NOT NULL DEFAULT 0"),
+    ):
+        _add_column(connection, "conversations", column, definition)
+    # 既存のメッセージのトークン数は文字数で多めに見積もり、すべて未要約とする
+    connection.execute(text("UPDATE chat_messages SET tokens = length(content) WHERE tokens = 0"))
+    connection.execute(text(
+        "UPDATE conversations SET pending_count = message_count, "
+        "pending_tokens = (SELECT COALESCE(SUM(tokens), 0) FROM chat_messages WHERE chat_messages.object_id = conversations.object_id) "
+        "WHERE summarized_through_id IS NULL"
+    ))
+
+MIGRATIONS: List[Callable[[Connection], None]] = [
+    _add_version_columns,
+    _add_object_id_indexes,
+    _convert_timestamps_to_epoch_ms,
+    _build_object_stats,
+    _add_latest_summary_pointer,
+    _backfill_summary_history,
+    _add_change_log_object_index,
+    _add_conversation_summary_columns,
+]
+
+def get_schema_version(connection: Connection) -> int:
+    return connection.execute(text("PRAGMA user_version")).scalar() or 0
+
+def set_schema_version(connection: Connection, version: int) -> None:
+    connection.execute(text(f"PRAGMA user_version = {int(version)}"))
+
+def run_migrations(engine: Engine, fresh: bool) -> None:
+    """
+    未適用のスキーマ変更を順に適用する。
+    create_allで新規作成したデータベース（fresh）は最新のスキーマのため、適用済みとして記録するだけ。
+    """
+    with engine.begin() as connection:
+        if fresh:
+            set_schema_version(connection, len(MIGRATIONS))
+            return
+        current = get_schema_version(connection)
+        for version, migration in enumerate(MIGRATIONS[current:], start=current + 1):
+            migration(connection)
+            set_schema_version(connection, version)
+
+def is_fresh_database(engine: Engine) -> bool:
+    """既存のテーブルがない（create_allで新規作成される）データベースかどうか"""
+    with engine.connect() as connection:
+        return not inspect(connection).has_table("objects")
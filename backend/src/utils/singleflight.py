@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+# 集約した処理を実行するスレッドの数（FastAPIが同期処理に使うスレッドの数と同じ）
+SINGLEFLIGHT_WORKERS = int(os.getenv("SINGLEFLIGHT_WORKERS", "40"))
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中であれば、新たに実行せずその結果を共有する。
+    結果はキャッシュせず、実行が終わった時点でキーは破棄される。
+    処理は最初の呼び出し元のスレッドではなく専用のスレッドで実行し、呼び出し元は全員その完了を待つ
+    （最初の呼び出し元が中断されても、待っている他の呼び出し元の処理は止まらない）。
+    """
+
+    def __init__(self, executor: Optional[Executor] = None):
+        self._executor = executor or ThreadPoolExecutor(max_workers=SINGLEFLIGHT_WORKERS, thread_name_prefix="singleflight")
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        # 統計情報
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if leader:
+            try:
+                self._executor.submit(self._run, key, call, fn)
+            except BaseException as exc:
+                # 実行を受け付けられなかった場合（停止中など）は待っている全員にエラーを伝える
+                self._finish(key, call, error=exc)
+
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _run(self, key: Hashable, call: _Call, fn: Callable[[], Any]) -> None:
+        try:
+            result = fn()
+        except BaseException as exc:
+            # 実行中のエラーは待っている全員に伝える（結果としては保持しない）
+            self._finish(key, call, error=exc)
+        else:
+            self._finish(key, call, result=result)
+
+    def _finish(self, key: Hashable, call: _Call, result: Any = None, error: Optional[BaseException] = None) -> None:
+        call.result = result
+        call.error = error
+        with self._lock:
+            del self._calls[key]
+        call.event.set()
+
+    def metrics(self) -> Dict[str, int]:
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            "executions": self.executions,
+            "shared": self.shared,
+            "in_flight": in_flight,
+        }
+
+def make_key(route: str, **params: Any) -> Tuple[str, Tuple[Tuple[str, Any], ...]]:
+    """ルート名とパラメーターから正規化したキーを作成"""
+    return route, tuple(sorted(params.items()))
+
+_reads = SingleFlight()
+
+def get_read_coalescer() -> SingleFlight:
+    """読み込みAPIで共有するSingleFlightを取得"""
+    return _reads
+
+def coalesced_json(route: str, fn: Callable[[], Any], **params: Any) -> Response:
+    """同時に届いた同一の読み込みを1回の実行にまとめ、シリアライズ済みのJSONを返す"""
+    def _execute() -> bytes:
+        return json.dumps(
+            jsonable_encoder(fn()),
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+    body = _reads.do(make_key(route, **params), _execute)
+    return Response(content=body, media_type="application/json")
@@ -0,0 +1,43 @@
+import os
+import time
+from datetime import datetime
+from typing import Optional, Union
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+import pytz
+
+# APIで返す日時のタイムゾーン（保存値はUTCのエポックミリ秒）
+DISPLAY_TIMEZONE = pytz.timezone(os.getenv("DISPLAY_TIMEZONE", "Asia/Tokyo"))
+
+# 移行前のデータベースに文字列で保存されていた日時のタイムゾーン
+LEGACY_TIMEZONE = pytz.timezone("Asia/Tokyo")
+
+def now_ms() -> int:
+    """現在時刻をエポックミリ秒で取得（タイムゾーンオブジェクトを生成しない）"""
+    return time.time_ns() // 1_000_000
+
+def to_epoch_ms(value: datetime) -> int:
+    """日時をエポックミリ秒に変換。タイムゾーンのない日時は表示用タイムゾーンの時刻とみなす"""
+    if value.tzinfo is None:
+        value = DISPLAY_TIMEZONE.localize(value)
+    return int(round(value.timestamp() * 1000))
+
+def from_epoch_ms(value: int) -> datetime:
+    """エポックミリ秒を表示用タイムゾーンの日時に変換（従来のAPIと同じくタイムゾーン情報は付けない）"""
+    return datetime.fromtimestamp(value / 1000, DISPLAY_TIMEZONE).replace(tzinfo=None)
+
+class EpochMillis(TypeDecorator):
+    """日時を整数のエポックミリ秒として保存する型。日時とエポックミリ秒のどちらでも書き込める"""
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[Union[datetime, int]], dialect) -> Optional[int]:
+        if value is None or isinstance(value, int):
+            return value
+        return to_epoch_ms(value)
+
+    def process_result_value(self, value: Optional[int], dialect) -> Optional[datetime]:
+        if value is None:
+            return None
+        return from_epoch_ms(value)
@@ -0,0 +1,13 @@
+import math
+import re
+
+_ASCII_RUN = re.compile(r"[A-Za-z0-9]+")
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算。英数字は4文字で1トークン、それ以外（日本語・記号）は1文字1トークンとし、改行も1トークンと数える。
+    モデルのトークナイザーより多めになるよう見積もるが保証はしないため、上限にはモデルのコンテキスト長より余裕を持たせる。
+    """
+    tokens = sum(math.ceil(len(run) / 4) for run in _ASCII_RUN.findall(text))
+    rest = _ASCII_RUN.sub("", text)
+    return tokens + sum(1 for char in rest if not char.isspace()) + rest.count("\n")
@@ -0,0 +1,112 @@
+from typing import List
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# オブジェクトごと・全体の統計をメモリ・サマリーの書き込みに合わせて更新するトリガー
+# （サービス以外の書き込みや一括削除でも統計がずれないようデータベース側で管理する）
+
+IMPORTANCE_LEVELS = range(1, 10)
+IMPORTANCE_COLUMNS = [f"importance_{level}" for level in IMPORTANCE_LEVELS]
+
+def _stats_tables():
+    # オブジェクトごとの統計と全体の統計（1行）を同じ式で更新する
+    return (("object_stats", "object_id = {row}.object_id"), ("global_stats", "id = 1"))
+
+def _memory_insert_sql() -> str:
+    statements = []
+    for table, where in _stats_tables():
+        histogram = ", ".join(f"{column} = {column} + (new.importance = {level})" for level, column in zip(IMPORTANCE_LEVELS, IMPORTANCE_COLUMNS))
+        statements.append(
+            f"UPDATE {table} SET memory_count = memory_count + 1, {histogram}, "
+            f"latest_memory_at = MAX(COALESCE(latest_memory_at, new.timestamp), new.timestamp) "
+            f"WHERE {where.format(row='new')};"
+        )
+    return "\n".join(statements)
+
+def _memory_delete_sql() -> str:
+    statements = []
+    for table, where in _stats_tables():
+        histogram = ", ".join(f"{column} = {column} - (old.importance = {level})" for level, column in zip(IMPORTANCE_LEVELS, IMPORTANCE_COLUMNS))
+        # 最新のメモリが削除された場合のみ最新時刻を再計算する
+        if table == "object_stats":
+            latest = "(SELECT MAX(timestamp) FROM memories WHERE object_id = old.object_id)"
+        else:
+            latest = "(SELECT MAX(latest_memory_at) FROM object_stats)"
+        statements.append(
+            f"UPDATE {table} SET memory_count = memory_count - 1, {histogram}, "
+            f"latest_memory_at = CASE WHEN old.timestamp >= latest_memory_at THEN {latest} ELSE latest_memory_at END "
+            f"WHERE {where.format(row='old')};"
+        )
+    return "\n".join(statements)
+
+def _memory_update_importance_sql() -> str:
+    statements = []
+    for table, where in _stats_tables():
+        histogram = ", ".join(
+            f"{column} = {column} + (new.importance = {level}) - (old.importance = {level})"
+            for level, column in zip(IMPORTANCE_LEVELS, IMPORTANCE_COLUMNS)
+        )
+        statements.append(f"UPDATE {table} SET {histogram} WHERE {where.format(row='new')};")
+    return "\n".join(statements)
+
+def _summary_count_sql(row: str, delta: str) -> str:
+    return "\n".join(
+        f"UPDATE {table} SET summary_count = summary_count {delta} 1 WHERE {where.format(row=row)};"
+        for table, where in _stats_tables()
+    )
+
+TRIGGERS = {
+    "stats_object_insert": (
+        "AFTER INSERT ON objects",
+        "INSERT OR IGNORE INTO object_stats (object_id) VALUES (new.id);\n"
+        "UPDATE global_stats SET object_count = object_count + 1 WHERE id = 1;"
+    ),
+    "stats_object_delete": (
+        "AFTER DELETE ON objects",
+        "DELETE FROM object_stats WHERE object_id = old.id;\n"
+        "UPDATE global_stats SET object_count = object_count - 1 WHERE id = 1;"
+    ),
+    "stats_memory_insert": ("AFTER INSERT ON memories", _memory_insert_sql()),
+    "stats_memory_delete": ("AFTER DELETE ON memories", _memory_delete_sql()),
+    "stats_memory_update_importance": (
+        "AFTER UPDATE OF importance ON memories WHEN old.importance IS NOT new.importance",
+        _memory_update_importance_sql()
+    ),
+    "stats_summary_insert": ("AFTER INSERT ON summaries", _summary_count_sql("new", "+")),
+    "stats_summary_delete": ("AFTER DELETE ON summaries", _summary_count_sql("old", "-")),
+}
+
+def create_triggers(connection: Connection) -> None:
+    """統計用のトリガーと全体の統計行を作成する（作成済みの場合は何もしない）"""
+    for name, (timing, body) in TRIGGERS.items():
+        connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS {name} {timing}\nBEGIN\n{body}\nEND"))
+    connection.execute(text("INSERT OR IGNORE INTO global_stats (id) VALUES (1)"))
+
+def _rebuild_sql() -> List[str]:
+    histogram_sums = ", ".join(f"SUM(importance = {level}) AS {column}" for level, column in zip(IMPORTANCE_LEVELS, IMPORTANCE_COLUMNS))
+    histogram_values = ", ".join(f"COALESCE(m.{column}, 0)" for column in IMPORTANCE_COLUMNS)
+    histogram_totals = ", ".join(f"{column} = COALESCE(m.{column}, 0)" for column in IMPORTANCE_COLUMNS)
+    columns = ", ".join(IMPORTANCE_COLUMNS)
+    return [
+        "DELETE FROM object_stats",
+        f"INSERT INTO object_stats (object_id, memory_count, {columns}, latest_memory_at, summary_count) "
+        f"SELECT o.id, COALESCE(m.memory_count, 0), {histogram_values}, m.latest_memory_at, COALESCE(s.summary_count, 0) "
+        f"FROM objects o "
+        f"LEFT JOIN (SELECT object_id, COUNT(*) AS memory_count, {histogram_sums}, MAX(timestamp) AS latest_memory_at FROM memories GROUP BY object_id) m ON m.object_id = o.id "
+        f"LEFT JOIN (SELECT object_id, COUNT(*) AS summary_count FROM summaries GROUP BY object_id) s ON s.object_id = o.id",
+        # 全体の統計は削除待ちの行も含めた実際の行数とする
+        "INSERT OR IGNORE INTO global_stats (id) VALUES (1)",
+        f"UPDATE global_stats SET "
+        f"object_count = (SELECT COUNT(*) FROM objects), "
+        f"summary_count = (SELECT COUNT(*) FROM summaries), "
+        f"memory_count = m.memory_count, {histogram_totals}, latest_memory_at = m.latest_memory_at "
+        f"FROM (SELECT COUNT(*) AS memory_count, {histogram_sums}, MAX(timestamp) AS latest_memory_at FROM memories) m "
+        f"WHERE id = 1",
+    ]
+
+REBUILD_STATS_SQL = _rebuild_sql()
+
+def rebuild_stats_tables(connection) -> None:
+    """メモリ・サマリーの実データから統計を作り直す（ConnectionとSessionのどちらでも実行できる）"""
+    for statement in REBUILD_STATS_SQL:
+        connection.execute(text(statement))
@@ -0,0 +1,145 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+from sqlalchemy.orm import Session
+from .database import WriterSessionLocal
+
+# 書き込みキューの設定（環境変数で変更可能）
+WRITER_MAX_BATCH = int(os.getenv("WRITER_MAX_BATCH", "64"))
+WRITER_MAX_LATENCY_MS = float(os.getenv("WRITER_MAX_LATENCY_MS", "5"))
+
+WriteOperation = Callable[[Session], Any]
+
+class SessionWriter:
+    """渡されたセッション上で書き込みを即時実行してコミットするライター"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def run(self, operation: WriteOperation) -> Any:
+        try:
+            result = operation(self.db)
+            self.db.commit()
+            return result
+        except Exception:
+            self.db.rollback()
+            raise
+
+class _PendingWrite:
+    def __init__(self, operation: WriteOperation):
+        self.operation = operation
+        self.future: Future = Future()
+
+class WriteQueue:
+    """
+    単一の書き込みスレッドで書き込みを直列化し、まとめてコミットするライター。
+    各書き込みはSAVEPOINT内で実行されるため、1件の失敗が同じグループの他の書き込みに影響しない。
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], max_batch: int = WRITER_MAX_BATCH, max_latency_ms: float = WRITER_MAX_LATENCY_MS):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000.0
+        self._queue: "queue.Queue[Optional[_PendingWrite]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._current_session: Optional[Session] = None
+        # 統計情報
+        self.batches = 0
+        self.writes = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+
+    def run(self, operation: WriteOperation) -> Any:
+        """書き込みをキューに投入し、その書き込みの結果（または例外）を待って返す"""
+        # 書き込みスレッド内からの呼び出しはデッドロックを避けるため直接実行する
+        if threading.current_thread() is self._thread:
+            return operation(self._current_session)
+        self.start()
+        pending = _PendingWrite(operation)
+        self._queue.put(pending)
+        return pending.future.result()
+
+    def _loop(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stopping = False
+            deadline = time.monotonic() + self.max_latency
+            # サイズか待ち時間の上限に達するまで後続の書き込みを集める
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    pending = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if pending is None:
+                    stopping = True
+                    break
+                batch.append(pending)
+            self._apply(batch)
+            if stopping:
+                return
+
+    def _apply(self, batch: List[_PendingWrite]) -> None:
+        session = self.session_factory()
+        self._current_session = session
+        outcomes = []
+        try:
+            for pending in batch:
+                try:
+                    with session.begin_nested():
+                        outcomes.append((pending, pending.operation(session), None))
+                except Exception as exc:
+                    outcomes.append((pending, None, exc))
+            session.commit()
+        except Exception as exc:
+            # グループ全体のコミットに失敗した場合は全員に例外を返す
+            session.rollback()
+            for pending in batch:
+                pending.future.set_exception(exc)
+            return
+        finally:
+            self._current_session = None
+            session.close()
+
+        self.batches += 1
+        self.writes += len(batch)
+        for pending, result, exc in outcomes:
+            if exc is not None:
+                pending.future.set_exception(exc)
+            else:
+                pending.future.set_result(result)
+
+_writer: Optional[WriteQueue] = None
+
+def get_writer() -> WriteQueue:
+    """アプリケーション全体で共有する書き込みキューを取得"""
+    global _writer
+    if _writer is None:
+        _writer = WriteQueue(WriterSessionLocal)
+    return _writer
+
+def stop_writer() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
@@ -0,0 +1,231 @@
+import pytest
+import asyncio
+import time
+from utils.admission import (
+    AdmissionPool, AdmissionRejected, AdmissionController, AdmissionMiddleware,
+    PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+)
+
+
+def deadline(seconds):
+    return time.monotonic() + seconds
+
+
+class TestAdmissionPool:
+    """流量制御プールのテストクラス"""
+
+    def test_acquire_within_limit(self):
+        """上限内のリクエストは待たずに実行枠を得られることを確認"""
+        async def scenario():
+            pool = AdmissionPool("reads", limit=2, max_queue=4)
+            await pool.acquire(PRIORITY_INTERACTIVE, deadline(1))
+            await pool.acquire(PRIORITY_INTERACTIVE, deadline(1))
+            assert pool.active == 2
+            pool.release(0.01)
+            pool.release(0.01)
+            assert pool.active == 0
+
+        asyncio.run(scenario())
+
+    def test_interactive_is_served_before_background(self):
+        """待ち行列ではinteractiveがbackgroundより先に実行枠を得ることを確認"""
+        async def scenario():
+            pool = AdmissionPool("reads", limit=1, max_queue=4)
+            order = []
+            await pool.acquire(PRIORITY_INTERACTIVE, deadline(1))
+
+            async def request(name, priority):
+                await pool.acquire(priority, deadline(1))
+                order.append(name)
+                pool.release(0.001)
+
+            background = asyncio.create_task(request("background", PRIORITY_BACKGROUND))
+            await asyncio.sleep(0)
+            interactive = asyncio.create_task(request("interactive", PRIORITY_INTERACTIVE))
+            await asyncio.sleep(0)
+            assert pool.queued == 2
+
+            pool.release(0.001)
+            await asyncio.gather(background, interactive)
+            assert order == ["interactive", "background"]
+            assert pool.active == 0
+
+        asyncio.run(scenario())
+
+    def test_full_queue_rejects(self):
+        """待ち行列が満杯の場合は即座に拒否されることを確認"""
+        async def scenario():
+            pool = AdmissionPool("reads", limit=1, max_queue=1)
+            await pool.acquire(PRIORITY_INTERACTIVE, deadline(1))
+            waiting = asyncio.create_task(pool.acquire(PRIORITY_INTERACTIVE, deadline(1)))
+            await asyncio.sleep(0)
+
+            with pytest.raises(AdmissionRejected):
+                await pool.acquire(PRIORITY_INTERACTIVE, deadline(1))
+            assert pool.rejected == 1
+
+            pool.release(0.001)
+            await waiting
+            pool.release(0.001)
+
+        asyncio.run(scenario())
+
+    def test_interactive_sheds_background(self):
+        """待ち行列が満杯の場合はbackgroundが追い出されinteractiveが並べることを確認"""
+        async def scenario():
+            pool = AdmissionPool("reads", limit=1, max_queue=1)
+            await pool.acquire(PRIORITY_INTERACTIVE, deadline(1))
+            background = asyncio.create_task(pool.acquire(PRIORITY_BACKGROUND, deadline(1)))
+            await asyncio.sleep(0)
+            interactive = asyncio.create_task(pool.acquire(PRIORITY_INTERACTIVE, deadline(1)))
+            await asyncio.sleep(0)
+
+            with pytest.raises(AdmissionRejected):
+                await background
+            assert pool.shed == 1
+
+            pool.release(0.001)
+            await interactive
+            pool.release(0.001)
+            assert pool.active == 0
+
+        asyncio.run(scenario())
+
+    def test_deadline_aware_rejection(self):
+        """期限内に順番が来る見込みがない場合は待たずに拒否されることを確認"""
+        async def scenario():
+            pool = AdmissionPool("reads", limit=1, max_queue=10)
+            pool.avg_service_time = 1.0
+            await pool.acquire(PRIORITY_INTERACTIVE, deadline(1))
+
+            started = time.monotonic()
+            with pytest.raises(AdmissionRejected) as exc_info:
+                await pool.acquire(PRIORITY_INTERACTIVE, deadline(0.1))
+            assert time.monotonic() - started < 0.05
+            assert exc_info.value.retry_after >= 1.0
+            pool.release(0.001)
+
+        asyncio.run(scenario())
+
+
+class TestAdmissionMiddleware:
+    """流量制御ミドルウェアのテストクラス"""
+
+    def test_rejects_with_503_and_retry_after(self):
+        """処理しきれないリクエストに503とRetry-Afterを返すことを確認"""
+        async def scenario():
+            controller = AdmissionController(limits={"details": 1, "reads": 1, "writes": 1, "chat": 1}, queue_size=0)
+            gate = asyncio.Event()
+
+            async def app(scope, receive, send):
+                await gate.wait()
+                await send({"type": "http.response.start", "status": 200, "headers": []})
+                await send({"type": "http.response.body", "body": b"ok"})
+
+            middleware = AdmissionMiddleware(app, controller)
+            scope = {"type": "http", "method": "GET", "path": "/objects/1/details", "headers": []}
+            first_messages, second_messages = [], []
+
+            async def collect(messages, message):
+                messages.append(message)
+
+            first = asyncio.create_task(middleware(scope, None, lambda m: collect(first_messages, m)))
+            await asyncio.sleep(0)
+            await middleware(scope, None, lambda m: collect(second_messages, m))
+
+            assert second_messages[0]["status"] == 503
+            assert (b"retry-after", b"1") in second_messages[0]["headers"]
+
+            gate.set()
+            await first
+            assert first_messages[0]["status"] == 200
+            assert controller.metrics()["details"]["active"] == 0
+            assert controller.metrics()["details"]["rejected"] == 1
+
+        asyncio.run(scenario())
+
+    def test_classify_routes(self):
+        """パスとメソッドからルートグループと優先度が決まることを確認"""
+        controller = AdmissionController()
+
+        assert controller.classify("GET", "/objects/1/details")[0].name == "details"
+        assert controller.classify("GET", "/memories/1")[0].name == "reads"
+        assert controller.classify("POST", "/memories/")[0].name == "writes"
+        assert controller.classify("GET", "/docs") is None
+        assert controller.classify("GET", "/metrics/admission") is None
+
+    def test_background_routes(self):
+        """差分同期・統計の再集計・サマリーの書き込みはヘッダーがなくてもバックグラウンドになることを確認"""
+        controller = AdmissionController()
+
+        assert controller.classify("GET", "/changes/")[:2] == (controller.pools["reads"], PRIORITY_BACKGROUND)
+        assert controller.classify("POST", "/stats/rebuild")[:2] == (controller.pools["writes"], PRIORITY_BACKGROUND)
+        assert controller.classify("POST", "/summaries/")[1] == PRIORITY_BACKGROUND
+        assert controller.classify("PUT", "/summaries/1")[1] == PRIORITY_BACKGROUND
+        assert controller.classify("GET", "/summaries/latest")[1] == PRIORITY_INTERACTIVE
+        assert controller.classify("GET", "/stats/")[1] == PRIORITY_INTERACTIVE
+        assert controller.classify("POST", "/npc/1/chat")[1:] == (PRIORITY_INTERACTIVE, False)
+        assert controller.classify("POST", "/npc/1/chat/stream")[1:] == (PRIORITY_INTERACTIVE, True)
+
+    def test_stream_releases_slot_when_started(self):
+        """ストリームのルートはレスポンスを開始した時点で実行枠を解放し、ストリームの間も次のリクエストを受け付けることを確認"""
+        async def scenario():
+            controller = AdmissionController(limits={"details": 1, "reads": 1, "writes": 1, "chat": 1}, queue_size=0)
+            gate = asyncio.Event()
+
+            async def app(scope, receive, send):
+                await send({"type": "http.response.start", "status": 200, "headers": []})
+                await gate.wait()
+                await send({"type": "http.response.body", "body": b"done"})
+
+            middleware = AdmissionMiddleware(app, controller)
+            scope = {"type": "http", "method": "POST", "path": "/npc/1/chat/stream", "headers": []}
+            messages = []
+
+            async def collect(message):
+                messages.append(message)
+
+            streams = [asyncio.create_task(middleware(scope, None, collect)) for _ in range(2)]
+            for _ in range(3):
+                await asyncio.sleep(0)
+
+            assert [message["status"] for message in messages] == [200, 200]
+            assert controller.metrics()["chat"]["active"] == 0
+
+            gate.set()
+            await asyncio.gather(*streams)
+            assert controller.metrics()["chat"]["active"] == 0
+            assert controller.metrics()["chat"]["admitted"] == 2
+            assert controller.metrics()["chat"]["rejected"] == 0
+
+        asyncio.run(scenario())
+
+    def test_chat_holds_slot_until_finished(self):
+        """ストリームでないルートはレスポンスを送り終えるまで実行枠を使うことを確認"""
+        async def scenario():
+            controller = AdmissionController(limits={"details": 1, "reads": 1, "writes": 1, "chat": 1}, queue_size=0)
+            gate = asyncio.Event()
+
+            async def app(scope, receive, send):
+                await send({"type": "http.response.start", "status": 200, "headers": []})
+                await gate.wait()
+                await send({"type": "http.response.body", "body": b"done"})
+
+            middleware = AdmissionMiddleware(app, controller)
+            scope = {"type": "http", "method": "POST", "path": "/npc/1/chat", "headers": []}
+            messages = []
+
+            async def collect(message):
+                messages.append(message)
+
+            first = asyncio.create_task(middleware(scope, None, collect))
+            await asyncio.sleep(0)
+            await middleware(scope, None, collect)
+
+            assert [message["status"] for message in messages if "status" in message] == [200, 503]
+
+            gate.set()
+            await first
+            assert controller.metrics()["chat"]["active"] == 0
+
+        asyncio.run(scenario())
@@ -0,0 +1,132 @@
+import pytest
+from fastapi import HTTPException
+from changes.service import ChangeService, compact_changes
+from changes.models import ChangeQuery
+from memories.service import MemoryService
+from memories.models import MemoryCreate, MemoryUpdate
+from objects.service import ObjectService
+from objects.models import ObjectCreate
+from utils.db_models import ChangeLogDB, ObjectDB
+
+
+class TestChangeService:
+    """変更ログサービスのテストクラス"""
+
+    def test_writes_are_recorded_in_order(self, db_session):
+        """作成・更新・削除が順番に記録されることを確認"""
+        object_service = ObjectService(db_session)
+        memory_service = MemoryService(db_session)
+        obj = object_service.create_object(ObjectCreate(name="テスト", summary="サマリー", description="説明"))
+        memory = memory_service.create_memory(MemoryCreate(object_id=obj.id, content="メモリ", importance=5))
+        memory_service.update_memory(memory.id, MemoryUpdate(importance=8))
+        memory_service.delete_memory(memory.id)
+
+        feed = ChangeService(db_session).get_changes(ChangeQuery(since=0))
+
+        assert [(c.entity, c.op) for c in feed.changes] == [
+            ("object", "upsert"),
+            ("memory", "upsert"),
+            ("memory", "upsert"),
+            ("memory", "delete"),
+        ]
+        assert feed.changes[2].data["importance"] == 8
+        # 削除はデータを持たないtombstoneとして記録される
+        assert feed.changes[3].id == memory.id
+        assert feed.changes[3].object_id == obj.id
+        assert feed.changes[3].data is None
+        assert feed.next_since == feed.changes[-1].seq
+        assert feed.has_more is False
+
+    def test_read_does_not_record_change(self, db_session, sample_memory):
+        """last_accessedの更新だけでは変更ログが記録されないことを確認"""
+        MemoryService(db_session).get_memory(sample_memory.id)
+
+        assert db_session.query(ChangeLogDB).count() == 0
+
+    def test_paging_with_since_and_limit(self, db_session, sample_object):
+        """sinceとlimitで続きを取得できることを確認"""
+        memory_service = MemoryService(db_session)
+        for i in range(5):
+            memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content=f"メモリ{i}", importance=5))
+        service = ChangeService(db_session)
+
+        first = service.get_changes(ChangeQuery(since=0, limit=3))
+        second = service.get_changes(ChangeQuery(since=first.next_since, limit=3))
+        third = service.get_changes(ChangeQuery(since=second.next_since, limit=3))
+
+        assert len(first.changes) == 3 and first.has_more is True
+        assert len(second.changes) == 2 and second.has_more is False
+        assert third.changes == [] and third.next_since == second.next_since
+
+    def test_invalid_parameters(self, db_session):
+        """不正なsince・limitで400エラーになることを確認"""
+        service = ChangeService(db_session)
+
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_changes(ChangeQuery(since=-1))
+        assert exc_info.value.status_code == 400
+
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_changes(ChangeQuery(since=0, limit=0))
+        assert exc_info.value.status_code == 400
+
+    def test_compaction_keeps_latest_entry_per_row(self, db_session, sample_memory):
+        """圧縮後も各行の最新の状態が取得できることを確認"""
+        memory_service = MemoryService(db_session)
+        for importance in range(1, 6):
+            memory_service.update_memory(sample_memory.id, MemoryUpdate(importance=importance))
+
+        removed = compact_changes(db_session, retention=0, tombstone_retention=100)
+        db_session.commit()
+
+        feed = ChangeService(db_session).get_changes(ChangeQuery(since=0))
+        assert removed == 4
+        assert len(feed.changes) == 1
+        assert feed.changes[0].data["importance"] == 5
+
+    def test_pruned_tombstones_require_reset(self, db_session, sample_object):
+        """破棄済みの削除記録より古いsinceを指定するとresetが返ることを確認"""
+        memory_service = MemoryService(db_session)
+        deleted = memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="メモリ1", importance=5))
+        memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="メモリ2", importance=5))
+        memory_service.delete_memory(deleted.id)
+        memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="メモリ3", importance=5))
+
+        compact_changes(db_session, retention=0, tombstone_retention=1)
+        db_session.commit()
+        service = ChangeService(db_session)
+
+        stale = service.get_changes(ChangeQuery(since=1))
+        assert stale.reset is True
+        assert stale.changes == []
+
+        fresh = service.get_changes(ChangeQuery(since=0))
+        assert fresh.reset is False
+        assert [c.data["content"] for c in fresh.changes] == ["メモリ2", "メモリ3"]
+
+    def test_deleted_object_children_are_not_replayed(self, db_session, sample_object):
+        """オブジェクトの削除記録が破棄された後も、最初からの取得で子のエントリが返らないことを確認"""
+        memory_service = MemoryService(db_session)
+        memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="メモリ", importance=5))
+        kept = ObjectService(db_session).create_object(ObjectCreate(name="残る", summary="サマリー", description="説明"))
+        memory_service.create_memory(MemoryCreate(object_id=kept.id, content="残るメモリ", importance=5))
+        ObjectService(db_session).delete_object(sample_object.id)
+
+        compact_changes(db_session, retention=0, tombstone_retention=0)
+        db_session.commit()
+
+        feed = ChangeService(db_session).get_changes(ChangeQuery(since=0))
+        assert [(c.entity, c.object_id) for c in feed.changes] == [("object", kept.id), ("memory", kept.id)]
+
+    def test_compaction_drops_orphaned_child_entries(self, db_session, sample_object):
+        """削除済みのオブジェクトを参照する子のエントリが圧縮で破棄されることを確認"""
+        MemoryService(db_session).create_memory(MemoryCreate(object_id=sample_object.id, content="メモリ", importance=5))
+        # 子の変更ログを消さずに削除された以前のオブジェクトを再現する
+        db_session.query(ObjectDB).filter(ObjectDB.id == sample_object.id).delete()
+        db_session.commit()
+
+        removed = compact_changes(db_session, retention=100, tombstone_retention=100)
+        db_session.commit()
+
+        assert removed == 1
+        assert ChangeService(db_session).get_changes(ChangeQuery(since=0)).changes == []
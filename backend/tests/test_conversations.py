@@ -0,0 +1,208 @@
+import pytest
+import pytz
+from fastapi import HTTPException
+from sqlalchemy import text
+from conversations.service import ConversationService
+from conversations.memory import ConversationMemory, CHAT_HISTORY_TURNS, CHAT_FOLD_BATCH
+from conversations.models import MessageCreate
+from objects.service import delete_object_children
+from utils.db_models import ObjectDB, ChatMessageDB, ConversationDB
+from utils.tokens import estimate_tokens
+
+SPEAKERS = {"player": "プレイヤー", "npc": "テストオブジェクト"}
+
+
+def add_turns(service, object_id, count):
+    """プレイヤーとNPCの発言を交互にcount件追加する"""
+    return [
+        service.append_message(object_id, MessageCreate(sender="npc" if i % 2 else "player", content=f"発言{i}"))
+        for i in range(count)
+    ]
+
+
+def create_objects(db_session, count):
+    objects = [ObjectDB(name=f"NPC{i}", summary="", description="説明", photos="[]") for i in range(count)]
+    db_session.add_all(objects)
+    db_session.commit()
+    return [obj.id for obj in objects]
+
+
+class TestConversationService:
+    """会話サービスのテストクラス"""
+
+    def test_append_updates_latest_and_unread(self, db_session, sample_object):
+        """書き込みのたびに最新のメッセージ・件数・未読数が更新されることを確認"""
+        service = ConversationService(db_session)
+
+        service.append_message(sample_object.id, MessageCreate(sender="npc", content="こんにちは"))
+        latest = service.append_message(sample_object.id, MessageCreate(sender="npc", content="元気？"))
+        preview = service.get_conversation(sample_object.id)
+
+        assert preview.object_name == sample_object.name
+        assert preview.latest_message.id == latest.id
+        assert preview.latest_message.content == "元気？"
+        assert preview.message_count == 2
+        assert preview.unread_count == 2
+
+        # プレイヤーが送信すると既読になる
+        service.append_message(sample_object.id, MessageCreate(content="元気です"))
+        preview = service.get_conversation(sample_object.id)
+        assert preview.message_count == 3
+        assert preview.unread_count == 0
+
+    def test_get_messages_keyset_paging(self, db_session, sample_object):
+        """履歴が新しい方から1ページずつ、ページ内は古い順に取得できることを確認"""
+        service = ConversationService(db_session)
+        for i in range(7):
+            service.append_message(sample_object.id, MessageCreate(sender="npc" if i % 2 else "player", content=f"メッセージ{i}"))
+
+        contents = []
+        page = service.get_messages(sample_object.id, limit=3)
+        while True:
+            contents = [message.content for message in page.messages] + contents
+            if not page.has_more:
+                break
+            page = service.get_messages(sample_object.id, before_id=page.next_before_id, limit=3)
+
+        assert contents == [f"メッセージ{i}" for i in range(7)]
+        assert page.next_before_id is None
+
+    def test_get_conversations_ordered_with_cursor(self, db_session):
+        """会話の一覧が新しい順に並び、カーソルで重複なく続きを取得できることを確認"""
+        service = ConversationService(db_session)
+        object_ids = create_objects(db_session, 5)
+        for object_id in object_ids:
+            service.append_message(object_id, MessageCreate(content="こんにちは"))
+        # 同じ時刻の会話はオブジェクトIDの降順に並ぶ
+        db_session.execute(text("UPDATE conversations SET latest_at = 1700000000000"))
+        db_session.execute(text("UPDATE conversations SET latest_at = 1700000001000 WHERE object_id = :id"), {"id": object_ids[1]})
+        db_session.commit()
+
+        first = service.get_conversations(limit=2)
+        second = service.get_conversations(cursor=first.next_cursor, limit=2)
+        third = service.get_conversations(cursor=second.next_cursor, limit=2)
+
+        ordered = [c.object_id for page in (first, second, third) for c in page.conversations]
+        assert ordered == [object_ids[1], object_ids[4], object_ids[3], object_ids[2], object_ids[0]]
+        assert third.next_cursor is None
+
+    def test_cursor_across_dst_transition(self, db_session, monkeypatch):
+        """夏時間の終わりの同じ時刻が2回ある時間帯でも、カーソルで重複・欠落なく続きを取得できることを確認"""
+        monkeypatch.setattr("utils.timestamps.DISPLAY_TIMEZONE", pytz.timezone("America/New_York"))
+        service = ConversationService(db_session)
+        object_ids = create_objects(db_session, 3)
+        for object_id in object_ids:
+            service.append_message(object_id, MessageCreate(content="こんにちは"))
+        # 2024-11-03 05:00 / 05:30 / 06:30 UTC（後の2つはどちらもニューヨークの01:30）
+        for object_id, latest_at in zip(object_ids, (1730610000000, 1730611800000, 1730615400000)):
+            db_session.execute(text("UPDATE conversations SET latest_at = :at WHERE object_id = :id"), {"at": latest_at, "id": object_id})
+        db_session.commit()
+
+        ordered, cursor = [], None
+        for _ in range(4):
+            page = service.get_conversations(cursor=cursor, limit=1)
+            ordered += [c.object_id for c in page.conversations]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+        assert ordered == [object_ids[2], object_ids[1], object_ids[0]]
+
+    def test_mark_read(self, db_session, sample_object):
+        """既読にしたメッセージより後のNPCのメッセージだけが未読に数えられることを確認"""
+        service = ConversationService(db_session)
+        messages = [service.append_message(sample_object.id, MessageCreate(sender="npc", content=f"返答{i}")) for i in range(4)]
+
+        assert service.mark_read(sample_object.id, messages[1].id).unread_count == 2
+        assert service.mark_read(sample_object.id).unread_count == 0
+
+    def test_validation(self, db_session, sample_object):
+        """不正な送信者・空のメッセージ・存在しないオブジェクト・不正なカーソルのエラーテスト"""
+        service = ConversationService(db_session)
+
+        for message_data, status_code in (
+            (MessageCreate(sender="system", content="こんにちは"), 400),
+            (MessageCreate(content="  "), 400),
+        ):
+            with pytest.raises(HTTPException) as exc_info:
+                service.append_message(sample_object.id, message_data)
+            assert exc_info.value.status_code == status_code
+
+        with pytest.raises(HTTPException) as exc_info:
+            service.append_message(999, MessageCreate(content="こんにちは"))
+        assert exc_info.value.status_code == 404
+
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_messages(999)
+        assert exc_info.value.status_code == 404
+
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_conversations(cursor="invalid")
+        assert exc_info.value.status_code == 400
+
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_conversation(sample_object.id)
+        assert exc_info.value.status_code == 404
+
+    def test_deleted_with_object(self, db_session, sample_object):
+        """オブジェクトの削除時に会話とメッセージも削除されることを確認"""
+        service = ConversationService(db_session)
+        service.append_message(sample_object.id, MessageCreate(content="こんにちは"))
+
+        delete_object_children(db_session, sample_object.id)
+        db_session.commit()
+
+        assert db_session.query(ChatMessageDB).count() == 0
+        assert db_session.query(ConversationDB).count() == 0
+
+
+class TestConversationMemory:
+    """会話の履歴（直近の発言と要約）のテストクラス"""
+
+    def test_pending_counters_maintained_on_write(self, db_session, sample_object):
+        """書き込みのたびにメッセージのトークン数と未要約の件数・トークン数が更新されることを確認"""
+        messages = add_turns(ConversationService(db_session), sample_object.id, 3)
+
+        conversation = db_session.query(ConversationDB).one()
+        assert conversation.pending_count == 3
+        assert conversation.pending_tokens == sum(estimate_tokens(m.content) for m in messages)
+
+    def test_window_keeps_recent_turns_within_budget(self, db_session, sample_object):
+        """直近の発言だけが古い順に含まれ、予算を超えないことを確認"""
+        add_turns(ConversationService(db_session), sample_object.id, CHAT_HISTORY_TURNS + 5)
+        memory = ConversationMemory(db_session)
+
+        window = memory.window(sample_object.id, SPEAKERS)
+        lines = window.text.splitlines()
+        assert len(lines) == CHAT_HISTORY_TURNS
+        assert lines[-1].endswith(f"発言{CHAT_HISTORY_TURNS + 4}")
+        assert window.used_tokens == estimate_tokens(window.text)
+
+        small = memory.window(sample_object.id, SPEAKERS, budget=20)
+        assert 0 < len(small.message_ids) < CHAT_HISTORY_TURNS
+        assert small.used_tokens <= 20
+        assert small.message_ids == window.message_ids[-len(small.message_ids):]
+
+    def test_fold_into_summary(self, db_session, sample_object):
+        """古い発言を要約に畳み込むと、未要約の件数が減り、要約と直近の発言で履歴が組み立てられることを確認"""
+        service = ConversationService(db_session)
+        memory = ConversationMemory(db_session)
+        add_turns(service, sample_object.id, CHAT_HISTORY_TURNS + CHAT_FOLD_BATCH - 1)
+        assert memory.needs_fold(sample_object.id) is False
+        add_turns(service, sample_object.id, 1)
+        assert memory.needs_fold(sample_object.id) is True
+
+        summary, messages = memory.fold_candidates(sample_object.id)
+        assert summary is None
+        assert len(messages) == CHAT_FOLD_BATCH
+        assert memory.apply_summary(sample_object.id, messages[-1].id, "これまでの要約") is True
+        # 同じ範囲の要約が後から保存されることはない
+        assert memory.apply_summary(sample_object.id, messages[-1].id, "古い要約") is False
+
+        conversation = db_session.query(ConversationDB).one()
+        assert conversation.pending_count == CHAT_HISTORY_TURNS
+        assert conversation.summary_tokens == estimate_tokens("これまでの要約")
+        window = memory.window(sample_object.id, SPEAKERS)
+        assert window.summary == "これまでの要約"
+        assert min(window.message_ids) > messages[-1].id
+        assert memory.needs_fold(sample_object.id) is False
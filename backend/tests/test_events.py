@@ -0,0 +1,84 @@
+import pytest
+import asyncio
+import json
+from memories.service import MemoryService
+from memories.models import MemoryCreate, MemoryUpdate
+from utils.events import EventBus, get_event_bus
+
+
+class TestEventBus:
+    """イベントバスのテストクラス"""
+
+    def test_publish_to_matching_subscribers(self):
+        """object_idで絞り込んだ購読者にだけイベントが届くことを確認"""
+        async def scenario():
+            bus = EventBus()
+            all_events = bus.subscribe()
+            only_one = bus.subscribe({1})
+
+            bus.publish("memory.created", 1, {"id": 10})
+            bus.publish("memory.created", 2, {"id": 11})
+
+            received_all = await all_events.next_batch(1)
+            received_one = await only_one.next_batch(1)
+
+            assert [event.object_id for event in received_all] == [1, 2]
+            assert [event.object_id for event in received_one] == [1]
+            assert json.loads(received_one[0].payload)["data"] == {"id": 10}
+
+        asyncio.run(scenario())
+
+    def test_slow_consumer_buffer_is_bounded(self):
+        """バッファが上限を超えた場合は古いイベントから捨てられることを確認"""
+        async def scenario():
+            bus = EventBus(max_buffer=3)
+            subscription = bus.subscribe()
+
+            for i in range(5):
+                bus.publish("memory.updated", 1, {"id": i})
+            await asyncio.sleep(0)
+
+            events = await subscription.next_batch(1)
+            assert [json.loads(event.payload)["data"]["id"] for event in events] == [2, 3, 4]
+            assert subscription.take_dropped() == 2
+            assert subscription.take_dropped() == 0
+
+        asyncio.run(scenario())
+
+    def test_unsubscribe_and_timeout(self):
+        """購読解除後はイベントが届かず、タイムアウト時は空のリストが返ることを確認"""
+        async def scenario():
+            bus = EventBus()
+            subscription = bus.subscribe()
+            subscription.close()
+
+            bus.publish("object.deleted", 1, {"id": 1})
+
+            assert await subscription.next_batch(0.01) == []
+            assert bus.metrics()["subscribers"] == 0
+
+        asyncio.run(scenario())
+
+    def test_service_writes_are_published(self, db_session, sample_object):
+        """サービスの作成・更新・削除がコミット後に通知されることを確認"""
+        async def scenario():
+            subscription = get_event_bus().subscribe({sample_object.id})
+            try:
+                service = MemoryService(db_session)
+                # サービスはスレッドプール上で実行される
+                memory = await asyncio.to_thread(
+                    service.create_memory,
+                    MemoryCreate(object_id=sample_object.id, content="通知テスト", importance=5)
+                )
+                await asyncio.to_thread(service.update_memory, memory.id, MemoryUpdate(importance=9))
+                await asyncio.to_thread(service.delete_memory, memory.id)
+                await asyncio.sleep(0)
+
+                events = await subscription.next_batch(1)
+                assert [event.type for event in events] == ["memory.created", "memory.updated", "memory.deleted"]
+                assert json.loads(events[1].payload)["data"]["importance"] == 9
+                assert json.loads(events[2].payload)["data"] == {"id": memory.id}
+            finally:
+                subscription.close()
+
+        asyncio.run(scenario())
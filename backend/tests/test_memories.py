@@ -1,4 +1,5 @@
 import pytest
+from sqlalchemy import event
 import time
 from fastapi import HTTPException
 from memories.service import MemoryService
@@ -198,6 +199,33 @@ class TestMemoryService:
         assert exc_info.value.status_code == 404
         assert "Memory with id 999 not found" in str(exc_info.value.detail)
 
+    def test_update_memory_without_prior_select(self, db_session, sample_memory):
+        """更新が成功する場合はSELECTを行わず、UPDATE ... RETURNINGだけで更新することを確認"""
+        service = MemoryService(db_session)
+        statements = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.lstrip().split()[0].upper())
+        
+        engine = db_session.get_bind()
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            service.update_memory(sample_memory.id, MemoryUpdate(importance=8), expected_version=sample_memory.version)
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        
+        assert "SELECT" not in statements
+        assert statements.count("UPDATE") == 1
+
+    def test_update_memory_not_found_with_invalid_body(self, db_session):
+        """存在しないメモリの更新は、入力が不正でも404エラーになることを確認"""
+        service = MemoryService(db_session)
+        
+        with pytest.raises(HTTPException) as exc_info:
+            service.update_memory(999, MemoryUpdate(importance=99))
+        
+        assert exc_info.value.status_code == 404
+
     def test_update_memory_invalid_importance_low(self, db_session, sample_memory):
         """更新時にimportanceが1未満の場合のバリデーションエラーテスト"""
         service = MemoryService(db_session)
@@ -453,4 +481,27 @@ class TestMemoryService:
         assert result[0].content == "High importance new"
         assert result[1].content == "High importance old"
         assert result[2].content == "Low importance new" 
-        assert result[3].content == "Low importance old" 
\ No newline at end of file
+        assert result[3].content == "Low importance old"
+
+    def test_update_memory_increments_version(self, db_session, sample_memory):
+        """更新のたびにversionが1ずつ増えることを確認"""
+        service = MemoryService(db_session)
+        
+        first = service.update_memory(sample_memory.id, MemoryUpdate(importance=6))
+        second = service.update_memory(sample_memory.id, MemoryUpdate(importance=7), expected_version=first.version)
+        
+        assert first.version == 2
+        assert second.version == 3
+        assert second.importance == 7
+
+    def test_update_memory_version_conflict(self, db_session, sample_memory):
+        """期待するversionが一致しない場合の409エラーテスト"""
+        service = MemoryService(db_session)
+        service.update_memory(sample_memory.id, MemoryUpdate(content="先に更新"))
+        
+        with pytest.raises(HTTPException) as exc_info:
+            service.update_memory(sample_memory.id, MemoryUpdate(content="後から更新", expected_version=1))
+        
+        assert exc_info.value.status_code == 409
+        # 先に行われた更新は上書きされない
+        assert service.get_memory(sample_memory.id).content == "先に更新"
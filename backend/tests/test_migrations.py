@@ -0,0 +1,71 @@
+import pytest
+from datetime import datetime
+from sqlalchemy.orm import Session
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.pool import StaticPool
+from utils.database import Base
+from utils.db_models import MemoryDB, SummaryDB
+from utils.migrations import MIGRATIONS, get_schema_version, is_fresh_database, run_migrations
+
+
+@pytest.fixture(scope="function")
+def engine():
+    """テスト用の空のデータベースを作成"""
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    yield engine
+    engine.dispose()
+
+
+class TestMigrations:
+    """スキーマ変更のテストクラス"""
+
+    def test_fresh_database_is_marked_latest(self, engine):
+        """新規作成したデータベースは最新のスキーマとして記録されることを確認"""
+        fresh = is_fresh_database(engine)
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine, fresh)
+
+        assert fresh is True
+        with engine.connect() as connection:
+            assert get_schema_version(connection) == len(MIGRATIONS)
+
+    def test_legacy_database_is_migrated(self, engine):
+        """既存のデータベースに不足している列が追加され、既存の行が保持されることを確認"""
+        with engine.begin() as connection:
+            connection.execute(text("CREATE TABLE objects (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, summary VARCHAR NOT NULL, description VARCHAR NOT NULL, photos TEXT)"))
+            connection.execute(text("CREATE TABLE memories (id INTEGER PRIMARY KEY, object_id INTEGER NOT NULL, content VARCHAR NOT NULL, importance INTEGER, timestamp DATETIME, last_accessed DATETIME)"))
+            connection.execute(text("CREATE TABLE summaries (id INTEGER PRIMARY KEY, object_id INTEGER NOT NULL, key_features VARCHAR NOT NULL, current_daily_tasks VARCHAR NOT NULL, recent_progress_feelings VARCHAR NOT NULL, created_at DATETIME)"))
+            connection.execute(text("INSERT INTO objects (id, name, summary, description, photos) VALUES (1, '既存', 'サマリー', '説明', '[]')"))
+            connection.execute(text("INSERT INTO memories (id, object_id, content, importance, timestamp, last_accessed) VALUES (1, 1, 'メモリ', 5, '2025-01-01 12:00:00.000000', '2025-01-02 09:30:00.250000')"))
+            connection.execute(text("INSERT INTO summaries (id, object_id, key_features, current_daily_tasks, recent_progress_feelings, created_at) VALUES (1, 1, '特徴', 'タスク', '感想', '2025-01-03 00:00:00.000000')"))
+
+        fresh = is_fresh_database(engine)
+        Base.metadata.create_all(bind=engine)
+        run_migrations(engine, fresh)
+        # 2回目の実行では何も変更されない
+        run_migrations(engine, False)
+
+        assert fresh is False
+        with engine.connect() as connection:
+            assert get_schema_version(connection) == len(MIGRATIONS)
+            for table in ("objects", "memories", "summaries"):
+                assert "version" in [column["name"] for column in inspect(connection).get_columns(table)]
+            assert connection.execute(text("SELECT name, version FROM objects")).first() == ("既存", 1)
+
+    def test_legacy_timestamps_are_converted_to_epoch_ms(self, engine):
+        """文字列で保存された日本時間の日時がエポックミリ秒に変換され、同じ日時として読み出せることを確認"""
+        self.test_legacy_database_is_migrated(engine)
+
+        with engine.connect() as connection:
+            row = connection.execute(text("SELECT typeof(timestamp), timestamp, last_accessed FROM memories")).first()
+            created_at = connection.execute(text("SELECT created_at FROM summaries")).scalar()
+        # 2025-01-01 12:00 JST = 2025-01-01 03:00 UTC
+        assert row == ("integer", 1735700400000, 1735777800250)
+        assert created_at == 1735830000000
+
+        with Session(engine) as session:
+            memory = session.get(MemoryDB, 1)
+            summary = session.get(SummaryDB, 1)
+            assert memory.timestamp == datetime(2025, 1, 1, 12, 0)
+            assert memory.last_accessed == datetime(2025, 1, 2, 9, 30, 0, 250000)
+            assert summary.created_at == datetime(2025, 1, 3, 0, 0)
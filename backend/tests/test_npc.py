@@ -0,0 +1,425 @@
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+from npc.cache import CacheStore, ResponseCache, PrefixStateCache
+from npc.context import ContextBuilder, ContextCache, estimate_tokens
+from npc.inference import InferenceEngine, FakeBackend, STATUS_LOADING, STATUS_READY
+from npc.scheduler import InferenceScheduler, JobCancelled, SchedulerFull
+from utils.admission import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from npc.models import ChatRequest
+from npc.service import NPCService
+from npc.summarizer import ConversationSummarizer
+from conversations.service import ConversationService
+from conversations.memory import CHAT_HISTORY_TURNS
+from utils.writer import SessionWriter
+from summaries.service import SummaryService
+from summaries.models import SummaryCreate
+from memories.service import MemoryService
+from memories.models import MemoryCreate, MemoryUpdate
+from utils.db_models import MemoryDB
+
+
+@pytest.fixture(scope="function")
+def engine():
+    """読み込み済みのFakeBackendの推論エンジンを作成"""
+    engine = InferenceEngine(FakeBackend())
+    engine.start()
+    assert engine.wait_ready(5)
+    return engine
+
+
+@pytest.fixture(scope="function")
+def scheduler(engine):
+    """FakeBackendの推論エンジンを使うスケジューラーを作成"""
+    scheduler = InferenceScheduler(engine)
+    yield scheduler
+    scheduler.stop()
+
+
+class TestInferenceEngine:
+    """推論エンジンのテストクラス"""
+
+    def test_start_does_not_block(self):
+        """モデルの読み込みを待たずにstartが戻ることを確認"""
+        engine = InferenceEngine(FakeBackend(load_delay=0.3))
+        engine.start()
+
+        assert engine.status == STATUS_LOADING
+        assert engine.wait_ready(5)
+        assert engine.status == STATUS_READY
+        assert engine.metrics()["load_seconds"] >= 0.3
+
+    def test_fake_backend_is_deterministic(self, engine):
+        """同じプロンプトには同じ応答が返ることを確認"""
+        prompt = "説明\nプレイヤー：こんにちは\nNPC："
+
+        assert engine.generate(prompt) == engine.generate(prompt)
+        assert "こんにちは" in engine.generate(prompt)
+        assert len(engine.generate(prompt, max_tokens=3)) == 3
+
+
+class CountingBackend(FakeBackend):
+    """推論の回数を数えるFakeBackend"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def stream(self, *args, **kwargs):
+        self.calls += 1
+        yield from super().stream(*args, **kwargs)
+
+
+class TestInferenceCache:
+    """推論キャッシュのテストクラス"""
+
+    def test_response_cache_hit(self):
+        """同じプロンプトは推論せずにキャッシュから返り、ヒット率が記録されることを確認"""
+        backend = CountingBackend()
+        engine = InferenceEngine(backend, response_cache=ResponseCache(CacheStore("responses", 1, directory=None)))
+        engine.start()
+        assert engine.wait_ready(5)
+        prompt = "説明\nプレイヤー：こんにちは\nNPC："
+
+        first = engine.generate(prompt)
+        # 空白の違いだけのプロンプトも同じキーになる
+        second = engine.generate("説明 \nプレイヤー：こんにちは  \n\nNPC：")
+
+        assert first == second
+        assert backend.calls == 1
+        metrics = engine.metrics()
+        assert metrics["response_cache"]["hits"] == 1
+        assert metrics["response_cache"]["hit_rate"] == 0.5
+        assert metrics["ttft_ms_last"] is not None
+
+        # 生成パラメーターが異なる場合は推論する
+        engine.generate(prompt, max_tokens=3)
+        assert backend.calls == 2
+
+    def test_prefix_state_cache(self):
+        """共通部分の状態は初回だけ作成し、2回目以降は読み込むことを確認"""
+        cache = PrefixStateCache(CacheStore("prefix", 1, directory=None))
+        created, loaded = [], []
+
+        assert cache.load_or_create("model", "説明\n# 会話\n", load=loaded.append, create=lambda: created.append(1) or "state") is False
+        assert cache.load_or_create("model", "説明\n# 会話\n", load=loaded.append, create=lambda: created.append(1) or "state") is True
+        # 空白が異なる共通部分はトークン列が変わるため別の状態として扱う
+        assert cache.load_or_create("model", "説明 \n# 会話\n", load=loaded.append, create=lambda: created.append(1) or "state") is False
+
+        assert len(created) == 2
+        assert loaded == ["state"]
+
+
+class TestContextBuilder:
+    """プロンプトの文脈の組み立てのテストクラス"""
+
+    def test_packs_memories_within_budget(self, db_session, sample_object):
+        """スコアの高いメモリから上限に収まるものだけを含めることを確認"""
+        memory_service = MemoryService(db_session)
+        low = memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="どうでもいいこと", importance=1))
+        high = memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="大切な約束", importance=9))
+        long = memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="長い" * 200, importance=8))
+        builder = ContextBuilder(db_session, cache=ContextCache())
+
+        context = builder.build(sample_object.id, 200)
+
+        assert context.used_tokens <= 200
+        assert context.used_tokens == estimate_tokens(context.text)
+        assert sample_object.description in context.text
+        # 長いメモリは収まらないため飛ばし、次に収まるものを詰める
+        assert context.memory_ids == [high.id, low.id]
+        assert context.omitted_memories == 1
+        assert "長い" not in context.text
+        assert long.id not in context.memory_ids
+
+    def test_cache_is_invalidated_on_change(self, db_session, sample_object):
+        """組み立て結果は再利用され、メモリが変更されると作り直されることを確認"""
+        memory_service = MemoryService(db_session)
+        memory = memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="昨日は雨だった", importance=5))
+        memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="今日は晴れ", importance=5))
+        cache = ContextCache()
+        builder = ContextBuilder(db_session, cache=cache)
+
+        first = builder.build(sample_object.id, 500)
+        assert builder.build(sample_object.id, 500) is first
+        assert cache.context_hits == 1
+
+        memory_service.update_memory(memory.id, MemoryUpdate(content="昨日は雪だった"))
+        counted = cache.tokens_counted
+        updated = builder.build(sample_object.id, 500)
+
+        assert "昨日は雪だった" in updated.text
+        assert "昨日は雨だった" not in updated.text
+        # 変更されたメモリだけトークン数を数え直す
+        assert cache.fragment_hits == 1
+        assert cache.tokens_counted - counted == estimate_tokens("- 昨日は雪だった\n")
+
+    def test_budget_validation(self, db_session, sample_object):
+        """範囲外の上限・説明が収まらない上限・存在しないオブジェクトのエラーテスト"""
+        builder = ContextBuilder(db_session, cache=ContextCache())
+
+        for budget, status_code in ((0, 400), (5, 400)):
+            with pytest.raises(HTTPException) as exc_info:
+                builder.build(sample_object.id, budget)
+            assert exc_info.value.status_code == status_code
+
+        with pytest.raises(HTTPException) as exc_info:
+            builder.build(999, 100)
+        assert exc_info.value.status_code == 404
+
+
+def block_stream(engine):
+    """releaseがセットされるまで推論を始めないようにし、実行したプレイヤーの発言を順に記録する"""
+    release = threading.Event()
+    order = []
+    original_stream = engine.stream
+
+    def blocking_stream(prompt, *args, **kwargs):
+        release.wait(5)
+        order.append(prompt.rsplit("プレイヤー：", 1)[1].split("\n")[0])
+        yield from original_stream(prompt, *args, **kwargs)
+
+    engine.stream = blocking_stream
+    return release, order
+
+
+def ready_engine(**backend_options):
+    engine = InferenceEngine(FakeBackend(**backend_options))
+    engine.start()
+    assert engine.wait_ready(5)
+    return engine
+
+
+class TestInferenceScheduler:
+    """推論のスケジューラーのテストクラス"""
+
+    def test_interactive_preempts_background(self):
+        """対話の推論が実行中のバックグラウンドの推論に割り込み、バックグラウンドの推論は続きから完了することを確認"""
+        engine = ready_engine(token_delay=0.02)
+        scheduler = InferenceScheduler(engine)
+        background_prompt = "説明\nプレイヤー：長い振り返り\nNPC："
+        try:
+            background = scheduler.submit(background_prompt, max_tokens=30, priority=PRIORITY_BACKGROUND, npc_id=1)
+            next(background.iter_chunks(timeout=5))
+            interactive = scheduler.submit("説明\nプレイヤー：こんにちは\nNPC：", max_tokens=5, priority=PRIORITY_INTERACTIVE, npc_id=2)
+
+            assert interactive.result(5)
+            assert not background.done
+            background_reply = background.result(5)
+        finally:
+            scheduler.stop()
+
+        assert background.preemptions >= 1
+        assert scheduler.metrics()["preemptions"] >= 1
+        # 割り込まれた時点までの部分を含めて最後まで生成される
+        assert background_reply.startswith("「長い振り返り」")
+        assert scheduler.metrics()["queue_wait_ms"]["interactive"] is not None
+        assert scheduler.metrics()["tokens_per_second"] > 0
+
+    def test_fairness_between_npcs(self):
+        """同じ優先度の推論はNPCごとに順番に実行されることを確認"""
+        scheduler = InferenceScheduler(ready_engine())
+        release, order = block_stream(scheduler.engine)
+        try:
+            jobs = [scheduler.submit(f"説明\nプレイヤー：{name}\nNPC：", max_tokens=3, npc_id=npc_id) for npc_id, name in ((1, "A1"), (1, "A2"), (1, "A3"), (2, "B1"))]
+            release.set()
+            for job in jobs:
+                job.result(5)
+        finally:
+            scheduler.stop()
+
+        # A1の実行中に投入されたB1は、先に投入されたA2・A3より先に実行される
+        assert order == ["A1", "B1", "A2", "A3"]
+
+    def test_per_npc_limit_and_cancel(self):
+        """NPCごとの上限を超える投入は拒否し、取り消した推論は実行されないことを確認"""
+        scheduler = InferenceScheduler(ready_engine(), max_pending_per_npc=2)
+        release, order = block_stream(scheduler.engine)
+        try:
+            first = scheduler.submit("説明\nプレイヤー：1\nNPC：", npc_id=1)
+            second = scheduler.submit("説明\nプレイヤー：2\nNPC：", npc_id=1)
+            with pytest.raises(SchedulerFull):
+                scheduler.submit("説明\nプレイヤー：3\nNPC：", npc_id=1)
+            # 他のNPCは投入できる
+            other = scheduler.submit("説明\nプレイヤー：4\nNPC：", npc_id=2)
+
+            second.cancel()
+            release.set()
+
+            assert first.result(5)
+            assert other.result(5)
+            with pytest.raises(JobCancelled):
+                second.result(5)
+        finally:
+            scheduler.stop()
+
+        assert order == ["1", "4"]
+        assert scheduler.metrics()["rejected"] == 1
+        assert scheduler.metrics()["cancelled"] == 1
+
+    def test_cancelled_job_frees_its_slot(self):
+        """待ち行列で取り消した推論は、先頭に来る前でも上限の枠を空けることを確認"""
+        scheduler = InferenceScheduler(ready_engine(), max_queue=1, max_pending_per_npc=2)
+        release, order = block_stream(scheduler.engine)
+        try:
+            first = scheduler.submit("説明\nプレイヤー：1\nNPC：", npc_id=1)
+            while scheduler._current is None:
+                time.sleep(0.001)
+            second = scheduler.submit("説明\nプレイヤー：2\nNPC：", npc_id=1)
+            with pytest.raises(SchedulerFull):
+                scheduler.submit("説明\nプレイヤー：3\nNPC：", npc_id=1)
+
+            second.cancel()
+            third = scheduler.submit("説明\nプレイヤー：3\nNPC：", npc_id=1)
+            release.set()
+
+            assert first.result(5)
+            assert third.result(5)
+        finally:
+            scheduler.stop()
+
+        assert order == ["1", "3"]
+
+    def test_tokens_are_counted_with_engine_tokenizer(self):
+        """生成したトークン数は断片の数ではなく推論エンジンのトークナイザーで数えることを確認"""
+        class TwoTokenBackend(FakeBackend):
+            def count_tokens(self, text):
+                return 2 * len(text)
+
+        engine = InferenceEngine(TwoTokenBackend())
+        engine.start()
+        assert engine.wait_ready(5)
+        scheduler = InferenceScheduler(engine)
+        try:
+            job = scheduler.submit("説明\nプレイヤー：こんにちは\nNPC：", max_tokens=20)
+            reply = job.result(5)
+        finally:
+            scheduler.stop()
+
+        metrics = scheduler.metrics()
+        assert metrics["chunks"] == len(reply)
+        assert metrics["tokens"] == job.tokens == 2 * len(reply)
+        assert metrics["tokens_per_second"] > 0
+
+    def test_background_jobs_do_not_block_interactive(self):
+        """バックグラウンドの推論が上限までたまっていても、同じNPCの対話の推論は投入できることを確認"""
+        scheduler = InferenceScheduler(ready_engine(), max_queue=2, max_pending_per_npc=2)
+        release, order = block_stream(scheduler.engine)
+        try:
+            background = [scheduler.submit(f"説明\nプレイヤー：B{i}\nNPC：", priority=PRIORITY_BACKGROUND, npc_id=1) for i in range(2)]
+            with pytest.raises(SchedulerFull):
+                scheduler.submit("説明\nプレイヤー：B2\nNPC：", priority=PRIORITY_BACKGROUND, npc_id=1)
+            interactive = scheduler.submit("説明\nプレイヤー：I\nNPC：", priority=PRIORITY_INTERACTIVE, npc_id=1)
+            release.set()
+
+            assert interactive.result(5)
+            for job in background:
+                job.result(5)
+        finally:
+            scheduler.stop()
+
+        assert scheduler.metrics()["rejected"] == 1
+
+
+class TestNPCService:
+    """NPCサービスのテストクラス"""
+
+    def test_chat_success(self, db_session, sample_object, scheduler):
+        """正常な会話テスト"""
+        service = NPCService(db_session, scheduler)
+
+        result = service.chat(sample_object.id, ChatRequest(message="今日は何をしていますか？"))
+
+        assert result.object_id == sample_object.id
+        assert "今日は何をしていますか？" in result.reply
+
+    def test_chat_stream(self, db_session, sample_object, scheduler):
+        """ストリームの断片をつなげると通常の会話と同じ返答になることを確認"""
+        service = NPCService(db_session, scheduler)
+        request = ChatRequest(message="今日は何をしていますか？")
+
+        chunks = list(service.chat_stream(sample_object.id, request).iter_chunks(timeout=5))
+
+        assert len(chunks) > 1
+        assert "".join(chunks).strip() == service.chat(sample_object.id, request).reply
+
+    def test_npc_chat_is_recorded(self, db_session, sample_object, scheduler):
+        """NPCとの会話でプレイヤーの発言と返答が保存されることを確認"""
+        service = ConversationService(db_session)
+        npc_service = NPCService(db_session, scheduler, conversations=service)
+
+        reply = npc_service.chat(sample_object.id, ChatRequest(message="こんにちは")).reply
+        page = service.get_messages(sample_object.id)
+
+        assert [(m.sender, m.content) for m in page.messages] == [("player", "こんにちは"), ("npc", reply)]
+        assert service.get_conversation(sample_object.id).unread_count == 1
+
+    def test_long_conversation_is_folded_into_summary(self, db_session, sample_object, scheduler):
+        """長い会話でも古い発言が要約に畳み込まれ、プロンプトの長さが一定に保たれることを確認"""
+        summarizer = ConversationSummarizer(scheduler, writer=SessionWriter(db_session))
+        service = NPCService(db_session, scheduler, conversations=ConversationService(db_session))
+        lengths = []
+        for turn in range(30):
+            service.chat(sample_object.id, ChatRequest(message=f"質問{turn}"))
+            # テストではバックグラウンドのスレッドを使わずに同じセッションで畳み込む
+            while summarizer.fold(sample_object.id, db_session):
+                pass
+            lengths.append(len(service.build_prompt(sample_object, "元気？")))
+
+        prefix, conversation = service.build_prompt_parts(sample_object, "元気？")
+        assert summarizer.folds > 0
+        assert "# これまでの会話\n" in prefix
+        # 会話の部分は直近の発言と今回の発言だけ
+        assert len(conversation.splitlines()) == CHAT_HISTORY_TURNS + 2
+        assert "質問29" in conversation and "質問0" not in conversation
+        assert max(lengths[10:]) - min(lengths[10:]) < 20
+
+    def test_prompt_includes_summary_and_memories(self, db_session, sample_object, scheduler):
+        """プロンプトに説明・最新のサマリー・重要なメモリが含まれることを確認"""
+        SummaryService(db_session).create_summary(SummaryCreate(object_id=sample_object.id, key_features="釣りが好き", current_daily_tasks="畑仕事", recent_progress_feelings="楽しい"))
+        db_session.add(MemoryDB(object_id=sample_object.id, content="昨日は雨だった", importance=9))
+        db_session.commit()
+        db_session.refresh(sample_object)
+        service = NPCService(db_session, scheduler)
+
+        prompt = service.build_prompt(sample_object, "元気？")
+
+        assert sample_object.description in prompt
+        assert "釣りが好き" in prompt
+        assert "昨日は雨だった" in prompt
+        assert prompt.endswith(f"{sample_object.name}：")
+
+        # 共通部分にはプレイヤーの発言を含まない
+        prefix, conversation = service.build_prompt_parts(sample_object, "元気？")
+        assert prefix + conversation == prompt
+        assert "元気？" not in prefix and prefix.endswith("# 会話\n")
+
+    def test_chat_validation(self, db_session, sample_object, scheduler):
+        """空のメッセージ・存在しないオブジェクトのエラーテスト"""
+        service = NPCService(db_session, scheduler)
+
+        with pytest.raises(HTTPException) as exc_info:
+            service.chat(sample_object.id, ChatRequest(message="  "))
+        assert exc_info.value.status_code == 400
+
+        with pytest.raises(HTTPException) as exc_info:
+            service.chat(999, ChatRequest(message="こんにちは"))
+        assert exc_info.value.status_code == 404
+
+    def test_chat_unavailable_while_loading_or_failed(self, db_session, sample_object):
+        """モデルの読み込み中・読み込み失敗時は503を返すことを確認"""
+        loading = InferenceEngine(FakeBackend(load_delay=1.0))
+        loading.start()
+        with pytest.raises(HTTPException) as exc_info:
+            NPCService(db_session, InferenceScheduler(loading)).chat(sample_object.id, ChatRequest(message="こんにちは"))
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.headers["Retry-After"] == "5"
+
+        failed = InferenceEngine(FakeBackend(fail=True))
+        failed.start()
+        failed.wait_ready(5)
+        with pytest.raises(HTTPException) as exc_info:
+            NPCService(db_session, InferenceScheduler(failed)).chat(sample_object.id, ChatRequest(message="こんにちは"))
+        assert exc_info.value.status_code == 503
+        assert "failed to load" in exc_info.value.detail
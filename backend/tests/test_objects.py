@@ -1,6 +1,6 @@
 import pytest
 from fastapi import HTTPException
-from objects.service import ObjectService
+from objects.service import ObjectService, sweep_orphans
 from objects.models import ObjectCreate, ObjectUpdate, ObjectQuery
 from utils.db_models import ObjectDB, MemoryDB, SummaryDB
 import pytz
@@ -424,6 +424,15 @@ class TestObjectService:
         assert exc_info.value.status_code == 404
         assert "Object with id 999 not found" in str(exc_info.value.detail)
 
+    def test_update_object_not_found_with_invalid_body(self, db_session):
+        """存在しないオブジェクトの更新は、入力が不正でも404エラーになることを確認"""
+        service = ObjectService(db_session)
+        
+        with pytest.raises(HTTPException) as exc_info:
+            service.update_object(999, ObjectUpdate())
+        
+        assert exc_info.value.status_code == 404
+
     def test_update_object_invalid_json_photos(self, db_session, sample_object):
         """更新時にphotosが無効なJSON形式の場合のバリデーションエラーテスト"""
         service = ObjectService(db_session)
@@ -561,6 +570,43 @@ class TestObjectService:
             service.get_object(sample_object.id)
         assert exc_info.value.status_code == 404
     
+    def test_delete_object_removes_children_in_batches(self, db_session, sample_object):
+        """オブジェクト削除時にメモリとサマリーが件数を制限した書き込みに分けて削除されることを確認"""
+        service = ObjectService(db_session)
+        other = ObjectDB(name="別のオブジェクト", summary="サマリー", description="説明", photos="[]")
+        db_session.add(other)
+        db_session.commit()
+        
+        for i in range(7):
+            db_session.add(MemoryDB(object_id=sample_object.id, content=f"メモリ{i}", importance=5))
+        for i in range(3):
+            db_session.add(SummaryDB(object_id=sample_object.id, key_features=f"特徴{i}", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+        db_session.add(MemoryDB(object_id=other.id, content="残るメモリ", importance=5))
+        db_session.commit()
+        
+        service.delete_object(sample_object.id, batch_size=3)
+        
+        assert db_session.query(MemoryDB).filter(MemoryDB.object_id == sample_object.id).count() == 0
+        assert db_session.query(SummaryDB).filter(SummaryDB.object_id == sample_object.id).count() == 0
+        # 他のオブジェクトの子は削除されない
+        assert db_session.query(MemoryDB).filter(MemoryDB.object_id == other.id).count() == 1
+    
+    def test_sweep_orphans(self, db_session, sample_object):
+        """存在しないオブジェクトを参照するメモリとサマリーだけが掃除されることを確認"""
+        db_session.add(MemoryDB(object_id=sample_object.id, content="残るメモリ", importance=5))
+        for i in range(4):
+            db_session.add(MemoryDB(object_id=999, content=f"孤立したメモリ{i}", importance=5))
+        db_session.add(SummaryDB(object_id=999, key_features="特徴", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+        db_session.commit()
+        
+        assert sweep_orphans(db_session, batch_size=3) == 3
+        assert sweep_orphans(db_session, batch_size=3) == 2
+        assert sweep_orphans(db_session, batch_size=3) == 0
+        db_session.commit()
+        
+        assert [m.content for m in db_session.query(MemoryDB).all()] == ["残るメモリ"]
+        assert db_session.query(SummaryDB).count() == 0
+    
     def test_delete_object_not_found(self, db_session):
         """存在しないオブジェクト削除テスト"""
         service = ObjectService(db_session)
@@ -701,4 +747,48 @@ class TestObjectService:
             service.get_object_details(999)
         
         assert exc_info.value.status_code == 404
-        assert "Object with id 999 not found" in str(exc_info.value.detail) 
\ No newline at end of file
+        assert "Object with id 999 not found" in str(exc_info.value.detail)
+
+    def test_update_object_version_conflict(self, db_session, sample_object):
+        """期待するversionが一致しない場合の409エラーテスト"""
+        service = ObjectService(db_session)
+        
+        updated = service.update_object(sample_object.id, ObjectUpdate(name="更新1"), expected_version=1)
+        assert updated.version == 2
+        
+        with pytest.raises(HTTPException) as exc_info:
+            service.update_object(sample_object.id, ObjectUpdate(name="更新2"), expected_version=1)
+        
+        assert exc_info.value.status_code == 409
+        assert service.get_object(sample_object.id).name == "更新1"
+
+    def test_update_object_not_found_with_expected_version(self, db_session):
+        """存在しないオブジェクトはversion指定があっても404になることを確認"""
+        service = ObjectService(db_session)
+        
+        with pytest.raises(HTTPException) as exc_info:
+            service.update_object(999, ObjectUpdate(name="更新"), expected_version=1)
+        
+        assert exc_info.value.status_code == 404
+
+    def test_get_object_page(self, db_session):
+        """一覧がIDの昇順に1ページずつ重複なく取得でき、変更番号と総数が返ることを確認"""
+        service = ObjectService(db_session)
+        created = [service.create_object(ObjectCreate(name=f"オブジェクト{i}", summary="サマリー", description="説明")) for i in range(5)]
+
+        ids = []
+        page = service.get_object_page(limit=2)
+        while True:
+            ids.extend(obj.id for obj in page.objects)
+            if not page.has_more:
+                break
+            page = service.get_object_page(after_id=page.next_after_id, limit=2)
+
+        assert ids == [obj.id for obj in created]
+        assert page.next_after_id is None
+        assert page.total == 5
+        assert page.change_seq >= 5
+
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_object_page(limit=0)
+        assert exc_info.value.status_code == 400
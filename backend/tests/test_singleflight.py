@@ -0,0 +1,92 @@
+import pytest
+import json
+import threading
+import time
+from fastapi import HTTPException
+from summaries.service import SummaryService
+from summaries.models import SummaryQuery
+from utils.singleflight import SingleFlight, make_key, coalesced_json
+
+
+def run_concurrently(count, target):
+    """同じ処理を複数スレッドから同時に実行して結果を返す"""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = target()
+        except Exception as exc:
+            results[index] = exc
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestSingleFlight:
+    """SingleFlightのテストクラス"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """同時に届いた同一キーの処理が1回だけ実行されることを確認"""
+        flight = SingleFlight()
+        executions = []
+
+        def slow():
+            executions.append(1)
+            time.sleep(0.1)
+            return {"value": 42}
+
+        results = run_concurrently(8, lambda: flight.do(make_key("route", id=1), slow))
+
+        assert len(executions) == 1
+        assert all(result == {"value": 42} for result in results)
+        assert flight.metrics() == {"executions": 1, "shared": 7, "in_flight": 0}
+
+    def test_different_keys_are_not_shared(self):
+        """パラメーターが異なる場合は別々に実行されることを確認"""
+        flight = SingleFlight()
+
+        assert flight.do(make_key("route", id=1, limit=10), lambda: 1) == 1
+        assert flight.do(make_key("route", id=1, limit=5), lambda: 2) == 2
+        # パラメーターの順序はキーに影響しない
+        assert make_key("route", a=1, b=2) == make_key("route", b=2, a=1)
+
+    def test_error_is_propagated_and_not_cached(self):
+        """実行中のエラーが待っている全員に伝わり、次の呼び出しでは再実行されることを確認"""
+        flight = SingleFlight()
+
+        def failing():
+            time.sleep(0.1)
+            raise HTTPException(status_code=404, detail="not found")
+
+        results = run_concurrently(4, lambda: flight.do("key", failing))
+
+        assert all(isinstance(result, HTTPException) and result.status_code == 404 for result in results)
+        assert flight.do("key", lambda: "retried") == "retried"
+
+    def test_runs_on_its_own_thread(self):
+        """処理が呼び出し元のスレッドではなく専用のスレッドで実行されることを確認"""
+        flight = SingleFlight()
+        caller = threading.current_thread()
+
+        executor_thread = flight.do("key", threading.current_thread)
+
+        assert executor_thread is not caller
+        assert executor_thread.name.startswith("singleflight")
+
+    def test_coalesced_json_with_summary_service(self, db_session, sample_summary):
+        """サービスの結果がシリアライズ済みJSONとして返されることを確認"""
+        service = SummaryService(db_session)
+        query = SummaryQuery(object_id=sample_summary.object_id, limit=10)
+
+        response = coalesced_json("summaries.list", lambda: service.get_summaries(query), object_id=query.object_id, limit=10)
+
+        assert response.media_type == "application/json"
+        body = json.loads(response.body)
+        assert body[0]["id"] == sample_summary.id
+        assert body[0]["key_features"] == "テスト特徴"
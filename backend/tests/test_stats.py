@@ -0,0 +1,97 @@
+import pytest
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import text
+from memories.service import MemoryService
+from memories.models import MemoryCreate, MemoryUpdate
+from objects.service import ObjectService
+from summaries.service import SummaryService
+from summaries.models import SummaryCreate
+from stats.service import StatsService
+from utils.db_models import ObjectDB, MemoryDB
+
+
+def create_memory(db_session, object_id, importance, timestamp=None):
+    """統計の確認用にメモリを1件追加"""
+    memory = MemoryDB(object_id=object_id, content="メモリ", importance=importance, timestamp=timestamp)
+    db_session.add(memory)
+    db_session.commit()
+    return memory
+
+
+class TestStatsService:
+    """統計サービスのテストクラス"""
+
+    def test_stats_follow_creates(self, db_session, sample_object):
+        """メモリ・サマリーの作成に合わせて統計が更新されることを確認"""
+        memory_service = MemoryService(db_session)
+        summary_service = SummaryService(db_session)
+        for importance in (3, 7, 7):
+            memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="メモリ", importance=importance))
+        created = memory_service.create_memory(MemoryCreate(object_id=sample_object.id, content="最新", importance=9))
+        summary_service.create_summary(SummaryCreate(object_id=sample_object.id, key_features="特徴", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+
+        stats = StatsService(db_session).get_object_stats(sample_object.id)
+
+        assert stats.memory_count == 4
+        assert stats.summary_count == 1
+        assert stats.importance_histogram[7] == 2
+        assert stats.importance_histogram[3] == 1
+        assert stats.importance_histogram[9] == 1
+        assert sum(stats.importance_histogram.values()) == 4
+        assert stats.latest_memory_at == created.timestamp
+
+    def test_stats_follow_updates_and_deletes(self, db_session, sample_object):
+        """重要度の更新とメモリの削除で統計が補正されることを確認"""
+        older = create_memory(db_session, sample_object.id, 5, datetime(2025, 1, 1, 12, 0))
+        newest = create_memory(db_session, sample_object.id, 5, datetime(2025, 1, 2, 12, 0))
+        memory_service = MemoryService(db_session)
+
+        memory_service.update_memory(older.id, MemoryUpdate(importance=8))
+        memory_service.delete_memory(newest.id)
+
+        stats = StatsService(db_session).get_object_stats(sample_object.id)
+        assert stats.memory_count == 1
+        assert stats.importance_histogram[5] == 0
+        assert stats.importance_histogram[8] == 1
+        # 最新のメモリが削除されたため最新時刻が再計算される
+        assert stats.latest_memory_at == datetime(2025, 1, 1, 12, 0)
+
+    def test_global_stats(self, db_session, sample_object):
+        """全体の統計がオブジェクトの追加・削除に追従することを確認"""
+        other = ObjectDB(name="別のオブジェクト", summary="サマリー", description="説明", photos="[]")
+        db_session.add(other)
+        db_session.commit()
+        create_memory(db_session, sample_object.id, 2)
+        create_memory(db_session, other.id, 4)
+        service = StatsService(db_session)
+
+        stats = service.get_global_stats()
+        assert stats.object_count == 2
+        assert stats.memory_count == 2
+
+        ObjectService(db_session).delete_object(other.id)
+        stats = service.get_global_stats()
+        assert stats.object_count == 1
+        assert stats.memory_count == 1
+        assert stats.importance_histogram[4] == 0
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_object_stats(other.id)
+        assert exc_info.value.status_code == 404
+
+    def test_rebuild_corrects_drift(self, db_session, sample_object):
+        """統計が実データとずれた場合に再構築で補正されることを確認"""
+        create_memory(db_session, sample_object.id, 6)
+        db_session.execute(text("UPDATE object_stats SET memory_count = 42, importance_6 = 0"))
+        db_session.commit()
+        service = StatsService(db_session)
+
+        result = service.rebuild()
+
+        assert result.objects == 1
+        assert result.corrected == 1
+        stats = service.get_object_stats(sample_object.id)
+        assert stats.memory_count == 1
+        assert stats.importance_histogram[6] == 1
+        # 再度実行してもずれはない
+        assert service.rebuild().corrected == 0
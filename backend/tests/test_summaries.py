@@ -265,6 +265,15 @@ class TestSummaryService:
         assert exc_info.value.status_code == 404
         assert "Summary with id 999 not found" in str(exc_info.value.detail)
 
+    def test_update_summary_not_found_with_invalid_body(self, db_session):
+        """存在しないサマリーの更新は、入力が不正でも404エラーになることを確認"""
+        service = SummaryService(db_session)
+        
+        with pytest.raises(HTTPException) as exc_info:
+            service.update_summary(999, SummaryUpdate())
+        
+        assert exc_info.value.status_code == 404
+
     def test_update_summary_skip_empty_fields(self, db_session, sample_summary):
         """更新時に空フィールドをスキップして有効フィールドのみ更新するテスト"""
         service = SummaryService(db_session)
@@ -382,4 +391,64 @@ class TestSummaryService:
         assert len(result) == 2
         # 作成日時順でソートされているか確認（新しい順）
         for i in range(len(result) - 1):
-            assert result[i].created_at >= result[i + 1].created_at 
\ No newline at end of file
+            assert result[i].created_at >= result[i + 1].created_at
+
+    def test_update_summary_version_conflict(self, db_session, sample_summary):
+        """期待するversionが一致しない場合の409エラーテスト"""
+        service = SummaryService(db_session)
+        
+        updated = service.update_summary(sample_summary.id, SummaryUpdate(key_features="更新1", expected_version=1))
+        assert updated.version == 2
+        
+        with pytest.raises(HTTPException) as exc_info:
+            service.update_summary(sample_summary.id, SummaryUpdate(key_features="更新2", expected_version=1))
+        
+        assert exc_info.value.status_code == 409
+        assert service.get_summary(sample_summary.id).key_features == "更新1"
+
+    def test_latest_summary_pointer(self, db_session, sample_object):
+        """作成・削除に合わせて最新のサマリーのポインターが更新されることを確認"""
+        service = SummaryService(db_session)
+        first = service.create_summary(SummaryCreate(object_id=sample_object.id, key_features="1件目", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+        second = service.create_summary(SummaryCreate(object_id=sample_object.id, key_features="2件目", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+        
+        assert service.get_latest_summary(sample_object.id).id == second.id
+        
+        # 最新のサマリーを削除すると1つ前のサマリーが最新になる
+        service.delete_summary(second.id)
+        assert service.get_latest_summary(sample_object.id).id == first.id
+        
+        service.delete_summary(first.id)
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_latest_summary(sample_object.id)
+        assert exc_info.value.status_code == 404
+        assert "No summaries found" in str(exc_info.value.detail)
+
+    def test_get_latest_summary_object_not_found(self, db_session):
+        """存在しないオブジェクトの最新のサマリー取得テスト"""
+        service = SummaryService(db_session)
+        
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_latest_summary(999)
+        
+        assert exc_info.value.status_code == 404
+        assert "Object with id 999 not found" in str(exc_info.value.detail)
+
+    def test_get_latest_summaries(self, db_session, sample_object):
+        """複数オブジェクトの最新のサマリーを一括取得するテスト"""
+        service = SummaryService(db_session)
+        other = ObjectDB(name="別のオブジェクト", summary="サマリー", description="説明", photos="[]")
+        empty = ObjectDB(name="サマリーなし", summary="サマリー", description="説明", photos="[]")
+        db_session.add_all([other, empty])
+        db_session.commit()
+        service.create_summary(SummaryCreate(object_id=sample_object.id, key_features="古い", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+        latest = service.create_summary(SummaryCreate(object_id=sample_object.id, key_features="新しい", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+        other_latest = service.create_summary(SummaryCreate(object_id=other.id, key_features="別", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+        
+        result = service.get_latest_summaries([sample_object.id, other.id, empty.id, 999])
+        
+        assert [summary.id for summary in result] == [latest.id, other_latest.id]
+        
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_latest_summaries([])
+        assert exc_info.value.status_code == 400
@@ -0,0 +1,89 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+from summaries.service import SummaryService
+from summaries.models import SummaryCreate, SummaryUpdate
+from summaries.history import SUMMARY_KEYFRAME_INTERVAL
+from utils.db_models import SummaryHistoryDB
+from utils.deltas import diff_text, apply_text, encode_delta, apply_delta
+from utils.timestamps import from_epoch_ms
+
+
+def set_recorded_at(db_session, summary_id, base_ms):
+    """履歴の記録時刻をバージョンごとに1秒ずつずらす（削除は最後のバージョンの1秒後）"""
+    db_session.execute(
+        text("UPDATE summary_history SET recorded_at = :base + (version + (kind = 'delete')) * 1000 WHERE summary_id = :id"),
+        {"base": base_ms, "id": summary_id}
+    )
+    db_session.commit()
+
+
+class TestDeltas:
+    """差分の作成・適用のテストクラス"""
+
+    def test_diff_roundtrip(self):
+        """差分を適用すると変更後の文字列に戻ることを確認"""
+        cases = [
+            ("", "新しい文字列"),
+            ("朝は畑を耕し、昼は市場へ行く", "朝は畑を耕し、夕方は市場へ行く"),
+            ("abcdef", ""),
+            ("同じ", "同じ"),
+        ]
+        for old, new in cases:
+            assert apply_text(old, diff_text(old, new)) == new
+
+    def test_delta_contains_only_changed_fields(self):
+        """変更のないフィールドは差分に含まれないことを確認"""
+        old = {"key_features": "a" * 200, "current_daily_tasks": "畑仕事"}
+        new = {"key_features": "a" * 200, "current_daily_tasks": "釣り"}
+
+        data = encode_delta(old, new)
+
+        assert apply_delta(old, data) == new
+        assert len(data) < len(old["key_features"])
+
+
+class TestSummaryHistory:
+    """サマリーの履歴のテストクラス"""
+
+    def test_get_summary_at_past_versions(self, db_session, sample_object):
+        """任意の時刻のサマリーの状態が復元できることを確認"""
+        service = SummaryService(db_session)
+        summary = service.create_summary(SummaryCreate(object_id=sample_object.id, key_features="特徴0", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+        for version in range(2, 21):
+            service.update_summary(summary.id, SummaryUpdate(key_features=f"特徴{version - 1}"))
+        set_recorded_at(db_session, summary.id, 1_700_000_000_000)
+
+        for version in (1, 2, SUMMARY_KEYFRAME_INTERVAL, SUMMARY_KEYFRAME_INTERVAL + 1, 20):
+            result = service.get_summary_at(sample_object.id, from_epoch_ms(1_700_000_000_000 + version * 1000 + 500))
+            assert result.version == version
+            assert result.key_features == f"特徴{version - 1}"
+            assert result.current_daily_tasks == "タスク"
+
+        # 全体は一定間隔でのみ保存される
+        kinds = [row.kind for row in db_session.query(SummaryHistoryDB).order_by(SummaryHistoryDB.version)]
+        assert kinds.count("delta") > kinds.count("keyframe")
+
+    def test_get_summary_at_follows_newer_and_deleted_summaries(self, db_session, sample_object):
+        """指定時刻に最新だったサマリーが選ばれ、削除後の時刻では除外されることを確認"""
+        service = SummaryService(db_session)
+        older = service.create_summary(SummaryCreate(object_id=sample_object.id, key_features="古い", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+        newer = service.create_summary(SummaryCreate(object_id=sample_object.id, key_features="新しい", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+        service.delete_summary(newer.id)
+        set_recorded_at(db_session, older.id, 1_700_000_000_000)
+        set_recorded_at(db_session, newer.id, 1_700_000_010_000)
+
+        assert service.get_summary_at(sample_object.id, from_epoch_ms(1_700_000_005_000)).id == older.id
+        assert service.get_summary_at(sample_object.id, from_epoch_ms(1_700_000_011_500)).id == newer.id
+        assert service.get_summary_at(sample_object.id, from_epoch_ms(1_700_000_013_000)).id == older.id
+
+        with pytest.raises(HTTPException) as exc_info:
+            service.get_summary_at(sample_object.id, from_epoch_ms(1_600_000_000_000))
+        assert exc_info.value.status_code == 404
+
+    def test_get_summary_at_without_time_returns_latest(self, db_session, sample_object):
+        """時刻を指定しない場合は最新のサマリーを返すことを確認"""
+        service = SummaryService(db_session)
+        created = service.create_summary(SummaryCreate(object_id=sample_object.id, key_features="特徴", current_daily_tasks="タスク", recent_progress_feelings="感想"))
+
+        assert service.get_summary_at(sample_object.id).id == created.id
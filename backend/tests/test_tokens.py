@@ -0,0 +1,25 @@
+from utils.tokens import estimate_tokens
+
+
+class TestEstimateTokens:
+    """トークン数の概算のテストクラス"""
+
+    def test_ascii_runs(self):
+        """英数字は4文字で1トークン（端数は切り上げ）と数えることを確認"""
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd") == 1
+        assert estimate_tokens("abcde") == 2
+        assert estimate_tokens("hello world") == 4
+
+    def test_japanese_and_symbols(self):
+        """日本語・記号は1文字1トークン、空白は数えず改行は1トークンと数えることを確認"""
+        assert estimate_tokens("こんにちは") == 5
+        assert estimate_tokens("「はい」。") == 5
+        assert estimate_tokens("あ い") == 2
+        assert estimate_tokens("あ\nい\n") == 4
+
+    def test_additive_across_lines(self):
+        """英数字の連続がつながらない場合、つなげた文字列の概算は各部分の概算の合計になることを確認（行ごとに数えた値を足せる）"""
+        parts = ["プレイヤー：", "hello", "\n", "NPC：", "元気です", "\n"]
+
+        assert estimate_tokens("".join(parts)) == sum(estimate_tokens(part) for part in parts)
@@ -0,0 +1,144 @@
+import pytest
+import threading
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from memories.service import MemoryService
+from memories.models import MemoryCreate
+from utils.database import Base, enable_write_transactions
+from utils.db_models import ObjectDB, MemoryDB
+from utils.writer import WriteQueue
+
+
+@pytest.fixture(scope="function")
+def file_sessionmaker(tmp_path):
+    """ファイルベースのSQLiteに接続する読み込み用・書き込み用のセッションファクトリを作成"""
+    url = f"sqlite:///{tmp_path / 'writer.db'}"
+    engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    writer_engine = create_engine(url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    enable_write_transactions(writer_engine)
+    yield sessionmaker(bind=engine), sessionmaker(bind=writer_engine)
+    engine.dispose()
+    writer_engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def write_queue(file_sessionmaker):
+    """テスト用の書き込みキューを作成"""
+    _, writer_sessionmaker = file_sessionmaker
+    writer = WriteQueue(writer_sessionmaker, max_batch=32, max_latency_ms=20)
+    writer.start()
+    yield writer
+    writer.stop()
+
+
+def add_object(name):
+    """オブジェクトを1件追加してIDを返す書き込み処理を作成"""
+    def _create(session):
+        obj = ObjectDB(name=name, summary="サマリー", description="説明", photos="[]")
+        session.add(obj)
+        session.flush()
+        return obj.id
+    return _create
+
+
+class TestWriteQueue:
+    """書き込みキューのテストクラス"""
+
+    def test_run_returns_result(self, write_queue, file_sessionmaker):
+        """書き込みの結果が呼び出し元に返ることを確認"""
+        session_factory, _ = file_sessionmaker
+        object_id = write_queue.run(add_object("テスト"))
+
+        with session_factory() as session:
+            assert session.get(ObjectDB, object_id) is not None
+
+    def test_concurrent_writes_are_group_committed(self, write_queue, file_sessionmaker):
+        """同時に投入された書き込みがまとめてコミットされ、各呼び出し元が自分の結果を受け取ることを確認"""
+        session_factory, _ = file_sessionmaker
+        results = {}
+        barrier = threading.Barrier(16)
+
+        def worker(index):
+            def _create(session):
+                obj = ObjectDB(name=f"オブジェクト{index}", summary="サマリー", description="説明", photos="[]")
+                session.add(obj)
+                session.flush()
+                return obj.id, obj.name
+
+            barrier.wait()
+            results[index] = write_queue.run(_create)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 16
+        assert all(name == f"オブジェクト{index}" for index, (_, name) in results.items())
+        assert len({object_id for object_id, _ in results.values()}) == 16
+        assert write_queue.writes == 16
+        assert write_queue.batches < 16
+
+        with session_factory() as session:
+            assert session.query(ObjectDB).count() == 16
+
+    def test_failed_write_does_not_affect_others(self, write_queue, file_sessionmaker):
+        """同じグループ内で失敗した書き込みだけがロールバックされることを確認"""
+        session_factory, _ = file_sessionmaker
+        errors = []
+        barrier = threading.Barrier(3)
+
+        def good(name):
+            barrier.wait()
+            write_queue.run(add_object(name))
+
+        def bad():
+            def _create(session):
+                session.add(ObjectDB(name="失敗", summary="サマリー", description="説明", photos="[]"))
+                session.flush()
+                raise HTTPException(status_code=400, detail="invalid")
+            barrier.wait()
+            try:
+                write_queue.run(_create)
+            except HTTPException as exc:
+                errors.append(exc)
+
+        threads = [
+            threading.Thread(target=good, args=("成功1",)),
+            threading.Thread(target=bad),
+            threading.Thread(target=good, args=("成功2",)),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(errors) == 1
+        assert errors[0].status_code == 400
+        with session_factory() as session:
+            names = sorted(obj.name for obj in session.query(ObjectDB).all())
+        assert names == ["成功1", "成功2"]
+
+    def test_memory_service_with_write_queue(self, write_queue, file_sessionmaker):
+        """MemoryServiceの書き込みが書き込みキュー経由で行われることを確認"""
+        session_factory, _ = file_sessionmaker
+        object_id = write_queue.run(add_object("テスト"))
+
+        with session_factory() as db:
+            service = MemoryService(db, writer=write_queue)
+            created = service.create_memory(MemoryCreate(object_id=object_id, content="キュー経由", importance=7))
+            fetched = service.get_memory(created.id)
+
+            assert fetched.content == "キュー経由"
+            assert fetched.last_accessed >= created.last_accessed
+
+            with pytest.raises(HTTPException) as exc_info:
+                service.create_memory(MemoryCreate(object_id=999, content="存在しない", importance=5))
+            assert exc_info.value.status_code == 404
+
+        with session_factory() as session:
+            assert session.query(MemoryDB).count() == 1
@@ -1,37 +1,111 @@
+import threading
+import time
 import flet as ft
+from api_client import get_client
+from chat.message_view import MessageView
+from gameEngine.ipc import get_sender
+from gameEngine.world_sim import get_world
+from ui_loader import get_loader
+
+# ストリーミング中に返答の吹き出しを更新する最大頻度（回/秒）
+STREAM_FPS = 20
+# 画面を開いたときに読み込む履歴の件数
+HISTORY_PAGE_SIZE = 50
+
+def find_object_id(user):
+    """ユーザーに対応するNPC（オブジェクト）のIDを取得する。見つからない場合はNone"""
+    if user.get("object_id") is not None:
+        return user["object_id"]
+    objects = get_client().find_objects(user["name"], limit=1)
+    return objects[0]["id"] if objects else None
+
+def load_history(object_id, before_id=None, limit=HISTORY_PAGE_SIZE):
+    """会話の履歴を新しい方から1ページ取得する（ページ内は古い順）"""
+    return get_client().get_messages(object_id, before_id=before_id, limit=limit)
+
+def to_chat_message(message):
+    """バックエンドのメッセージを画面表示用の形式に変換する"""
+    return {"from": "me" if message["sender"] == "player" else "you", "text": message["content"]}
 
 def chat_detail(page, user, back_callback):
+    # 前の画面の取得を取り消し、この画面の取得を始める
+    scope = get_loader(page).begin()
     page.controls.clear()
 
-    # 指定ユーザーとのダミーチャット履歴（田中 太郎のみサンプル会話あり）
-    chat_history = [
-        {"from": "me", "text": "こんにちは！"},
-        {"from": "you", "text": "こんにちは！お元気ですか？"},
-    ] if user["name"] == "田中 太郎" else []
+    # 履歴の続きを取得する位置（バックエンドに保存され、画面を開くたびに最新のページから読み込む）
+    history_cursor = {"object_id": None, "before_id": None}
+
+    def load_older():
+        """読み込み済みより古い履歴を1ページ取得する（これ以上ない場合は空のリスト）"""
+        if history_cursor["before_id"] is None:
+            return []
+        history = load_history(history_cursor["object_id"], before_id=history_cursor["before_id"])
+        history_cursor["before_id"] = history["next_before_id"]
+        return [to_chat_message(message) for message in history["messages"]]
 
-    # チャットメッセージ表示用カラム
-    chat_column = ft.Column([], expand=True, scroll="auto", height=200)
+    # チャットメッセージ表示用のビュー（表示範囲の吹き出しだけを作る）
+    message_view = MessageView(load_older=load_older, scope=scope)
 
-    def update_chat():
+    def receive_reply(message, reply_msg):
         """
-        チャット履歴を画面に反映する関数。
-        メッセージの送信者によって表示位置・色を変更。
+        返答を受信するスレッドの処理。
+        断片が届くたびに最後の吹き出しの文字だけを更新し、更新頻度はSTREAM_FPSまでに抑える。
+        画面を離れた後も返答は最後まで受信する（バックエンドに保存される）が、画面は更新しない。
         """
-        chat_column.controls.clear()
-        for msg in chat_history:
-            align = ft.alignment.center_right if msg["from"] == "me" else ft.alignment.center_left
-            color = "blue" if msg["from"] == "me" else "grey"
-            chat_column.controls.append(
-                ft.Container(
-                    content=ft.Text(msg["text"], color="white"),
-                    bgcolor=color,
-                    alignment=align,
-                    padding=10,
-                    margin=5,
-                    border_radius=10,
-                )
-            )
-        chat_column.update()
+        min_interval = 1.0 / STREAM_FPS
+        last_update = 0.0
+        try:
+            object_id = find_object_id(user)
+            if object_id is None:
+                reply_msg["text"] = "（このユーザーのNPCが見つかりません）"
+            else:
+                for chunk in get_client().stream_chat(object_id, message):
+                    reply_msg["text"] += chunk
+                    now = time.monotonic()
+                    if now - last_update >= min_interval and not scope.cancelled:
+                        message_view.update_text(reply_msg)
+                        last_update = now
+                # 返答をPyxelの画面に表示し、NPCの頭上にも発言として表示する（Pyxelが起動していない場合は捨てられる）
+                get_sender().send_speech(object_id, reply_msg["text"])
+                get_world().say(object_id, reply_msg["text"])
+                # 表示中に届いた返答は既読にする
+                if not scope.cancelled:
+                    get_client().mark_read(object_id)
+        except Exception as exc:
+            reply_msg["text"] += f"（返答を取得できませんでした: {exc}）"
+        finally:
+            # 最後に間引かれた分も含めて表示し、送信できる状態に戻す
+            if not scope.cancelled:
+                message_view.update_text(reply_msg)
+                send_btn.disabled = False
+                send_btn.update()
+
+    def fetch_latest_history():
+        """最新の履歴を取得し、会話を既読にする（ワーカースレッドで実行）"""
+        object_id = find_object_id(user)
+        if object_id is None:
+            return None, None
+        history = load_history(object_id)
+        if history["messages"]:
+            get_client().mark_read(object_id, history["messages"][-1]["id"])
+        return object_id, history
+
+    def show_latest_history(result):
+        """
+        最新の履歴を表示する。
+        読み込み中の送信は履歴と重複するため、読み込み終わるまで送信ボタンを無効にしておく。
+        """
+        object_id, history = result
+        if history is not None:
+            history_cursor.update(object_id=object_id, before_id=history["next_before_id"])
+            message_view.set_messages([to_chat_message(message) for message in history["messages"]], history["has_more"])
+        send_btn.disabled = False
+        return [send_btn]
+
+    def enable_send(exc):
+        # バックエンドに接続できない場合は空の会話のまま送信できるようにする
+        send_btn.disabled = False
+        return [send_btn]
 
     # メッセージ入力欄
     text_field = ft.TextField(label="メッセージを入力...", width=250)
@@ -39,16 +113,22 @@ def chat_detail(page, user, back_callback):
     def on_send(e):
         """
         送信ボタン押下時の処理。
-        入力欄のテキストをチャット履歴に追加し、画面を更新。
+        入力欄のテキストの吹き出しを追加し、返答の吹き出しをストリーミングで更新する。
+        履歴の長さによらず、追加するのは吹き出し2つだけ。
         """
-        if text_field.value.strip():
-            chat_history.append({"from": "me", "text": text_field.value.strip()})
-            update_chat()
+        message = text_field.value.strip()
+        if message:
+            message_view.append({"from": "me", "text": message})
             text_field.value = ""
             text_field.update()
+            # 返答を受信し終わるまで次の送信はできない
+            send_btn.disabled = True
+            send_btn.update()
+            reply_msg = message_view.append({"from": "you", "text": ""})
+            threading.Thread(target=receive_reply, args=(message, reply_msg), daemon=True).start()
 
     # 送信・戻るボタン
-    send_btn = ft.ElevatedButton("送信", on_click=on_send)
+    send_btn = ft.ElevatedButton("送信", on_click=on_send, disabled=True)
     back_btn = ft.ElevatedButton("戻る", on_click=back_callback)
 
     # 画面レイアウトの追加
@@ -56,7 +136,7 @@ def chat_detail(page, user, back_callback):
         ft.Column(
             [
                 ft.Text(f"{user['name']}さんとのチャット", size=20, weight="bold"),
-                chat_column,
+                message_view.column,
                 ft.Row([text_field, send_btn], alignment=ft.MainAxisAlignment.CENTER),
                 back_btn
             ],
@@ -64,5 +144,5 @@ def chat_detail(page, user, back_callback):
             spacing=20,
         )
     )
-    update_chat()
     page.update()
+    scope.load(fetch_latest_history, show_latest_history, on_error=enable_send)
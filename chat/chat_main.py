@@ -1,68 +1,94 @@
 import flet as ft
+from api_client import get_client
 from chat.chat_detail import chat_detail
+from mirror import get_mirror
+from ui_loader import get_loader, placeholder
 
-# 人間ユーザーのリスト（object_list.pyのobjectsから抽出）
-USERS = [
-    {"name": "田中 太郎", "age": 28, "job": "エンジニア"},
-    {"name": "佐藤 花子", "age": 34, "job": "デザイナー"},
-    {"name": "鈴木 次郎", "age": 22, "job": "学生"},
-    {"name": "高橋 美咲", "age": 41, "job": "マネージャー"},
-    {"name": "伊藤 健一", "age": 30, "job": "営業"},
-    {"name": "山本 直樹", "age": 25, "job": "プログラマー"},
-    {"name": "中村 由美", "age": 29, "job": "マーケター"},
-    {"name": "小林 拓也", "age": 33, "job": "コンサルタント"},
-    {"name": "加藤 さくら", "age": 27, "job": "ライター"},
-    {"name": "渡辺 大輔", "age": 38, "job": "ディレクター"},
-    {"name": "松本 佳奈", "age": 24, "job": "アナリスト"},
-    {"name": "斎藤 剛", "age": 36, "job": "プロデューサー"},
-]
+# 一覧に表示する会話・NPCの件数
+CONVERSATION_PAGE_SIZE = 50
+NPC_LIST_LIMIT = 100
 
-# 各ユーザーの最新チャットメッセージ（現状は田中 太郎のみダミーデータあり）
-latest_messages = {
-    "田中 太郎": "こんにちは！お元気ですか？",
-    "佐藤 花子": "",
-    "鈴木 次郎": "",
-    "高橋 美咲": "",
-    "伊藤 健一": "",
-    "山本 直樹": "",
-    "中村 由美": "",
-    "小林 拓也": "",
-    "加藤 さくら": "",
-    "渡辺 大輔": "",
-    "松本 佳奈": "",
-    "斎藤 剛": "",
-}
+def load_users(conversations=()):
+    """
+    チャット相手（NPC）の一覧を作成する関数。
+    会話のあるNPCを新しい順に並べ、まだ会話のないNPC（ローカルのミラーから取得）をその後ろに並べる。
+    """
+    users = [
+        {
+            "object_id": conversation["object_id"],
+            "name": conversation["object_name"],
+            "latest_message": conversation["latest_message"]["content"],
+            "unread_count": conversation["unread_count"],
+        }
+        for conversation in conversations
+    ]
+    talked = {user["object_id"] for user in users}
+    for obj in get_mirror().get_object_page(limit=NPC_LIST_LIMIT)["objects"]:
+        if obj["id"] not in talked:
+            users.append({"object_id": obj["id"], "name": obj["name"], "latest_message": "", "unread_count": 0})
+    return users
+
+def load_conversations():
+    """会話のあるNPCの最新のメッセージと未読数をバックエンドから1回のリクエストで取得し、一覧を作成する"""
+    return load_users(get_client().get_conversations(limit=CONVERSATION_PAGE_SIZE)["conversations"])
 
 def chat_main(page, back_callback):
     """
     チャットメイン画面を表示する関数。
     ユーザーリストを表示し、ユーザー選択でチャット詳細画面へ遷移。
+    画面はすぐに表示し、ユーザーリストは別スレッドで取得してから表示する。
+    まずローカルのミラーのNPCを表示し、バックエンドから会話を取得できたら最新のメッセージ・未読数を加えて表示し直す。
     """
+    scope = get_loader(page).begin()
     page.controls.clear()
 
     def on_user_click(e, user):
         # ユーザー選択時にチャット詳細画面へ遷移
         chat_detail(page, user, lambda e=None: chat_main(page, back_callback))
 
+    status_text = ft.Text("チャットしたいユーザーを選択してください", size=14, color="grey")
     user_list = ft.ListView(
-        controls=[
-            ft.ListTile(
-                title=ft.Text(user["name"]),
-                subtitle=ft.Text(latest_messages.get(user["name"], "")),
-                on_click=lambda e, u=user: on_user_click(e, u)
-            ) for user in USERS
-        ],
+        controls=[placeholder()],
         expand=False,
         height=350,
         spacing=10,
     )
 
+    state = {"conversations_loaded": False}
+
+    def show_local_users(users):
+        # 会話を先に取得できた場合はそちらを表示する
+        if state["conversations_loaded"]:
+            return []
+        return show_users(users)
+
+    def show_conversations(users):
+        state["conversations_loaded"] = True
+        return show_users(users)
+
+    def show_users(users):
+        user_list.controls = [
+            ft.ListTile(
+                title=ft.Text(user["name"]),
+                subtitle=ft.Text(user["latest_message"]),
+                # 未読のメッセージがある場合は件数を表示
+                trailing=ft.Text(str(user["unread_count"]), color="red") if user["unread_count"] else None,
+                on_click=lambda e, u=user: on_user_click(e, u)
+            ) for user in users
+        ]
+        return [user_list]
+
+    def show_error(exc):
+        # ミラーのNPCはそのまま表示する
+        status_text.value = f"会話の履歴を取得できませんでした: {exc}"
+        return [status_text]
+
     back_btn = ft.ElevatedButton("戻る", on_click=back_callback)
     page.add(
         ft.Column(
             [
                 ft.Text("ユーザーリスト", size=20, weight="bold"),
-                ft.Text("チャットしたいユーザーを選択してください", size=14, color="grey"),
+                status_text,
                 user_list,
                 back_btn
             ],
@@ -71,3 +97,5 @@ def chat_main(page, back_callback):
         )
     )
     page.update()
+    scope.load(load_users, show_local_users, on_error=show_error)
+    scope.load(load_conversations, show_conversations, on_error=show_error)
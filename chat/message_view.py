@@ -0,0 +1,177 @@
+import itertools
+import threading
+import flet as ft
+
+# 画面に置いておく吹き出しの最大数（範囲外のメッセージはスクロールしたときに作り直す）
+MAX_RENDERED_MESSAGES = 120
+# スクロールで一度に表示を広げる吹き出しの数
+RENDER_PAGE_SIZE = 30
+# 端からこの距離（ピクセル）以内までスクロールしたら続きを表示する
+SCROLL_THRESHOLD = 80
+
+def make_bubble(msg):
+    """
+    1件のメッセージの吹き出しを作成する関数。
+    メッセージの送信者によって表示位置・色を変更。
+    """
+    align = ft.alignment.center_right if msg["from"] == "me" else ft.alignment.center_left
+    color = "blue" if msg["from"] == "me" else "grey"
+    return ft.Container(
+        content=ft.Text(msg["text"], color="white"),
+        bgcolor=color,
+        alignment=align,
+        padding=10,
+        margin=5,
+        border_radius=10,
+        key=msg["key"],
+    )
+
+class MessageView:
+    """
+    チャットの吹き出しを表示するビュー。
+    読み込んだメッセージはすべてデータとして保持し、吹き出しは連続した最大MAX_RENDERED_MESSAGES件の範囲だけを作る。
+    新しいメッセージは吹き出しを1つ追加して範囲外になった古い吹き出しを外すだけなので、会話の長さによらず一定の時間で表示できる。
+    上端までスクロールすると古いメッセージを表示し、読み込んだものを使い切るとload_olderで履歴の続きを取得する。
+    """
+
+    def __init__(self, load_older=None, height=200, scope=None):
+        # load_older: 読み込み済みより古いメッセージを古い順のリストで返す関数（ネットワークに接続するためscopeのワーカースレッドで呼ぶ）
+        # scope: 履歴の取得に使うui_loaderのスコープ（画面を離れると取得が取り消される）
+        self.load_older = load_older
+        self.scope = scope
+        self.messages = []  # 読み込んだメッセージ（古い順）
+        self.start = 0  # 吹き出しを作っている範囲 [start, end)
+        self.end = 0
+        self.has_older = load_older is not None
+        self.loading = False
+        self._keys = itertools.count()
+        self._texts = {}  # 吹き出しを作っているメッセージのキー → 文字のコントロール
+        # 受信スレッド・スクロールのイベントから同時に操作されるため範囲の変更は排他する
+        self._lock = threading.RLock()
+        self.column = ft.Column([], expand=True, scroll="auto", height=height, on_scroll=self._on_scroll)
+
+    def _track(self, msg):
+        msg["key"] = f"m{next(self._keys)}"
+        return msg
+
+    def _bubble(self, msg):
+        bubble = make_bubble(msg)
+        self._texts[msg["key"]] = bubble.content
+        return bubble
+
+    def _drop(self, controls):
+        for bubble in controls:
+            self._texts.pop(bubble.key, None)
+
+    def set_messages(self, messages, has_older):
+        """表示するメッセージを置き換え、最新の範囲の吹き出しを作る（画面を開いたときのみ使用）"""
+        with self._lock:
+            self.messages = [self._track(msg) for msg in messages]
+            self.has_older = has_older and self.load_older is not None
+            self._render(max(0, len(self.messages) - MAX_RENDERED_MESSAGES), len(self.messages))
+        self.scroll_to_bottom()
+
+    def _render(self, start, end):
+        """範囲の吹き出しを作り直す（範囲は最大MAX_RENDERED_MESSAGES件のため一定の時間で終わる）"""
+        self._texts.clear()
+        self.column.controls = [self._bubble(msg) for msg in self.messages[start:end]]
+        self.start, self.end = start, end
+        self.column.update()
+
+    def _trim_front(self):
+        excess = (self.end - self.start) - MAX_RENDERED_MESSAGES
+        if excess > 0:
+            self._drop(self.column.controls[:excess])
+            del self.column.controls[:excess]
+            self.start += excess
+
+    def _trim_back(self):
+        excess = (self.end - self.start) - MAX_RENDERED_MESSAGES
+        if excess > 0:
+            self._drop(self.column.controls[-excess:])
+            del self.column.controls[-excess:]
+            self.end -= excess
+
+    def append(self, msg):
+        """
+        メッセージを末尾に追加し、最新のメッセージまでスクロールする。
+        追加したメッセージ（update_textで表示を更新する際に使う）を返す。
+        """
+        with self._lock:
+            self.messages.append(self._track(msg))
+            if self.end == len(self.messages) - 1:
+                # 最新の範囲を表示中: 吹き出しを1つ追加し、範囲外になった古い吹き出しを外す
+                self.column.controls.append(self._bubble(msg))
+                self.end += 1
+                self._trim_front()
+                self.column.update()
+            else:
+                # 古いメッセージを表示中: 最新の範囲に戻る
+                self._render(max(0, len(self.messages) - RENDER_PAGE_SIZE), len(self.messages))
+        self.scroll_to_bottom()
+        return msg
+
+    def update_text(self, msg):
+        """メッセージの文字の表示を更新する（吹き出しが範囲外の場合は次に作るときに反映される）"""
+        with self._lock:
+            text = self._texts.get(msg["key"])
+            if text is not None:
+                text.value = msg["text"]
+                text.update()
+
+    def scroll_to_bottom(self):
+        self.column.scroll_to(offset=-1, duration=0)
+
+    def _on_scroll(self, e):
+        if e.pixels <= e.min_scroll_extent + SCROLL_THRESHOLD:
+            self.show_older()
+        elif e.pixels >= e.max_scroll_extent - SCROLL_THRESHOLD:
+            self.show_newer()
+
+    def show_older(self):
+        """範囲を古い方へ広げる。読み込んだメッセージを使い切った場合は履歴の続きを別スレッドで取得する"""
+        with self._lock:
+            if self.start == 0:
+                if self.has_older and not self.loading:
+                    self.loading = True
+                    self.scope.load(self.load_older, self._prepend_older, on_error=self._fetch_failed)
+                return
+            anchor = self.column.controls[0].key if self.column.controls else None
+            start = max(0, self.start - RENDER_PAGE_SIZE)
+            self.column.controls[:0] = [self._bubble(msg) for msg in self.messages[start:self.start]]
+            self.start = start
+            self._trim_back()
+            self.column.update()
+        # 追加する前に先頭にあった吹き出しの位置を保ち、表示が飛ばないようにする
+        if anchor is not None:
+            self.column.scroll_to(key=anchor, duration=0)
+
+    def show_newer(self):
+        """範囲を新しい方へ広げる"""
+        with self._lock:
+            if self.end == len(self.messages):
+                return
+            end = min(len(self.messages), self.end + RENDER_PAGE_SIZE)
+            self.column.controls.extend(self._bubble(msg) for msg in self.messages[self.end:end])
+            self.end = end
+            self._trim_front()
+            self.column.update()
+
+    def _prepend_older(self, older):
+        """取得した履歴の続きを先頭に加えて表示する（吹き出しの更新はshow_olderで行う）"""
+        with self._lock:
+            self.loading = False
+            if not older:
+                self.has_older = False
+                return []
+            self.messages[:0] = [self._track(msg) for msg in older]
+            self.start += len(older)
+            self.end += len(older)
+        self.show_older()
+        return []
+
+    def _fetch_failed(self, exc):
+        # 取得に失敗した場合は次のスクロールで再試行する
+        with self._lock:
+            self.loading = False
+        return []
@@ -3,8 +3,10 @@ from .canvas import Canvas
 from .color_palette import ColorPalette
 from .character_form import CharacterForm
 from .database import register_to_database
+from ui_loader import get_loader
 
 def createNPC_main(page: ft.Page, back_callback=None):
+    scope = get_loader(page).begin()
     page.controls.clear()
 
     page.title = "ドット絵エディター"
@@ -37,12 +39,19 @@ def createNPC_main(page: ft.Page, back_callback=None):
         character_name = character_form.get_character_name()
         character_description = character_form.get_character_description()
         
-        # DB登録処理
-        register_to_database(character_name, character_description, file_path)
-        
-        page.snack_bar = ft.SnackBar(ft.Text(f"キャラクター「{character_name}」を登録しました！"))
-        page.snack_bar.open = True
-        page.update()
+        # DB登録処理（バックエンドに接続するため別スレッドで行い、終わったら結果を表示する）
+        def show_result(registered):
+            message = "登録しました！" if registered else "登録できませんでした"
+            page.snack_bar = ft.SnackBar(ft.Text(f"キャラクター「{character_name}」を{message}"))
+            page.snack_bar.open = True
+            return [page]
+
+        scope.load(
+            lambda: register_to_database(character_name, character_description, file_path),
+            show_result,
+            on_error=lambda exc: show_result(False),
+            cancellable=False,
+        )
 
     # UIコンポーネントの作成
     canvas_with_drag = canvas.create_canvas_with_drag()
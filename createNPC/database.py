@@ -1,73 +1,82 @@
 """
 キャラクターデータベース関連の処理
+
+キャラクターはバックエンドのオブジェクトとして登録する（画像ファイルのパスはphotosにJSONの配列として保存）。
+読み込みはローカルのミラーから行い、書き込みはミラーのキューに追加してバックエンドに送る（接続できない間は接続できてから送る）。
 """
+import json
+from mirror import get_mirror, get_mirror_sync
+
+# 一覧で取得するキャラクターの最大数
+CHARACTER_LIST_LIMIT = 100
+
+def to_character(obj):
+    """バックエンドのオブジェクトをキャラクター情報の形式に変換する"""
+    try:
+        photos = json.loads(obj.get("photos") or "[]")
+    except ValueError:
+        photos = []
+    return {
+        "id": obj["id"],
+        "name": obj["name"],
+        "description": obj.get("description", obj["summary"]),
+        "image_path": photos[0] if photos else None,
+    }
 
 def register_to_database(name, description, image_path):
     """
-    キャラクター情報をデータベースに登録する（仮実装）
-    
+    キャラクター情報をデータベースに登録する
+
     Args:
         name (str): キャラクター名
         description (str): キャラクターの説明
         image_path (str): 画像ファイルのパス
-    
-    TODO: 実際のDB接続・登録処理を実装
+
+    Returns:
+        bool: 登録を受け付けた場合はTrue
     """
-    print(f"DB登録 - 名前: {name}, 説明: {description}, 画像: {image_path}")
-    
-    # ここに実際のDB登録処理を実装予定
-    # 例：
-    # import sqlite3
-    # conn = sqlite3.connect('characters.db')
-    # cursor = conn.cursor()
-    # cursor.execute("INSERT INTO characters (name, description, image_path) VALUES (?, ?, ?)", 
-    #                (name, description, image_path))
-    # conn.commit()
-    # conn.close()
-    
-    return True  # 成功時はTrueを返す
+    get_mirror().enqueue("POST", "/objects/", {
+        "name": name,
+        "summary": description,
+        "description": description,
+        "photos": json.dumps([image_path]),
+    })
+    get_mirror_sync().request_sync()
+    return True
 
 def get_all_characters():
     """
-    全キャラクターの情報を取得する（仮実装）
-    
+    全キャラクターの情報を取得する
+
     Returns:
-        list: キャラクター情報のリスト
-    
-    TODO: 実際のDB接続・取得処理を実装
+        list: キャラクター情報のリスト（一覧用のため画像のパスは含まない）
     """
-    # 仮のデータを返す
-    return [
-        {"id": 1, "name": "サンプルキャラ1", "description": "テスト用キャラクター", "image_path": "sample1.py"},
-        {"id": 2, "name": "サンプルキャラ2", "description": "テスト用キャラクター2", "image_path": "sample2.py"},
-    ]
+    page = get_mirror().get_object_page(limit=CHARACTER_LIST_LIMIT)
+    return [to_character(obj) for obj in page["objects"]]
 
 def get_character_by_id(character_id):
     """
-    IDでキャラクター情報を取得する（仮実装）
-    
+    IDでキャラクター情報を取得する
+
     Args:
         character_id (int): キャラクターID
-        
+
     Returns:
-        dict: キャラクター情報
-    
-    TODO: 実際のDB接続・取得処理を実装
+        dict: キャラクター情報（存在しない場合はNone）
     """
-    # 仮のデータを返す
-    return {"id": character_id, "name": f"キャラクター{character_id}", "description": "説明", "image_path": f"char{character_id}.py"}
+    obj = get_mirror().get_object(character_id)
+    return to_character(obj) if obj is not None else None
 
 def delete_character(character_id):
     """
-    キャラクターを削除する（仮実装）
-    
+    キャラクターを削除する
+
     Args:
         character_id (int): 削除するキャラクターID
-        
+
     Returns:
-        bool: 削除成功時はTrue
-    
-    TODO: 実際のDB接続・削除処理を実装
+        bool: 削除を受け付けた場合はTrue
     """
-    print(f"キャラクターID {character_id} を削除しました")
+    get_mirror().delete_object(character_id)
+    get_mirror_sync().request_sync()
     return True
@@ -0,0 +1,375 @@
+"""
+ランチャー（Flet）とPyxelのプロセスの間のメッセージの送受信
+
+UDPのデータグラムに次の形式のフレームを並べて送る（数値はリトルエンディアン）。
+    ヘッダー（14バイト）: マジック"PX" / バージョン / 種類 / 通し番号(uint32) / 断片の番号(uint16) / 断片の数(uint16) / ペイロードの長さ(uint16)
+    ペイロード: 種類ごとの固定長の部分 + 可変長の部分（文字列はUTF-8、スプライトは色番号の列）
+1つのデータグラムに収まらないメッセージは断片に分けて送り、受信側で組み立て直す。
+通し番号はメッセージごとに1ずつ増えるため、受信側で欠けたメッセージの数が分かる。
+"""
+import logging
+import math
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# 接続先（Pyxelのプロセスが待ち受ける）
+IPC_HOST = "127.0.0.1"
+IPC_PORT = 50007
+# 1つのデータグラムの最大サイズ（ループバックでは分割されない大きさ）
+MAX_DATAGRAM_SIZE = 8192
+# ソケットのバッファ（ゲームのフレームの間に届くメッセージを取りこぼさない大きさ）
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+# 受信したメッセージをゲームのループへ渡すリングバッファの大きさ（2のべき乗）
+RING_CAPACITY = 1 << 16
+# 組み立て途中のメッセージを保持する最大数（超えた場合は古いものを欠けたメッセージとして捨てる）
+MAX_PENDING_MESSAGES = 64
+# 受け取った最も大きい通し番号よりこの数以内の前の番号は遅れて届いたメッセージとみなす（それより前は送信側の再起動とみなす）
+REORDER_WINDOW = 1024
+
+MAGIC = b"PX"
+VERSION = 1
+HEADER = struct.Struct("<2sBBIHHH")
+
+# メッセージの種類
+MSG_SPEECH = 1
+MSG_NPC_STATE = 2
+MSG_SPAWN = 3
+MSG_DESPAWN = 4
+MSG_SPRITE = 5
+
+SPEECH = struct.Struct("<I")
+NPC_STATE = struct.Struct("<IffBB")
+SPAWN = struct.Struct("<IffH")
+DESPAWN = struct.Struct("<I")
+SPRITE = struct.Struct("<HBB")
+
+class Speech(NamedTuple):
+    npc_id: int
+    text: str
+
+class NpcState(NamedTuple):
+    npc_id: int
+    x: float
+    y: float
+    state: int
+    direction: int
+
+class Spawn(NamedTuple):
+    npc_id: int
+    x: float
+    y: float
+    sprite_id: int
+    name: str
+
+class Despawn(NamedTuple):
+    npc_id: int
+
+class SpriteUpdate(NamedTuple):
+    sprite_id: int
+    width: int
+    height: int
+    pixels: bytes  # 色番号（width×height、行ごと）
+
+def _decode_speech(payload):
+    (npc_id,) = SPEECH.unpack_from(payload)
+    return Speech(npc_id, bytes(payload[SPEECH.size:]).decode("utf-8", errors="replace"))
+
+def _decode_spawn(payload):
+    npc_id, x, y, sprite_id = SPAWN.unpack_from(payload)
+    return Spawn(npc_id, x, y, sprite_id, bytes(payload[SPAWN.size:]).decode("utf-8", errors="replace"))
+
+def _decode_sprite(payload):
+    sprite_id, width, height = SPRITE.unpack_from(payload)
+    return SpriteUpdate(sprite_id, width, height, bytes(payload[SPRITE.size:SPRITE.size + width * height]))
+
+DECODERS = {
+    MSG_SPEECH: _decode_speech,
+    MSG_NPC_STATE: lambda payload: NpcState(*NPC_STATE.unpack_from(payload)),
+    MSG_SPAWN: _decode_spawn,
+    MSG_DESPAWN: lambda payload: Despawn(*DESPAWN.unpack_from(payload)),
+    MSG_SPRITE: _decode_sprite,
+}
+
+class RingBuffer:
+    """
+    1つの書き込みスレッドと1つの読み込みスレッドの間でロックを使わずにメッセージを渡すリングバッファ。
+    書き込み側はtailだけ、読み込み側はheadだけを更新する（整数の代入は不可分なため、要素を書いてからtailを進めれば読み込み側に途中の状態は見えない）。
+    """
+
+    def __init__(self, capacity=RING_CAPACITY):
+        if capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        self._slots = [None] * capacity
+        self._mask = capacity - 1
+        self.capacity = capacity
+        self._head = 0
+        self._tail = 0
+
+    def push(self, item):
+        """末尾に追加する。いっぱいの場合はFalse（書き込みスレッドから呼ぶ）"""
+        tail = self._tail
+        if tail - self._head >= self.capacity:
+            return False
+        self._slots[tail & self._mask] = item
+        self._tail = tail + 1
+        return True
+
+    def drain(self):
+        """たまっているメッセージをすべて古い順に取り出す（読み込みスレッドから呼ぶ）"""
+        head, tail = self._head, self._tail
+        slots, mask = self._slots, self._mask
+        items = [slots[index & mask] for index in range(head, tail)]
+        for index in range(head, tail):
+            slots[index & mask] = None
+        self._head = tail
+        return items
+
+    def __len__(self):
+        return self._tail - self._head
+
+class IpcSender:
+    """
+    Pyxelのプロセスへメッセージを送る（スレッドセーフ）。
+    batch()の中で送ったメッセージは1つのデータグラムにまとめて送る（大量の状態の更新を少ないシステムコールで送れる）。
+    Pyxelのプロセスが起動していない場合、メッセージは捨てられる。
+    """
+
+    def __init__(self, host=IPC_HOST, port=IPC_PORT, max_datagram=MAX_DATAGRAM_SIZE):
+        self.address = (host, port)
+        self.max_datagram = max_datagram
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        self._lock = threading.RLock()
+        self._buffer = bytearray()
+        self._batch_depth = 0
+        self._seq = 0
+        # 統計情報
+        self.sent_messages = 0
+        self.sent_datagrams = 0
+        self.send_errors = 0
+
+    def close(self):
+        self.flush()
+        self._sock.close()
+
+    def send_speech(self, npc_id, text):
+        self._emit(MSG_SPEECH, SPEECH.pack(npc_id) + text.encode("utf-8"))
+
+    def send_state(self, npc_id, x, y, state=0, direction=0):
+        self._emit(MSG_NPC_STATE, NPC_STATE.pack(npc_id, x, y, state, direction))
+
+    def send_spawn(self, npc_id, x, y, sprite_id=0, name=""):
+        self._emit(MSG_SPAWN, SPAWN.pack(npc_id, x, y, sprite_id) + name.encode("utf-8"))
+
+    def send_despawn(self, npc_id):
+        self._emit(MSG_DESPAWN, DESPAWN.pack(npc_id))
+
+    def send_sprite(self, sprite_id, width, height, pixels):
+        """スプライトの画像を送る（pixelsは色番号のバイト列、width×height）"""
+        if len(pixels) != width * height:
+            raise ValueError("pixels must have width * height entries")
+        self._emit(MSG_SPRITE, SPRITE.pack(sprite_id, width, height) + bytes(pixels))
+
+    @contextmanager
+    def batch(self):
+        """この中で送ったメッセージをまとめて送る"""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self._send_buffer()
+
+    def flush(self):
+        with self._lock:
+            self._send_buffer()
+
+    def _emit(self, message_type, payload):
+        max_payload = self.max_datagram - HEADER.size
+        count = max(1, math.ceil(len(payload) / max_payload))
+        if count > 0xFFFF:
+            raise ValueError("message is too large")
+        with self._lock:
+            self._seq = seq = (self._seq + 1) & 0xFFFFFFFF
+            for index in range(count):
+                part = payload[index * max_payload:(index + 1) * max_payload]
+                if len(self._buffer) + HEADER.size + len(part) > self.max_datagram:
+                    self._send_buffer()
+                self._buffer += HEADER.pack(MAGIC, VERSION, message_type, seq, index, count, len(part))
+                self._buffer += part
+            self.sent_messages += 1
+            if not self._batch_depth:
+                self._send_buffer()
+
+    def _send_buffer(self):
+        if not self._buffer:
+            return
+        try:
+            self._sock.sendto(self._buffer, self.address)
+            self.sent_datagrams += 1
+        except OSError:
+            self.send_errors += 1
+        self._buffer = bytearray()
+
+class IpcReceiver:
+    """
+    メッセージを受信するスレッド。受信したメッセージはリングバッファに入れ、ゲームのループがフレームごとにdrainで取り出す。
+    リングバッファがいっぱいの場合は空くまで待つ（待っている間に届いたデータグラムはソケットのバッファにためる）ため、メッセージを捨てない。
+    """
+
+    def __init__(self, host=IPC_HOST, port=IPC_PORT, capacity=RING_CAPACITY):
+        self.address = (host, port)
+        self.ring = RingBuffer(capacity)
+        self._fragments = {}  # 通し番号 → 受け取った断片のリスト
+        self._highest_seq = None
+        self._missing = set()  # 欠けたものとして数えた通し番号（遅れて届いた場合に数え直す）
+        self._stopped = threading.Event()
+        self._thread = None
+        self._sock = None
+        # 統計情報
+        self.received_messages = 0
+        self.lost_messages = 0
+        self.malformed = 0
+        self.overflow_waits = 0
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        self._sock.bind(self.address)
+        # 停止を確認するため定期的に受信を中断する
+        self._sock.settimeout(0.2)
+        self._thread = threading.Thread(target=self._loop, name="ipc-receiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def drain(self):
+        """前回以降に受信したメッセージを古い順に返す（ゲームのループから1フレームに1回呼ぶ）"""
+        return self.ring.drain()
+
+    def _loop(self):
+        buffer = bytearray(MAX_DATAGRAM_SIZE)
+        view = memoryview(buffer)
+        while not self._stopped.is_set():
+            try:
+                size = self._sock.recv_into(buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                logger.exception("IPC receiver stopped")
+                return
+            for message in self.parse(view[:size]):
+                self._push(message)
+
+    def _push(self, message):
+        while not self.ring.push(message):
+            # ゲームのループが取り出すまで待つ
+            self.overflow_waits += 1
+            if self._stopped.is_set():
+                return
+            time.sleep(0.001)
+        self.received_messages += 1
+
+    def parse(self, datagram):
+        """1つのデータグラムのメッセージを順に返す（断片は組み立て終わったときに返す）"""
+        if bytes(datagram[:2]) != MAGIC:
+            # 以前の形式（UTF-8の文字列だけのデータグラム）はNPCを指定しない発言として扱う
+            yield Speech(0, bytes(datagram).decode("utf-8", errors="replace"))
+            return
+        offset = 0
+        while offset + HEADER.size <= len(datagram):
+            magic, version, message_type, seq, index, count, length = HEADER.unpack_from(datagram, offset)
+            offset += HEADER.size
+            payload = datagram[offset:offset + length]
+            offset += length
+            if magic != MAGIC or version != VERSION or len(payload) < length or index >= count:
+                self.malformed += 1
+                return
+            if count > 1:
+                payload = self._reassemble(seq, index, count, payload)
+                if payload is None:
+                    continue
+            self._track(seq)
+            decoder = DECODERS.get(message_type)
+            if decoder is None:
+                self.malformed += 1
+                continue
+            try:
+                yield decoder(payload)
+            except (struct.error, ValueError):
+                self.malformed += 1
+
+    def _reassemble(self, seq, index, count, payload):
+        parts = self._fragments.get(seq)
+        if parts is None:
+            if len(self._fragments) >= MAX_PENDING_MESSAGES:
+                # 最後の断片が届かなかった古いメッセージを捨てる
+                del self._fragments[next(iter(self._fragments))]
+            parts = self._fragments[seq] = [None] * count
+        parts[index] = bytes(payload)
+        if any(part is None for part in parts):
+            return None
+        del self._fragments[seq]
+        return b"".join(parts)
+
+    def _track(self, seq):
+        """
+        通し番号から欠けたメッセージを数える。受け取った最も大きい番号との差から数えるため、
+        断片の組み立てが後の番号より遅れて終わったメッセージは、欠けたものとして数えていた分を戻す。
+        送信側が再起動して番号が戻った場合は数え直す。
+        """
+        if self._highest_seq is None:
+            self._highest_seq = seq
+            return
+        gap = (seq - self._highest_seq) & 0xFFFFFFFF
+        if gap == 0:
+            return
+        if gap < 0x80000000:
+            self.lost_messages += gap - 1
+            if gap - 1 <= REORDER_WINDOW:
+                self._missing.update((seq - offset) & 0xFFFFFFFF for offset in range(1, gap))
+            self._highest_seq = seq
+            if len(self._missing) > REORDER_WINDOW:
+                self._missing = {missing for missing in self._missing if (seq - missing) & 0xFFFFFFFF <= REORDER_WINDOW}
+        elif seq in self._missing:
+            self._missing.discard(seq)
+            self.lost_messages -= 1
+        elif (self._highest_seq - seq) & 0xFFFFFFFF > REORDER_WINDOW:
+            self._highest_seq = seq
+            self._missing.clear()
+
+    def metrics(self):
+        return {
+            "received_messages": self.received_messages,
+            "lost_messages": self.lost_messages,
+            "malformed": self.malformed,
+            "overflow_waits": self.overflow_waits,
+            "queued": len(self.ring),
+        }
+
+_sender = None
+_sender_lock = threading.Lock()
+
+def get_sender():
+    """ランチャーのプロセス全体で共有する送信側を取得"""
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = IpcSender()
+        return _sender
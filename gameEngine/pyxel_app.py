@@ -1,31 +1,22 @@
 # このファイルはPyxel関連の機能だけを持つモジュール
 
 import pyxel
-import socket
-import threading
+from gameEngine.ipc import IpcReceiver, Speech, NpcState, Spawn, Despawn, SpriteUpdate
 from gameEngine.player import Player
+from gameEngine.world_state import WorldStateReader
 from dot_image import image_data  # 追加
 
-def run_pyxel_app():
-    """Pyxelアプリケーションを初期化し、実行するメイン関数"""
-    
-    received_message = ""
+def run_pyxel_app(world_state_name=None):
+    """
+    Pyxelアプリケーションを初期化し、実行するメイン関数。
+    world_state_nameはランチャーが作成したワールドの状態の共有メモリの名前（指定された場合はそのNPCを描画する）。
+    """
 
-    def udp_listener():
-        nonlocal received_message
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        try:
-            sock.bind(("127.0.0.1", 50007))
-            while True:
-                data, _ = sock.recvfrom(1024)
-                try:
-                    received_message = data.decode("utf-8")
-                except UnicodeDecodeError:
-                    received_message = "<decode error>"
-        except Exception as e:
-            print(f"UDP Error: {e}")
-        finally:
-            sock.close()
+    # ランチャーから送られたスプライトを置くイメージバンク（16×16ドットのスロットをsprite_idの順に並べる）
+    SPRITE_BANK = 2
+    SPRITE_SIZE = 16
+    # ワールドの状態の共有メモリを開けなかった場合に開き直す間隔（フレーム）
+    WORLD_ATTACH_INTERVAL = 30
 
     def load_dot_image():
         """dot_imageをPyxelのイメージバンクに登録する"""
@@ -49,15 +40,93 @@ def run_pyxel_app():
             pyxel.load("sample.pyxres")  # 追加: 背景リソースを読み込む
             load_dot_image()  # ドット絵をロード
             self.message = ""
+            self.npcs = {}  # NPCのID → 位置・状態・発言
+            self.sprites = set()  # 受け取ったスプライトのID
             self.player = Player()  # プレイヤー生成
-            threading.Thread(target=udp_listener, daemon=True).start()
+            # 受信はバックグラウンドのスレッドで行い、届いたメッセージはフレームごとにまとめて反映する
+            self.receiver = IpcReceiver()
+            self.receiver.start()
+            self.world = None  # ワールドの状態（共有メモリ）
+            self.world_frame = None  # 最後に読めたワールドの状態
             pyxel.run(self.update, self.draw)
 
         def update(self):
-            nonlocal received_message
-            self.message = received_message
+            for message in self.receiver.drain():
+                self.apply(message)
+            if world_state_name and self.world is None and pyxel.frame_count % WORLD_ATTACH_INTERVAL == 0:
+                self.attach_world()
             self.player.update()  # プレイヤーの移動処理
 
+        def apply(self, message):
+            """受信したメッセージを反映する"""
+            if isinstance(message, NpcState):
+                npc = self.npcs.get(message.npc_id)
+                if npc is not None:
+                    npc["x"], npc["y"] = message.x, message.y
+                    npc["state"], npc["direction"] = message.state, message.direction
+            elif isinstance(message, Speech):
+                self.message = message.text
+                npc = self.npcs.get(message.npc_id)
+                if npc is not None:
+                    npc["speech"] = message.text
+            elif isinstance(message, Spawn):
+                self.npcs[message.npc_id] = {
+                    "x": message.x, "y": message.y, "state": 0, "direction": 0,
+                    "sprite_id": message.sprite_id, "name": message.name, "speech": "",
+                }
+            elif isinstance(message, Despawn):
+                self.npcs.pop(message.npc_id, None)
+            elif isinstance(message, SpriteUpdate):
+                self.load_sprite(message)
+
+        def attach_world(self):
+            """ワールドの状態の共有メモリを開く（ランチャーが作成する前は次の機会に開き直す）"""
+            try:
+                self.world = WorldStateReader(world_state_name)
+            except (FileNotFoundError, ValueError) as exc:
+                print(f"World state error: {exc}")
+
+        def load_sprite(self, sprite):
+            """受け取ったスプライトをイメージバンクのスロットに書き込む"""
+            slots = pyxel.images[SPRITE_BANK].width // SPRITE_SIZE
+            if sprite.sprite_id >= slots * slots:
+                return
+            u = sprite.sprite_id % slots * SPRITE_SIZE
+            v = sprite.sprite_id // slots * SPRITE_SIZE
+            width, height = min(sprite.width, SPRITE_SIZE), min(sprite.height, SPRITE_SIZE)
+            image = pyxel.images[SPRITE_BANK]
+            for y in range(height):
+                for x in range(width):
+                    image.pset(u + x, v + y, sprite.pixels[y * sprite.width + x] % 16)
+            self.sprites.add(sprite.sprite_id)
+
+        def draw_npc(self, x, y, sprite_id, direction, speech):
+            if sprite_id in self.sprites:
+                slots = pyxel.images[SPRITE_BANK].width // SPRITE_SIZE
+                u = sprite_id % slots * SPRITE_SIZE
+                v = sprite_id // slots * SPRITE_SIZE
+                # 左向きの場合は左右を反転して描画
+                width = -SPRITE_SIZE if direction else SPRITE_SIZE
+                pyxel.blt(x, y, SPRITE_BANK, u, v, width, SPRITE_SIZE, 0)
+            else:
+                # スプライトがまだ届いていないNPCはドット絵で描画
+                pyxel.blt(x, y, 1, 0, 0, SPRITE_SIZE, SPRITE_SIZE)
+            if speech:
+                pyxel.text(x, y - pyxel.FONT_HEIGHT - 1, speech, 7)
+
+        def draw_npcs(self):
+            for npc in self.npcs.values():
+                self.draw_npc(npc["x"], npc["y"], npc["sprite_id"], npc["direction"], npc["speech"])
+
+        def draw_world(self):
+            """共有メモリの最新の世代のNPCを描画する（書き込みと重なって読めなかった場合は前のフレームの状態を描画する）"""
+            self.world_frame = self.world.read() or self.world_frame
+            frame = self.world_frame
+            if frame is None:
+                return
+            for index in range(frame.count):
+                self.draw_npc(frame.xs[index], frame.ys[index], frame.sprites[index], frame.directions[index], frame.speech.get(index))
+
         def draw(self):
             pyxel.cls(0)
             # 追加: マップ(背景)を描画
@@ -66,6 +135,9 @@ def run_pyxel_app():
             x = max(0, (200 - pyxel.FONT_WIDTH * len(msg)) // 2)
             y = 45
             pyxel.text(x, y, msg, 7)
+            if self.world is not None:
+                self.draw_world()
+            self.draw_npcs()
             self.player.draw()  # プレイヤーの描画
 
     # この関数が呼ばれたら、Appクラスをインスタンス化して実行
@@ -0,0 +1,153 @@
+"""
+ランチャーで動かすワールドのシミュレーション
+
+NPCを画面の中で動かし、1ティックごとにワールドの状態を共有メモリに書き込む（Pyxelはフレームごとにそれを読んで描画する）。
+"""
+import atexit
+import random
+import threading
+import time
+from array import array
+from gameEngine.world_state import WorldStateWriter
+
+# 1秒あたりのティック数
+WORLD_TICK_RATE = 30
+# Pyxelの画面の大きさとNPCの大きさ
+WORLD_WIDTH = 200
+WORLD_HEIGHT = 100
+NPC_SIZE = 16
+# 発言を表示しておく時間（秒）
+SPEECH_DURATION = 5.0
+
+# NPCの状態
+STATE_WALKING = 1
+STATE_TALKING = 2
+
+class WorldSimulation:
+    """NPCの位置・状態を項目ごとの配列で持ち、バックグラウンドのスレッドで動かして共有メモリに公開する"""
+
+    def __init__(self, writer=None, tick_rate=WORLD_TICK_RATE):
+        self.writer = writer or WorldStateWriter()
+        self.tick_rate = tick_rate
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._index = {}  # NPCのID → 配列の位置
+        self.ids = array("I")
+        self.xs = array("f")
+        self.ys = array("f")
+        self.dxs = array("f")
+        self.dys = array("f")
+        self.states = array("B")
+        self.directions = array("B")
+        self.sprites = array("H")
+        self._speech = {}  # NPCのID → (発言, 表示を終える時刻)
+
+    @property
+    def name(self):
+        """Pyxelのプロセスに渡す共有メモリの名前"""
+        return self.writer.name
+
+    def set_npcs(self, npc_ids):
+        """表示するNPCを入れ替える（続けて表示するNPCは位置を保つ）"""
+        with self._lock:
+            npc_ids = list(dict.fromkeys(npc_ids))[:self.writer.capacity]
+            previous = {npc_id: self._row(index) for npc_id, index in self._index.items()}
+            columns = (self.ids, self.xs, self.ys, self.dxs, self.dys, self.states, self.directions, self.sprites)
+            for column in columns:
+                del column[:]
+            self._index = {}
+            for npc_id in npc_ids:
+                row = previous.get(npc_id) or self._new_row(npc_id)
+                self._index[npc_id] = len(self.ids)
+                for column, value in zip(columns, row):
+                    column.append(value)
+            self._speech = {npc_id: speech for npc_id, speech in self._speech.items() if npc_id in self._index}
+
+    def _row(self, index):
+        return (self.ids[index], self.xs[index], self.ys[index], self.dxs[index], self.dys[index],
+                self.states[index], self.directions[index], self.sprites[index])
+
+    def _new_row(self, npc_id):
+        dx = random.choice([-1.0, 1.0])
+        return (npc_id, random.uniform(0, WORLD_WIDTH - NPC_SIZE), random.uniform(0, WORLD_HEIGHT - NPC_SIZE),
+                dx, random.choice([-1.0, 1.0]), STATE_WALKING, int(dx < 0), npc_id & 0xFF)
+
+    def say(self, npc_id, text, duration=SPEECH_DURATION):
+        """NPCに発言させる（発言している間は立ち止まる）"""
+        with self._lock:
+            self._speech[npc_id] = (text, time.monotonic() + duration)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name="world-sim", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        self.writer.close()
+
+    def _loop(self):
+        interval = 1.0 / self.tick_rate
+        next_tick = time.monotonic()
+        while not self._stopped.is_set():
+            self.tick()
+            next_tick += interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # 遅れた分は飛ばす
+                next_tick = time.monotonic()
+                delay = 0
+            self._stopped.wait(delay)
+
+    def tick(self):
+        """NPCを1ティック分動かして公開する"""
+        now = time.monotonic()
+        with self._lock:
+            self._speech = {npc_id: speech for npc_id, speech in self._speech.items() if speech[1] > now}
+            speech = {}
+            for npc_id, (text, _) in self._speech.items():
+                index = self._index.get(npc_id)
+                if index is not None:
+                    speech[index] = text
+            self._move(speech)
+            self.writer.publish(self.ids, self.xs, self.ys, self.states, self.directions, self.sprites, speech)
+
+    def _move(self, speech):
+        """壁で跳ね返りながら動かす（発言しているNPCは止める）"""
+        xs, ys, dxs, dys = self.xs, self.ys, self.dxs, self.dys
+        max_x, max_y = WORLD_WIDTH - NPC_SIZE, WORLD_HEIGHT - NPC_SIZE
+        for index in range(len(xs)):
+            if index in speech:
+                self.states[index] = STATE_TALKING
+                continue
+            self.states[index] = STATE_WALKING
+            x, y = xs[index] + dxs[index], ys[index] + dys[index]
+            if x <= 0 or x >= max_x:
+                dxs[index] = -dxs[index]
+                self.directions[index] = int(dxs[index] < 0)
+                x = max(0, min(x, max_x))
+            if y <= 0 or y >= max_y:
+                dys[index] = -dys[index]
+                y = max(0, min(y, max_y))
+            xs[index], ys[index] = x, y
+
+_world = None
+_world_lock = threading.Lock()
+
+def get_world():
+    """ランチャーのプロセス全体で共有するワールドのシミュレーションを取得（終了時に共有メモリを削除する）"""
+    global _world
+    with _world_lock:
+        if _world is None:
+            _world = WorldSimulation()
+            atexit.register(_world.close)
+        return _world
@@ -0,0 +1,253 @@
+"""
+ランチャーとPyxelのプロセスで共有するワールドの状態（共有メモリ）
+
+共有メモリは次の固定のレイアウトで、ヘッダーの後に同じ形のバッファが2つ並ぶ。
+    ヘッダー（64バイト）: マジック"PXWS" / バージョン / NPCの最大数 / 発言の文字列の領域のサイズ / 世代(uint64)
+    バッファ: NPCの数 / 発言の使用量 / ID / x / y / 発言の位置 / 発言の長さ / スプライト / 状態 / 向き（項目ごとの配列） / 発言の文字列（UTF-8）
+書き込み側は表示されていない方のバッファに書いてから世代を1つ進める（世代の下位1ビットが表示するバッファ）。
+読み込み側は世代を読んでそのバッファの配列をまとめてコピーし、コピーした後も世代が変わっていないことを確認する
+（変わっていた場合は書き込み側が次の世代を同じバッファに書いている途中の可能性があるため読み直す）。
+NPCごとのデシリアライズはなく、フレームごとに配列を1回ずつコピーするだけで読める。
+"""
+import struct
+import sys
+from array import array
+from multiprocessing import shared_memory
+from typing import Dict, List, NamedTuple
+
+# NPCの最大数と発言の文字列の領域のサイズ（1つのバッファあたり）
+WORLD_CAPACITY = 4096
+WORLD_TEXT_CAPACITY = 64 * 1024
+# 読み込みが書き込みと重なった場合に読み直す回数
+WORLD_READ_RETRIES = 3
+
+MAGIC = b"PXWS"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")
+HEADER_SIZE = 64
+GENERATION_OFFSET = 16
+BUFFER_HEADER = struct.Struct("<II")
+
+# バッファ内の配列（名前・型・要素のサイズ）。アラインメントのため大きい型から並べる
+COLUMNS = (
+    ("ids", "I", 4),
+    ("xs", "f", 4),
+    ("ys", "f", 4),
+    ("text_offsets", "I", 4),
+    ("text_lengths", "H", 2),
+    ("sprites", "H", 2),
+    ("states", "B", 1),
+    ("directions", "B", 1),
+)
+
+def _align(size):
+    return (size + 7) & ~7
+
+def buffer_size(capacity, text_capacity):
+    size = BUFFER_HEADER.size
+    for _, _, itemsize in COLUMNS:
+        size = _align(size) + itemsize * capacity
+    return _align(_align(size) + text_capacity)
+
+class _BufferViews:
+    """1つのバッファの各配列を参照するmemoryview（コピーしない）"""
+
+    def __init__(self, buf, offset, capacity, text_capacity):
+        self.header = buf[offset:offset + BUFFER_HEADER.size]
+        position = offset + BUFFER_HEADER.size
+        self._views = [self.header]
+        for name, fmt, itemsize in COLUMNS:
+            position = _align(position)
+            view = buf[position:position + itemsize * capacity].cast(fmt)
+            setattr(self, name, view)
+            self._views.append(view)
+            position += itemsize * capacity
+        position = _align(position)
+        self.text = buf[position:position + text_capacity]
+        self._views.append(self.text)
+
+    def release(self):
+        for view in self._views:
+            view.release()
+
+class WorldFrame(NamedTuple):
+    """1つの世代のワールドの状態のコピー"""
+    generation: int
+    count: int
+    ids: List[int]
+    xs: List[float]
+    ys: List[float]
+    states: List[int]
+    directions: List[int]
+    sprites: List[int]
+    speech: Dict[int, str]  # 配列の位置 → 発言（発言しているNPCだけ）
+
+class WorldView:
+    """
+    1つの世代のワールドの状態（共有メモリを直接参照する）。
+    次の世代が公開されると書き込み側が同じバッファに書き始めるため、読んだ後にWorldStateReader.is_currentで確認する。
+    """
+
+    def __init__(self, generation, views, count):
+        self.generation = generation
+        self.count = count
+        self.ids = views.ids[:count]
+        self.xs = views.xs[:count]
+        self.ys = views.ys[:count]
+        self.sprites = views.sprites[:count]
+        self.states = views.states[:count]
+        self.directions = views.directions[:count]
+        self._views = views
+
+    def copy(self):
+        """配列をまとめてコピーする"""
+        lengths = self._views.text_lengths[:self.count].tolist()
+        speech = {index: self.speech(index) for index, length in enumerate(lengths) if length}
+        return WorldFrame(
+            self.generation, self.count, self.ids.tolist(), self.xs.tolist(), self.ys.tolist(),
+            self.states.tolist(), self.directions.tolist(), self.sprites.tolist(), speech,
+        )
+
+    def speech(self, index):
+        """NPCの発言（ない場合は空文字列）"""
+        length = self._views.text_lengths[index]
+        if not length:
+            return ""
+        offset = self._views.text_offsets[index]
+        return bytes(self._views.text[offset:offset + length]).decode("utf-8", errors="replace")
+
+class WorldStateWriter:
+    """ワールドの状態を共有メモリに書き込む（1つのスレッドから使う）"""
+
+    def __init__(self, name=None, capacity=WORLD_CAPACITY, text_capacity=WORLD_TEXT_CAPACITY):
+        self.capacity = capacity
+        self.text_capacity = text_capacity
+        size = buffer_size(capacity, text_capacity)
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + 2 * size)
+        buf = self._shm.buf
+        HEADER.pack_into(buf, 0, MAGIC, VERSION, capacity, text_capacity)
+        self._generation = buf[GENERATION_OFFSET:GENERATION_OFFSET + 8].cast("Q")
+        self._generation[0] = 0
+        self._buffers = [_BufferViews(buf, HEADER_SIZE + index * size, capacity, text_capacity) for index in range(2)]
+
+    @property
+    def name(self):
+        """読み込み側に渡す共有メモリの名前"""
+        return self._shm.name
+
+    @property
+    def generation(self):
+        return self._generation[0]
+
+    def publish(self, ids, xs, ys, states=None, directions=None, sprites=None, speech=None):
+        """
+        NPCの状態を書き込んで公開する。
+        各配列はarray（型はCOLUMNSと同じ）またはシーケンス、speechは{配列の位置: 発言}。
+        発言の領域に収まらない発言は省略する。
+        """
+        count = len(ids)
+        if count > self.capacity:
+            raise ValueError(f"Too many NPCs: {count} > {self.capacity}")
+        generation = self._generation[0] + 1
+        views = self._buffers[generation & 1]
+        zeros = bytes(count)
+        views.ids[:count] = _as_array("I", ids)
+        views.xs[:count] = _as_array("f", xs)
+        views.ys[:count] = _as_array("f", ys)
+        views.states[:count] = _as_array("B", states if states is not None else zeros)
+        views.directions[:count] = _as_array("B", directions if directions is not None else zeros)
+        views.sprites[:count] = _as_array("H", sprites if sprites is not None else array("H", bytes(2 * count)))
+        views.text_lengths[:count] = array("H", bytes(2 * count))
+        used = 0
+        for index, text in (speech or {}).items():
+            data = text.encode("utf-8")[:0xFFFF]
+            if used + len(data) > self.text_capacity:
+                continue
+            views.text[used:used + len(data)] = data
+            views.text_offsets[index] = used
+            views.text_lengths[index] = len(data)
+            used += len(data)
+        BUFFER_HEADER.pack_into(views.header, 0, count, used)
+        # バッファを書き終えてから世代を進める（読み込み側はここで新しいバッファに切り替わる）
+        self._generation[0] = generation
+
+    def close(self, unlink=True):
+        for views in self._buffers:
+            views.release()
+        self._generation.release()
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+def _as_array(typecode, values):
+    if isinstance(values, array) and values.typecode == typecode:
+        return values
+    return array(typecode, values)
+
+def _attach(name):
+    """既存の共有メモリを開く（読み込み側の終了時に共有メモリが削除されないようにする）"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if sys.platform != "win32":
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+class WorldStateReader:
+    """共有メモリのワールドの状態を読み込む（Pyxelのプロセスで使う）"""
+
+    def __init__(self, name):
+        self._shm = _attach(name)
+        buf = self._shm.buf
+        magic, version, capacity, text_capacity = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self._shm.close()
+            raise ValueError(f"Not a world state buffer: {name}")
+        size = buffer_size(capacity, text_capacity)
+        self._generation = buf[GENERATION_OFFSET:GENERATION_OFFSET + 8].cast("Q")
+        self._buffers = [_BufferViews(buf, HEADER_SIZE + index * size, capacity, text_capacity) for index in range(2)]
+
+    @property
+    def generation(self):
+        return self._generation[0]
+
+    def snapshot(self):
+        """最新の世代の状態。まだ何も公開されていない場合はNone"""
+        generation = self._generation[0]
+        if not generation:
+            return None
+        views = self._buffers[generation & 1]
+        count, _ = BUFFER_HEADER.unpack_from(views.header, 0)
+        return WorldView(generation, views, count)
+
+    def is_current(self, view):
+        """
+        viewを取得してから次の世代が公開されていなければTrue。
+        書き込み側は次の世代を公開した直後から、その次の世代をviewと同じバッファに書き始めるため、1世代でも進んでいれば読んだ内容は信用できない。
+        """
+        return self._generation[0] == view.generation
+
+    def read(self, retries=WORLD_READ_RETRIES):
+        """
+        最新の世代の状態をコピーして返す（seqlockと同じく、コピーした後に世代が変わっていれば読み直す）。
+        まだ何も公開されていない場合・読み直しても書き込みと重なった場合はNone。
+        """
+        for _ in range(retries):
+            view = self.snapshot()
+            if view is None:
+                return None
+            frame = view.copy()
+            if self.is_current(view):
+                return frame
+        return None
+
+    def close(self):
+        for views in self._buffers:
+            views.release()
+        self._generation.release()
+        try:
+            self._shm.close()
+        except BufferError:
+            # 使い終えていないWorldViewがある場合はプロセスの終了時に閉じられる
+            pass
@@ -7,6 +7,19 @@ import gameEngine.pyxel_app as pyxel_app  # 作成したPyxelモジュールを
 from objects.object_list import object_list
 from chat.chat_main import chat_main
 from createNPC.createNPC_main import createNPC_main
+from ui_loader import get_loader
+from mirror import get_mirror, get_mirror_sync
+from gameEngine.world_sim import get_world
+
+def mirror_object_ids():
+    """ミラーにあるオブジェクトのIDをすべて取得"""
+    ids, after_id = [], None
+    while True:
+        data = get_mirror().get_object_page(after_id, limit=500)
+        ids.extend(obj["id"] for obj in data["objects"])
+        if not data["has_more"]:
+            return ids
+        after_id = data["next_after_id"]
 
 def main(page: ft.Page):
     # --- ページ基本設定 ---
@@ -18,12 +31,19 @@ def main(page: ft.Page):
 
     pyxel_proc = None  # Pyxelプロセス管理用
 
+    # ローカルのミラーをバックエンドとバックグラウンドで同期する（画面はミラーから表示するため待たない）
+    get_mirror_sync().start()
+    # NPCが追加・削除されたらPyxelに表示するNPCも入れ替える
+    get_mirror_sync().add_listener(lambda: get_world().set_npcs(mirror_object_ids()))
+
     # --- 画面遷移用関数 ---
     def show_initial_screen(e=None):
         """
         アプリ起動時の初期画面を表示する関数。
         各機能へのボタンを配置。
         """
+        # 前の画面の取得を取り消す
+        get_loader(page).begin()
         page.controls.clear()
         pyxel_btn = ft.ElevatedButton("Pyxel起動", on_click=on_start_pyxel)
         list_btn = ft.ElevatedButton("リスト", on_click=lambda e: object_list(page, show_initial_screen))
@@ -45,11 +65,16 @@ def main(page: ft.Page):
         """
         nonlocal pyxel_proc
         if pyxel_proc is None or pyxel_proc.poll() is not None:
+            # NPCを動かし、その状態を共有メモリでPyxelに渡す
+            world = get_world()
+            world.set_npcs(mirror_object_ids())
+            world.start()
+
             # 開発時: 現在のスクリプトをrun_pyxel引数付きで起動
-            pyxel_proc = subprocess.Popen([sys.executable, __file__, "run_pyxel"])
+            pyxel_proc = subprocess.Popen([sys.executable, __file__, "run_pyxel", world.name])
 
             # ビルド時: 必要に応じてパスを修正
-            # pyxel_proc = subprocess.Popen([sys.executable, "run_pyxel"])
+            # pyxel_proc = subprocess.Popen([sys.executable, "run_pyxel", world.name])
 
     # 初期画面表示
     show_initial_screen()
@@ -58,7 +83,7 @@ def main(page: ft.Page):
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "run_pyxel":
         # Pyxelアプリ起動
-        pyxel_app.run_pyxel_app() 
+        pyxel_app.run_pyxel_app(sys.argv[2] if len(sys.argv) > 2 else None)
     else:
         # Fletアプリ起動
         ft.app(target=main)
\ No newline at end of file
@@ -0,0 +1,19 @@
+"""
+ローカルのミラーモジュール
+
+バックエンドのデータをローカルのSQLiteに保持し、バックエンドが遅い・再起動中でも画面を表示できるようにします。
+以下のコンポーネントが含まれています：
+
+- LocalMirror: オブジェクト・最新のサマリー・最近のメモリのミラーと、送る前の書き込みのキュー
+- MirrorSync: 書き込みの再送と変更の差分同期（バックグラウンドのスレッド）
+"""
+
+from .store import LocalMirror
+from .sync import MirrorSync, get_mirror, get_mirror_sync
+
+__all__ = [
+    'LocalMirror',
+    'MirrorSync',
+    'get_mirror',
+    'get_mirror_sync'
+]
@@ -0,0 +1,324 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# ローカルのミラーのファイル（パッケージ化したアプリでも書き込めるようホームディレクトリに置く）
+MIRROR_PATH = os.getenv("MIRROR_PATH", os.path.join(os.path.expanduser("~"), ".ai_monitoring_game", "mirror.db"))
+# オブジェクトごとに保持する最近のメモリの件数
+MIRROR_MEMORIES_PER_OBJECT = int(os.getenv("MIRROR_MEMORIES_PER_OBJECT", "50"))
+# 画面のキャッシュの差分同期のために保持する変更の件数
+MIRROR_CHANGE_LOG_RETENTION = int(os.getenv("MIRROR_CHANGE_LOG_RETENTION", "5000"))
+# 一覧の1ページの最大件数（バックエンドの/objects/pageと同じ）
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    description TEXT NOT NULL,
+    photos TEXT,
+    version INTEGER NOT NULL
+);
+-- オブジェクトごとの最新のサマリー
+CREATE TABLE IF NOT EXISTS summaries (
+    object_id INTEGER PRIMARY KEY,
+    id INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_summaries_id ON summaries (id);
+CREATE TABLE IF NOT EXISTS memories (
+    id INTEGER PRIMARY KEY,
+    object_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_memories_object_timestamp ON memories (object_id, timestamp);
+-- 反映した変更（画面のキャッシュがバックエンドと同じ形式で差分を取得するため）
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY,
+    entity TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    object_id INTEGER,
+    op TEXT NOT NULL,
+    data TEXT
+);
+-- バックエンドへ送る前の書き込み（接続できるようになったら古い順に送る）
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    body TEXT,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class LocalMirror:
+    """
+    バックエンドのデータ（オブジェクト・最新のサマリー・最近のメモリ）のローカルのSQLiteのミラー（スレッドセーフ）。
+    画面はまずここから読むため、起動直後や画面の遷移でバックエンドに接続しない。
+    バックエンドの変更ログ（/changes/）の差分をapply_changesで反映し、書き込みはoutboxにためて接続できるときに送る。
+    """
+
+    def __init__(self, path=MIRROR_PATH, memories_per_object=MIRROR_MEMORIES_PER_OBJECT, change_log_retention=MIRROR_CHANGE_LOG_RETENTION):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.memories_per_object = memories_per_object
+        self.change_log_retention = change_log_retention
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # 同期の状態
+
+    def _get_state(self, key, default=None):
+        row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row is not None else default
+
+    def _set_state(self, key, value):
+        self._db.execute(
+            "INSERT INTO sync_state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, None if value is None else str(value)),
+        )
+
+    @property
+    def change_seq(self):
+        """反映済みのバックエンドの変更番号（次の/changes/のsince）"""
+        with self._lock:
+            return int(self._get_state("change_seq", 0))
+
+    @property
+    def bootstrapping(self):
+        """最初からの同期の途中（またはまだ同期していない）か"""
+        with self._lock:
+            return self._get_state("log_start") is None
+
+    def bind(self, base_url):
+        """接続先のバックエンドを記録する。前回と違う場合はミラーを空にする（別のバックエンドのデータを表示しない）"""
+        with self._lock, self._db:
+            if self._get_state("base_url") not in (None, base_url):
+                self._clear()
+            self._set_state("base_url", base_url)
+
+    def reset(self):
+        """ミラーを空にし、最初から同期し直す（バックエンドから差分同期できないと通知された場合）"""
+        with self._lock, self._db:
+            self._clear()
+
+    def _clear(self):
+        for table in ("objects", "summaries", "memories", "change_log"):
+            self._db.execute(f"DELETE FROM {table}")
+        self._set_state("change_seq", 0)
+        # 最初からの同期が終わるまでは画面のキャッシュを差分同期できない
+        self._set_state("log_start", None)
+
+    # 差分の反映
+
+    def apply_changes(self, changes, next_since, log=True):
+        """
+        /changes/の1回分の変更を1つのトランザクションで反映する。
+        log=Falseの場合（最初からの同期中）は画面のキャッシュ向けの変更を記録しない。
+        """
+        with self._lock, self._db:
+            touched = set()
+            for change in changes:
+                handler = getattr(self, f"_apply_{change['entity']}", None)
+                if handler is not None:
+                    handler(change)
+                    if change["entity"] == "memory" and change["op"] == "upsert":
+                        touched.add(change["object_id"])
+            for object_id in touched:
+                self._prune_memories(object_id)
+            if log and changes:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO change_log (seq, entity, id, object_id, op, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (change["seq"], change["entity"], change["id"], change.get("object_id"), change["op"],
+                         json.dumps(change["data"], ensure_ascii=False) if change.get("data") is not None else None)
+                        for change in changes
+                    ],
+                )
+                self._prune_change_log()
+            self._set_state("change_seq", next_since)
+
+    def finish_bootstrap(self):
+        """最初からの同期が終わったときに呼ぶ（これより前の変更番号からは画面のキャッシュを差分同期できない）"""
+        with self._lock, self._db:
+            self._set_state("log_start", self._get_state("change_seq", 0))
+
+    def _apply_object(self, change):
+        if change["op"] == "delete":
+            # オブジェクトの削除ではメモリ・サマリーの削除は記録されないため、ここでまとめて削除する
+            self._db.execute("DELETE FROM objects WHERE id = ?", (change["id"],))
+            self._db.execute("DELETE FROM summaries WHERE object_id = ?", (change["id"],))
+            self._db.execute("DELETE FROM memories WHERE object_id = ?", (change["id"],))
+            return
+        data = change["data"]
+        self._db.execute(
+            "INSERT OR REPLACE INTO objects (id, name, summary, description, photos, version) VALUES (?, ?, ?, ?, ?, ?)",
+            (data["id"], data["name"], data["summary"], data["description"], data.get("photos"), data["version"]),
+        )
+
+    def _apply_summary(self, change):
+        if change["op"] == "delete":
+            # 最新のサマリーが削除された場合、1つ前のサマリーは次にバックエンドから取得するまで表示しない
+            self._db.execute("DELETE FROM summaries WHERE id = ?", (change["id"],))
+            return
+        data = change["data"]
+        # バックエンドと同じく作成日時（同じ場合はID）が最も新しいものを最新とする
+        self._db.execute(
+            "INSERT INTO summaries (object_id, id, created_at, data) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(object_id) DO UPDATE SET id = excluded.id, created_at = excluded.created_at, data = excluded.data "
+            "WHERE (excluded.created_at, excluded.id) >= (summaries.created_at, summaries.id)",
+            (data["object_id"], data["id"], data["created_at"], json.dumps(data, ensure_ascii=False)),
+        )
+
+    def _apply_memory(self, change):
+        if change["op"] == "delete":
+            self._db.execute("DELETE FROM memories WHERE id = ?", (change["id"],))
+            return
+        data = change["data"]
+        self._db.execute(
+            "INSERT OR REPLACE INTO memories (id, object_id, timestamp, data) VALUES (?, ?, ?, ?)",
+            (data["id"], data["object_id"], data["timestamp"], json.dumps(data, ensure_ascii=False)),
+        )
+
+    def _prune_memories(self, object_id):
+        """オブジェクトのメモリを新しい方からmemories_per_object件だけ残す"""
+        self._db.execute(
+            "DELETE FROM memories WHERE object_id = ? AND id NOT IN "
+            "(SELECT id FROM memories WHERE object_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?)",
+            (object_id, object_id, self.memories_per_object),
+        )
+
+    def _prune_change_log(self):
+        row = self._db.execute(
+            "SELECT seq FROM change_log ORDER BY seq DESC LIMIT 1 OFFSET ?", (self.change_log_retention,)
+        ).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM change_log WHERE seq <= ?", (row["seq"],))
+            self._set_state("log_start", max(int(self._get_state("log_start") or 0), row["seq"]))
+
+    # 読み込み（バックエンドのAPIと同じ形式で返す）
+
+    def get_object(self, object_id):
+        """オブジェクトの詳細。ミラーにない場合はNone"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, name, summary, description, photos, version FROM objects WHERE id = ?", (object_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_object_page(self, after_id=None, limit=100):
+        """IDの昇順の一覧の1ページ（/objects/pageと同じ形式）"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, name, summary, version FROM objects WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id if after_id is not None else 0, limit + 1),
+            ).fetchall()
+            total = self._db.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+            change_seq = int(self._get_state("change_seq", 0))
+        has_more = len(rows) > limit
+        objects = [dict(row) for row in rows[:limit]]
+        return {
+            "objects": objects,
+            "next_after_id": objects[-1]["id"] if has_more else None,
+            "has_more": has_more,
+            "total": total,
+            "change_seq": change_seq,
+        }
+
+    def get_latest_summary(self, object_id):
+        """オブジェクトの最新のサマリー。ミラーにない場合はNone"""
+        with self._lock:
+            row = self._db.execute("SELECT data FROM summaries WHERE object_id = ?", (object_id,)).fetchone()
+        return json.loads(row["data"]) if row is not None else None
+
+    def get_recent_memories(self, object_id, limit=10):
+        """オブジェクトの最近のメモリ（新しい順）"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM memories WHERE object_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (object_id, limit),
+            ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def get_changes(self, since, limit=100):
+        """反映した変更の差分（/changes/と同じ形式）。保持している範囲より前からは差分同期できないためreset=True"""
+        with self._lock:
+            change_seq = int(self._get_state("change_seq", 0))
+            log_start = self._get_state("log_start")
+            if log_start is None or since < int(log_start):
+                return {"changes": [], "next_since": change_seq, "has_more": False, "reset": True}
+            rows = self._db.execute(
+                "SELECT seq, entity, id, object_id, op, data FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?",
+                (since, limit + 1),
+            ).fetchall()
+        has_more = len(rows) > limit
+        changes = [
+            {**dict(row), "data": json.loads(row["data"]) if row["data"] is not None else None}
+            for row in rows[:limit]
+        ]
+        return {
+            "changes": changes,
+            "next_since": changes[-1]["seq"] if changes else since,
+            "has_more": has_more,
+            "reset": False,
+        }
+
+    # 書き込みのキュー
+
+    def enqueue(self, method, path, body=None):
+        """バックエンドへの書き込みをキューに追加する"""
+        with self._lock, self._db:
+            self._enqueue(method, path, body)
+
+    def _enqueue(self, method, path, body):
+        self._db.execute(
+            "INSERT INTO outbox (method, path, body, created_at) VALUES (?, ?, ?, ?)",
+            (method, path, json.dumps(body, ensure_ascii=False) if body is not None else None, time.time()),
+        )
+
+    def pending_writes(self, limit=100):
+        """送っていない書き込み（古い順）"""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM outbox ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [{**dict(row), "body": json.loads(row["body"]) if row["body"] is not None else None} for row in rows]
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def complete_write(self, write_id):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (write_id,))
+
+    def fail_write(self, write_id, error):
+        """送れなかった書き込みを記録する（キューには残し、次の同期で再送する）"""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ? WHERE id = ?", (str(error), write_id)
+            )
+
+    def delete_object(self, object_id):
+        """オブジェクトをミラーから削除し、バックエンドでの削除をキューに追加する"""
+        with self._lock, self._db:
+            self._apply_object({"op": "delete", "id": object_id})
+            self._enqueue("DELETE", f"/objects/{object_id}", None)
@@ -0,0 +1,185 @@
+import logging
+import os
+import threading
+from api_client import ApiConnectionError, ApiError, get_client
+from .store import LocalMirror
+
+logger = logging.getLogger(__name__)
+
+# 同期の間隔（秒）。接続できない間は最大MIRROR_SYNC_MAX_INTERVALまで間隔を広げる
+MIRROR_SYNC_INTERVAL = float(os.getenv("MIRROR_SYNC_INTERVAL", "5"))
+MIRROR_SYNC_MAX_INTERVAL = float(os.getenv("MIRROR_SYNC_MAX_INTERVAL", "60"))
+# 1回に取得する変更の件数
+MIRROR_CHANGES_LIMIT = 1000
+
+class MirrorSync:
+    """
+    ローカルのミラーをバックエンドと同期する処理（バックグラウンドのスレッドで行う）。
+    1回の同期では、キューにたまった書き込みを古い順に送ってから、前回以降の変更を/changes/から取得して反映する。
+    """
+
+    def __init__(self, mirror, client=None, interval=MIRROR_SYNC_INTERVAL, max_interval=MIRROR_SYNC_MAX_INTERVAL):
+        self.mirror = mirror
+        self.client = client or get_client()
+        self.interval = interval
+        self.max_interval = max_interval
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._sync_lock = threading.Lock()
+        self._thread = None
+        self._listeners = []
+        self.online = False
+        # 統計情報
+        self.syncs = 0
+        self.applied_changes = 0
+        self.replayed_writes = 0
+        self.dropped_writes = 0
+        self.failures = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name="mirror-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def add_listener(self, listener):
+        """ミラーに変更を反映したときに呼ぶ関数を登録する（同期のスレッドから呼ばれる）"""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def request_sync(self):
+        """次の同期を待たずに同期する（書き込みをキューに追加したときなど）"""
+        self._wake.set()
+
+    def _loop(self):
+        interval = self.interval
+        while not self._stopped.is_set():
+            try:
+                self.sync()
+                interval = self.interval
+            except ApiError:
+                # バックエンドが停止中・再起動中の場合はミラーのまま表示し、間隔を広げて再試行する
+                self.failures += 1
+                interval = min(interval * 2, self.max_interval)
+            except Exception:
+                self.failures += 1
+                interval = min(interval * 2, self.max_interval)
+                logger.exception("Failed to sync local mirror")
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    def sync(self):
+        """書き込みを送ってから変更を取得する（自分の書き込みも変更として取得される）"""
+        with self._sync_lock:
+            try:
+                self.push()
+                self.pull()
+            except ApiConnectionError:
+                self.online = False
+                raise
+            self.online = True
+            self.syncs += 1
+
+    def push(self):
+        """キューの書き込みを古い順に送る。接続できない場合は残りを次の同期で送る"""
+        while True:
+            writes = self.mirror.pending_writes()
+            if not writes:
+                return
+            for write in writes:
+                try:
+                    self._send(write)
+                except ApiConnectionError as exc:
+                    self.mirror.fail_write(write["id"], exc)
+                    raise
+                except ApiError as exc:
+                    if exc.status is None or exc.status == 429 or exc.status >= 500:
+                        # 混雑・バックエンドの一時的なエラーは次の同期で再送する
+                        self.mirror.fail_write(write["id"], exc)
+                        raise
+                    # 入力エラー・競合など、再送しても成功しない書き込みは捨てる
+                    logger.warning("Dropped queued write %s %s: %s", write["method"], write["path"], exc)
+                    self.dropped_writes += 1
+                else:
+                    self.replayed_writes += 1
+                self.mirror.complete_write(write["id"])
+
+    def _send(self, write):
+        if write["method"] == "POST":
+            return self.client.post(write["path"], write["body"])
+        if write["method"] == "PUT":
+            return self.client.put(write["path"], write["body"])
+        if write["method"] == "DELETE":
+            return self.client.delete(write["path"])
+        raise ValueError(f"Unsupported method: {write['method']}")
+
+    def pull(self):
+        """前回以降の変更を取得して反映する。差分同期できない場合は最初から取得し直す"""
+        since = self.mirror.change_seq
+        bootstrapping = self.mirror.bootstrapping
+        changed = False
+        while True:
+            feed = self.client.get_changes(since, limit=MIRROR_CHANGES_LIMIT)
+            if feed["reset"]:
+                self.mirror.reset()
+                since, bootstrapping, changed = 0, True, True
+                continue
+            self.mirror.apply_changes(feed["changes"], feed["next_since"], log=not bootstrapping)
+            self.applied_changes += len(feed["changes"])
+            changed = changed or bool(feed["changes"])
+            since = feed["next_since"]
+            if not feed["has_more"]:
+                break
+        if bootstrapping:
+            self.mirror.finish_bootstrap()
+        if changed:
+            for listener in list(self._listeners):
+                try:
+                    listener()
+                except Exception:
+                    logger.exception("Mirror listener failed")
+
+    def metrics(self):
+        return {
+            "online": self.online,
+            "change_seq": self.mirror.change_seq,
+            "pending_writes": self.mirror.pending_count(),
+            "syncs": self.syncs,
+            "applied_changes": self.applied_changes,
+            "replayed_writes": self.replayed_writes,
+            "dropped_writes": self.dropped_writes,
+            "failures": self.failures,
+        }
+
+_mirror = None
+_sync = None
+_lock = threading.Lock()
+
+def get_mirror():
+    """アプリ全体で共有するローカルのミラーを取得"""
+    global _mirror
+    with _lock:
+        if _mirror is None:
+            _mirror = LocalMirror()
+            _mirror.bind(get_client().base_url)
+        return _mirror
+
+def get_mirror_sync():
+    """アプリ全体で共有するミラーの同期処理を取得"""
+    global _sync
+    mirror = get_mirror()
+    with _lock:
+        if _sync is None:
+            _sync = MirrorSync(mirror)
+        return _sync
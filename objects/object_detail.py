@@ -1,19 +1,26 @@
 import flet as ft
+from api_client import ApiError, get_client
+from mirror import get_mirror
+from ui_loader import get_loader
+from .object_store import get_object_store
 
 def object_detail(page, obj, back_callback):
+    """
+    オブジェクト詳細画面を表示する関数。
+    一覧の項目（名前・サマリー）をすぐに表示し、説明は詳細のキャッシュ（一覧と同じバージョンの場合）かローカルのミラーから取得して表示する。
+    最新のサマリーがあれば特徴も表示する（ミラーの最初の同期が終わるまではバックエンドから取得する）。
+    """
+    scope = get_loader(page).begin()
     page.controls.clear()
-    if obj.get("type") == "person":
-        detail_controls = [
-            ft.Text(f"名前: {obj['name']}", size=18),
-            ft.Text(f"年齢: {obj['age']}"),
-            ft.Text(f"職業: {obj['job']}"),
-        ]
-    else:
-        detail_controls = [
-            ft.Text(f"名前: {obj['name']}", size=18),
-            ft.Text(f"状態: {obj.get('status', '不明')}"),
-        ]
-    detail_controls.append(ft.ElevatedButton("戻る", on_click=back_callback))
+    description_text = ft.Text("読み込み中...", color="grey")
+    features_text = ft.Text("", visible=False)
+    detail_controls = [
+        ft.Text(f"名前: {obj['name']}", size=18),
+        ft.Text(f"サマリー: {obj['summary']}"),
+        description_text,
+        features_text,
+        ft.ElevatedButton("戻る", on_click=back_callback),
+    ]
     page.add(
         ft.Column(
             detail_controls,
@@ -22,3 +29,30 @@ def object_detail(page, obj, back_callback):
         )
     )
     page.update()
+
+    def fetch_detail():
+        detail = get_object_store().get_detail(obj["id"], obj.get("version"))
+        mirror = get_mirror()
+        latest_summary = mirror.get_latest_summary(obj["id"])
+        if latest_summary is None and mirror.bootstrapping:
+            try:
+                latest_summary = get_client().get_latest_summary(obj["id"])
+            except ApiError:
+                # 特徴は表示できなくても説明は表示する
+                latest_summary = None
+        return detail, latest_summary
+
+    def show_detail(result):
+        detail, latest_summary = result
+        description_text.value = f"説明: {detail['description']}"
+        description_text.color = None
+        if latest_summary is not None:
+            features_text.value = f"特徴: {latest_summary['key_features']}"
+            features_text.visible = True
+        return [description_text, features_text]
+
+    def show_error(exc):
+        description_text.value = f"詳細を取得できませんでした: {exc}"
+        return [description_text]
+
+    scope.load(fetch_detail, show_detail, on_error=show_error)
@@ -1,51 +1,117 @@
+import threading
 import flet as ft
+from mirror import get_mirror_sync
+from ui_loader import get_loader
 from .object_detail import object_detail
+from .object_store import get_object_store
 
-def object_list(page, back_callback):
-    # オブジェクトリスト（人・部屋など）
-    objects = [
-        {"type": "person", "name": "田中 太郎", "age": 28, "job": "エンジニア"},
-        {"type": "person", "name": "佐藤 花子", "age": 34, "job": "デザイナー"},
-        {"type": "person", "name": "鈴木 次郎", "age": 22, "job": "学生"},
-        {"type": "person", "name": "高橋 美咲", "age": 41, "job": "マネージャー"},
-        {"type": "person", "name": "伊藤 健一", "age": 30, "job": "営業"},
-        {"type": "person", "name": "山本 直樹", "age": 25, "job": "プログラマー"},
-        {"type": "person", "name": "中村 由美", "age": 29, "job": "マーケター"},
-        {"type": "person", "name": "小林 拓也", "age": 33, "job": "コンサルタント"},
-        {"type": "person", "name": "加藤 さくら", "age": 27, "job": "ライター"},
-        {"type": "person", "name": "渡辺 大輔", "age": 38, "job": "ディレクター"},
-        {"type": "person", "name": "松本 佳奈", "age": 24, "job": "アナリスト"},
-        {"type": "person", "name": "斎藤 剛", "age": 36, "job": "プロデューサー"},
-        # ここから物の例
-        {"type": "room", "name": "子供部屋", "status": "空室"},
-        {"type": "room", "name": "リビング", "status": "在室"},
-        {"type": "car", "name": "社用車A", "status": "駐車場"},
-    ]
+# 1行の高さ（固定にしてスクロール位置から表示中の行を計算する）
+ITEM_HEIGHT = 56
+LIST_HEIGHT = 300
+# 表示範囲の前後に余分に作っておく行数
+OVERSCAN = 5
+# 末尾からこの行数以内までスクロールしたら続きのページを取得する
+PREFETCH_ROWS = 20
 
+def object_list(page, back_callback):
+    """
+    オブジェクトリスト画面を表示する関数。
+    一覧はバックエンドからページ単位で取得してキャッシュし、表示中の行のListTileだけを作る（スクロールしても作り直さず中身を入れ替える）。
+    画面を開き直したときはキャッシュから即座に表示し、前回以降の変更だけを取得して反映する。
+    取得はすべてui_loaderのワーカースレッドで行い、スクロール・クリックの処理ではキャッシュだけを使う。
+    """
+    scope = get_loader(page).begin()
+    store = get_object_store()
     page.controls.clear()
 
-    def on_object_click(e, obj):
-        object_detail(page, obj, lambda e=None: object_list(page, back_callback))
-
-    name_list = ft.ListView(
-        controls=[
-            ft.ListTile(
-                title=ft.Text(
-                    f"{obj['name']}"
-                ),
-                on_click=lambda e, o=obj: on_object_click(e, o)
-            ) for obj in objects
-        ],
-        expand=False,
-        height=300,  # 高さを指定してスクロール可能に
-        spacing=10,
+    visible_rows = LIST_HEIGHT // ITEM_HEIGHT + 1 + OVERSCAN * 2
+    state = {"row": 0, "start": None}
+    lock = threading.Lock()
+
+    def on_object_click(e):
+        item = e.control.data
+        if item is None:
+            return
+        object_detail(page, item, lambda e=None: object_list(page, back_callback))
+
+    # 表示範囲の行（数は一定で、スクロールに合わせて中身と位置を入れ替える）
+    tiles = [
+        ft.Container(
+            content=ft.ListTile(title=ft.Text(""), subtitle=ft.Text("", max_lines=1), on_click=on_object_click),
+            height=ITEM_HEIGHT,
+            visible=False,
+        )
+        for _ in range(visible_rows)
+    ]
+    # 表示範囲より前・後の行の高さを占める余白
+    top_spacer = ft.Container(height=0)
+    bottom_spacer = ft.Container(height=0)
+    status_text = ft.Text("読み込み中...", size=14, color="grey")
+    name_list = ft.Column(
+        [top_spacer, *tiles, bottom_spacer],
+        scroll="auto",
+        height=LIST_HEIGHT,
+        spacing=0,
+        on_scroll=lambda e: on_scroll(e),
     )
+
+    def refresh(changed):
+        """取得・同期で一覧が変わった場合は表示し直す（変更したコントロールを返す）"""
+        return layout(state["row"], force=True) if changed else []
+
+    def show_error(exc):
+        status_text.value = f"取得できませんでした: {exc}"
+        return [status_text]
+
+    def on_scroll(e):
+        store.scroll_offset = e.pixels
+        controls = layout(int(e.pixels // ITEM_HEIGHT))
+        if controls:
+            page.update(*controls)
+
+    def layout(first, force=False):
+        """
+        first行目付近の行だけを表示するようにコントロールを変更し、変更したコントロールを返す（表示範囲が変わらない場合は何もしない）。
+        キャッシュにないページ・続きのページの取得を予約する。
+        """
+        start = max(first - OVERSCAN, 0)
+        with lock:
+            state["row"] = first
+            if start == state["start"] and not force:
+                return []
+            state["start"] = start
+            count = store.loaded_count
+            end = min(start + visible_rows, count)
+            missing_pages = set()
+            for index, tile in enumerate(tiles):
+                position = start + index
+                if position >= end:
+                    tile.visible = False
+                    continue
+                item = store.item_at(position)
+                if item is None:
+                    # キャッシュから捨てたページ
+                    missing_pages.add(store.page_of(position))
+                tile.visible = True
+                tile.content.data = item
+                tile.content.title.value = item["name"] if item else "読み込み中..."
+                tile.content.subtitle.value = item["summary"] if item else ""
+            top_spacer.height = start * ITEM_HEIGHT
+            bottom_spacer.height = max(count - end, 0) * ITEM_HEIGHT
+            total = store.total if store.total is not None else count
+            status_text.value = f"全{total}件" if store.complete or count else "読み込み中..."
+        for page_number in missing_pages:
+            scope.load(lambda n=page_number: store.fetch_page(n), refresh, on_error=show_error)
+        if end + PREFETCH_ROWS >= count and not store.complete:
+            scope.load(store.fetch_next_page, refresh, on_error=show_error)
+        return [name_list, status_text]
+
     back_btn = ft.ElevatedButton("戻る", on_click=back_callback)
     page.add(
         ft.Column(
             [
                 ft.Text("オブジェクトリスト", size=20, weight="bold"),
-                ft.Text("下にスクロールできます", size=14, color="grey"),
+                status_text,
                 name_list,
                 back_btn
             ],
@@ -54,3 +120,22 @@ def object_list(page, back_callback):
         )
     )
     page.update()
+
+    # 前回のスクロール位置から表示する
+    offset = store.scroll_offset
+    page.update(*layout(int(offset // ITEM_HEIGHT), force=True))
+    if offset:
+        name_list.scroll_to(offset=offset, duration=0)
+    # 前回以降の変更だけを取得して反映する（ミラーから読むため、バックエンドに接続できなくても表示できる）
+    scope.load(store.sync, refresh, on_error=show_error)
+
+    mirror_sync = get_mirror_sync()
+
+    def on_mirror_changed():
+        """表示中にミラーが同期されたら、その変更を反映する"""
+        if scope.cancelled:
+            mirror_sync.remove_listener(on_mirror_changed)
+            return
+        scope.load(store.sync, refresh, on_error=show_error)
+
+    mirror_sync.add_listener(on_mirror_changed)
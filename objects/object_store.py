@@ -0,0 +1,243 @@
+import bisect
+import threading
+from collections import OrderedDict
+from api_client import get_client
+from mirror import get_mirror
+
+# 1回に取得する一覧の件数
+PAGE_SIZE = 100
+# 保持する一覧のページ数・詳細の件数（最近使ったものから残す）
+PAGE_CACHE_PAGES = 50
+DETAIL_CACHE_SIZE = 256
+# 1回に取得する変更の件数
+CHANGES_LIMIT = 500
+
+class LRUCache:
+    """件数の上限を超えると最も長く使われていないものから捨てるキャッシュ"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._entries:
+            return default
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def set(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        return self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+class ObjectStore:
+    """
+    オブジェクトの一覧・詳細のクライアント側キャッシュ。
+    一覧はIDの昇順にPAGE_SIZE件ずつのページとして取得し、最近使ったページと詳細だけを保持する。
+    ページの境界（各ページの最後のID）と件数は捨てたページの分も保持するため、位置から項目のページを求めたり、捨てたページを同じ範囲で取得し直したりできる。
+    画面を開き直したときは前回以降の変更だけを取得して反映し、変更のないページは取得し直さない。
+    一覧・変更・詳細はローカルのミラー（バックエンドとはバックグラウンドで同期される）から読むため、バックエンドに接続しない。
+    """
+
+    def __init__(self, page_size=PAGE_SIZE, page_cache_pages=PAGE_CACHE_PAGES, detail_cache_size=DETAIL_CACHE_SIZE):
+        self.page_size = page_size
+        self.pages = LRUCache(page_cache_pages)  # ページ番号 → 項目のリスト
+        self.details = LRUCache(detail_cache_size)  # ID → 詳細
+        self._lock = threading.RLock()
+        self._loading = set()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.pages.clear()
+            self.details.clear()
+            self.bounds = []  # ページ番号 → そのページの最後のID
+            self.lengths = []  # ページ番号 → そのページの件数
+            self.seqs = []  # ページ番号 → そのページを取得した時点の変更番号
+            self._offsets = None
+            self.complete = False  # 最後のページまで取得したか
+            self.total = None
+            self.change_seq = None
+            self.scroll_offset = 0.0
+
+    @property
+    def loaded_count(self):
+        """境界を取得済みのページの件数の合計（スクロールできる範囲）"""
+        return sum(self.lengths)
+
+    def _page_offsets(self):
+        if self._offsets is None:
+            offsets, position = [], 0
+            for length in self.lengths:
+                offsets.append(position)
+                position += length
+            self._offsets = offsets
+        return self._offsets
+
+    def locate(self, position):
+        """一覧の位置を（ページ番号, ページ内の位置）に変換する"""
+        offsets = self._page_offsets()
+        page_number = bisect.bisect_right(offsets, position) - 1
+        return page_number, position - offsets[page_number]
+
+    def item_at(self, position):
+        """位置の項目を返す。ページを保持していない場合はNone（fetch_pageで取得する）"""
+        with self._lock:
+            if position < 0 or position >= self.loaded_count:
+                return None
+            page_number, index = self.locate(position)
+            items = self.pages.get(page_number)
+            if items is None or index >= len(items):
+                return None
+            return items[index]
+
+    def page_of(self, position):
+        with self._lock:
+            return self.locate(position)[0]
+
+    def fetch_next_page(self):
+        """続きのページを取得する。取得した場合はTrue"""
+        with self._lock:
+            if self.complete:
+                return False
+            page_number = len(self.bounds)
+        return self.fetch_page(page_number)
+
+    def fetch_page(self, page_number):
+        """
+        ページを取得してキャッシュする（別スレッドから呼ぶ）。
+        捨てたページは同じ範囲（前のページの最後のIDの次から境界のIDまで）を取得し直す。
+        捨てている間に範囲内に作成されたオブジェクトは件数に含まれていないため、保持している件数で足りなければ境界まで続けて取得する。
+        同じページを同時に取得しない。
+        """
+        with self._lock:
+            if page_number in self._loading or page_number > len(self.bounds):
+                return False
+            self._loading.add(page_number)
+            after_id = self.bounds[page_number - 1] if page_number > 0 else None
+            bound = self.bounds[page_number] if page_number < len(self.bounds) else None
+            limit = self.lengths[page_number] if page_number < len(self.lengths) else self.page_size
+        try:
+            result = get_mirror().get_object_page(after_id, limit=max(limit, 1))
+            if bound is not None:
+                # 変更番号は最初の取得のもの（後の取得までの変更は次のsyncで反映し直す）
+                first, items = result, list(result["objects"])
+                while result["has_more"] and items and items[-1]["id"] < bound:
+                    result = get_mirror().get_object_page(items[-1]["id"], limit=self.page_size)
+                    items.extend(result["objects"])
+                result = {**result, "objects": items, "change_seq": first["change_seq"]}
+        finally:
+            with self._lock:
+                self._loading.discard(page_number)
+        with self._lock:
+            items = result["objects"]
+            if self.change_seq is None:
+                self.change_seq = result["change_seq"]
+            self.total = result["total"]
+            if page_number == len(self.bounds):
+                # 新しいページ
+                if not items:
+                    self.complete = True
+                    return False
+                self.bounds.append(items[-1]["id"])
+                self.lengths.append(len(items))
+                self.seqs.append(result["change_seq"])
+                self._offsets = None
+                self.complete = not result["has_more"]
+            else:
+                # 捨てたページの取得し直し（境界より後の項目は次のページのもの）
+                items = [item for item in items if item["id"] <= self.bounds[page_number]]
+                self.lengths[page_number] = len(items)
+                self.seqs[page_number] = result["change_seq"]
+                self._offsets = None
+            self.pages.set(page_number, items)
+            return True
+
+    def sync(self):
+        """前回以降の変更を取得してキャッシュに反映する（別スレッドから呼ぶ）。一覧の表示が変わる場合はTrue"""
+        with self._lock:
+            since = self.change_seq
+        if since is None:
+            return False
+        changed = False
+        while True:
+            feed = get_mirror().get_changes(since, limit=CHANGES_LIMIT)
+            if feed["reset"]:
+                # 差分同期できない場合は最初から取得し直す
+                self.reset()
+                return True
+            with self._lock:
+                for change in feed["changes"]:
+                    if change["entity"] == "object":
+                        changed = self._apply(change) or changed
+                self.change_seq = since = feed["next_since"]
+            if not feed["has_more"]:
+                return changed
+
+    def _apply(self, change):
+        object_id = change["id"]
+        self.details.pop(object_id)
+        page_number = bisect.bisect_left(self.bounds, object_id)
+        if page_number == len(self.bounds):
+            # 取得済みの範囲より後の新しいオブジェクト
+            if change["op"] == "upsert" and self.complete:
+                self.complete = False
+                self.total = (self.total or 0) + 1
+                return True
+            return False
+        if change["seq"] <= self.seqs[page_number]:
+            # ページの取得時点で反映済みの変更
+            return False
+        items = self.pages.get(page_number)
+        index = next((i for i, item in enumerate(items) if item["id"] == object_id), None) if items is not None else None
+        if change["op"] == "delete":
+            if items is not None and index is None:
+                return False
+            if index is not None:
+                del items[index]
+            self.lengths[page_number] -= 1
+            self._offsets = None
+            self.total = max((self.total or 1) - 1, 0)
+            return True
+        data = change["data"] or {}
+        item = {key: data.get(key) for key in ("id", "name", "summary", "version")}
+        if index is not None:
+            items[index] = item
+        elif items is not None:
+            # 範囲内に作成されたオブジェクト（削除されたIDの再利用）
+            position = bisect.bisect_left([existing["id"] for existing in items], object_id)
+            items.insert(position, item)
+            self.lengths[page_number] += 1
+            self._offsets = None
+            self.total = (self.total or 0) + 1
+        return True
+
+    def get_detail(self, object_id, version=None):
+        """詳細を取得する（一覧と同じバージョンがキャッシュにある場合は取得しない。ミラーにない場合はバックエンドから取得する）"""
+        with self._lock:
+            cached = self.details.get(object_id)
+        if cached is not None and (version is None or cached["version"] == version):
+            return cached
+        detail = get_mirror().get_object(object_id) or get_client().get_object(object_id)
+        with self._lock:
+            self.details.set(object_id, detail)
+        return detail
+
+_store = ObjectStore()
+
+def get_object_store():
+    """アプリ全体で共有するオブジェクトのキャッシュを取得（画面を開き直しても保持される）"""
+    return _store
@@ -0,0 +1,5 @@
+import sys
+import os
+
+# リポジトリのルートを追加（フロントエンドのパッケージを読み込むため）
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,350 @@
+import asyncio
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import api_client.client
+from api_client import ApiClient, ApiConnectionError, ApiError, AsyncApiClient
+from api_client.client import RETRY_MAX_DELAY, backoff_delay
+
+
+class Handler(BaseHTTPRequestHandler):
+    """テスト用のサーバーのハンドラー（server.routesのパスごとの関数が応答を決める）"""
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        # 同じ接続で何件目のリクエストか（keep-aliveの接続を使い回したかの確認に使う）
+        self.connection_requests = getattr(self, "connection_requests", 0) + 1
+        path = urllib.parse.urlsplit(self.path).path
+        self.server.hits.append((self.command, self.path))
+        result = self.server.routes[path](self, body)
+        if result is None:
+            # 応答せずに接続を閉じる
+            self.close_connection = True
+            return
+        status, headers, payload = result
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.routes = {}
+    server.hits = []
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server):
+    client = ApiClient(f"http://127.0.0.1:{server.server_port}", timeout=5, retries=2)
+    yield client
+    client.close()
+
+
+def ok(payload=None, **headers):
+    return 200, headers, {} if payload is None else payload
+
+
+def fail(status, detail="error", **headers):
+    return status, headers, {"detail": detail}
+
+
+def sequence(*responses):
+    """呼ばれるたびに順に応答する（最後の応答は繰り返す）"""
+    responses = list(responses)
+
+    def route(handler, body):
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+    return route
+
+
+class TestBackoff:
+    """再試行の待ち時間のテストクラス"""
+
+    def test_backoff_is_bounded(self):
+        """待ち時間が0から指数的な上限（最大RETRY_MAX_DELAY）の範囲に収まることを確認"""
+        for attempt in range(10):
+            for _ in range(20):
+                delay = backoff_delay(attempt)
+                assert 0 <= delay <= min(RETRY_MAX_DELAY, 0.1 * 2 ** attempt)
+
+    def test_retry_after_is_a_floor(self):
+        """Retry-Afterが指定された場合はその時間より前に再試行しないことを確認"""
+        assert all(backoff_delay(0, retry_after=1.5) >= 1.5 for _ in range(20))
+
+
+class TestRetries:
+    """ApiClientの再試行の規則のテストクラス"""
+
+    @pytest.mark.parametrize("status", [429, 503])
+    def test_rejected_statuses_are_retried_for_post(self, server, client, status):
+        """サーバーが処理せずに断ったステータスはPOSTでも再試行することを確認"""
+        server.routes["/items"] = sequence(fail(status), ok({"id": 1}))
+
+        assert client.post("/items", {"name": "a"}) == {"id": 1}
+        assert [method for method, _ in server.hits] == ["POST", "POST"]
+        assert client.retried == 1
+
+    def test_retry_after_is_honoured(self, server, client):
+        """Retry-Afterの時間が経つまで再試行しないことを確認"""
+        server.routes["/items"] = sequence(fail(503, **{"Retry-After": "0.3"}), ok())
+
+        started = time.monotonic()
+        client.get("/items")
+
+        assert time.monotonic() - started >= 0.3
+
+    @pytest.mark.parametrize("method, retried", [("GET", True), ("PUT", True), ("DELETE", True), ("POST", False)])
+    def test_gateway_statuses_are_retried_only_for_idempotent_methods(self, server, client, method, retried):
+        """処理されたか分からないステータスは冪等なメソッドのみ再試行することを確認"""
+        server.routes["/items"] = sequence(fail(502), ok())
+        call = {
+            "GET": lambda: client.get("/items"),
+            "PUT": lambda: client.put("/items", {}),
+            "DELETE": lambda: client.delete("/items"),
+            "POST": lambda: client.post("/items", {}),
+        }[method]
+
+        if retried:
+            assert call() == {}
+            assert len(server.hits) == 2
+        else:
+            with pytest.raises(ApiError) as exc_info:
+                call()
+            assert exc_info.value.status == 502
+            assert len(server.hits) == 1
+
+    def test_client_errors_are_not_retried(self, server, client):
+        """入力エラーなどは再試行せずにApiErrorとしてdetailを返すことを確認"""
+        server.routes["/items"] = sequence(fail(409, "Version conflict"))
+
+        with pytest.raises(ApiError) as exc_info:
+            client.put("/items", {})
+
+        assert exc_info.value.status == 409
+        assert exc_info.value.detail == "Version conflict"
+        assert len(server.hits) == 1
+
+    def test_retries_are_limited(self, server, client):
+        """再試行はretries回までであることを確認"""
+        server.routes["/items"] = sequence(fail(503))
+
+        with pytest.raises(ApiError):
+            client.get("/items")
+
+        assert len(server.hits) == 3
+
+    def test_connection_refused(self, server):
+        """接続できない場合はApiConnectionErrorになり、冪等なメソッドのみ再試行することを確認"""
+        port = server.server_port
+        server.shutdown()
+        server.server_close()
+        client = ApiClient(f"http://127.0.0.1:{port}", timeout=5, retries=2)
+
+        with pytest.raises(ApiConnectionError):
+            client.get("/items")
+        assert client.retried == 2
+
+        with pytest.raises(ApiConnectionError):
+            client.post("/items", {})
+        assert client.retried == 2
+
+
+class TestConnections:
+    """接続のプールのテストクラス"""
+
+    def test_connections_are_reused(self, server, client):
+        """keep-aliveの接続を使い回すことを確認"""
+        server.routes["/items"] = lambda handler, body: ok({"request": handler.connection_requests})
+
+        assert [client.get("/items")["request"] for _ in range(3)] == [1, 2, 3]
+        assert client.metrics()["created"] == 1
+        assert client.metrics()["reused"] == 2
+
+    def test_closed_idle_connection_is_not_used(self, server, client):
+        """サーバー側で閉じられた空いている接続は使わずに接続し直すことを確認"""
+        server.routes["/items"] = lambda handler, body: ok()
+        # 応答してから接続を閉じる（クライアントには閉じることを知らせない）
+        server.routes["/close"] = lambda handler, body: setattr(handler, "close_connection", True) or ok()
+
+        client.get("/close")
+        time.sleep(0.1)
+        client.post("/items", {})
+
+        assert client.metrics()["created"] == 2
+        assert client.metrics()["reused"] == 0
+        assert [method for method, _ in server.hits] == ["GET", "POST"]
+
+    @pytest.mark.parametrize("method, resent", [("GET", True), ("POST", False)])
+    def test_stale_connection_resends_only_idempotent_requests(self, server, client, method, resent):
+        """使い回した接続が送った後に閉じられた場合、冪等なメソッドのみ送り直すことを確認"""
+        # 同じ接続の2件目のリクエストは受け取ってから応答せずに閉じる
+        server.routes["/items"] = lambda handler, body: ok() if handler.connection_requests == 1 else None
+
+        client.get("/items")
+        if resent:
+            assert client.get("/items") == {}
+            assert client.retried == 0
+            assert len(server.hits) == 3
+        else:
+            with pytest.raises(ApiConnectionError):
+                client.post("/items", {})
+            assert len(server.hits) == 2
+
+
+class TestCoalescing:
+    """リクエストをまとめる処理のテストクラス"""
+
+    def test_concurrent_gets_are_coalesced(self, server, client):
+        """同時に送られた同じGETは1回だけ送り、呼び出し元ごとに別の辞書を返すことを確認"""
+        release = threading.Event()
+
+        def slow(handler, body):
+            release.wait(5)
+            return ok({"items": [1, 2]})
+        server.routes["/items"] = slow
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.get("/items", limit=2))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while client.coalesced < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert server.hits == [("GET", "/items?limit=2")]
+        assert results == [{"items": [1, 2]}] * 3
+        assert len({id(result) for result in results}) == 3
+
+    def test_coalesced_errors_are_shared(self, server, client):
+        """まとめたGETが失敗した場合は待っていた呼び出し元にも同じエラーが返ることを確認"""
+        release = threading.Event()
+
+        def slow(handler, body):
+            release.wait(5)
+            return fail(404, "Not found")
+        server.routes["/items"] = slow
+        errors = []
+
+        def call():
+            try:
+                client.get("/items")
+            except ApiError as exc:
+                errors.append(exc.status)
+        threads = [threading.Thread(target=call) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while client.coalesced < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert errors == [404, 404]
+        assert len(server.hits) == 1
+
+    def test_latest_summaries_are_batched(self, server, client, monkeypatch):
+        """同時に呼ばれたオブジェクトごとの最新のサマリーの取得が1回のリクエストにまとまることを確認"""
+        def latest(handler, body):
+            object_ids = urllib.parse.parse_qs(urllib.parse.urlsplit(handler.path).query)["object_ids"]
+            return ok([{"id": int(object_id) * 10, "object_id": int(object_id)} for object_id in object_ids if object_id != "3"])
+        server.routes["/summaries/latest"] = latest
+        monkeypatch.setattr(api_client.client, "BATCH_WINDOW", 0.2)
+        results = {}
+        threads = [
+            threading.Thread(target=lambda object_id=object_id: results.setdefault(object_id, client.get_latest_summary(object_id)))
+            for object_id in (1, 2, 3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(server.hits) == 1
+        assert sorted(urllib.parse.parse_qs(urllib.parse.urlsplit(server.hits[0][1]).query)["object_ids"]) == ["1", "2", "3"]
+        assert client.metrics()["batched"] == 2
+        assert results == {1: {"id": 10, "object_id": 1}, 2: {"id": 20, "object_id": 2}, 3: None}
+
+    def test_latest_summaries_are_chunked(self, server, client):
+        """一括取得はバックエンドの上限の件数ごとに分けて送ることを確認"""
+        server.routes["/summaries/latest"] = lambda handler, body: ok([])
+
+        assert client.get_latest_summaries(list(range(1, 1502)) + [1]) == []
+        assert len(server.hits) == 2
+        assert server.hits[1][1].count("object_ids=") == 501
+
+
+class TestAsyncApiClient:
+    """asyncio版のクライアントのテストクラス"""
+
+    def test_calls_do_not_block_the_loop(self, server, client):
+        """呼び出しの間もイベントループが動き、結果を返すことを確認"""
+        def slow(handler, body):
+            time.sleep(0.2)
+            return ok({"id": 1})
+        server.routes["/objects/1"] = slow
+        async_client = AsyncApiClient(client)
+
+        async def main():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+            ticker = asyncio.create_task(tick())
+            result = await async_client.get_object(1)
+            ticker.cancel()
+            return result, ticks
+
+        result, ticks = asyncio.run(main())
+
+        assert result == {"id": 1}
+        assert ticks >= 5
+
+    def test_stream_chat(self, server, client):
+        """ストリーミングの返答を断片ごとに返すことを確認"""
+        events = b"".join(
+            f"event: token\ndata: {json.dumps({'text': text})}\n\n".encode("utf-8") for text in ("こん", "にちは")
+        ) + b"event: done\ndata: {}\n\n"
+        server.routes["/npc/1/chat/stream"] = lambda handler, body: (200, {"Content-Type": "text/event-stream"}, events)
+        async_client = AsyncApiClient(client)
+
+        async def main():
+            return [chunk async for chunk in async_client.stream_chat(1, "やあ")]
+
+        assert asyncio.run(main()) == ["こん", "にちは"]
+        assert client.metrics()["idle"] == 1
+
+    def test_errors_are_raised(self, server, client):
+        """エラーはApiErrorとして呼び出し元に送出されることを確認"""
+        server.routes["/objects/1"] = sequence(fail(404, "Object with id 1 not found"))
+
+        with pytest.raises(ApiError) as exc_info:
+            asyncio.run(AsyncApiClient(client).get_object(1))
+
+        assert exc_info.value.status == 404
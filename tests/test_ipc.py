@@ -0,0 +1,176 @@
+import socket
+import pytest
+from gameEngine.ipc import (
+    HEADER, IpcReceiver, IpcSender, RingBuffer,
+    Speech, NpcState, Spawn, Despawn, SpriteUpdate,
+)
+
+
+@pytest.fixture
+def channel():
+    """送信側と、送られたデータグラムをそのまま受け取るソケットを作成"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(1)
+    senders = []
+
+    def make_sender(**options):
+        sender = IpcSender(port=sock.getsockname()[1], **options)
+        senders.append(sender)
+        return sender
+
+    def receive(count):
+        return [sock.recv(65536) for _ in range(count)]
+
+    yield make_sender, receive
+    for sender in senders:
+        sender.close()
+    sock.close()
+
+
+def parse_all(receiver, datagrams):
+    return [message for datagram in datagrams for message in receiver.parse(memoryview(datagram))]
+
+
+class TestIpcProtocol:
+    """ランチャーとPyxelの間のメッセージの形式のテストクラス"""
+
+    def test_batch_round_trip(self, channel):
+        """batchの中で送ったすべての種類のメッセージが1つのデータグラムで届き、元に戻ることを確認"""
+        make_sender, receive = channel
+        sender = make_sender()
+        with sender.batch():
+            sender.send_spawn(1, 10.0, 20.0, sprite_id=3, name="アリス")
+            sender.send_state(1, 11.5, 21.0, state=1, direction=1)
+            sender.send_speech(1, "こんにちは")
+            sender.send_sprite(3, 2, 2, bytes([1, 2, 3, 4]))
+            sender.send_despawn(1)
+
+        datagrams = receive(1)
+        receiver = IpcReceiver()
+
+        assert sender.sent_datagrams == 1
+        assert parse_all(receiver, datagrams) == [
+            Spawn(1, 10.0, 20.0, 3, "アリス"),
+            NpcState(1, 11.5, 21.0, 1, 1),
+            Speech(1, "こんにちは"),
+            SpriteUpdate(3, 2, 2, bytes([1, 2, 3, 4])),
+            Despawn(1),
+        ]
+        assert receiver.lost_messages == 0
+        assert receiver.malformed == 0
+
+    def test_header_layout(self, channel):
+        """フレームのヘッダーの内容を確認"""
+        make_sender, receive = channel
+        make_sender().send_despawn(7)
+
+        (datagram,) = receive(1)
+
+        assert HEADER.unpack_from(datagram) == (b"PX", 1, 4, 1, 0, 1, 4)
+        assert len(datagram) == HEADER.size + 4
+
+    def test_fragmented_payload_is_reassembled(self, channel):
+        """1つのデータグラムに収まらないメッセージが断片に分かれ、届いた順によらず組み立て直されることを確認"""
+        make_sender, receive = channel
+        sender = make_sender(max_datagram=64)
+        text = "長い発言" * 40
+        sender.send_speech(2, text)
+
+        datagrams = receive(sender.sent_datagrams)
+        receiver = IpcReceiver()
+
+        assert len(datagrams) > 1
+        assert all(len(datagram) <= 64 for datagram in datagrams)
+        assert parse_all(receiver, reversed(datagrams)) == [Speech(2, text)]
+
+    def test_missing_sequence_is_counted(self, channel):
+        """届かなかったメッセージの数が通し番号から数えられることを確認"""
+        make_sender, receive = channel
+        sender = make_sender()
+        for npc_id in range(4):
+            sender.send_despawn(npc_id)
+
+        datagrams = receive(4)
+        receiver = IpcReceiver()
+        messages = parse_all(receiver, [datagrams[0], datagrams[2], datagrams[3]])
+
+        assert messages == [Despawn(0), Despawn(2), Despawn(3)]
+        assert receiver.lost_messages == 1
+
+    def test_late_fragmented_message_is_not_lost(self, channel):
+        """断片に分かれたメッセージの組み立てが後の番号より遅れて終わっても、欠けたメッセージとして数えないことを確認"""
+        make_sender, receive = channel
+        sender = make_sender(max_datagram=64)
+        text = "長い発言" * 10
+        sender.send_despawn(1)
+        sender.send_speech(2, text)
+        fragments = sender.sent_datagrams - 1
+        sender.send_despawn(3)
+        sender.send_despawn(4)
+
+        datagrams = receive(sender.sent_datagrams)
+        first, speech, third, fourth = datagrams[0], datagrams[1:1 + fragments], datagrams[-2], datagrams[-1]
+        receiver = IpcReceiver()
+        messages = parse_all(receiver, [first, *speech[:-1], third, speech[-1], fourth])
+
+        assert messages == [Despawn(1), Despawn(3), Speech(2, text), Despawn(4)]
+        assert receiver.lost_messages == 0
+
+    def test_loss_is_counted_from_highest_sequence(self):
+        """欠けた数は受け取った最も大きい番号から数え、送信側の再起動で番号が戻った場合は数え直すことを確認"""
+        def frame(seq):
+            return HEADER.pack(b"PX", 1, 4, seq, 0, 1, 4) + seq.to_bytes(4, "little")
+        receiver = IpcReceiver()
+
+        parse_all(receiver, [frame(seq) for seq in (1, 4, 2, 5)])
+        assert receiver.lost_messages == 1
+
+        # 再起動した送信側の番号は1から始まる
+        parse_all(receiver, [frame(seq) for seq in (5000, 1, 2, 4)])
+        assert receiver.lost_messages == 1 + 4994 + 1
+
+    def test_truncated_frame_is_malformed(self, channel):
+        """途中で切れたフレームは捨てて数えることを確認"""
+        make_sender, receive = channel
+        make_sender().send_speech(1, "こんにちは")
+
+        (datagram,) = receive(1)
+        receiver = IpcReceiver()
+
+        assert parse_all(receiver, [datagram[:-3]]) == []
+        assert receiver.malformed == 1
+
+    def test_legacy_text_datagram(self):
+        """以前の形式の文字列だけのデータグラムはNPCを指定しない発言になることを確認"""
+        assert parse_all(IpcReceiver(), ["こんにちは".encode("utf-8")]) == [Speech(0, "こんにちは")]
+
+
+class TestRingBuffer:
+    """リングバッファのテストクラス"""
+
+    def test_push_and_drain_in_order(self):
+        """追加した順に取り出せ、いっぱいの場合は追加できないことを確認"""
+        ring = RingBuffer(4)
+        assert all(ring.push(i) for i in range(4))
+        assert ring.push(4) is False
+        assert len(ring) == 4
+
+        assert ring.drain() == [0, 1, 2, 3]
+        assert ring.drain() == []
+
+    def test_wraps_around(self):
+        """末尾を越えて先頭に戻っても順序が保たれることを確認"""
+        ring = RingBuffer(4)
+        ring.push(0)
+        ring.push(1)
+        ring.drain()
+        for i in range(2, 6):
+            assert ring.push(i)
+
+        assert ring.drain() == [2, 3, 4, 5]
+
+    def test_capacity_must_be_power_of_two(self):
+        """大きさが2のべき乗でない場合はエラーになることを確認"""
+        with pytest.raises(ValueError):
+            RingBuffer(3)
@@ -0,0 +1,176 @@
+import pytest
+
+ft = pytest.importorskip("flet")
+from chat.message_view import MAX_RENDERED_MESSAGES, RENDER_PAGE_SIZE, MessageView
+
+
+class FakeScope:
+    """履歴の取得を実行せずに記録するスコープ"""
+
+    def __init__(self):
+        self.loads = []
+
+    def load(self, fetch, apply, on_error=None):
+        self.loads.append((fetch, apply, on_error))
+
+
+def make_messages(count, offset=0):
+    return [{"from": "me" if index % 2 else "npc", "text": f"メッセージ{index}"} for index in range(offset, offset + count)]
+
+
+@pytest.fixture
+def text_updates(monkeypatch):
+    """吹き出しの文字のupdateを記録する（ページに追加していないコントロールはupdateできないため）"""
+    updated = []
+    monkeypatch.setattr(ft.Text, "update", lambda self: updated.append(self.value))
+    return updated
+
+
+def make_view(**options):
+    view = MessageView(**options)
+    view.updates = 0
+    view.scrolls = []
+
+    def update():
+        view.updates += 1
+    view.column.update = update
+    view.column.scroll_to = lambda **kwargs: view.scrolls.append(kwargs)
+    return view
+
+
+def rendered_keys(view):
+    return [bubble.key for bubble in view.column.controls]
+
+
+def keys(messages):
+    return [msg["key"] for msg in messages]
+
+
+def assert_window(view, start, end):
+    """吹き出しの範囲が[start, end)で、吹き出しと文字のコントロールがその範囲のメッセージと一致することを確認"""
+    assert (view.start, view.end) == (start, end)
+    assert rendered_keys(view) == keys(view.messages[start:end])
+    assert set(view._texts) == set(keys(view.messages[start:end]))
+    assert len(view.column.controls) <= MAX_RENDERED_MESSAGES
+
+
+class TestMessageView:
+    """チャットの吹き出しの表示範囲のテストクラス"""
+
+    def test_set_messages_renders_latest_window(self):
+        """最新のMAX_RENDERED_MESSAGES件だけ吹き出しを作り、最下部までスクロールすることを確認"""
+        view = make_view()
+        view.set_messages(make_messages(200), has_older=False)
+
+        assert_window(view, 200 - MAX_RENDERED_MESSAGES, 200)
+        assert view.scrolls[-1] == {"offset": -1, "duration": 0}
+
+    def test_short_conversation_renders_everything(self):
+        """メッセージが少ない場合はすべての吹き出しを作ることを確認"""
+        view = make_view()
+        view.set_messages(make_messages(5), has_older=False)
+
+        assert_window(view, 0, 5)
+
+    def test_append_trims_front(self):
+        """最新の範囲を表示中に追加すると、古い吹き出しを外して最大件数を保つことを確認"""
+        view = make_view()
+        view.set_messages(make_messages(MAX_RENDERED_MESSAGES), has_older=False)
+
+        for msg in make_messages(3, offset=MAX_RENDERED_MESSAGES):
+            view.append(msg)
+
+        assert_window(view, 3, MAX_RENDERED_MESSAGES + 3)
+        assert view.column.controls[-1].content.value == f"メッセージ{MAX_RENDERED_MESSAGES + 2}"
+
+    def test_show_older_trims_back(self):
+        """古い方へ広げると、新しい方の吹き出しを外し、先頭にあった吹き出しの位置までスクロールすることを確認"""
+        view = make_view()
+        view.set_messages(make_messages(200), has_older=False)
+        anchor = view.column.controls[0].key
+
+        view.show_older()
+
+        start = 200 - MAX_RENDERED_MESSAGES - RENDER_PAGE_SIZE
+        assert_window(view, start, start + MAX_RENDERED_MESSAGES)
+        assert view.scrolls[-1] == {"key": anchor, "duration": 0}
+
+    def test_show_newer_trims_front(self):
+        """新しい方へ広げると、古い方の吹き出しを外すことを確認"""
+        view = make_view()
+        view.set_messages(make_messages(200), has_older=False)
+        view.show_older()
+        view.show_older()
+
+        view.show_newer()
+
+        end = 200 - RENDER_PAGE_SIZE
+        assert_window(view, end - MAX_RENDERED_MESSAGES, end)
+
+    def test_append_while_viewing_older_returns_to_latest(self):
+        """古いメッセージを表示中に追加すると、最新の範囲を作り直すことを確認"""
+        view = make_view()
+        view.set_messages(make_messages(200), has_older=False)
+        view.show_older()
+
+        view.append(make_messages(1, offset=200)[0])
+
+        assert_window(view, 201 - RENDER_PAGE_SIZE, 201)
+
+    def test_prepend_older_shifts_window(self):
+        """取得した履歴を先頭に加えると、表示中の範囲の位置がずれて同じメッセージを指し続け、古い方へ広がることを確認"""
+        scope = FakeScope()
+        view = make_view(load_older=lambda: None, scope=scope)
+        view.set_messages(make_messages(10, offset=50), has_older=True)
+        shown = rendered_keys(view)
+
+        view.show_older()
+
+        assert len(scope.loads) == 1
+        assert view.loading
+        view.show_older()
+        assert len(scope.loads) == 1
+
+        assert view._prepend_older(make_messages(50)) == []
+
+        assert not view.loading
+        assert len(view.messages) == 60
+        assert_window(view, 50 - RENDER_PAGE_SIZE, 60)
+        assert rendered_keys(view)[-10:] == shown
+        assert [msg["text"] for msg in view.messages[:2]] == ["メッセージ0", "メッセージ1"]
+
+    def test_prepend_nothing_stops_loading(self):
+        """履歴の続きがない場合はそれ以上取得しないことを確認"""
+        scope = FakeScope()
+        view = make_view(load_older=lambda: None, scope=scope)
+        view.set_messages(make_messages(10), has_older=True)
+        view.show_older()
+
+        view._prepend_older([])
+        view.show_older()
+
+        assert not view.has_older
+        assert len(scope.loads) == 1
+        assert_window(view, 0, 10)
+
+    def test_update_text(self, text_updates):
+        """表示中の吹き出しの文字は更新され、範囲外の吹き出しは作り直すときに新しい文字で作られることを確認"""
+        view = make_view()
+        view.set_messages(make_messages(200), has_older=False)
+        visible = view.messages[-1]
+        trimmed = view.messages[0]
+
+        visible["text"] = "更新"
+        view.update_text(visible)
+        trimmed["text"] = "範囲外で更新"
+        view.update_text(trimmed)
+
+        assert text_updates == ["更新"]
+        assert view.column.controls[-1].content.value == "更新"
+
+        view.show_older()
+        view.show_older()
+        view.show_older()
+
+        assert view.start == 0
+        assert view.column.controls[0].content.value == "範囲外で更新"
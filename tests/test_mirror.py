@@ -0,0 +1,272 @@
+import pytest
+from api_client import ApiConnectionError, ApiError
+from mirror import LocalMirror, MirrorSync
+
+
+class FakeClient:
+    """/changes/の応答を順に返し、書き込みを記録するクライアント（errorsにパスごとの例外を指定できる）"""
+
+    def __init__(self, feeds=(), errors=None):
+        self.feeds = list(feeds)
+        self.errors = dict(errors or {})
+        self.sinces = []
+        self.sent = []
+
+    def get_changes(self, since=0, limit=None):
+        self.sinces.append(since)
+        return self.feeds.pop(0)
+
+    def _write(self, method, path, body=None):
+        error = self.errors.get(path)
+        if error is not None:
+            raise error
+        self.sent.append((method, path, body))
+        return {}
+
+    def post(self, path, body=None):
+        return self._write("POST", path, body)
+
+    def put(self, path, body):
+        return self._write("PUT", path, body)
+
+    def delete(self, path):
+        return self._write("DELETE", path)
+
+
+def feed(changes, next_since, has_more=False, reset=False):
+    return {"changes": changes, "next_since": next_since, "has_more": has_more, "reset": reset}
+
+
+def object_change(seq, object_id, name="アリス", op="upsert"):
+    data = None
+    if op == "upsert":
+        data = {"id": object_id, "name": name, "summary": "", "description": "", "photos": None, "version": seq}
+    return {"seq": seq, "entity": "object", "id": object_id, "object_id": object_id, "op": op, "data": data}
+
+
+def summary_change(seq, summary_id, object_id, created_at, op="upsert"):
+    data = {"id": summary_id, "object_id": object_id, "summary": f"サマリー{summary_id}", "created_at": created_at}
+    return {"seq": seq, "entity": "summary", "id": summary_id, "object_id": object_id, "op": op,
+            "data": data if op == "upsert" else None}
+
+
+def memory_change(seq, memory_id, object_id, timestamp, op="upsert"):
+    data = {"id": memory_id, "object_id": object_id, "content": f"メモリ{memory_id}", "timestamp": timestamp}
+    return {"seq": seq, "entity": "memory", "id": memory_id, "object_id": object_id, "op": op,
+            "data": data if op == "upsert" else None}
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    mirror = LocalMirror(path=str(tmp_path / "mirror.db"), memories_per_object=2, change_log_retention=3)
+    yield mirror
+    mirror.close()
+
+
+class TestLocalMirror:
+    """ローカルのミラーへの差分の反映のテストクラス"""
+
+    def test_apply_changes(self, mirror):
+        """オブジェクト・サマリー・メモリの変更が反映され、バックエンドと同じ形式で読めることを確認"""
+        mirror.apply_changes([
+            object_change(1, 1),
+            summary_change(2, 10, 1, "2024-01-01T00:00:00"),
+            memory_change(3, 100, 1, "2024-01-01T00:00:00"),
+        ], 3)
+
+        assert mirror.get_object(1)["name"] == "アリス"
+        assert mirror.get_latest_summary(1)["id"] == 10
+        assert [memory["id"] for memory in mirror.get_recent_memories(1)] == [100]
+        assert mirror.change_seq == 3
+        assert mirror.get_object_page()["change_seq"] == 3
+
+    def test_older_summary_does_not_replace_latest(self, mirror):
+        """作成日時が古いサマリーの変更が後から届いても最新のサマリーが変わらないことを確認"""
+        mirror.apply_changes([summary_change(1, 11, 1, "2024-01-02T00:00:00")], 1)
+        mirror.apply_changes([summary_change(2, 10, 1, "2024-01-01T00:00:00")], 2)
+
+        assert mirror.get_latest_summary(1)["id"] == 11
+
+    def test_memories_are_pruned(self, mirror):
+        """オブジェクトごとに新しい方からmemories_per_object件だけ残ることを確認"""
+        mirror.apply_changes([
+            memory_change(seq, 100 + seq, 1, f"2024-01-0{seq}T00:00:00") for seq in range(1, 5)
+        ], 4)
+
+        assert [memory["id"] for memory in mirror.get_recent_memories(1)] == [104, 103]
+
+    def test_delete_tombstones(self, mirror):
+        """削除の変更でオブジェクトとそのサマリー・メモリが消えることを確認"""
+        mirror.apply_changes([
+            object_change(1, 1),
+            object_change(2, 2, name="ボブ"),
+            summary_change(3, 10, 1, "2024-01-01T00:00:00"),
+            memory_change(4, 100, 1, "2024-01-01T00:00:00"),
+            memory_change(5, 200, 2, "2024-01-01T00:00:00"),
+        ], 5)
+        mirror.apply_changes([object_change(6, 1, op="delete"), memory_change(7, 200, 2, None, op="delete")], 7)
+
+        assert mirror.get_object(1) is None
+        assert mirror.get_latest_summary(1) is None
+        assert mirror.get_recent_memories(1) == []
+        assert mirror.get_object(2)["name"] == "ボブ"
+        assert mirror.get_recent_memories(2) == []
+
+    def test_summary_delete(self, mirror):
+        """最新のサマリーの削除が反映されることを確認"""
+        mirror.apply_changes([summary_change(1, 10, 1, "2024-01-01T00:00:00")], 1)
+        mirror.apply_changes([summary_change(2, 10, 1, None, op="delete")], 2)
+
+        assert mirror.get_latest_summary(1) is None
+
+    def test_changes_reset_until_bootstrap_finishes(self, mirror):
+        """最初からの同期が終わるまでは画面のキャッシュに差分を返さずreset=Trueを返すことを確認"""
+        mirror.apply_changes([object_change(1, 1)], 1, log=False)
+
+        assert mirror.bootstrapping
+        assert mirror.get_changes(0)["reset"]
+
+        mirror.finish_bootstrap()
+        mirror.apply_changes([object_change(2, 2)], 2)
+        changes = mirror.get_changes(1)
+
+        assert not mirror.bootstrapping
+        assert not changes["reset"]
+        assert [change["seq"] for change in changes["changes"]] == [2]
+        assert changes["changes"][0]["data"]["id"] == 2
+        assert changes["next_since"] == 2
+
+    def test_changes_reset_after_log_is_pruned(self, mirror):
+        """保持している変更より前からの差分はreset=Trueになることを確認"""
+        mirror.finish_bootstrap()
+        mirror.apply_changes([object_change(seq, seq) for seq in range(1, 6)], 5)
+
+        assert mirror.get_changes(0)["reset"]
+        changes = mirror.get_changes(2)
+        assert not changes["reset"]
+        assert [change["seq"] for change in changes["changes"]] == [3, 4, 5]
+
+    def test_bind_to_other_backend_clears(self, mirror):
+        """前回と違うバックエンドに接続するとミラーが空になることを確認"""
+        mirror.bind("http://a")
+        mirror.apply_changes([object_change(1, 1)], 1)
+        mirror.finish_bootstrap()
+        mirror.bind("http://a")
+
+        assert mirror.get_object(1) is not None
+
+        mirror.bind("http://b")
+
+        assert mirror.get_object(1) is None
+        assert mirror.change_seq == 0
+        assert mirror.bootstrapping
+
+    def test_outbox(self, mirror):
+        """書き込みのキューが古い順に返り、失敗の記録と完了の削除ができることを確認"""
+        mirror.enqueue("POST", "/objects/", {"name": "アリス"})
+        mirror.delete_object(1)
+        writes = mirror.pending_writes()
+
+        assert [(write["method"], write["path"], write["body"]) for write in writes] == [
+            ("POST", "/objects/", {"name": "アリス"}),
+            ("DELETE", "/objects/1", None),
+        ]
+
+        mirror.fail_write(writes[0]["id"], "timeout")
+        mirror.complete_write(writes[1]["id"])
+        writes = mirror.pending_writes()
+
+        assert mirror.pending_count() == 1
+        assert writes[0]["attempts"] == 1
+        assert writes[0]["last_error"] == "timeout"
+
+
+class TestMirrorSync:
+    """ミラーの同期処理のテストクラス"""
+
+    def test_bootstrap_then_incremental(self, mirror):
+        """最初の同期は変更を記録せずに取得し、次の同期からは差分が画面のキャッシュ向けに記録されることを確認"""
+        client = FakeClient([
+            feed([object_change(1, 1)], 1, has_more=True),
+            feed([object_change(2, 2)], 2),
+            feed([object_change(3, 1, name="アリス2")], 3),
+        ])
+        sync = MirrorSync(mirror, client=client)
+        notified = []
+        sync.add_listener(lambda: notified.append(True))
+
+        sync.sync()
+
+        assert client.sinces == [0, 1]
+        assert not mirror.bootstrapping
+        assert mirror.get_changes(0)["changes"] == []
+
+        sync.sync()
+
+        assert client.sinces == [0, 1, 2]
+        assert mirror.get_object(1)["name"] == "アリス2"
+        assert [change["seq"] for change in mirror.get_changes(2)["changes"]] == [3]
+        assert len(notified) == 2
+        assert sync.online
+        assert sync.metrics()["applied_changes"] == 3
+
+    def test_reset_restarts_from_zero(self, mirror):
+        """バックエンドから差分同期できないと通知されるとミラーを空にして最初から取得し直すことを確認"""
+        mirror.apply_changes([object_change(1, 1), object_change(2, 2)], 2)
+        mirror.finish_bootstrap()
+        client = FakeClient([
+            feed([], 2, reset=True),
+            feed([object_change(9, 2, name="ボブ")], 9),
+        ])
+        sync = MirrorSync(mirror, client=client)
+
+        sync.sync()
+
+        assert client.sinces == [2, 0]
+        assert mirror.get_object(1) is None
+        assert mirror.get_object(2)["name"] == "ボブ"
+        assert mirror.change_seq == 9
+        assert not mirror.bootstrapping
+        # 最初から取得し直した変更は画面のキャッシュ向けに記録しない（画面のキャッシュもリセットさせる）
+        assert mirror.get_changes(2)["reset"]
+        assert not mirror.get_changes(9)["reset"]
+
+    def test_replay_drops_conflicts(self, mirror):
+        """キューの書き込みが古い順に送られ、409の書き込みは捨てて次の書き込みを送ることを確認"""
+        mirror.enqueue("POST", "/objects/", {"name": "アリス"})
+        mirror.enqueue("PUT", "/objects/1", {"name": "アリス2", "version": 1})
+        mirror.delete_object(2)
+        client = FakeClient([feed([], 0)], errors={"/objects/1": ApiError(409, "Version conflict")})
+        sync = MirrorSync(mirror, client=client)
+
+        sync.sync()
+
+        assert client.sent == [("POST", "/objects/", {"name": "アリス"}), ("DELETE", "/objects/2", None)]
+        assert mirror.pending_count() == 0
+        assert sync.replayed_writes == 2
+        assert sync.dropped_writes == 1
+
+    @pytest.mark.parametrize("error", [ApiConnectionError("refused"), ApiError(503, "busy")])
+    def test_replay_keeps_writes_on_transient_errors(self, mirror, error):
+        """接続できない・一時的なエラーの場合は書き込みをキューに残し、変更を取得せずに次の同期で再送することを確認"""
+        mirror.enqueue("PUT", "/objects/1", {"name": "アリス2"})
+        mirror.enqueue("DELETE", "/objects/2")
+        client = FakeClient([feed([], 0)], errors={"/objects/1": error})
+        sync = MirrorSync(mirror, client=client)
+
+        with pytest.raises(type(error)):
+            sync.sync()
+
+        writes = mirror.pending_writes()
+        assert [write["path"] for write in writes] == ["/objects/1", "/objects/2"]
+        assert writes[0]["attempts"] == 1
+        assert client.sent == []
+        assert client.sinces == []
+        assert not sync.online
+
+        client.errors.clear()
+        sync.sync()
+
+        assert [path for _, path, _ in client.sent] == ["/objects/1", "/objects/2"]
+        assert mirror.pending_count() == 0
+        assert sync.online
@@ -0,0 +1,226 @@
+import pytest
+import objects.object_store
+from mirror import LocalMirror
+from objects.object_store import LRUCache, ObjectStore
+
+
+class FakeClient:
+    """ミラーにないオブジェクトの詳細を返すクライアント"""
+
+    def __init__(self):
+        self.requested = []
+
+    def get_object(self, object_id):
+        self.requested.append(object_id)
+        return {"id": object_id, "name": f"remote{object_id}", "summary": "", "description": "バックエンド", "version": 1}
+
+
+class Backend:
+    """ミラーに変更を反映するテスト用のバックエンド（変更番号を順に振る）"""
+
+    def __init__(self, mirror):
+        self.mirror = mirror
+        self.seq = 0
+
+    def apply(self, *changes, log=True):
+        rows = []
+        for op, object_id, name in changes:
+            self.seq += 1
+            data = None
+            if op == "upsert":
+                data = {"id": object_id, "name": name, "summary": "", "description": f"説明{object_id}", "photos": None, "version": self.seq}
+            rows.append({"seq": self.seq, "entity": "object", "id": object_id, "object_id": object_id, "op": op, "data": data})
+        self.mirror.apply_changes(rows, self.seq, log=log)
+
+    def upsert(self, object_id, name=None):
+        self.apply(("upsert", object_id, name or f"obj{object_id}"))
+
+    def delete(self, object_id):
+        self.apply(("delete", object_id, None))
+
+
+@pytest.fixture
+def mirror(tmp_path):
+    mirror = LocalMirror(path=str(tmp_path / "mirror.db"))
+    yield mirror
+    mirror.close()
+
+
+@pytest.fixture
+def backend(mirror, monkeypatch):
+    """IDが2, 4, ..., 20の10件のオブジェクトがあるミラーを使うようにする"""
+    backend = Backend(mirror)
+    backend.apply(*[("upsert", object_id, f"obj{object_id}") for object_id in range(2, 21, 2)], log=False)
+    mirror.finish_bootstrap()
+    monkeypatch.setattr(objects.object_store, "get_mirror", lambda: mirror)
+    return backend
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(objects.object_store, "get_client", lambda: client)
+    return client
+
+
+def page_ids(store, page_number):
+    return [item["id"] for item in store.pages.get(page_number)]
+
+
+def load_all(store):
+    while store.fetch_next_page():
+        pass
+
+
+class TestLRUCache:
+    """件数に上限のあるキャッシュのテストクラス"""
+
+    def test_least_recently_used_is_evicted(self):
+        """上限を超えると最も長く使われていないものから捨てることを確認"""
+        cache = LRUCache(2)
+        cache.set(1, "a")
+        cache.set(2, "b")
+        cache.get(1)
+        cache.set(3, "c")
+
+        assert 1 in cache and 3 in cache
+        assert 2 not in cache
+        assert len(cache) == 2
+
+
+class TestObjectStore:
+    """オブジェクトの一覧のキャッシュのテストクラス"""
+
+    def test_pages_and_bounds(self, backend):
+        """IDの昇順にページを取得し、境界・件数・位置からの項目が求まることを確認"""
+        store = ObjectStore(page_size=3)
+        load_all(store)
+
+        assert store.bounds == [6, 12, 18, 20]
+        assert store.lengths == [3, 3, 3, 1]
+        assert store.complete
+        assert store.total == 10
+        assert store.locate(4) == (1, 1)
+        assert store.item_at(4)["id"] == 10
+        assert store.item_at(10) is None
+        assert not store.fetch_next_page()
+
+    def test_evicted_pages_keep_bounds(self, backend):
+        """最近使っていないページは捨てられ、境界と件数は残ることを確認"""
+        store = ObjectStore(page_size=3, page_cache_pages=2)
+        load_all(store)
+
+        assert 0 not in store.pages and 1 not in store.pages
+        assert store.item_at(0) is None
+        assert store.page_of(0) == 0
+        assert store.loaded_count == 10
+
+    def test_evicted_page_is_refetched_over_same_range(self, backend):
+        """捨てたページを取得し直すと、同じ境界の範囲の項目だけになることを確認"""
+        store = ObjectStore(page_size=3, page_cache_pages=2)
+        load_all(store)
+
+        assert store.fetch_page(1)
+
+        assert page_ids(store, 1) == [8, 10, 12]
+        assert store.bounds == [6, 12, 18, 20]
+
+    def test_refetch_includes_objects_created_after_eviction(self, backend):
+        """捨てた後にページの範囲内に作成されたオブジェクトがあっても、境界までの項目を取得し直すことを確認"""
+        store = ObjectStore(page_size=3, page_cache_pages=2)
+        load_all(store)
+        backend.upsert(9)
+        backend.upsert(11)
+        store.sync()
+
+        assert store.fetch_page(1)
+
+        assert page_ids(store, 1) == [8, 9, 10, 11, 12]
+        assert store.lengths[1] == 5
+        assert [store.item_at(position)["id"] for position in range(3, 8)] == [8, 9, 10, 11, 12]
+
+    def test_refetch_after_delete(self, backend):
+        """捨てたページの範囲内のオブジェクトが削除された場合、件数が減って取得し直されることを確認"""
+        store = ObjectStore(page_size=3, page_cache_pages=2)
+        load_all(store)
+        backend.delete(10)
+        store.sync()
+
+        assert store.lengths[1] == 2
+        assert store.fetch_page(1)
+        assert page_ids(store, 1) == [8, 12]
+        assert store.total == 9
+
+    def test_sync_patches_cached_pages(self, backend):
+        """変更を取得するとキャッシュしたページが更新・削除・挿入で書き換えられることを確認"""
+        store = ObjectStore(page_size=3)
+        load_all(store)
+        backend.upsert(8, "更新")
+        backend.delete(10)
+        backend.upsert(9)
+
+        assert store.sync()
+
+        assert page_ids(store, 1) == [8, 9, 12]
+        assert store.item_at(3)["name"] == "更新"
+        assert store.lengths == [3, 3, 3, 1]
+        assert store.total == 10
+        assert not store.sync()
+
+    def test_sync_skips_changes_already_in_page(self, backend):
+        """ページを取得した時点で反映済みの変更は適用しないことを確認"""
+        store = ObjectStore(page_size=3)
+        store.fetch_next_page()
+        backend.upsert(14, "更新")
+        store.fetch_next_page()
+        store.fetch_next_page()
+
+        store.sync()
+
+        assert page_ids(store, 2) == [14, 16, 18]
+        assert store.lengths[2] == 3
+        assert store.item_at(6)["name"] == "更新"
+
+    def test_new_object_after_last_page(self, backend):
+        """最後のページより後に作成されたオブジェクトは続きのページとして取得できることを確認"""
+        store = ObjectStore(page_size=3)
+        load_all(store)
+        backend.upsert(30)
+
+        assert store.sync()
+        assert not store.complete
+        assert store.total == 11
+        assert store.fetch_next_page()
+        assert page_ids(store, 4) == [30]
+
+    def test_sync_reset(self, backend, mirror):
+        """差分同期できない場合はキャッシュを空にすることを確認"""
+        store = ObjectStore(page_size=3)
+        load_all(store)
+        mirror.reset()
+
+        assert store.sync()
+        assert store.bounds == []
+        assert store.change_seq is None
+
+    def test_detail_cache(self, backend, client):
+        """詳細は一覧と同じバージョンならキャッシュから返し、変更されると取得し直すことを確認"""
+        store = ObjectStore(page_size=3)
+        load_all(store)
+        detail = store.get_detail(4)
+
+        assert detail["description"] == "説明4"
+        assert store.get_detail(4, detail["version"]) is detail
+
+        backend.upsert(4, "更新")
+        store.sync()
+
+        assert store.get_detail(4)["name"] == "更新"
+        assert client.requested == []
+
+    def test_detail_falls_back_to_client(self, backend, client):
+        """ミラーにないオブジェクトの詳細はバックエンドから取得することを確認"""
+        store = ObjectStore()
+
+        assert store.get_detail(99)["description"] == "バックエンド"
+        assert client.requested == [99]
@@ -0,0 +1,162 @@
+import threading
+import time
+import pytest
+
+pytest.importorskip("flet")
+from ui_loader import UILoader
+
+# 結果をまとめて反映する間隔（テストでは反映を待つ時間を短くする）
+BATCH_INTERVAL = 0.05
+
+
+class FakePage:
+    """page.updateに渡されたコントロールを記録するページ"""
+
+    def __init__(self):
+        self.updates = []
+
+    def update(self, *controls):
+        self.updates.append(controls)
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def settle():
+    """予約された反映が行われるまで待つ"""
+    time.sleep(BATCH_INTERVAL * 4)
+
+
+@pytest.fixture
+def page():
+    return FakePage()
+
+
+@pytest.fixture
+def loader(page):
+    loader = UILoader(page, max_workers=1, batch_interval=BATCH_INTERVAL)
+    yield loader
+    loader.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class TestUILoader:
+    """画面のデータ取得のテストクラス"""
+
+    def test_results_are_applied_in_one_update(self, page, loader):
+        """1フレームの間に届いた結果が1回のpage.updateでまとめて反映されることを確認"""
+        loader.batch_interval = 0.3
+        scope = loader.begin()
+        controls = [object() for _ in range(3)]
+        futures = [scope.load(lambda index=index: index, lambda index: [controls[index]]) for index in range(3)]
+        for future in futures:
+            future.result(2)
+
+        assert wait_for(lambda: page.updates)
+        settle()
+        assert page.updates == [tuple(controls)]
+
+    def test_duplicate_controls_are_sent_once(self, page, loader):
+        """複数の結果が同じコントロールを返しても1回だけ送ることを確認"""
+        loader.batch_interval = 0.3
+        scope = loader.begin()
+        shared, other = object(), object()
+        scope.load(lambda: None, lambda _: [shared]).result(2)
+        scope.load(lambda: None, lambda _: [shared, other]).result(2)
+
+        assert wait_for(lambda: page.updates)
+        assert page.updates == [(shared, other)]
+
+    def test_begin_cancels_pending_loads(self, page, loader):
+        """次の画面がbeginを呼ぶと、まだ始まっていない取得は取り消され、実行中の取得の結果は捨てられることを確認"""
+        started, release = threading.Event(), threading.Event()
+        fetched = []
+
+        def blocking():
+            started.set()
+            release.wait(2)
+            fetched.append("running")
+            return "running"
+        scope = loader.begin()
+        running = scope.load(blocking, lambda _: [object()])
+        queued = scope.load(lambda: fetched.append("queued"), lambda _: [object()])
+        assert started.wait(2)
+
+        next_scope = loader.begin()
+        release.set()
+        running.result(2)
+        settle()
+
+        assert scope.cancelled and not next_scope.cancelled
+        assert queued.cancelled()
+        assert fetched == ["running"]
+        assert page.updates == []
+        # 取り消したスコープからは新しい取得を始めない
+        assert scope.load(lambda: None, lambda _: [object()]) is None
+
+    def test_results_of_cancelled_scope_are_dropped_at_flush(self, page, loader):
+        """反映を待っている間に画面を離れた場合、その結果は反映されないことを確認"""
+        loader.batch_interval = 0.3
+        scope = loader.begin()
+        old = object()
+        scope.load(lambda: None, lambda _: [old]).result(2)
+
+        next_scope = loader.begin()
+        new = object()
+        next_scope.load(lambda: None, lambda _: [new]).result(2)
+
+        assert wait_for(lambda: page.updates)
+        settle()
+        assert page.updates == [(new,)]
+
+    def test_not_cancellable_load_still_runs(self, page, loader):
+        """cancellable=Falseの取得は画面を離れても実行され、結果の反映だけをやめることを確認"""
+        started, release = threading.Event(), threading.Event()
+        scope = loader.begin()
+        scope.load(lambda: (started.set(), release.wait(2)), lambda _: [object()])
+        assert started.wait(2)
+        written = []
+        write = scope.load(lambda: written.append(True), lambda _: [object()], cancellable=False)
+
+        loader.begin()
+        release.set()
+        write.result(2)
+        settle()
+
+        assert written == [True]
+        assert page.updates == []
+
+    def test_errors_are_applied_with_on_error(self, page, loader):
+        """取得に失敗した場合はon_errorの返したコントロールが反映され、反映に失敗した結果は他の結果を妨げないことを確認"""
+        loader.batch_interval = 0.3
+        scope = loader.begin()
+        error_control, ok_control = object(), object()
+        errors = []
+
+        def fail():
+            raise ValueError("boom")
+
+        def on_error(exc):
+            errors.append(str(exc))
+            return [error_control]
+
+        def broken(_):
+            raise RuntimeError("apply failed")
+        scope.load(fail, lambda _: [], on_error=on_error).result(2)
+        scope.load(lambda: None, broken).result(2)
+        scope.load(lambda: None, lambda _: [ok_control]).result(2)
+
+        assert wait_for(lambda: page.updates)
+        assert errors == ["boom"]
+        assert page.updates == [(error_control, ok_control)]
+
+    def test_no_update_without_controls(self, page, loader):
+        """反映するコントロールがない場合はpage.updateを呼ばないことを確認"""
+        scope = loader.begin()
+        scope.load(lambda: None, lambda _: None).result(2)
+        settle()
+
+        assert page.updates == []
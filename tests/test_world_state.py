@@ -0,0 +1,79 @@
+import pytest
+from gameEngine.world_state import WorldStateWriter, WorldStateReader
+
+
+@pytest.fixture
+def world():
+    """書き込み側と読み込み側を作成"""
+    writer = WorldStateWriter(capacity=8, text_capacity=64)
+    reader = WorldStateReader(writer.name)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+class TestWorldState:
+    """共有メモリのワールドの状態のテストクラス"""
+
+    def test_nothing_published(self, world):
+        """まだ公開されていない場合はNoneになることを確認"""
+        _, reader = world
+
+        assert reader.snapshot() is None
+        assert reader.read() is None
+
+    def test_round_trip(self, world):
+        """書き込んだ状態がそのまま読めることを確認"""
+        writer, reader = world
+        writer.publish([3, 7], [1.5, 20.0], [2.0, 40.5], states=[1, 2], directions=[0, 1], sprites=[5, 9], speech={1: "こんにちは"})
+
+        frame = reader.read()
+
+        assert frame.generation == 1
+        assert frame.count == 2
+        assert frame.ids == [3, 7]
+        assert frame.xs == [1.5, 20.0]
+        assert frame.ys == [2.0, 40.5]
+        assert frame.states == [1, 2]
+        assert frame.directions == [0, 1]
+        assert frame.sprites == [5, 9]
+        assert frame.speech == {1: "こんにちは"}
+
+    def test_generations_alternate_buffers(self, world):
+        """世代が進むごとに新しい状態が読め、前の世代の発言が残らないことを確認"""
+        writer, reader = world
+        writer.publish([1, 2, 3], [0, 0, 0], [0, 0, 0], speech={0: "a", 2: "b"})
+        writer.publish([4], [10], [20])
+        writer.publish([5, 6], [1, 2], [3, 4], speech={1: "c"})
+
+        frame = reader.read()
+
+        assert frame.generation == 3
+        assert frame.ids == [5, 6]
+        assert frame.speech == {1: "c"}
+
+    def test_stale_view_is_detected(self, world):
+        """読んだ後に次の世代が公開された場合は読み直しが必要と判定されることを確認"""
+        writer, reader = world
+        writer.publish([1], [0], [0])
+        view = reader.snapshot()
+        assert reader.is_current(view)
+
+        writer.publish([2], [0], [0])
+
+        assert not reader.is_current(view)
+        assert reader.read().ids == [2]
+
+    def test_speech_over_capacity_is_skipped(self, world):
+        """発言の領域に収まらない発言は省略されることを確認"""
+        writer, reader = world
+        writer.publish([1, 2], [0, 0], [0, 0], speech={0: "x" * 60, 1: "y" * 10})
+
+        assert reader.read().speech == {0: "x" * 60}
+
+    def test_too_many_npcs(self, world):
+        """NPCの最大数を超えるとエラーになることを確認"""
+        writer, _ = world
+
+        with pytest.raises(ValueError):
+            writer.publish(list(range(9)), [0] * 9, [0] * 9)
@@ -0,0 +1,19 @@
+"""
+画面のデータ取得モジュール
+
+Fletのイベントの処理を止めずにバックエンドからデータを取得するための処理を提供します。
+以下のコンポーネントが含まれています：
+
+- UILoader: ワーカースレッドで取得し、結果をまとめて1回のpage.updateで反映する
+- LoadScope: 1つの画面の取得（画面を離れると取り消される）
+- placeholder: 取得中に表示するプレースホルダー
+"""
+
+from .loader import UILoader, LoadScope, get_loader, placeholder
+
+__all__ = [
+    'UILoader',
+    'LoadScope',
+    'get_loader',
+    'placeholder'
+]
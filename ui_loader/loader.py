@@ -0,0 +1,140 @@
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import flet as ft
+
+logger = logging.getLogger(__name__)
+
+# データの取得に使うワーカースレッドの数
+UI_LOADER_WORKERS = 4
+# 取得した結果をまとめて画面に反映する間隔（秒）。1フレームの間に届いた結果は1回のpage.updateで反映する
+UI_BATCH_INTERVAL = 1 / 60
+
+def placeholder(text="読み込み中..."):
+    """取得が終わるまで表示しておくプレースホルダー"""
+    return ft.Row(
+        [ft.ProgressRing(width=16, height=16, stroke_width=2), ft.Text(text, size=14, color="grey")],
+        alignment=ft.MainAxisAlignment.CENTER,
+    )
+
+class LoadScope:
+    """
+    1つの画面で行う取得をまとめたもの。
+    画面を離れるとき（次の画面がUILoader.beginを呼んだとき）に取り消され、まだ始まっていない取得は行わず、届いた結果は捨てる。
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.cancelled = False
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def load(self, fetch, apply, on_error=None, cancellable=True):
+        """
+        fetch()をワーカースレッドで実行し、結果をapply(結果)で画面に反映する。
+        apply・on_error(例外)は変更したコントロールを返す（他の結果と合わせて1回のpage.updateで反映する）。
+        Fletのイベントの処理から呼んでもすぐに戻るため、画面の操作が止まらない。
+        書き込みなど画面を離れても行う処理はcancellable=Falseにする（結果の反映だけをやめる）。
+        """
+        with self._lock:
+            if self.cancelled and cancellable:
+                return None
+            future = self.loader.executor.submit(self._run, fetch, apply, on_error, cancellable)
+            if cancellable:
+                self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _run(self, fetch, apply, on_error, cancellable):
+        if self.cancelled and cancellable:
+            return
+        try:
+            result = fetch()
+        except Exception as exc:
+            if on_error is None:
+                logger.exception("Failed to load data")
+                return
+            self.loader.enqueue(self, on_error, exc)
+            return
+        self.loader.enqueue(self, apply, result)
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def cancel(self):
+        """まだ始まっていない取得を取り消す（実行中の取得の結果は反映しない）"""
+        with self._lock:
+            self.cancelled = True
+            futures, self._futures = self._futures, set()
+        for future in futures:
+            future.cancel()
+
+class UILoader:
+    """
+    画面のデータ取得をワーカースレッドで行い、結果をまとめて画面に反映する（ページごとにget_loaderの1つを共有する）。
+    ネットワーク・データベースの処理をFletのイベントの処理で行わないため、バックエンドが遅くても画面の遷移は止まらない。
+    """
+
+    def __init__(self, page, max_workers=UI_LOADER_WORKERS, batch_interval=UI_BATCH_INTERVAL):
+        self.page = page
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ui-loader")
+        self.batch_interval = batch_interval
+        self._scope = None
+        self._pending = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def begin(self):
+        """画面を表示するときに呼び、前の画面の取得を取り消して新しい画面の取得をまとめるスコープを返す"""
+        scope = LoadScope(self)
+        with self._lock:
+            previous, self._scope = self._scope, scope
+        if previous is not None:
+            previous.cancel()
+        return scope
+
+    def enqueue(self, scope, apply, value):
+        """反映を予約する（最初の予約から1フレーム後にまとめて反映する）"""
+        with self._lock:
+            self._pending.append((scope, apply, value))
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.batch_interval, self._flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._timer = None
+        controls = []
+        for scope, apply, value in pending:
+            # 画面を離れた後に届いた結果は捨てる
+            if scope.cancelled:
+                continue
+            try:
+                controls.extend(apply(value) or ())
+            except Exception:
+                logger.exception("Failed to apply loaded data")
+        if not controls:
+            return
+        # 同じコントロールは1回だけ送る
+        unique = list({id(control): control for control in controls}.values())
+        try:
+            self.page.update(*unique)
+        except Exception:
+            # 反映する前に画面を離れた場合など
+            logger.exception("Failed to update page")
+
+_loaders = weakref.WeakKeyDictionary()
+_loaders_lock = threading.Lock()
+
+def get_loader(page):
+    """ページで共有するデータ取得の処理を取得"""
+    with _loaders_lock:
+        loader = _loaders.get(page)
+        if loader is None:
+            loader = _loaders[page] = UILoader(page)
+        return loader